@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Перенос старых сообщений в архивную базу
+
+Примеры:
+    python archive_messages.py
+    python archive_messages.py --days 180 --vacuum
+
+Переносит сообщения старше ARCHIVE_MESSAGES_AFTER_DAYS (или --days) из
+основной базы в архив рядом с ней (<база>_archive.db; у шардов сообщений
+свои архивы). Бот читает архив при листании истории назад, выгрузках и
+поиске сообщения по ID. С --vacuum основная база сразу уменьшается
+(VACUUM блокирует базу на время работы - лучше запускать при
+остановленном боте).
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+
+from loguru import logger
+
+import Config
+from database.db import Database
+from utils.cold_storage import MessageArchiver
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Перенос старых сообщений в архивную базу")
+    parser.add_argument("--days", type=int, help="Переносить сообщения старше указанного числа дней")
+    parser.add_argument("--vacuum", action="store_true", help="Уменьшить файл основной базы после переноса (VACUUM)")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=Config.LOG_LEVEL)
+
+    if not os.path.exists(Config.DATABASE_PATH):
+        print(f"❌ База данных не найдена: {Config.DATABASE_PATH}", file=sys.stderr)
+        return 1
+    db = Database(Config.DATABASE_PATH)
+
+    size_before = sum(map(os.path.getsize, db.message_paths))
+    moved = MessageArchiver(db, after_days=args.days).run()
+    print(f"🗄 Перенесено в архив сообщений: {moved}")
+    for archive_path in filter(os.path.exists, db.archive_paths):
+        print(f"📦 Архив: {archive_path}, {os.path.getsize(archive_path) / 1048576:.1f} МБ")
+
+    if args.vacuum:
+        for path in db.message_paths:
+            conn = sqlite3.connect(path)
+            try:
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+        size_after = sum(map(os.path.getsize, db.message_paths))
+        print(f"💾 Основная база: {size_before / 1048576:.1f} МБ -> {size_after / 1048576:.1f} МБ")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Сжатие текста старых сообщений (холодное хранение)
+
+Примеры:
+    python compress_messages.py
+    python compress_messages.py --days 30 --vacuum
+
+Сжимает текст сообщений старше COLD_STORAGE_AFTER_DAYS (или --days)
+zlib с общим словарем; бот читает такие сообщения как обычно. Место,
+освобожденное в файле базы, переиспользуется для новых данных, а с
+--vacuum файл базы сразу уменьшается (VACUUM блокирует базу на время
+работы - лучше запускать при остановленном боте).
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+
+from loguru import logger
+
+import Config
+from database.db import Database
+from utils.cold_storage import MessageCompressor
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Сжатие текста старых сообщений")
+    parser.add_argument("--days", type=int, help="Сжимать сообщения старше указанного числа дней")
+    parser.add_argument("--vacuum", action="store_true", help="Уменьшить файл базы после сжатия (VACUUM)")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=Config.LOG_LEVEL)
+
+    if not os.path.exists(Config.DATABASE_PATH):
+        print(f"❌ База данных не найдена: {Config.DATABASE_PATH}", file=sys.stderr)
+        return 1
+    db = Database(Config.DATABASE_PATH)
+
+    size_before = sum(map(os.path.getsize, db.message_paths))
+    report = MessageCompressor(db, after_days=args.days).run()
+    print(f"🗜 Проверено сообщений: {report.checked}, сжато: {report.compressed}")
+    if report.compressed:
+        print(f"📦 Текст: {report.bytes_before / 1024:.0f} КБ -> {report.bytes_after / 1024:.0f} КБ")
+
+    if args.vacuum:
+        for path in db.message_paths:
+            conn = sqlite3.connect(path)
+            try:
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+        size_after = sum(map(os.path.getsize, db.message_paths))
+        print(f"💾 Файл базы: {size_before / 1048576:.1f} МБ -> {size_after / 1048576:.1f} МБ")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
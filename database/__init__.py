@@ -1,4 +1,5 @@
 from .db import Database
-from .models import Contact, Message, Admin
+from .storage import Storage, create_database
+from .models import Contact, Message, Admin, TelegramEntity, ContactImportJob, BulkImport, ContactMerge
  
-__all__ = ['Database', 'Contact', 'Message', 'Admin'] 
\ No newline at end of file
+__all__ = ['Database', 'Storage', 'create_database', 'Contact', 'Message', 'Admin', 'TelegramEntity', 'ContactImportJob', 'BulkImport', 'ContactMerge'] 
\ No newline at end of file
@@ -1,16 +1,145 @@
+import heapq
+import os
 import sqlite3
 from loguru import logger
-from typing import List, Optional
-from .models import Contact, Message, Admin
-from .models import CREATE_CONTACTS_TABLE, CREATE_MESSAGES_TABLE, CREATE_ADMINS_TABLE
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from .models import Contact, Message, Admin, ContactMerge
+from .models import CREATE_CONTACTS_TABLE, CREATE_MESSAGES_TABLE, CREATE_MESSAGES_INDEXES, MESSAGES_MIGRATIONS
+from .models import CREATE_COMPRESSION_DICTIONARIES_TABLE, TEXT_NOT_COMPRESSED
+from .models import CREATE_ARCHIVE_MESSAGES_TABLE, CREATE_ARCHIVE_MESSAGES_INDEXES
+from .models import CREATE_ADMINS_TABLE
+from .models import CREATE_CONTACTS_INDEXES, CONTACTS_MIGRATIONS
+from .models import CREATE_CONTACT_MERGES_TABLE
+from .node_state import NodeState
+from .storage import Storage
+from utils.phone import normalize_phone, is_synthetic_phone, reverse_digits, search_prefixes
+from utils.compression import decompress_text
+import Config
 
-class Database:
-    def __init__(self, db_path: str = "telegram_crm.db"):
+# Ключ bot_state с курсором заполнения contacts.normalized_phone/phone_reversed для старых записей
+PHONE_BACKFILL_STATE_KEY = "contacts_phone_backfill_v2"
+
+# Ключ bot_state с числом шардов, по которым разложены сообщения
+MESSAGE_SHARDS_STATE_KEY = "message_shards"
+
+# Ранги результатов поиска контактов (меньше - выше в выдаче)
+SEARCH_RANK_PHONE_EXACT = 0
+SEARCH_RANK_PHONE_SUFFIX = 1
+SEARCH_RANK_PHONE_PREFIX = 2
+SEARCH_RANK_NAME_PREFIX = 3
+SEARCH_RANK_TEXT = 4
+SEARCH_RANK_PHONE_INFIX = 5
+
+# Меньше цифр - скорее часть имени или примечания, чем номера
+MIN_PHONE_SEARCH_DIGITS = 3
+
+
+def _is_phone_token(token: str) -> bool:
+    """Часть запроса, похожая на номер или его фрагмент (цифры, +, -, скобки)"""
+    return any(ch.isdigit() for ch in token) and all(ch.isdigit() or ch in "+-()" for ch in token)
+
+
+def _prefix_upper_bound(prefix: str) -> str:
+    """Верхняя граница диапазона строк, начинающихся с prefix (для поиска по индексу)"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+# Колонки сообщения целиком: поля Message и сжатый текст (см. Database._message_from_row)
+_MESSAGE_COLUMNS = ("id, contact_id, message_id, direction, text, media_type, media_file_id, timestamp, preview, "
+                    "text_compressed, text_dictionary_id")
+
+# Колонки сообщений для списков: только поля из индекса idx_messages_history
+# (без полного текста), остальные - NULL, чтобы собрать Message(*row)
+_MESSAGE_LIST_COLUMNS = "id, contact_id, NULL, direction, NULL, media_type, NULL, timestamp, preview"
+
+_PREVIEW_MARK = "…"
+
+# Следующий ID сообщения в шарде (параметры: число шардов, число шардов, номер шарда):
+# больше всех когда-либо выданных в шарде (sqlite_sequence помнит и перенесенные
+# в архив или в другой шард) и с остатком от деления на число шардов, равным
+# номеру шарда, - поэтому ID уникальны во всех шардах
+_NEXT_SHARD_MESSAGE_ID = "(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'messages'), 0) / ? + 1) * ? + ?"
+
+
+def message_preview(text: Optional[str]) -> Optional[str]:
+    """Начало текста сообщения для списков (с "…", если текст обрезан)"""
+    if text is None or len(text) <= Config.MAX_MESSAGE_PREVIEW_LENGTH:
+        return text
+    return text[:Config.MAX_MESSAGE_PREVIEW_LENGTH] + _PREVIEW_MARK
+
+
+# Временная таблица соответствий источник -> целевой контакт для слияния дубликатов
+_CREATE_MERGE_MAP = """CREATE TEMP TABLE IF NOT EXISTS merge_map (
+                           source_id INTEGER PRIMARY KEY, target_id INTEGER NOT NULL, reason TEXT)"""
+
+
+def message_shard_paths(db_path: str, shards: int) -> List[str]:
+    """Файлы с сообщениями: при одном шарде - сама база, иначе <база>_messages_<i>of<K>.db"""
+    if shards <= 1:
+        return [db_path]
+    base = os.path.splitext(db_path)[0]
+    return [f"{base}_messages_{index}of{shards}.db" for index in range(shards)]
+
+
+def _archive_path(path: str) -> str:
+    """Архив старых сообщений рядом с файлом сообщений"""
+    return os.path.splitext(path)[0] + "_archive.db"
+
+
+def _parse_timestamp(value):
+    """Строка даты из SQLite в datetime (прочие значения без изменений)"""
+    if isinstance(value, str):
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def _list_message(row: tuple) -> Message:
+    """Message из строки _MESSAGE_LIST_COLUMNS"""
+    message = Message(*row)
+    message.timestamp = _parse_timestamp(message.timestamp)
+    return message
+
+
+class Database(Storage, NodeState):
+    """Хранилище в SQLite: контакты, сообщения и служебное состояние узла (в одной базе)"""
+
+    def __init__(self, db_path: str = "telegram_crm.db", message_shards: int = None):
+        super().__init__()
         self.db_path = db_path
+        # Словари сжатия текста по ID (не меняются после создания)
+        self.compression_dictionaries: Dict[int, bytes] = {}
+        # Сообщения хранятся в основной базе или по шардам (MESSAGE_SHARDS); у каждого
+        # файла сообщений свой архив старых сообщений (создается при первом переносе).
+        # Фактическое число шардов - то, в котором уже лежат данные (см. _init_message_shards)
+        self.configured_message_shards = max(1, message_shards or Config.MESSAGE_SHARDS)
+        self._set_message_layout(1)
         self.init_db()
 
-    def get_connection(self):
-        return sqlite3.connect(self.db_path)
+    def _set_message_layout(self, shards: int):
+        self.message_shards = shards
+        self.message_paths = message_shard_paths(self.db_path, shards)
+        self.archive_paths = [_archive_path(path) for path in self.message_paths]
+
+    def message_shard(self, contact_id: int) -> int:
+        """Шард с сообщениями контакта (все сообщения контакта - в одном шарде)"""
+        return contact_id % self.message_shards
+
+    def _message_connection(self, shard: int, archive: bool = False):
+        """Соединение с файлом сообщений шарда; archive - с подключенным архивом шарда"""
+        conn = sqlite3.connect(self.message_paths[shard])
+        if archive:
+            # Архив подключается только для запросов, которым он нужен
+            conn.execute("ATTACH DATABASE ? AS archive", (self.archive_paths[shard],))
+        return conn
+
+    def has_archive(self, shard: int = 0) -> bool:
+        """Есть ли архив сообщений шарда (его может создать и другой процесс)"""
+        return os.path.exists(self.archive_paths[shard])
+
+    def _message_schemas(self, shard: int = 0) -> Tuple[str, ...]:
+        """Схемы с сообщениями шарда: файл сообщений и архив, если он есть"""
+        return ("main", "archive") if self.has_archive(shard) else ("main",)
 
     def init_db(self):
         """Инициализация базы данных и создание таблиц"""
@@ -20,8 +149,18 @@ class Database:
             
             # Создаем таблицы
             cursor.execute(CREATE_CONTACTS_TABLE)
-            cursor.execute(CREATE_MESSAGES_TABLE)
+            cursor.execute("PRAGMA table_info(contacts)")
+            contact_columns = {row[1] for row in cursor.fetchall()}
+            for column, declaration in CONTACTS_MIGRATIONS:
+                if column not in contact_columns:
+                    cursor.execute(f"ALTER TABLE contacts ADD COLUMN {column} {declaration}")
+            self._create_messages_schema(cursor)
             cursor.execute(CREATE_ADMINS_TABLE)
+            self._create_node_tables(cursor)
+            cursor.execute(CREATE_CONTACT_MERGES_TABLE)
+            cursor.execute(CREATE_COMPRESSION_DICTIONARIES_TABLE)
+            for statement in CREATE_CONTACTS_INDEXES:
+                cursor.execute(statement)
             
             conn.commit()
             logger.info("База данных успешно инициализирована")
@@ -30,18 +169,157 @@ class Database:
         finally:
             conn.close()
 
+        self._init_message_shards()
+        if self.get_state(PHONE_BACKFILL_STATE_KEY) != "done":
+            self.backfill_normalized_phones()
+
+    @staticmethod
+    def _create_messages_schema(cursor):
+        """Таблица messages с миграциями и индексами (в основной базе и в каждом шарде)"""
+        cursor.execute(CREATE_MESSAGES_TABLE)
+        cursor.execute("PRAGMA table_info(messages)")
+        message_columns = {row[1] for row in cursor.fetchall()}
+        for column, declaration in MESSAGES_MIGRATIONS:
+            if column not in message_columns:
+                cursor.execute(f"ALTER TABLE messages ADD COLUMN {column} {declaration}")
+        if "preview" not in message_columns:
+            # Превью уже сохраненных сообщений (по тому же правилу, что message_preview)
+            cursor.execute(
+                "UPDATE messages SET preview = CASE WHEN length(text) > ? THEN substr(text, 1, ?) || ? "
+                "ELSE text END WHERE text IS NOT NULL",
+                (Config.MAX_MESSAGE_PREVIEW_LENGTH, Config.MAX_MESSAGE_PREVIEW_LENGTH, _PREVIEW_MARK)
+            )
+        for statement in CREATE_MESSAGES_INDEXES:
+            cursor.execute(statement)
+
+    def _init_message_shards(self):
+        """
+        Раскладка сообщений по шардам и схема файлов шардов
+
+        Сообщения контакта лежат в шарде contact_id % K, у каждого шарда
+        свой файл и своя блокировка записи, поэтому сохранение сообщений
+        разных контактов не ждет друг друга и основную базу. Раскладка, в
+        которой уже лежат сообщения, записана в bot_state и меняется только
+        перераспределением (shard_messages.py): при другом MESSAGE_SHARDS
+        используется записанная.
+        """
+        configured = self.configured_message_shards
+        stored = self.get_state(MESSAGE_SHARDS_STATE_KEY)
+        if stored is not None:
+            shards = int(stored)
+            if shards != configured:
+                logger.warning(
+                    f"⚠️ Сообщения разложены по {shards} шардам, а MESSAGE_SHARDS = {configured}: "
+                    f"используется {shards}, перераспределить - shard_messages.py"
+                )
+        elif configured > 1 and self._has_unsharded_messages():
+            logger.warning(
+                f"⚠️ Сообщения хранятся в основной базе, MESSAGE_SHARDS = {configured} не применен: "
+                f"перераспределить - shard_messages.py"
+            )
+            shards = 1
+        else:
+            shards = configured
+            self.set_state(MESSAGE_SHARDS_STATE_KEY, str(shards))
+
+        self._set_message_layout(shards)
+        for shard, path in enumerate(self.message_paths):
+            if path != self.db_path:
+                self._init_message_store(shard)
+
+    def _init_message_store(self, shard: int):
+        conn = self._message_connection(shard)
+        cursor = conn.cursor()
+        try:
+            self._create_messages_schema(cursor)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _has_unsharded_messages(self) -> bool:
+        """Есть ли сообщения в основной базе или в ее архиве"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT 1 FROM messages LIMIT 1")
+            return cursor.fetchone() is not None or os.path.exists(_archive_path(self.db_path))
+        finally:
+            conn.close()
+
+    def backfill_normalized_phones(self, batch_size: int = 1000) -> int:
+        """
+        Заполнение normalized_phone, phone_synthetic и phone_reversed у контактов, добавленных до их появления
+
+        Контакты обрабатываются пачками по id, каждая пачка - отдельная
+        транзакция вместе с курсором в bot_state, поэтому прерванное
+        заполнение продолжается при следующем запуске.
+
+        Returns:
+            Количество обработанных контактов
+        """
+        last_id = int(self.get_state(PHONE_BACKFILL_STATE_KEY, "0") or 0)
+        processed = 0
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            while True:
+                cursor.execute(
+                    "SELECT id, phone, telegram_user_id FROM contacts WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+
+                updates = []
+                for contact_id, phone, telegram_user_id in rows:
+                    synthetic = is_synthetic_phone(phone, telegram_user_id)
+                    normalized = None if synthetic else normalize_phone(phone)
+                    updates.append((normalized, int(synthetic), reverse_digits(normalized), contact_id))
+                cursor.executemany(
+                    "UPDATE contacts SET normalized_phone = ?, phone_synthetic = ?, phone_reversed = ? WHERE id = ?",
+                    updates
+                )
+
+                last_id = rows[-1][0]
+                processed += len(rows)
+                cursor.execute(
+                    """INSERT INTO bot_state (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+                       ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at""",
+                    (PHONE_BACKFILL_STATE_KEY, str(last_id))
+                )
+                conn.commit()
+        finally:
+            conn.close()
+
+        self.set_state(PHONE_BACKFILL_STATE_KEY, "done")
+        if processed:
+            self.bump_version("contacts")
+            logger.info(f"📱 Нормализованы телефоны контактов: {processed}")
+        return processed
+
     # Методы для работы с контактами
-    def add_contact(self, name: str, phone: str, note: str = None, telegram_user_id: int = None) -> int:
-        """Добавление нового контакта"""
+    def add_contact(self, name: str, phone: str, note: str = None, telegram_user_id: int = None,
+                    synthetic: bool = False) -> int:
+        """
+        Добавление нового контакта
+
+        Args:
+            synthetic: phone - временный номер, а не настоящий (не участвует в поиске по телефону)
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
+            normalized = None if synthetic else normalize_phone(phone)
             cursor.execute(
-                "INSERT INTO contacts (name, phone, note, telegram_user_id) VALUES (?, ?, ?, ?)",
-                (name, phone, note, telegram_user_id)
+                """INSERT INTO contacts (name, phone, note, telegram_user_id, normalized_phone, phone_synthetic,
+                                         phone_reversed)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (name, phone, note, telegram_user_id, normalized, int(synthetic), reverse_digits(normalized))
             )
             conn.commit()
             contact_id = cursor.lastrowid
+            self.bump_version("contacts", [contact_id])
             logger.info(f"➕ Контакт добавлен в базу: {name} ({phone}) [ID: {contact_id}]")
             return contact_id
         finally:
@@ -65,12 +343,38 @@ class Database:
         finally:
             conn.close()
 
+    def get_contacts_by_ids(self, contact_ids: List[int]) -> List[Contact]:
+        """Получение контактов по списку ID (в порядке списка, отсутствующие пропускаются)"""
+        if not contact_ids:
+            return []
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            contacts = {}
+            # SQLite ограничивает число параметров запроса 999
+            for start in range(0, len(contact_ids), 900):
+                chunk = contact_ids[start:start + 900]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(f"SELECT * FROM contacts WHERE id IN ({placeholders})", chunk)
+                for row in cursor.fetchall():
+                    contact = Contact(*row)
+                    contact.date_added = _parse_timestamp(contact.date_added)
+                    contacts[contact.id] = contact
+            return [contacts[contact_id] for contact_id in contact_ids if contact_id in contacts]
+        finally:
+            conn.close()
+
     def get_contact_by_phone(self, phone: str) -> Optional[Contact]:
-        """Получение контакта по номеру телефона"""
+        """Получение контакта по номеру телефона в любом написании (по normalized_phone)"""
+        normalized = normalize_phone(phone)
+        if normalized is None:
+            return None
+
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
-            cursor.execute("SELECT * FROM contacts WHERE phone = ?", (phone,))
+            cursor.execute("SELECT * FROM contacts WHERE normalized_phone = ? ORDER BY id LIMIT 1", (normalized,))
             result = cursor.fetchone()
             if result:
                 contact = Contact(*result)
@@ -133,6 +437,12 @@ class Database:
             if phone is not None:
                 updates.append("phone = ?")
                 params.append(phone)
+                normalized = normalize_phone(phone)
+                updates.append("normalized_phone = ?")
+                params.append(normalized)
+                updates.append("phone_reversed = ?")
+                params.append(reverse_digits(normalized))
+                updates.append("phone_synthetic = 0")
             if note is not None:
                 updates.append("note = ?")
                 params.append(note)
@@ -141,6 +451,7 @@ class Database:
                 params.append(contact_id)
                 cursor.execute(f"UPDATE contacts SET {', '.join(updates)} WHERE id = ?", params)
                 conn.commit()
+                self.bump_version("contacts", [contact_id])
         finally:
             conn.close()
 
@@ -152,6 +463,7 @@ class Database:
             cursor.execute("UPDATE contacts SET telegram_user_id = ? WHERE id = ?", 
                          (telegram_user_id, contact_id))
             conn.commit()
+            self.bump_version("contacts", [contact_id])
         finally:
             conn.close()
 
@@ -162,30 +474,97 @@ class Database:
         try:
             cursor.execute("DELETE FROM contacts WHERE id = ?", (contact_id,))
             conn.commit()
+            self.bump_version("contacts", [contact_id])
         finally:
             conn.close()
 
-    def search_contacts(self, query: str) -> List[Contact]:
-        """Поиск контактов по имени, телефону или примечанию"""
+    def search_contacts(self, query: str, limit: int = 100) -> List[Contact]:
+        """
+        Поиск контактов по имени, телефону или примечанию с ранжированием
+
+        Цифры запроса ищутся по индексам телефона: точное совпадение,
+        окончание номера (phone_reversed) и начало номера (normalized_phone),
+        каждое - диапазонным поиском по индексу. Остальной текст ищется в
+        имени и примечании. Если в запросе есть и слова, и цифры, контакт
+        должен подходить под обе части. Середина номера ищется полным
+        просмотром только если индексы ничего не нашли.
+
+        Returns:
+            Контакты по убыванию релевантности (не больше limit)
+        """
+        text = " ".join(token for token in query.split() if not _is_phone_token(token))
+        digits = "".join(ch for token in query.split() if _is_phone_token(token) for ch in token if ch.isdigit())
+        if len(digits) < MIN_PHONE_SEARCH_DIGITS:
+            text, digits = query.strip(), ""
+
+        parts = []
+        params = []
+        if digits:
+            normalized = normalize_phone(digits)
+            if normalized:
+                parts.append(f"SELECT id, {SEARCH_RANK_PHONE_EXACT} FROM contacts WHERE normalized_phone = ?")
+                params.append(normalized)
+            reversed_digits = digits[::-1]
+            parts.append(
+                f"SELECT id, {SEARCH_RANK_PHONE_SUFFIX} FROM contacts WHERE phone_reversed >= ? AND phone_reversed < ?"
+            )
+            params.extend([reversed_digits, _prefix_upper_bound(reversed_digits)])
+            for prefix in search_prefixes(digits):
+                parts.append(
+                    f"SELECT id, {SEARCH_RANK_PHONE_PREFIX} FROM contacts "
+                    f"WHERE normalized_phone >= ? AND normalized_phone < ?"
+                )
+                params.extend([prefix, _prefix_upper_bound(prefix)])
+        elif text:
+            parts.append(f"SELECT id, {SEARCH_RANK_NAME_PREFIX} FROM contacts WHERE name LIKE ?")
+            params.append(f"{text}%")
+            parts.append(f"SELECT id, {SEARCH_RANK_TEXT} FROM contacts WHERE name LIKE ? OR note LIKE ? OR phone LIKE ?")
+            params.extend([f"%{text}%"] * 3)
+        else:
+            return []
+
+        text_filter = ""
+        if digits and text:
+            text_filter = "WHERE c.name LIKE ? OR c.note LIKE ?"
+        text_params = [f"%{text}%"] * 2 if text_filter else []
+
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
-            cursor.execute(
-                "SELECT * FROM contacts WHERE name LIKE ? OR phone LIKE ? OR note LIKE ?",
-                (f"%{query}%", f"%{query}%", f"%{query}%")
-            )
+            cursor.execute(self._ranked_search_sql(parts, text_filter), (*params, *text_params, limit))
+            rows = cursor.fetchall()
+
+            if digits and not rows:
+                cursor.execute(
+                    self._ranked_search_sql(
+                        [f"SELECT id, {SEARCH_RANK_PHONE_INFIX} FROM contacts WHERE normalized_phone LIKE ?"],
+                        text_filter
+                    ),
+                    (f"%{digits}%", *text_params, limit)
+                )
+                rows = cursor.fetchall()
+
             contacts = []
-            for row in cursor.fetchall():
+            for row in rows:
                 contact = Contact(*row)
-                # Конвертируем строку даты в datetime объект
-                if isinstance(contact.date_added, str):
-                    from datetime import datetime
-                    contact.date_added = datetime.strptime(contact.date_added, '%Y-%m-%d %H:%M:%S')
+                contact.date_added = _parse_timestamp(contact.date_added)
                 contacts.append(contact)
             return contacts
         finally:
             conn.close()
 
+    @staticmethod
+    def _ranked_search_sql(parts: List[str], text_filter: str = "") -> str:
+        """Объединение подзапросов (id, ранг) в одну выдачу по лучшему рангу"""
+        return f"""
+            WITH hits(id, rank) AS ({" UNION ALL ".join(parts)})
+            SELECT c.* FROM contacts c
+            JOIN (SELECT id, MIN(rank) AS rank FROM hits GROUP BY id) h ON h.id = c.id
+            {text_filter}
+            ORDER BY h.rank, c.name
+            LIMIT ?
+        """
+
     def get_contacts_count(self) -> int:
         """Получение общего количества контактов"""
         conn = self.get_connection()
@@ -200,84 +579,529 @@ class Database:
     def add_message(self, contact_id: int, message_id: int, direction: str,
                    text: str, media_type: str = 'text', media_file_id: str = None) -> int:
         """Добавление нового сообщения"""
-        conn = self.get_connection()
+        shard = self.message_shard(contact_id)
+        if self.message_shards > 1:
+            id_sql, id_params = _NEXT_SHARD_MESSAGE_ID, (self.message_shards, self.message_shards, shard)
+        else:
+            id_sql, id_params = "NULL", ()
+        conn = self._message_connection(shard)
         cursor = conn.cursor()
         try:
             cursor.execute(
-                """INSERT INTO messages 
-                   (contact_id, message_id, direction, text, media_type, media_file_id)
-                   VALUES (?, ?, ?, ?, ?, ?)""",
-                (contact_id, message_id, direction, text, media_type, media_file_id)
+                f"""INSERT INTO messages 
+                   (id, contact_id, message_id, direction, text, media_type, media_file_id, preview)
+                   VALUES ({id_sql}, ?, ?, ?, ?, ?, ?, ?)""",
+                (*id_params, contact_id, message_id, direction, text, media_type, media_file_id, message_preview(text))
             )
             conn.commit()
-            return cursor.lastrowid
         finally:
             conn.close()
 
-    def get_contact_messages(self, contact_id: int, limit: int = 20) -> List[Message]:
-        """Получение истории сообщений контакта"""
-        conn = self.get_connection()
+        # timestamp по умолчанию - CURRENT_TIMESTAMP (UTC, с точностью до секунды)
+        message = Message(cursor.lastrowid, contact_id, message_id, direction, text, media_type,
+                          media_file_id, datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0),
+                          message_preview(text))
+        self._notify_message(message)
+        return message.id
+
+    def get_messages_page(self, contact_id: int, cursor_id: int = None, newer: bool = False,
+                          limit: int = 20) -> List[Message]:
+        """
+        Страница истории сообщений контакта от курсора
+
+        Сообщения упорядочены по (timestamp, id), курсор - ID сообщения-границы.
+        Страница читается одним диапазоном покрывающего индекса idx_messages_history,
+        поэтому ее стоимость не зависит от длины переписки, номера страницы и
+        длины самих сообщений: у сообщений заполнено только превью, полный текст -
+        get_message. Когда страница выходит за старейшие сообщения основной
+        базы, она дочитывается из архива.
+
+        Args:
+            cursor_id: ID сообщения, от которого продолжается история (None - последние сообщения)
+            newer: True - сообщения новее курсора (старые первыми), иначе старше (новые первыми)
+        """
+        order = "ASC" if newer else "DESC"
+        if cursor_id is None:
+            condition, params = "", (contact_id, limit)
+        else:
+            condition = f"AND (timestamp, id) {'>' if newer else '<'} (SELECT timestamp, id FROM messages WHERE id = ?)"
+            params = (contact_id, cursor_id, limit)
+
+        shard = self.message_shard(contact_id)
+        conn = self._message_connection(shard)
         cursor = conn.cursor()
         try:
             cursor.execute(
-                "SELECT * FROM messages WHERE contact_id = ? ORDER BY timestamp DESC LIMIT ?",
-                (contact_id, limit)
+                f"SELECT {_MESSAGE_LIST_COLUMNS} FROM messages WHERE contact_id = ? {condition} "
+                f"ORDER BY timestamp {order}, id {order} LIMIT ?",
+                params
             )
-            messages = []
-            for row in cursor.fetchall():
-                message = Message(*row)
-                # Конвертируем строку даты в datetime объект
-                if isinstance(message.timestamp, str):
-                    from datetime import datetime
-                    message.timestamp = datetime.strptime(message.timestamp, '%Y-%m-%d %H:%M:%S')
-                messages.append(message)
+            messages = [_list_message(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+        # Страница дошла до старейших сообщений основной базы (или курсор уже в архиве)
+        if len(messages) < limit and (not newer or not messages) and self.has_archive(shard):
+            messages = self._archive_page(shard, contact_id, cursor_id, newer, limit, messages)
+        return messages
+
+    def _archive_page(self, shard: int, contact_id: int, cursor_id: Optional[int], newer: bool, limit: int,
+                      messages: List[Message]) -> List[Message]:
+        """
+        Продолжение страницы истории в архиве
+
+        В архив сообщения переносятся строго от старых к новым, поэтому
+        архивные сообщения контакта всегда старше оставшихся в основной базе.
+        """
+        conn = self._message_connection(shard, archive=True)
+        cursor = conn.cursor()
+        try:
+            position = None
+            if messages:
+                last = messages[-1]
+                position = (last.timestamp.strftime('%Y-%m-%d %H:%M:%S'), last.id)
+            elif cursor_id is not None:
+                cursor.execute("SELECT timestamp, id FROM main.messages WHERE id = ?", (cursor_id,))
+                position = cursor.fetchone()
+                if position is not None and newer:
+                    # Курсор в основной базе - новее него в архиве ничего нет
+                    return messages
+                if position is None:
+                    cursor.execute("SELECT timestamp, id FROM archive.messages WHERE id = ?", (cursor_id,))
+                    position = cursor.fetchone()
+                    if position is None:
+                        return messages
+
+            order = "ASC" if newer else "DESC"
+            condition = f"AND (timestamp, id) {'>' if newer else '<'} (?, ?)" if position else ""
+            cursor.execute(
+                f"SELECT {_MESSAGE_LIST_COLUMNS} FROM archive.messages WHERE contact_id = ? {condition} "
+                f"ORDER BY timestamp {order}, id {order} LIMIT ?",
+                (contact_id, *(position or ()), limit - len(messages))
+            )
+            messages = messages + [_list_message(row) for row in cursor.fetchall()]
+
+            if newer and len(messages) < limit:
+                # После архива история продолжается с первых сообщений основной базы
+                cursor.execute(
+                    f"SELECT {_MESSAGE_LIST_COLUMNS} FROM main.messages WHERE contact_id = ? "
+                    f"ORDER BY timestamp ASC, id ASC LIMIT ?",
+                    (contact_id, limit - len(messages))
+                )
+                messages += [_list_message(row) for row in cursor.fetchall()]
             return messages
         finally:
             conn.close()
 
-    def get_messages_count(self) -> int:
-        """Получение общего количества сообщений"""
+    def get_message(self, message_id: int) -> Optional[Message]:
+        """Сообщение целиком (с полным текстом) по ID в базе или в архиве"""
+        # ID, выданные в шарде, указывают на него; сообщения, сохраненные до
+        # перераспределения по шардам, ищутся в остальных
+        shard = message_id % self.message_shards
+        shards = [shard] + [other for other in range(self.message_shards) if other != shard]
+        return self._find_message("id = ?", (message_id,), shards)
+
+    def _find_message(self, condition: str, params: tuple, shards: Iterable[int]) -> Optional[Message]:
+        """Первое сообщение по условию в шардах по порядку: сначала файл сообщений, затем архив"""
+        for shard in shards:
+            for schema in self._message_schemas(shard):
+                conn = self._message_connection(shard, archive=schema == "archive")
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(f"SELECT {_MESSAGE_COLUMNS} FROM {schema}.messages WHERE {condition}", params)
+                    row = cursor.fetchone()
+                    if row:
+                        return self._message_from_row(row)
+                finally:
+                    conn.close()
+        return None
+
+    def get_message_counts(self, contact_ids: Iterable[int]) -> Dict[int, Dict[str, int]]:
+        """
+        Количество сообщений контактов по направлениям (по индексу, без чтения текста)
+
+        Returns:
+            {contact_id: {"incoming": n, "outgoing": n}} (контакты без сообщений отсутствуют)
+        """
+        by_shard: Dict[int, List[int]] = {}
+        for contact_id in contact_ids:
+            by_shard.setdefault(self.message_shard(contact_id), []).append(contact_id)
+
+        counts: Dict[int, Dict[str, int]] = {}
+        for shard, shard_contact_ids in by_shard.items():
+            schemas = self._message_schemas(shard)
+            conn = self._message_connection(shard, archive=len(schemas) > 1)
+            cursor = conn.cursor()
+            try:
+                # SQLite ограничивает число параметров запроса 999
+                for start in range(0, len(shard_contact_ids), 900):
+                    chunk = shard_contact_ids[start:start + 900]
+                    placeholders = ",".join("?" * len(chunk))
+                    for schema in schemas:
+                        cursor.execute(
+                            f"""SELECT contact_id, direction, COUNT(*) FROM {schema}.messages
+                                WHERE contact_id IN ({placeholders})
+                                GROUP BY contact_id, direction""",
+                            chunk
+                        )
+                        for contact_id, direction, count in cursor.fetchall():
+                            contact_counts = counts.setdefault(contact_id, {})
+                            contact_counts[direction] = contact_counts.get(direction, 0) + count
+            finally:
+                conn.close()
+        return counts
+
+    def iter_contacts(self, batch_size: int = 1000) -> Iterator[Contact]:
+        """
+        Потоковый обход всех контактов в порядке добавления
+
+        Строки читаются пачками по batch_size (fetchmany) с продолжением по
+        id, поэтому память не зависит от размера таблицы, а между пачками
+        база не заблокирована для записи.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
-            cursor.execute("SELECT COUNT(*) FROM messages")
-            return cursor.fetchone()[0]
+            last_id = 0
+            while True:
+                cursor.execute("SELECT * FROM contacts WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size))
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                for row in rows:
+                    contact = Contact(*row)
+                    contact.date_added = _parse_timestamp(contact.date_added)
+                    yield contact
+                last_id = rows[-1][0]
         finally:
             conn.close()
 
+    def iter_messages(self, since: Union[datetime, str] = None, contact_id: int = None,
+                      batch_size: int = 1000) -> Iterator[Message]:
+        """
+        Потоковый обход сообщений в порядке сохранения (сначала архивные)
+
+        Шарды читаются одновременно, их потоки сливаются по ID сообщения.
+
+        Args:
+            since: Только сообщения не старше этой даты
+            contact_id: Только сообщения одного контакта
+            batch_size: Размер пачки чтения
+        """
+        conditions = ["id > ?"]
+        params = []
+        if since is not None:
+            since = since.strftime('%Y-%m-%d %H:%M:%S') if isinstance(since, datetime) else since
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if contact_id is not None:
+            conditions.append("contact_id = ?")
+            params.append(contact_id)
+
+        shards = [self.message_shard(contact_id)] if contact_id is not None else range(self.message_shards)
+        streams = [self._iter_shard_messages(shard, conditions, params, since, batch_size) for shard in shards]
+        if len(streams) == 1:
+            yield from streams[0]
+        else:
+            yield from heapq.merge(*streams, key=lambda message: message.id)
+
+    def _iter_shard_messages(self, shard: int, conditions: List[str], params: list, since: Optional[str],
+                             batch_size: int) -> Iterator[Message]:
+        schemas = self._message_schemas(shard)
+        conn = self._message_connection(shard, archive=len(schemas) > 1)
+        cursor = conn.cursor()
+        try:
+            for schema in reversed(schemas):
+                if schema == "archive" and since is not None:
+                    # Архив целиком старше since - не просматривается
+                    cursor.execute("SELECT MAX(timestamp) FROM archive.messages")
+                    newest = cursor.fetchone()[0]
+                    if newest is None or newest < since:
+                        continue
+                query = f"SELECT {_MESSAGE_COLUMNS} FROM {schema}.messages WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?"
+                last_id = 0
+                while True:
+                    cursor.execute(query, (last_id, *params, batch_size))
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield self._message_from_row(row)
+                    last_id = rows[-1][0]
+        finally:
+            conn.close()
+
+    def get_messages_count(self) -> int:
+        """Получение общего количества сообщений"""
+        total = 0
+        for shard in range(self.message_shards):
+            schemas = self._message_schemas(shard)
+            conn = self._message_connection(shard, archive=len(schemas) > 1)
+            cursor = conn.cursor()
+            try:
+                for schema in schemas:
+                    cursor.execute(f"SELECT COUNT(*) FROM {schema}.messages")
+                    total += cursor.fetchone()[0]
+            finally:
+                conn.close()
+        return total
+
     def get_messages_count_by_period(self, period_days: int = 1) -> int:
         """Получение количества сообщений за период"""
+        total = 0
+        for shard in range(self.message_shards):
+            conn = self._message_connection(shard)
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    "SELECT COUNT(*) FROM messages WHERE timestamp >= datetime('now', '-{} days')".format(period_days)
+                )
+                total += cursor.fetchone()[0]
+            finally:
+                conn.close()
+        return total
+
+    def get_message_by_id(self, contact_id: int, message_id: int) -> Optional[Message]:
+        """Получение сообщения по ID контакта и ID сообщения (в том числе из архива)"""
+        return self._find_message("contact_id = ? AND message_id = ?", (contact_id, message_id),
+                                  [self.message_shard(contact_id)])
+
+    def _message_from_row(self, row: tuple) -> Message:
+        """Message из строки _MESSAGE_COLUMNS: сжатый текст распаковывается"""
+        message = Message(*row[:9])
+        message.timestamp = _parse_timestamp(message.timestamp)
+        compressed, dictionary_id = row[9], row[10]
+        if compressed is not None:
+            message.text = decompress_text(compressed, self.get_compression_dictionary(dictionary_id))
+        return message
+
+    # Холодное хранение текста старых сообщений
+    def add_compression_dictionary(self, data: bytes, samples: int = 0) -> int:
+        """Сохранение нового словаря сжатия"""
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
             cursor.execute(
-                "SELECT COUNT(*) FROM messages WHERE timestamp >= datetime('now', '-{} days')".format(period_days)
+                "INSERT INTO compression_dictionaries (data, samples) VALUES (?, ?)",
+                (data, samples)
             )
-            return cursor.fetchone()[0]
+            conn.commit()
+            self.compression_dictionaries[cursor.lastrowid] = data
+            return cursor.lastrowid
         finally:
             conn.close()
 
-    def get_message_by_id(self, contact_id: int, message_id: int) -> Optional[Message]:
-        """Получение сообщения по ID контакта и ID сообщения"""
+    def get_compression_dictionary(self, dictionary_id: int) -> bytes:
+        """Словарь сжатия по ID (кэшируется: словари не меняются)"""
+        data = self.compression_dictionaries.get(dictionary_id)
+        if data is not None:
+            return data
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT data FROM compression_dictionaries WHERE id = ?", (dictionary_id,))
+            row = cursor.fetchone()
+            if not row:
+                raise LookupError(f"Словарь сжатия {dictionary_id} не найден")
+            self.compression_dictionaries[dictionary_id] = row[0]
+            return row[0]
+        finally:
+            conn.close()
+
+    def get_latest_compression_dictionary(self) -> Optional[Tuple[int, bytes]]:
+        """Последний созданный словарь сжатия (ID, данные)"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT id, data FROM compression_dictionaries ORDER BY id DESC LIMIT 1")
+            row = cursor.fetchone()
+            if not row:
+                return None
+            self.compression_dictionaries[row[0]] = row[1]
+            return row[0], row[1]
+        finally:
+            conn.close()
+
+    def get_messages_to_compress(self, before: datetime, limit: int = 500,
+                                 shard: int = 0) -> List[Tuple[int, Optional[str]]]:
+        """
+        Еще не проверенные задачей сжатия сообщения шарда старше даты (по частичному индексу)
+
+        Returns:
+            [(ID сообщения, текст)] - от старых к новым
+        """
+        conn = self._message_connection(shard)
+        cursor = conn.cursor()
         try:
             cursor.execute(
-                "SELECT * FROM messages WHERE contact_id = ? AND message_id = ?",
-                (contact_id, message_id)
+                """SELECT id, text FROM messages
+                   WHERE text_dictionary_id IS NULL AND timestamp < ?
+                   ORDER BY timestamp LIMIT ?""",
+                (before.strftime('%Y-%m-%d %H:%M:%S'), limit)
             )
-            result = cursor.fetchone()
-            if result:
-                message = Message(*result)
-                # Конвертируем строку даты в datetime объект
-                if isinstance(message.timestamp, str):
-                    from datetime import datetime
-                    message.timestamp = datetime.strptime(message.timestamp, '%Y-%m-%d %H:%M:%S')
-                return message
-            return None
+            return cursor.fetchall()
         finally:
             conn.close()
 
+    def archive_messages(self, before: datetime, limit: int = 1000, shard: int = 0) -> int:
+        """
+        Перенос самых старых сообщений шарда (старше даты) в его архив одной транзакцией
+
+        Сообщения переносятся строго по (timestamp, id): архивные сообщения
+        контакта всегда старше оставшихся в основной базе (на это опираются
+        чтения истории с продолжением в архиве).
+
+        Returns:
+            Количество перенесенных сообщений (0 - переносить больше нечего)
+        """
+        conn = self._message_connection(shard, archive=True)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(CREATE_ARCHIVE_MESSAGES_TABLE)
+            for statement in CREATE_ARCHIVE_MESSAGES_INDEXES:
+                cursor.execute(statement)
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)")
+            cursor.execute("DELETE FROM archive_batch")
+            cursor.execute(
+                """INSERT INTO archive_batch (id)
+                   SELECT id FROM main.messages WHERE timestamp < ? ORDER BY timestamp, id LIMIT ?""",
+                (before.strftime('%Y-%m-%d %H:%M:%S'), limit)
+            )
+            moved = cursor.rowcount
+            if moved:
+                cursor.execute(
+                    f"""INSERT INTO archive.messages ({_MESSAGE_COLUMNS})
+                        SELECT {_MESSAGE_COLUMNS} FROM main.messages WHERE id IN (SELECT id FROM archive_batch)"""
+                )
+                cursor.execute("DELETE FROM main.messages WHERE id IN (SELECT id FROM archive_batch)")
+            cursor.execute("DELETE FROM archive_batch")
+            conn.commit()
+            return moved
+        finally:
+            conn.close()
+
+    def store_compressed_messages(self, rows: List[Tuple[int, Optional[bytes], int]], shard: int = 0):
+        """
+        Сохранение результатов сжатия сообщений шарда одной транзакцией
+
+        Args:
+            rows: (ID сообщения, сжатый текст, ID словаря); сжатый текст None -
+                сообщение остается как есть и помечается проверенным
+        """
+        conn = self._message_connection(shard)
+        cursor = conn.cursor()
+        try:
+            cursor.executemany(
+                """UPDATE messages SET text = NULL, text_compressed = ?, text_dictionary_id = ?
+                   WHERE id = ? AND text_dictionary_id IS NULL""",
+                [(data, dictionary_id, message_id) for message_id, data, dictionary_id in rows if data is not None]
+            )
+            cursor.executemany(
+                "UPDATE messages SET text_dictionary_id = ? WHERE id = ? AND text_dictionary_id IS NULL",
+                [(TEXT_NOT_COMPRESSED, message_id) for message_id, data, _ in rows if data is None]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def reshard_messages(self, shards: int, batch_size: int = 1000) -> int:
+        """
+        Перераспределение всех сообщений (и архивных) по новому числу шардов
+
+        Сообщения копируются пачками в файлы новой раскладки с сохранением ID
+        (ссылки /msg_<id> продолжают работать), затем новая раскладка
+        записывается в bot_state и старые файлы очищаются. Копирование
+        идемпотентно, а раскладка меняется только после него, поэтому после
+        сбоя достаточно запустить перераспределение еще раз. Бот на время
+        работы должен быть остановлен.
+
+        Returns:
+            Количество перенесенных сообщений
+        """
+        shards = max(1, shards)
+        if shards == self.message_shards:
+            return 0
+        old_shards = range(self.message_shards)
+        with_archive = any(self.has_archive(shard) for shard in old_shards)
+        new_paths = message_shard_paths(self.db_path, shards)
+
+        targets = []
+        for path in new_paths:
+            conn = sqlite3.connect(path)
+            self._create_messages_schema(conn.cursor())
+            if with_archive:
+                conn.execute("ATTACH DATABASE ? AS archive", (_archive_path(path),))
+                conn.execute(CREATE_ARCHIVE_MESSAGES_TABLE)
+                for statement in CREATE_ARCHIVE_MESSAGES_INDEXES:
+                    conn.execute(statement)
+            conn.commit()
+            targets.append(conn)
+
+        moved = 0
+        last_sequence = 0
+        insert = f"INSERT OR REPLACE INTO {{}}.messages ({_MESSAGE_COLUMNS}) VALUES ({', '.join('?' * 11)})"
+        try:
+            for shard in old_shards:
+                schemas = self._message_schemas(shard)
+                conn = self._message_connection(shard, archive=len(schemas) > 1)
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'messages'")
+                    row = cursor.fetchone()
+                    last_sequence = max(last_sequence, row[0] if row else 0)
+                    for schema in schemas:
+                        last_id = 0
+                        while True:
+                            cursor.execute(
+                                f"SELECT {_MESSAGE_COLUMNS} FROM {schema}.messages WHERE id > ? ORDER BY id LIMIT ?",
+                                (last_id, batch_size)
+                            )
+                            rows = cursor.fetchall()
+                            if not rows:
+                                break
+                            by_shard: Dict[int, List[tuple]] = {}
+                            for row in rows:
+                                by_shard.setdefault((row[1] or 0) % shards, []).append(row)
+                            for target_shard, shard_rows in by_shard.items():
+                                targets[target_shard].executemany(insert.format(schema), shard_rows)
+                                targets[target_shard].commit()
+                            moved += len(rows)
+                            last_id = rows[-1][0]
+                finally:
+                    conn.close()
+
+            # Новые ID в каждом шарде - больше всех выданных до перераспределения
+            for conn in targets:
+                updated = conn.execute(
+                    "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'messages'", (last_sequence,)
+                ).rowcount
+                if not updated:
+                    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('messages', ?)", (last_sequence,))
+                conn.commit()
+        finally:
+            for conn in targets:
+                conn.close()
+
+        self.set_state(MESSAGE_SHARDS_STATE_KEY, str(shards))
+        old_paths, old_archives = self.message_paths, self.archive_paths
+        self._set_message_layout(shards)
+        for path, archive_path in zip(old_paths, old_archives):
+            if path == self.db_path:
+                conn = self.get_connection()
+                try:
+                    conn.execute("DELETE FROM messages")
+                    conn.commit()
+                finally:
+                    conn.close()
+            else:
+                os.remove(path)
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
+
+        logger.info(f"🔀 Сообщения перераспределены по {shards} шардам: {moved}")
+        self.bump_version("messages")
+        return moved
+
     # Методы для работы с администраторами
     def add_admin(self, username: str, telegram_user_id: int) -> int:
         """Добавление нового администратора"""
@@ -364,4 +1188,265 @@ class Database:
             logger.error(f"Ошибка при удалении дубликатов: {e}")
             return 0
         finally:
-            conn.close() 
\ No newline at end of file
+            conn.close()
+
+    def import_contacts_chunk(self, import_id: int, rows: List[Tuple[str, str, Optional[str]]],
+                              rows_read: int, invalid: int = 0, enqueue_telegram: bool = False) -> Tuple[int, int]:
+        """
+        Вставка пачки контактов одной транзакцией
+
+        Номера, уже существующие в базе, пропускаются (поиск по индексу
+        idx_contacts_normalized_phone). Вместе с контактами в той же транзакции
+        сохраняется курсор импорта, поэтому после перезапуска пачка не
+        будет вставлена повторно.
+
+        Args:
+            rows: Список (имя, телефон в формате normalize_phone, примечание)
+            rows_read: Сколько записей файла обработано с учетом этой пачки
+            invalid: Сколько записей пачки отброшено при разборе
+            enqueue_telegram: Поставить новые контакты в очередь импорта в Telegram
+
+        Returns:
+            (вставлено, дубликатов)
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            # Блокировка записи до проверки дубликатов: add_contact бота/юзербота
+            # не может вставить тот же номер между проверкой и вставкой пачки
+            cursor.execute("BEGIN IMMEDIATE")
+            phones = list({phone for _, phone, _ in rows})
+            existing = set()
+            if phones:
+                placeholders = ",".join("?" * len(phones))
+                cursor.execute(f"SELECT normalized_phone FROM contacts WHERE normalized_phone IN ({placeholders})", phones)
+                existing = {row[0] for row in cursor.fetchall()}
+
+            new_rows = []
+            for name, phone, note in rows:
+                if phone in existing:
+                    continue
+                existing.add(phone)
+                new_rows.append((name, phone, note))
+
+            # ID берутся из lastrowid: после удаления последнего контакта AUTOINCREMENT не продолжает MAX(id)
+            new_ids = []
+            for name, phone, note in new_rows:
+                cursor.execute(
+                    "INSERT INTO contacts (name, phone, note, normalized_phone, phone_reversed) VALUES (?, ?, ?, ?, ?)",
+                    (name, phone, note, phone, reverse_digits(phone))
+                )
+                new_ids.append(cursor.lastrowid)
+
+            if enqueue_telegram and new_ids:
+                cursor.executemany(
+                    "INSERT INTO contact_import_jobs (contact_id, name, phone) VALUES (?, ?, ?)",
+                    [(contact_id, name, phone) for contact_id, (name, phone, _) in zip(new_ids, new_rows)]
+                )
+
+            duplicates = len(rows) - len(new_rows)
+            cursor.execute(
+                """UPDATE bulk_imports
+                   SET rows_read = ?, inserted = inserted + ?, duplicates = duplicates + ?,
+                       invalid = invalid + ?, updated_at = CURRENT_TIMESTAMP
+                   WHERE id = ?""",
+                (rows_read, len(new_rows), duplicates, invalid, import_id)
+            )
+            conn.commit()
+            if new_ids:
+                self.bump_version("contacts", new_ids)
+            return len(new_rows), duplicates
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    # Методы для слияния дубликатов контактов
+    def merge_contacts(self, merges: List[ContactMerge]) -> int:
+        """
+        Слияние групп дубликатов одной транзакцией
+
+        Сообщения (в том числе архивные) и задачи импорта источников переносятся на целевой контакт
+        одним проходом по таблицам (через временную таблицу соответствий),
+        целевой контакт получает итоговые поля слияния, источники
+        записываются в журнал contact_merges и удаляются. Группы, контакты
+        которых успели удалить, пропускаются.
+
+        При раскладке сообщений по шардам сообщения переносятся до записи
+        контактов своими транзакциями по шардам (см. _merge_sharded_messages):
+        если запись контактов не удастся, сообщения уже принадлежат целевым
+        контактам, а повторное слияние доделает остальное.
+
+        Returns:
+            Количество перенесенных сообщений
+        """
+        if not merges:
+            return 0
+
+        # При одном шарде сообщения в основной базе и переносятся этой же транзакцией
+        schemas = self._message_schemas() if self.message_shards == 1 else ()
+        conn = self.get_connection()
+        if "archive" in schemas:
+            conn.execute("ATTACH DATABASE ? AS archive", (self.archive_paths[0],))
+        cursor = conn.cursor()
+        try:
+            cursor.execute(_CREATE_MERGE_MAP)
+            cursor.execute("DELETE FROM merge_map")
+            cursor.executemany(
+                "INSERT INTO merge_map (source_id, target_id, reason) VALUES (?, ?, ?)",
+                [(source_id, merge.target_id, merge.reason) for merge in merges for source_id in merge.source_ids]
+            )
+            cursor.execute(
+                """DELETE FROM merge_map
+                   WHERE source_id NOT IN (SELECT id FROM contacts) OR target_id NOT IN (SELECT id FROM contacts)"""
+            )
+
+            if self.message_shards == 1:
+                message_counts = self._reassign_messages(cursor, schemas)
+            else:
+                cursor.execute("SELECT source_id, target_id FROM merge_map")
+                message_counts = self._merge_sharded_messages(cursor.fetchall())
+            cursor.execute(
+                """SELECT m.target_id, c.id, c.name, c.phone, c.note, c.telegram_user_id, m.reason
+                   FROM merge_map m JOIN contacts c ON c.id = m.source_id"""
+            )
+            cursor.executemany(
+                """INSERT INTO contact_merges (target_id, source_id, source_name, source_phone, source_note,
+                                               source_telegram_user_id, reason, messages_moved)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                [row + (message_counts.get(row[1], 0),) for row in cursor.fetchall()]
+            )
+
+            cursor.execute(
+                """UPDATE contact_import_jobs
+                   SET contact_id = (SELECT target_id FROM merge_map WHERE source_id = contact_import_jobs.contact_id)
+                   WHERE contact_id IN (SELECT source_id FROM merge_map)"""
+            )
+
+            cursor.execute("SELECT DISTINCT target_id FROM merge_map")
+            targets = {row[0] for row in cursor.fetchall()}
+            updates = []
+            for merge in merges:
+                if merge.target_id not in targets:
+                    continue
+                synthetic = is_synthetic_phone(merge.phone, merge.telegram_user_id)
+                normalized = None if synthetic else normalize_phone(merge.phone)
+                updates.append((merge.name, merge.phone, merge.note, merge.telegram_user_id,
+                                normalized, int(synthetic), reverse_digits(normalized), merge.target_id))
+            cursor.executemany(
+                """UPDATE contacts SET name = ?, phone = ?, note = ?, telegram_user_id = ?,
+                                       normalized_phone = ?, phone_synthetic = ?, phone_reversed = ?
+                   WHERE id = ?""",
+                updates
+            )
+
+            cursor.execute("SELECT source_id FROM merge_map")
+            sources = [row[0] for row in cursor.fetchall()]
+            cursor.execute("DELETE FROM contacts WHERE id IN (SELECT source_id FROM merge_map)")
+            cursor.execute("DELETE FROM merge_map")
+            conn.commit()
+        finally:
+            conn.close()
+
+        if sources:
+            self.bump_version("contacts", list(targets) + sources)
+            self.bump_version("messages")
+        return sum(message_counts.values())
+
+    @staticmethod
+    def _reassign_messages(cursor, schemas: Iterable[str]) -> Dict[int, int]:
+        """
+        Перенос сообщений источников из merge_map на целевые контакты в схемах соединения
+
+        Returns:
+            {ID источника: сколько сообщений перенесено}
+        """
+        counts: Dict[int, int] = {}
+        for schema in schemas:
+            cursor.execute(
+                f"""SELECT contact_id, COUNT(*) FROM {schema}.messages
+                    WHERE contact_id IN (SELECT source_id FROM merge_map) GROUP BY contact_id"""
+            )
+            for contact_id, count in cursor.fetchall():
+                counts[contact_id] = counts.get(contact_id, 0) + count
+            cursor.execute(
+                f"""UPDATE {schema}.messages
+                    SET contact_id = (SELECT target_id FROM merge_map WHERE source_id = messages.contact_id)
+                    WHERE contact_id IN (SELECT source_id FROM merge_map)"""
+            )
+        return counts
+
+    def _merge_sharded_messages(self, pairs: List[Tuple[int, int]]) -> Dict[int, int]:
+        """
+        Перенос сообщений источников слияния на целевые контакты по шардам
+
+        Сообщения источника из другого шарда сначала переезжают в шард
+        целевого контакта (одной транзакцией для обоих файлов и их архивов),
+        затем в каждом шарде переназначаются на целевые контакты.
+
+        Args:
+            pairs: (ID источника, ID целевого контакта)
+
+        Returns:
+            {ID источника: сколько сообщений перенесено}
+        """
+        moves: Dict[Tuple[int, int], List[int]] = {}
+        by_target_shard: Dict[int, List[Tuple[int, int]]] = {}
+        for source_id, target_id in pairs:
+            source_shard, target_shard = self.message_shard(source_id), self.message_shard(target_id)
+            if source_shard != target_shard:
+                moves.setdefault((source_shard, target_shard), []).append(source_id)
+            by_target_shard.setdefault(target_shard, []).append((source_id, target_id))
+
+        for (source_shard, target_shard), source_ids in moves.items():
+            self._move_contacts_messages(source_ids, source_shard, target_shard)
+
+        counts: Dict[int, int] = {}
+        for shard, shard_pairs in by_target_shard.items():
+            schemas = self._message_schemas(shard)
+            conn = self._message_connection(shard, archive=len(schemas) > 1)
+            cursor = conn.cursor()
+            try:
+                cursor.execute(_CREATE_MERGE_MAP)
+                cursor.execute("DELETE FROM merge_map")
+                cursor.executemany("INSERT INTO merge_map (source_id, target_id) VALUES (?, ?)", shard_pairs)
+                counts.update(self._reassign_messages(cursor, schemas))
+                cursor.execute("DELETE FROM merge_map")
+                conn.commit()
+            finally:
+                conn.close()
+        return counts
+
+    def _move_contacts_messages(self, contact_ids: List[int], source_shard: int, target_shard: int):
+        """Перенос всех сообщений контактов (и архивных) в другой шард одной транзакцией"""
+        source_archive = self.has_archive(source_shard)
+        conn = self._message_connection(target_shard, archive=source_archive)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("ATTACH DATABASE ? AS source", (self.message_paths[source_shard],))
+            tiers = [("main", "source")]
+            if source_archive:
+                cursor.execute("ATTACH DATABASE ? AS source_archive", (self.archive_paths[source_shard],))
+                cursor.execute(CREATE_ARCHIVE_MESSAGES_TABLE)
+                for statement in CREATE_ARCHIVE_MESSAGES_INDEXES:
+                    cursor.execute(statement)
+                tiers.append(("archive", "source_archive"))
+
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS moved_contacts (id INTEGER PRIMARY KEY)")
+            cursor.execute("DELETE FROM moved_contacts")
+            cursor.executemany(
+                "INSERT INTO moved_contacts (id) VALUES (?)",
+                [(contact_id,) for contact_id in contact_ids]
+            )
+            for target, source in tiers:
+                cursor.execute(
+                    f"""INSERT INTO {target}.messages ({_MESSAGE_COLUMNS})
+                        SELECT {_MESSAGE_COLUMNS} FROM {source}.messages
+                        WHERE contact_id IN (SELECT id FROM moved_contacts)"""
+                )
+                cursor.execute(f"DELETE FROM {source}.messages WHERE contact_id IN (SELECT id FROM moved_contacts)")
+            cursor.execute("DELETE FROM moved_contacts")
+            conn.commit()
+        finally:
+            conn.close()
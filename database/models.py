@@ -1,6 +1,7 @@
 import sqlite3
 from datetime import datetime
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import List
 
 @dataclass
 class Contact:
@@ -10,6 +11,9 @@ class Contact:
     note: str = None
     telegram_user_id: int = None
     date_added: datetime = None
+    normalized_phone: str = None  # E.164, ключ поиска по телефону (None у временных номеров)
+    phone_synthetic: bool = False  # временный номер "+<telegram id>" вместо настоящего
+    phone_reversed: str = None  # цифры normalized_phone задом наперед (поиск по окончанию номера)
 
 @dataclass
 class Message:
@@ -21,6 +25,9 @@ class Message:
     media_type: str = 'text'  # 'text', 'photo', 'video', 'document', 'none'
     media_file_id: str = None
     timestamp: datetime = None
+    # Начало текста для списков (история, буфер последних сообщений); "…" в конце - текст обрезан.
+    # В списках text не читается (None), полный текст - Database.get_message
+    preview: str = None
 
 @dataclass
 class Admin:
@@ -29,6 +36,58 @@ class Admin:
     telegram_user_id: int
     date_added: datetime = None
 
+@dataclass
+class TelegramEntity:
+    id: int
+    access_hash: int = None
+    first_name: str = None
+    last_name: str = None
+    username: str = None
+    phone: str = None
+    bot: bool = False
+    date_updated: datetime = None
+
+@dataclass
+class ContactImportJob:
+    id: int
+    contact_id: int
+    name: str
+    phone: str
+    requested_by: int = None  # Telegram ID администратора, которого уведомить
+    status: str = 'pending'  # 'pending', 'done', 'not_found', 'failed'
+    attempts: int = 0
+    telegram_user_id: int = None
+    created_at: datetime = None
+    processed_at: datetime = None
+
+@dataclass
+class BulkImport:
+    id: int
+    source: str  # путь к файлу CSV/vCard
+    file_format: str  # 'csv' или 'vcard'
+    requested_by: int = None
+    status: str = 'running'  # 'running', 'done', 'failed'
+    rows_read: int = 0  # курсор: сколько записей файла уже обработано
+    inserted: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    error: str = None
+    created_at: datetime = None
+    updated_at: datetime = None
+
+@dataclass
+class ContactMerge:
+    """Слияние дубликатов: контакты source_ids переносятся в target_id и удаляются"""
+    target_id: int
+    source_ids: List[int]
+    reason: str  # 'telegram_id', 'phone' или 'name' - по какому ключу найдены дубликаты
+    # Итоговые поля контакта target_id
+    name: str = None
+    phone: str = None
+    note: str = None
+    telegram_user_id: int = None
+    source_names: List[str] = field(default_factory=list)  # для отчета
+
 # SQL запросы для создания таблиц
 CREATE_CONTACTS_TABLE = """
 CREATE TABLE IF NOT EXISTS contacts (
@@ -37,10 +96,20 @@ CREATE TABLE IF NOT EXISTS contacts (
     phone TEXT NOT NULL,
     note TEXT,
     telegram_user_id BIGINT,
-    date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    normalized_phone TEXT,
+    phone_synthetic INTEGER DEFAULT 0,
+    phone_reversed TEXT
 );
 """
 
+# Колонки, добавленные в contacts после первой версии схемы (ALTER TABLE для старых баз)
+CONTACTS_MIGRATIONS = [
+    ("normalized_phone", "TEXT"),
+    ("phone_synthetic", "INTEGER DEFAULT 0"),
+    ("phone_reversed", "TEXT"),
+]
+
 CREATE_MESSAGES_TABLE = """
 CREATE TABLE IF NOT EXISTS messages (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -55,6 +124,65 @@ CREATE TABLE IF NOT EXISTS messages (
 );
 """
 
+# Колонки, добавленные в messages после первой версии схемы
+MESSAGES_MIGRATIONS = [
+    ("preview", "TEXT"),
+    # Холодное хранение: сжатый текст (text при этом NULL) и словарь сжатия
+    ("text_compressed", "BLOB"),
+    ("text_dictionary_id", "INTEGER"),
+]
+
+# text_dictionary_id сообщения, проверенного задачей сжатия и оставленного как есть
+# (короткий текст или медиа); NULL - сообщение еще не проверялось
+TEXT_NOT_COMPRESSED = 0
+
+# История контакта по страницам: (timestamp, id) внутри контакта - один диапазон индекса.
+# Индекс покрывающий: списки и счетчики сообщений читаются из него, не затрагивая
+# строки таблицы с полным текстом
+CREATE_MESSAGES_INDEXES = [
+    "DROP INDEX IF EXISTS idx_messages_contact_timestamp;",
+    "CREATE INDEX IF NOT EXISTS idx_messages_history "
+    "ON messages (contact_id, timestamp, id, direction, media_type, preview);",
+    # Выбор сообщений для переноса в архив (самые старые)
+    "CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp);",
+    # Еще не проверенные задачей сжатия сообщения (частичный индекс: сжатые из него выпадают)
+    "CREATE INDEX IF NOT EXISTS idx_messages_uncompressed ON messages (timestamp) WHERE text_dictionary_id IS NULL;",
+]
+
+# Архив старых сообщений - отдельный файл, подключаемый к соединению как схема archive.
+# Колонки те же, что у messages (ID сохраняются), сжатый текст переносится как есть
+CREATE_ARCHIVE_MESSAGES_TABLE = """
+CREATE TABLE IF NOT EXISTS archive.messages (
+    id INTEGER PRIMARY KEY,
+    contact_id INTEGER,
+    message_id BIGINT,
+    direction TEXT,
+    text TEXT,
+    media_type TEXT,
+    media_file_id TEXT,
+    timestamp TIMESTAMP,
+    preview TEXT,
+    text_compressed BLOB,
+    text_dictionary_id INTEGER
+);
+"""
+
+CREATE_ARCHIVE_MESSAGES_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS archive.idx_messages_history "
+    "ON messages (contact_id, timestamp, id, direction, media_type, preview);",
+    "CREATE INDEX IF NOT EXISTS archive.idx_messages_timestamp ON messages (timestamp);",
+]
+
+# Общие словари zlib для сжатия текста старых сообщений (не удаляются: на них ссылаются сообщения)
+CREATE_COMPRESSION_DICTIONARIES_TABLE = """
+CREATE TABLE IF NOT EXISTS compression_dictionaries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    data BLOB NOT NULL,
+    samples INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
 CREATE_ADMINS_TABLE = """
 CREATE TABLE IF NOT EXISTS admins (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -62,4 +190,173 @@ CREATE TABLE IF NOT EXISTS admins (
     telegram_user_id BIGINT NOT NULL,
     date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
-""" 
\ No newline at end of file
+""" 
+CREATE_BOT_STATE_TABLE = """
+CREATE TABLE IF NOT EXISTS bot_state (
+    key TEXT PRIMARY KEY,
+    value TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+CREATE_PROCESSED_UPDATES_TABLE = """
+CREATE TABLE IF NOT EXISTS processed_updates (
+    update_id BIGINT PRIMARY KEY,
+    processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Полученные, но еще не обработанные обновления Bot API (JSON): offset подтверждает
+# их Telegram сразу, а после рестарта они дообрабатываются отсюда
+CREATE_PENDING_UPDATES_TABLE = """
+CREATE TABLE IF NOT EXISTS pending_updates (
+    update_id BIGINT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+CREATE_TELEGRAM_ENTITIES_TABLE = """
+CREATE TABLE IF NOT EXISTS telegram_entities (
+    id BIGINT PRIMARY KEY,
+    access_hash BIGINT,
+    first_name TEXT,
+    last_name TEXT,
+    username TEXT,
+    phone TEXT,
+    bot INTEGER DEFAULT 0,
+    date_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+CREATE_CONVERSATION_STATES_TABLE = """
+CREATE TABLE IF NOT EXISTS conversation_states (
+    namespace TEXT NOT NULL,
+    user_id BIGINT NOT NULL,
+    value TEXT,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, user_id)
+);
+"""
+
+CREATE_CONTACT_IMPORT_JOBS_TABLE = """
+CREATE TABLE IF NOT EXISTS contact_import_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    contact_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    requested_by BIGINT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER DEFAULT 0,
+    telegram_user_id BIGINT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP,
+    FOREIGN KEY (contact_id) REFERENCES contacts (id)
+);
+"""
+
+CREATE_CONTACT_IMPORT_JOBS_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_contact_import_jobs_status ON contact_import_jobs (status, id);",
+    "CREATE INDEX IF NOT EXISTS idx_contact_import_jobs_processed ON contact_import_jobs (processed_at);",
+]
+
+CREATE_BULK_IMPORTS_TABLE = """
+CREATE TABLE IF NOT EXISTS bulk_imports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    file_format TEXT NOT NULL,
+    requested_by BIGINT,
+    status TEXT NOT NULL DEFAULT 'running',
+    rows_read INTEGER DEFAULT 0,
+    inserted INTEGER DEFAULT 0,
+    duplicates INTEGER DEFAULT 0,
+    invalid INTEGER DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Журнал слияний дубликатов (удаленный контакт сохраняется для разбора ошибочных слияний)
+CREATE_CONTACT_MERGES_TABLE = """
+CREATE TABLE IF NOT EXISTS contact_merges (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    target_id INTEGER NOT NULL,
+    source_id INTEGER NOT NULL,
+    source_name TEXT,
+    source_phone TEXT,
+    source_note TEXT,
+    source_telegram_user_id BIGINT,
+    reason TEXT NOT NULL,
+    messages_moved INTEGER DEFAULT 0,
+    merged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Поиск контактов по нормализованному телефону (в том числе дубликатов при импорте)
+CREATE_CONTACTS_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_contacts_normalized_phone ON contacts (normalized_phone);",
+    "CREATE INDEX IF NOT EXISTS idx_contacts_phone_reversed ON contacts (phone_reversed);",
+]
+
+# PostgreSQL (STORAGE_BACKEND = "postgres"): общие для всех узлов таблицы контактов,
+# сообщений, администраторов и журнала слияний. Колонки в том же порядке, что в
+# SQLite; время - UTC без часового пояса с точностью до секунды, как CURRENT_TIMESTAMP.
+# Телефоны сравниваются побайтно (COLLATE "C") - поиск по префиксу идет диапазоном индекса
+POSTGRES_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS contacts (
+        id BIGSERIAL PRIMARY KEY,
+        name TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        note TEXT,
+        telegram_user_id BIGINT,
+        date_added TIMESTAMP(0) DEFAULT (now() AT TIME ZONE 'utc'),
+        normalized_phone TEXT COLLATE "C",
+        phone_synthetic BOOLEAN DEFAULT FALSE,
+        phone_reversed TEXT COLLATE "C"
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_contacts_normalized_phone ON contacts (normalized_phone)",
+    "CREATE INDEX IF NOT EXISTS idx_contacts_phone_reversed ON contacts (phone_reversed)",
+    "CREATE INDEX IF NOT EXISTS idx_contacts_telegram_user_id ON contacts (telegram_user_id)",
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        id BIGSERIAL PRIMARY KEY,
+        contact_id BIGINT,
+        message_id BIGINT,
+        direction TEXT CHECK(direction IN ('incoming', 'outgoing')),
+        text TEXT,
+        media_type TEXT DEFAULT 'text',
+        media_file_id TEXT,
+        timestamp TIMESTAMP(0) DEFAULT (now() AT TIME ZONE 'utc'),
+        preview TEXT
+    )
+    """,
+    # Страницы истории - только из индекса (как idx_messages_history в SQLite)
+    "CREATE INDEX IF NOT EXISTS idx_messages_history "
+    "ON messages (contact_id, timestamp, id) INCLUDE (direction, media_type, preview)",
+    "CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp)",
+    """
+    CREATE TABLE IF NOT EXISTS admins (
+        id BIGSERIAL PRIMARY KEY,
+        username TEXT NOT NULL,
+        telegram_user_id BIGINT NOT NULL,
+        date_added TIMESTAMP(0) DEFAULT (now() AT TIME ZONE 'utc')
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS contact_merges (
+        id BIGSERIAL PRIMARY KEY,
+        target_id BIGINT NOT NULL,
+        source_id BIGINT NOT NULL,
+        source_name TEXT,
+        source_phone TEXT,
+        source_note TEXT,
+        source_telegram_user_id BIGINT,
+        reason TEXT NOT NULL,
+        messages_moved INTEGER DEFAULT 0,
+        merged_at TIMESTAMP(0) DEFAULT (now() AT TIME ZONE 'utc')
+    )
+    """,
+]
@@ -0,0 +1,411 @@
+"""
+Служебное состояние узла бота в SQLite
+"""
+
+import sqlite3
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from .models import TelegramEntity, ContactImportJob, BulkImport
+from .models import CREATE_BOT_STATE_TABLE, CREATE_PROCESSED_UPDATES_TABLE, CREATE_PENDING_UPDATES_TABLE
+from .models import CREATE_TELEGRAM_ENTITIES_TABLE, CREATE_CONVERSATION_STATES_TABLE
+from .models import CREATE_CONTACT_IMPORT_JOBS_TABLE, CREATE_CONTACT_IMPORT_JOBS_INDEXES, CREATE_BULK_IMPORTS_TABLE
+
+
+class NodeState:
+    """
+    Служебное состояние одного узла бота/юзербота
+
+    Курсоры и журнал обновлений Bot API, кэш сущностей Telegram,
+    состояния диалогов, очередь импорта контактов в Telegram и курсоры
+    массового импорта. Это состояние относится к узлу, а не к данным CRM,
+    поэтому всегда хранится в его SQLite базе: Database (SQLite) держит
+    его в той же базе, что и контакты, PostgresDatabase - в отдельной
+    SQLite базе узла.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        conn = self.get_connection()
+        try:
+            self._create_node_tables(conn.cursor())
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_connection(self):
+        return sqlite3.connect(self.db_path)
+
+    @staticmethod
+    def _create_node_tables(cursor):
+        cursor.execute(CREATE_BOT_STATE_TABLE)
+        cursor.execute(CREATE_PROCESSED_UPDATES_TABLE)
+        cursor.execute(CREATE_PENDING_UPDATES_TABLE)
+        cursor.execute(CREATE_TELEGRAM_ENTITIES_TABLE)
+        cursor.execute(CREATE_CONVERSATION_STATES_TABLE)
+        cursor.execute(CREATE_CONTACT_IMPORT_JOBS_TABLE)
+        cursor.execute(CREATE_BULK_IMPORTS_TABLE)
+        for statement in CREATE_CONTACT_IMPORT_JOBS_INDEXES:
+            cursor.execute(statement)
+
+    # Методы для служебного состояния бота
+    def get_state(self, key: str, default: str = None) -> Optional[str]:
+        """Получение значения служебного параметра"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT value FROM bot_state WHERE key = ?", (key,))
+            result = cursor.fetchone()
+            return result[0] if result else default
+        finally:
+            conn.close()
+
+    def set_state(self, key: str, value: str):
+        """Сохранение значения служебного параметра"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """INSERT INTO bot_state (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+                   ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at""",
+                (key, value)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def mark_update_processed(self, update_id: int):
+        """Отметка обновления Bot API как обработанного (и удаление из очереди необработанных)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "INSERT OR IGNORE INTO processed_updates (update_id) VALUES (?)",
+                (update_id,)
+            )
+            cursor.execute("DELETE FROM pending_updates WHERE update_id = ?", (update_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def save_pending_updates(self, updates: List[Tuple[int, str]]):
+        """Сохранение полученных обновлений (update_id, JSON) до их обработки"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.executemany("INSERT OR IGNORE INTO pending_updates (update_id, payload) VALUES (?, ?)", updates)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_pending_updates(self) -> List[Tuple[int, str]]:
+        """Полученные, но не обработанные обновления (update_id, JSON) по порядку"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT update_id, payload FROM pending_updates ORDER BY update_id")
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def get_processed_update_ids(self, min_update_id: int) -> set:
+        """Получение ID уже обработанных обновлений начиная с min_update_id"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT update_id FROM processed_updates WHERE update_id >= ?",
+                (min_update_id,)
+            )
+            return {row[0] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+    def prune_processed_updates(self, below_update_id: int) -> int:
+        """Удаление записей об обновлениях, подтвержденных через offset"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM processed_updates WHERE update_id < ?", (below_update_id,))
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    # Методы для кэша сущностей Telegram
+    def save_telegram_entity(self, entity: TelegramEntity):
+        """Сохранение (обновление) сущности Telegram в кэше"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """INSERT OR REPLACE INTO telegram_entities
+                   (id, access_hash, first_name, last_name, username, phone, bot, date_updated)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)""",
+                (entity.id, entity.access_hash, entity.first_name, entity.last_name,
+                 entity.username, entity.phone, int(bool(entity.bot)))
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_telegram_entity(self, entity_id: int) -> Optional[TelegramEntity]:
+        """Получение сущности Telegram из кэша по ID"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT * FROM telegram_entities WHERE id = ?", (entity_id,))
+            result = cursor.fetchone()
+            if result:
+                entity = TelegramEntity(*result)
+                entity.bot = bool(entity.bot)
+                if isinstance(entity.date_updated, str):
+                    entity.date_updated = datetime.strptime(entity.date_updated, '%Y-%m-%d %H:%M:%S')
+                return entity
+            return None
+        finally:
+            conn.close()
+
+    # Методы для состояний диалогов с администраторами
+    def save_conversation_state(self, namespace: str, user_id: int, value: str, expires_at: float):
+        """Сохранение состояния диалога пользователя"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """INSERT OR REPLACE INTO conversation_states (namespace, user_id, value, expires_at)
+                   VALUES (?, ?, ?, ?)""",
+                (namespace, user_id, value, expires_at)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def delete_conversation_state(self, namespace: str, user_id: int):
+        """Удаление состояния диалога пользователя"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "DELETE FROM conversation_states WHERE namespace = ? AND user_id = ?",
+                (namespace, user_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_conversation_states(self, namespace: str, now: float) -> List[Tuple[int, str, float]]:
+        """Получение неистекших состояний диалогов (user_id, value, expires_at)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """SELECT user_id, value, expires_at FROM conversation_states
+                   WHERE namespace = ? AND expires_at > ? ORDER BY expires_at""",
+                (namespace, now)
+            )
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def prune_conversation_states(self, now: float) -> int:
+        """Удаление истекших состояний диалогов"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM conversation_states WHERE expires_at <= ?", (now,))
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    # Методы для очереди импорта контактов в Telegram
+    def add_contact_import_job(self, contact_id: int, name: str, phone: str, requested_by: int = None) -> int:
+        """Постановка контакта в очередь импорта (повторно не добавляется, пока ожидает)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT id FROM contact_import_jobs WHERE contact_id = ? AND status = 'pending'",
+                (contact_id,)
+            )
+            result = cursor.fetchone()
+            if result:
+                return result[0]
+
+            cursor.execute(
+                """INSERT INTO contact_import_jobs (contact_id, name, phone, requested_by)
+                   VALUES (?, ?, ?, ?)""",
+                (contact_id, name, phone, requested_by)
+            )
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+    def get_pending_contact_imports(self, limit: int) -> List[ContactImportJob]:
+        """Получение ожидающих импорта контактов в порядке постановки"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT * FROM contact_import_jobs WHERE status = 'pending' ORDER BY id LIMIT ?",
+                (limit,)
+            )
+            return [ContactImportJob(*row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def get_pending_contact_imports_count(self) -> int:
+        """Количество контактов в очереди импорта"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT COUNT(*) FROM contact_import_jobs WHERE status = 'pending'")
+            return cursor.fetchone()[0]
+        finally:
+            conn.close()
+
+    def count_contact_imports_since(self, seconds: int) -> int:
+        """Количество номеров, отправленных в Telegram за последние seconds секунд"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """SELECT COUNT(*) FROM contact_import_jobs
+                   WHERE status IN ('done', 'not_found') AND processed_at >= datetime('now', ?)""",
+                (f"-{int(seconds)} seconds",)
+            )
+            return cursor.fetchone()[0]
+        finally:
+            conn.close()
+
+    def finish_contact_import(self, job_id: int, status: str, telegram_user_id: int = None):
+        """Завершение задачи импорта ('done' или 'not_found')"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """UPDATE contact_import_jobs
+                   SET status = ?, telegram_user_id = ?, processed_at = CURRENT_TIMESTAMP,
+                       attempts = attempts + 1
+                   WHERE id = ?""",
+                (status, telegram_user_id, job_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def fail_contact_import_attempt(self, job_id: int, max_attempts: int) -> bool:
+        """
+        Отметка неудачной попытки импорта
+
+        Returns:
+            True, если попытки исчерпаны и задача помечена как 'failed'
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """UPDATE contact_import_jobs
+                   SET attempts = attempts + 1,
+                       status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END,
+                       processed_at = CASE WHEN attempts + 1 >= ? THEN CURRENT_TIMESTAMP ELSE NULL END
+                   WHERE id = ?""",
+                (max_attempts, max_attempts, job_id)
+            )
+            cursor.execute("SELECT status FROM contact_import_jobs WHERE id = ?", (job_id,))
+            result = cursor.fetchone()
+            conn.commit()
+            return bool(result) and result[0] == 'failed'
+        finally:
+            conn.close()
+
+    # Методы для массового импорта контактов из файлов
+    def create_bulk_import(self, source: str, file_format: str, requested_by: int = None) -> int:
+        """Регистрация массового импорта файла"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "INSERT INTO bulk_imports (source, file_format, requested_by) VALUES (?, ?, ?)",
+                (source, file_format, requested_by)
+            )
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+    def get_bulk_import(self, import_id: int) -> Optional[BulkImport]:
+        """Получение массового импорта по ID"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT * FROM bulk_imports WHERE id = ?", (import_id,))
+            result = cursor.fetchone()
+            return BulkImport(*result) if result else None
+        finally:
+            conn.close()
+
+    def get_unfinished_bulk_imports(self) -> List[BulkImport]:
+        """Массовые импорты, прерванные перезапуском"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT * FROM bulk_imports WHERE status = 'running' ORDER BY id")
+            return [BulkImport(*row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def enqueue_contact_imports(self, contacts: List[Tuple[int, str, str]]):
+        """Постановка новых контактов (id, имя, телефон) в очередь импорта в Telegram"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.executemany("INSERT INTO contact_import_jobs (contact_id, name, phone) VALUES (?, ?, ?)", contacts)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def reassign_contact_imports(self, pairs: List[Tuple[int, int]]):
+        """Перенос задач импорта с удаленных при слиянии контактов на целевые: (источник, цель)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.executemany(
+                "UPDATE contact_import_jobs SET contact_id = ? WHERE contact_id = ?",
+                [(target_id, source_id) for source_id, target_id in pairs]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def record_bulk_import_chunk(self, import_id: int, rows_read: int, inserted: int, duplicates: int,
+                                 invalid: int = 0):
+        """Продвижение курсора массового импорта после вставки пачки"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """UPDATE bulk_imports
+                   SET rows_read = ?, inserted = inserted + ?, duplicates = duplicates + ?,
+                       invalid = invalid + ?, updated_at = CURRENT_TIMESTAMP
+                   WHERE id = ?""",
+                (rows_read, inserted, duplicates, invalid, import_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def finish_bulk_import(self, import_id: int, status: str, error: str = None):
+        """Завершение массового импорта ('done' или 'failed')"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "UPDATE bulk_imports SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (status, error, import_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
@@ -0,0 +1,721 @@
+"""
+Хранилище контактов, сообщений и администраторов в PostgreSQL (asyncpg)
+"""
+
+import asyncio
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import asyncpg
+from loguru import logger
+
+import Config
+from .db import MIN_PHONE_SEARCH_DIGITS, _is_phone_token, _parse_timestamp, _prefix_upper_bound
+from .db import SEARCH_RANK_NAME_PREFIX, SEARCH_RANK_PHONE_EXACT, SEARCH_RANK_PHONE_INFIX
+from .db import SEARCH_RANK_PHONE_PREFIX, SEARCH_RANK_PHONE_SUFFIX, SEARCH_RANK_TEXT, message_preview
+from .models import Admin, BulkImport, Contact, ContactImportJob, ContactMerge, Message, TelegramEntity
+from .models import POSTGRES_SCHEMA
+from .node_state import NodeState
+from .storage import Storage
+from utils.phone import normalize_phone, is_synthetic_phone, reverse_digits, search_prefixes
+
+# Канал уведомлений об изменениях для других узлов: "<узел>:<таблица>:<ID через запятую или *>"
+CHANGES_CHANNEL = "crm_changes"
+
+# Ограничение PostgreSQL на размер уведомления - 8000 байт; длинные списки ID заменяются на "*"
+_MAX_NOTIFY_PAYLOAD = 7000
+
+# Ключ pg_advisory_xact_lock: узлы, запущенные одновременно, создают схему по очереди
+_SCHEMA_LOCK_KEY = 4_180_201
+
+_CONTACT_COLUMNS = "id, name, phone, note, telegram_user_id, date_added, normalized_phone, phone_synthetic, phone_reversed"
+_MESSAGE_COLUMNS = "id, contact_id, message_id, direction, text, media_type, media_file_id, timestamp, preview"
+# Для списков (как в SQLite): только поля из индекса idx_messages_history
+_MESSAGE_LIST_COLUMNS = "id, contact_id, NULL, direction, NULL, media_type, NULL, timestamp, preview"
+
+
+class PostgresDatabase(Storage):
+    """
+    Контакты, сообщения и администраторы в общей базе PostgreSQL
+
+    С одной базой могут работать несколько узлов бота/юзербота. Служебное
+    состояние узла (курсоры обновлений, очереди импорта, состояния
+    диалогов, кэш сущностей Telegram) хранится в SQLite базе узла -
+    методы NodeState передаются объекту self.node. Других методов
+    Database (сжатие, архив, шарды сообщений) здесь нет.
+
+    Интерфейс синхронный, как у Database: запросы выполняются в отдельном
+    потоке со своим циклом событий asyncio, вызывающий поток ждет
+    результат. Соединения берутся из пула asyncpg (DB_POOL_SIZE); asyncpg
+    подготавливает каждый запрос один раз на соединение и кэширует
+    (POSTGRES_STATEMENT_CACHE_SIZE), поэтому запросы написаны с
+    постоянным текстом и параметрами. Массовый импорт контактов
+    загружается через COPY.
+
+    Изменения публикуются через NOTIFY: другие узлы получают их через
+    LISTEN и обновляют кэши в памяти так же, как при своих изменениях
+    (bump_version и подписчики новых сообщений).
+    """
+
+    def __init__(self, dsn: str, db_path: str = "telegram_crm.db"):
+        super().__init__()
+        self.dsn = dsn
+        self.node = NodeState(db_path)
+        # Свои уведомления узел получает тоже - они пропускаются по ID узла
+        self.node_id = uuid.uuid4().hex[:12]
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="postgres", daemon=True).start()
+
+        # Пул создается внутри цикла: конструктор Pool берет текущий цикл потока
+        async def create_pool():
+            return await asyncpg.create_pool(
+                dsn,
+                min_size=1,
+                max_size=Config.DB_POOL_SIZE,
+                command_timeout=Config.DB_TIMEOUT,
+                statement_cache_size=Config.POSTGRES_STATEMENT_CACHE_SIZE,
+            )
+        self.pool = self._run(create_pool())
+        self._listener = None
+        self.init_db()
+
+    def _run(self, coroutine):
+        """Выполнение корутины в цикле событий PostgreSQL с ожиданием результата"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def _transaction(self, func):
+        """Вызов func(conn) в транзакции на соединении из пула"""
+        async def run():
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    return await func(conn)
+        return self._run(run())
+
+    def _fetch(self, query: str, *args) -> list:
+        return self._run(self.pool.fetch(query, *args))
+
+    def _fetchrow(self, query: str, *args):
+        return self._run(self.pool.fetchrow(query, *args))
+
+    def _fetchval(self, query: str, *args):
+        return self._run(self.pool.fetchval(query, *args))
+
+    def _execute(self, query: str, *args) -> str:
+        return self._run(self.pool.execute(query, *args))
+
+    def close(self):
+        """Закрытие пула соединений и подписки на уведомления"""
+        async def close():
+            if self._listener is not None:
+                await self._listener.close()
+            await self.pool.close()
+        self._run(close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def init_db(self):
+        """Общие таблицы в PostgreSQL и подписка на изменения других узлов"""
+        self._transaction(self._create_schema)
+        if self._listener is None:
+            self._run(self._listen())
+        logger.info("База данных PostgreSQL успешно инициализирована")
+
+    @staticmethod
+    async def _create_schema(conn):
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", _SCHEMA_LOCK_KEY)
+        for statement in POSTGRES_SCHEMA:
+            await conn.execute(statement)
+
+    # Уведомления об изменениях между узлами
+    def _payload(self, table: str, ids: Iterable[int] = None) -> str:
+        payload = f"{self.node_id}:{table}:{'*' if ids is None else ','.join(map(str, ids))}"
+        return payload if len(payload) <= _MAX_NOTIFY_PAYLOAD else f"{self.node_id}:{table}:*"
+
+    async def _publish(self, conn, table: str, ids: Iterable[int] = None):
+        """Уведомление других узлов (доставляется при фиксации транзакции conn)"""
+        await conn.execute("SELECT pg_notify($1, $2)", CHANGES_CHANNEL, self._payload(table, ids))
+
+    async def _listen(self):
+        self._listener = await asyncpg.connect(self.dsn)
+        self._listener.add_termination_listener(
+            lambda conn: logger.warning("⚠️ Подписка на изменения PostgreSQL прервана: кэши других узлов не обновляются")
+        )
+        await self._listener.add_listener(CHANGES_CHANNEL, self._on_change)
+
+    def _on_change(self, conn, pid: int, channel: str, payload: str):
+        node_id, table, ids = payload.split(":", 2)
+        if node_id == self.node_id:
+            return
+        ids = None if ids == "*" else [int(value) for value in ids.split(",") if value]
+        if table == "message":
+            # Новое сообщение на другом узле - в буферы последних сообщений, как свое
+            self._loop.create_task(self._receive_messages(ids))
+        else:
+            self.bump_version(table, ids)
+
+    async def _receive_messages(self, ids: List[int]):
+        try:
+            rows = await self.pool.fetch(
+                f"SELECT {_MESSAGE_COLUMNS} FROM messages WHERE id = ANY($1::bigint[]) ORDER BY id", ids
+            )
+            for row in rows:
+                self._notify_message(Message(*row))
+        except Exception as e:
+            logger.error(f"Ошибка при получении сообщений другого узла: {e}")
+            self.bump_version("messages")
+
+    # Методы для работы с контактами
+    def add_contact(self, name: str, phone: str, note: str = None, telegram_user_id: int = None,
+                    synthetic: bool = False) -> int:
+        """
+        Добавление нового контакта
+
+        Args:
+            synthetic: phone - временный номер, а не настоящий (не участвует в поиске по телефону)
+        """
+        normalized = None if synthetic else normalize_phone(phone)
+
+        async def insert(conn):
+            contact_id = await conn.fetchval(
+                """INSERT INTO contacts (name, phone, note, telegram_user_id, normalized_phone, phone_synthetic,
+                                         phone_reversed)
+                   VALUES ($1, $2, $3, $4, $5, $6, $7) RETURNING id""",
+                name, phone, note, telegram_user_id, normalized, synthetic, reverse_digits(normalized)
+            )
+            await self._publish(conn, "contacts", [contact_id])
+            return contact_id
+
+        contact_id = self._transaction(insert)
+        self.bump_version("contacts", [contact_id])
+        logger.info(f"➕ Контакт добавлен в базу: {name} ({phone}) [ID: {contact_id}]")
+        return contact_id
+
+    def get_contact(self, contact_id: int) -> Optional[Contact]:
+        """Получение контакта по ID"""
+        row = self._fetchrow(f"SELECT {_CONTACT_COLUMNS} FROM contacts WHERE id = $1", contact_id)
+        return Contact(*row) if row else None
+
+    def get_contacts_by_ids(self, contact_ids: List[int]) -> List[Contact]:
+        """Получение контактов по списку ID (в порядке списка, отсутствующие пропускаются)"""
+        if not contact_ids:
+            return []
+        rows = self._fetch(
+            f"SELECT {_CONTACT_COLUMNS} FROM contacts WHERE id = ANY($1::bigint[])", list(contact_ids)
+        )
+        contacts = {row["id"]: Contact(*row) for row in rows}
+        return [contacts[contact_id] for contact_id in contact_ids if contact_id in contacts]
+
+    def get_contact_by_phone(self, phone: str) -> Optional[Contact]:
+        """Получение контакта по номеру телефона в любом написании (по normalized_phone)"""
+        normalized = normalize_phone(phone)
+        if normalized is None:
+            return None
+        row = self._fetchrow(
+            f"SELECT {_CONTACT_COLUMNS} FROM contacts WHERE normalized_phone = $1 ORDER BY id LIMIT 1", normalized
+        )
+        return Contact(*row) if row else None
+
+    def get_contact_by_telegram_id(self, telegram_user_id: int) -> Optional[Contact]:
+        """Получение контакта по Telegram ID"""
+        row = self._fetchrow(
+            f"SELECT {_CONTACT_COLUMNS} FROM contacts WHERE telegram_user_id = $1 ORDER BY id LIMIT 1",
+            telegram_user_id
+        )
+        return Contact(*row) if row else None
+
+    def get_recent_contacts(self, limit: int = 10) -> List[Contact]:
+        """Получение последних контактов"""
+        rows = self._fetch(f"SELECT {_CONTACT_COLUMNS} FROM contacts ORDER BY date_added DESC, id DESC LIMIT $1", limit)
+        return [Contact(*row) for row in rows]
+
+    def get_all_contacts(self, limit: int = 50, offset: int = 0) -> List[Contact]:
+        """Получение всех контактов с пагинацией"""
+        # Побайтное сравнение имен - тот же порядок, что в SQLite
+        rows = self._fetch(
+            f'SELECT {_CONTACT_COLUMNS} FROM contacts ORDER BY name COLLATE "C", id LIMIT $1 OFFSET $2',
+            limit, offset
+        )
+        return [Contact(*row) for row in rows]
+
+    def _update_contact(self, contact_id: int, query: str, *args):
+        async def update(conn):
+            await conn.execute(query, *args)
+            await self._publish(conn, "contacts", [contact_id])
+
+        self._transaction(update)
+        self.bump_version("contacts", [contact_id])
+
+    def update_contact(self, contact_id: int, name: str = None, phone: str = None, note: str = None):
+        """Обновление контакта"""
+        updates = []
+        args = []
+        if name is not None:
+            args.append(name)
+            updates.append(f"name = ${len(args)}")
+        if phone is not None:
+            normalized = normalize_phone(phone)
+            args.extend([phone, normalized, reverse_digits(normalized)])
+            updates.append(f"phone = ${len(args) - 2}, normalized_phone = ${len(args) - 1}, "
+                           f"phone_reversed = ${len(args)}, phone_synthetic = FALSE")
+        if note is not None:
+            args.append(note)
+            updates.append(f"note = ${len(args)}")
+
+        if updates:
+            args.append(contact_id)
+            self._update_contact(contact_id, f"UPDATE contacts SET {', '.join(updates)} WHERE id = ${len(args)}", *args)
+
+    def update_contact_telegram_id(self, contact_id: int, telegram_user_id: int):
+        """Обновление Telegram ID контакта"""
+        self._update_contact(
+            contact_id, "UPDATE contacts SET telegram_user_id = $1 WHERE id = $2", telegram_user_id, contact_id
+        )
+
+    def delete_contact(self, contact_id: int):
+        """Удаление контакта"""
+        self._update_contact(contact_id, "DELETE FROM contacts WHERE id = $1", contact_id)
+
+    def search_contacts(self, query: str, limit: int = 100) -> List[Contact]:
+        """
+        Поиск контактов по имени, телефону или примечанию с ранжированием
+
+        Те же правила, что у Database.search_contacts; имя и примечание
+        сравниваются без учета регистра (ILIKE) для любых букв.
+        """
+        text = " ".join(token for token in query.split() if not _is_phone_token(token))
+        digits = "".join(ch for token in query.split() if _is_phone_token(token) for ch in token if ch.isdigit())
+        if len(digits) < MIN_PHONE_SEARCH_DIGITS:
+            text, digits = query.strip(), ""
+
+        args = []
+
+        def arg(value) -> str:
+            args.append(value)
+            return f"${len(args)}"
+
+        parts = []
+        if digits:
+            normalized = normalize_phone(digits)
+            if normalized:
+                parts.append(f"SELECT id, {SEARCH_RANK_PHONE_EXACT} FROM contacts WHERE normalized_phone = {arg(normalized)}")
+            reversed_digits = digits[::-1]
+            parts.append(
+                f"SELECT id, {SEARCH_RANK_PHONE_SUFFIX} FROM contacts "
+                f"WHERE phone_reversed >= {arg(reversed_digits)} AND phone_reversed < {arg(_prefix_upper_bound(reversed_digits))}"
+            )
+            for prefix in search_prefixes(digits):
+                parts.append(
+                    f"SELECT id, {SEARCH_RANK_PHONE_PREFIX} FROM contacts "
+                    f"WHERE normalized_phone >= {arg(prefix)} AND normalized_phone < {arg(_prefix_upper_bound(prefix))}"
+                )
+        elif text:
+            parts.append(f"SELECT id, {SEARCH_RANK_NAME_PREFIX} FROM contacts WHERE name ILIKE {arg(f'{text}%')}")
+            pattern = arg(f"%{text}%")
+            parts.append(
+                f"SELECT id, {SEARCH_RANK_TEXT} FROM contacts "
+                f"WHERE name ILIKE {pattern} OR note ILIKE {pattern} OR phone ILIKE {pattern}"
+            )
+        else:
+            return []
+
+        rows = self._fetch(self._ranked_search_sql(parts, text if digits else None, arg, limit), *args)
+        if digits and not rows:
+            args.clear()
+            parts = [f"SELECT id, {SEARCH_RANK_PHONE_INFIX} FROM contacts WHERE normalized_phone LIKE {arg(f'%{digits}%')}"]
+            rows = self._fetch(self._ranked_search_sql(parts, text, arg, limit), *args)
+        return [Contact(*row) for row in rows]
+
+    @staticmethod
+    def _ranked_search_sql(parts: List[str], text: Optional[str], arg, limit: int) -> str:
+        """Объединение подзапросов (id, ранг) в одну выдачу по лучшему рангу"""
+        text_filter = ""
+        if text:
+            pattern = arg(f"%{text}%")
+            text_filter = f"WHERE c.name ILIKE {pattern} OR c.note ILIKE {pattern}"
+        columns = ", ".join(f"c.{column}" for column in _CONTACT_COLUMNS.split(", "))
+        return f"""
+            WITH hits(id, rank) AS ({" UNION ALL ".join(parts)})
+            SELECT {columns} FROM contacts c
+            JOIN (SELECT id, MIN(rank) AS rank FROM hits GROUP BY id) h ON h.id = c.id
+            {text_filter}
+            ORDER BY h.rank, c.name COLLATE "C"
+            LIMIT {arg(limit)}
+        """
+
+    def get_contacts_count(self) -> int:
+        """Получение общего количества контактов"""
+        return self._fetchval("SELECT COUNT(*) FROM contacts")
+
+    def iter_contacts(self, batch_size: int = 1000) -> Iterator[Contact]:
+        """Потоковый обход всех контактов в порядке добавления (пачками с продолжением по id)"""
+        last_id = 0
+        while True:
+            rows = self._fetch(
+                f"SELECT {_CONTACT_COLUMNS} FROM contacts WHERE id > $1 ORDER BY id LIMIT $2", last_id, batch_size
+            )
+            if not rows:
+                return
+            for row in rows:
+                yield Contact(*row)
+            last_id = rows[-1]["id"]
+
+    def import_contacts_chunk(self, import_id: int, rows: List[Tuple[str, str, Optional[str]]],
+                              rows_read: int, invalid: int = 0, enqueue_telegram: bool = False) -> Tuple[int, int]:
+        """
+        Вставка пачки контактов массового импорта
+
+        Пачка загружается во временную таблицу одним COPY и вставляется
+        одним запросом под блокировкой вставок в contacts; номера, уже
+        существующие в базе, и повторы внутри пачки пропускаются (остается
+        первая запись). Курсор импорта и
+        очередь импорта в Telegram - служебное состояние узла - сохраняются
+        в SQLite после вставки: если узел упадет между ними, повтор пачки
+        найдет ее контакты как дубликаты.
+
+        Returns:
+            (вставлено, дубликатов)
+        """
+        async def insert(conn):
+            # Как BEGIN IMMEDIATE в SQLite: вставки других узлов ждут конца транзакции,
+            # иначе NOT EXISTS не видит номер, добавленный параллельно и еще не зафиксированный
+            await conn.execute("LOCK TABLE contacts IN SHARE ROW EXCLUSIVE MODE")
+            await conn.execute(
+                """CREATE TEMP TABLE import_rows (
+                       position INTEGER, name TEXT, phone TEXT COLLATE "C", note TEXT, phone_reversed TEXT
+                   ) ON COMMIT DROP"""
+            )
+            await conn.copy_records_to_table(
+                "import_rows",
+                records=[(position, name, phone, note, reverse_digits(phone))
+                         for position, (name, phone, note) in enumerate(rows)],
+                columns=["position", "name", "phone", "note", "phone_reversed"]
+            )
+            inserted = await conn.fetch(
+                """INSERT INTO contacts (name, phone, note, normalized_phone, phone_reversed)
+                   SELECT name, phone, note, phone, phone_reversed
+                   FROM (SELECT DISTINCT ON (phone) * FROM import_rows ORDER BY phone, position) first_rows
+                   WHERE NOT EXISTS (SELECT 1 FROM contacts c WHERE c.normalized_phone = first_rows.phone)
+                   ORDER BY position
+                   RETURNING id, name, phone"""
+            )
+            if inserted:
+                await self._publish(conn, "contacts", [row["id"] for row in inserted])
+            return sorted(tuple(row) for row in inserted)
+
+        inserted = self._transaction(insert) if rows else []
+        duplicates = len(rows) - len(inserted)
+
+        if enqueue_telegram and inserted:
+            self.node.enqueue_contact_imports(inserted)
+        self.node.record_bulk_import_chunk(import_id, rows_read, len(inserted), duplicates, invalid)
+
+        if inserted:
+            self.bump_version("contacts", [contact_id for contact_id, _, _ in inserted])
+        return len(inserted), duplicates
+
+    def merge_contacts(self, merges: List[ContactMerge]) -> int:
+        """
+        Слияние групп дубликатов одной транзакцией
+
+        Как Database.merge_contacts: сообщения источников переносятся на
+        целевой контакт, источники записываются в журнал contact_merges и
+        удаляются. Задачи импорта в Telegram (очередь узла в SQLite)
+        переносятся после фиксации слияния.
+
+        Returns:
+            Количество перенесенных сообщений
+        """
+        if not merges:
+            return 0
+
+        async def merge(conn):
+            await conn.execute(
+                """CREATE TEMP TABLE merge_map (
+                       source_id BIGINT PRIMARY KEY, target_id BIGINT NOT NULL, reason TEXT
+                   ) ON COMMIT DROP"""
+            )
+            await conn.copy_records_to_table(
+                "merge_map",
+                records=[(source_id, merge.target_id, merge.reason) for merge in merges for source_id in merge.source_ids],
+                columns=["source_id", "target_id", "reason"]
+            )
+            await conn.execute(
+                """DELETE FROM merge_map
+                   WHERE source_id NOT IN (SELECT id FROM contacts) OR target_id NOT IN (SELECT id FROM contacts)"""
+            )
+
+            message_counts = dict(await conn.fetch(
+                """SELECT contact_id, COUNT(*) FROM messages
+                   WHERE contact_id IN (SELECT source_id FROM merge_map) GROUP BY contact_id"""
+            ))
+            sources = await conn.fetch(
+                """SELECT m.target_id, c.id, c.name, c.phone, c.note, c.telegram_user_id, m.reason
+                   FROM merge_map m JOIN contacts c ON c.id = m.source_id"""
+            )
+            await conn.executemany(
+                """INSERT INTO contact_merges (target_id, source_id, source_name, source_phone, source_note,
+                                               source_telegram_user_id, reason, messages_moved)
+                   VALUES ($1, $2, $3, $4, $5, $6, $7, $8)""",
+                [tuple(row) + (message_counts.get(row["id"], 0),) for row in sources]
+            )
+            await conn.execute(
+                """UPDATE messages SET contact_id = m.target_id
+                   FROM merge_map m WHERE messages.contact_id = m.source_id"""
+            )
+
+            targets = {row["target_id"] for row in sources}
+            updates = []
+            for merge in merges:
+                if merge.target_id not in targets:
+                    continue
+                synthetic = is_synthetic_phone(merge.phone, merge.telegram_user_id)
+                normalized = None if synthetic else normalize_phone(merge.phone)
+                updates.append((merge.name, merge.phone, merge.note, merge.telegram_user_id,
+                                normalized, synthetic, reverse_digits(normalized), merge.target_id))
+            await conn.executemany(
+                """UPDATE contacts SET name = $1, phone = $2, note = $3, telegram_user_id = $4,
+                                       normalized_phone = $5, phone_synthetic = $6, phone_reversed = $7
+                   WHERE id = $8""",
+                updates
+            )
+            await conn.execute("DELETE FROM contacts WHERE id IN (SELECT source_id FROM merge_map)")
+
+            pairs = [(row["id"], row["target_id"]) for row in sources]
+            if pairs:
+                await self._publish(conn, "contacts", list(targets) + [source_id for source_id, _ in pairs])
+                await self._publish(conn, "messages")
+            return pairs, targets, sum(message_counts.values())
+
+        pairs, targets, moved = self._transaction(merge)
+        if not pairs:
+            return 0
+
+        self.node.reassign_contact_imports(pairs)
+        self.bump_version("contacts", list(targets) + [source_id for source_id, _ in pairs])
+        self.bump_version("messages")
+        return moved
+
+    # Методы для работы с сообщениями
+    def add_message(self, contact_id: int, message_id: int, direction: str,
+                    text: str, media_type: str = 'text', media_file_id: str = None) -> int:
+        """Добавление нового сообщения (вставка и уведомление других узлов - один запрос)"""
+        preview = message_preview(text)
+        row = self._fetchrow(
+            """WITH saved AS (
+                   INSERT INTO messages (contact_id, message_id, direction, text, media_type, media_file_id, preview)
+                   VALUES ($1, $2, $3, $4, $5, $6, $7)
+                   RETURNING id, timestamp
+               )
+               SELECT id, timestamp, pg_notify($8, $9::text || id) FROM saved""",
+            contact_id, message_id, direction, text, media_type, media_file_id, preview,
+            CHANGES_CHANNEL, f"{self.node_id}:message:"
+        )
+        message = Message(row["id"], contact_id, message_id, direction, text, media_type, media_file_id,
+                          row["timestamp"], preview)
+        self._notify_message(message)
+        return message.id
+
+    def get_messages_page(self, contact_id: int, cursor_id: int = None, newer: bool = False,
+                          limit: int = 20) -> List[Message]:
+        """
+        Страница истории сообщений контакта от курсора
+
+        Сообщения упорядочены по (timestamp, id) и читаются одним диапазоном
+        индекса idx_messages_history без обращения к таблице; у сообщений
+        заполнено только превью, полный текст - get_message.
+        """
+        order = "ASC" if newer else "DESC"
+        condition = ""
+        args = [contact_id, limit]
+        if cursor_id is not None:
+            condition = f"AND (timestamp, id) {'>' if newer else '<'} (SELECT timestamp, id FROM messages WHERE id = $3)"
+            args.append(cursor_id)
+        rows = self._fetch(
+            f"SELECT {_MESSAGE_LIST_COLUMNS} FROM messages WHERE contact_id = $1 {condition} "
+            f"ORDER BY timestamp {order}, id {order} LIMIT $2",
+            *args
+        )
+        return [Message(*row) for row in rows]
+
+    def get_message(self, message_id: int) -> Optional[Message]:
+        """Сообщение целиком (с полным текстом) по ID"""
+        row = self._fetchrow(f"SELECT {_MESSAGE_COLUMNS} FROM messages WHERE id = $1", message_id)
+        return Message(*row) if row else None
+
+    def get_message_by_id(self, contact_id: int, message_id: int) -> Optional[Message]:
+        """Получение сообщения по ID контакта и ID сообщения"""
+        row = self._fetchrow(
+            f"SELECT {_MESSAGE_COLUMNS} FROM messages WHERE contact_id = $1 AND message_id = $2 ORDER BY id LIMIT 1",
+            contact_id, message_id
+        )
+        return Message(*row) if row else None
+
+    def get_message_counts(self, contact_ids: Iterable[int]) -> Dict[int, Dict[str, int]]:
+        """
+        Количество сообщений контактов по направлениям (по индексу, без чтения текста)
+
+        Returns:
+            {contact_id: {"incoming": n, "outgoing": n}} (контакты без сообщений отсутствуют)
+        """
+        rows = self._fetch(
+            """SELECT contact_id, direction, COUNT(*) FROM messages
+               WHERE contact_id = ANY($1::bigint[]) GROUP BY contact_id, direction""",
+            list(contact_ids)
+        )
+        counts: Dict[int, Dict[str, int]] = {}
+        for contact_id, direction, count in rows:
+            counts.setdefault(contact_id, {})[direction] = count
+        return counts
+
+    def iter_messages(self, since: Union[datetime, str] = None, contact_id: int = None,
+                      batch_size: int = 1000) -> Iterator[Message]:
+        """
+        Потоковый обход сообщений в порядке сохранения
+
+        Args:
+            since: Только сообщения не старше этой даты
+            contact_id: Только сообщения одного контакта
+            batch_size: Размер пачки чтения
+        """
+        conditions = ["id > $1"]
+        args = []
+        if since is not None:
+            args.append(_parse_timestamp(since))
+            conditions.append(f"timestamp >= ${len(args) + 1}")
+        if contact_id is not None:
+            args.append(contact_id)
+            conditions.append(f"contact_id = ${len(args) + 1}")
+        query = (f"SELECT {_MESSAGE_COLUMNS} FROM messages WHERE {' AND '.join(conditions)} "
+                 f"ORDER BY id LIMIT ${len(args) + 2}")
+
+        last_id = 0
+        while True:
+            rows = self._fetch(query, last_id, *args, batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield Message(*row)
+            last_id = rows[-1]["id"]
+
+    def get_messages_count(self) -> int:
+        """Получение общего количества сообщений"""
+        return self._fetchval("SELECT COUNT(*) FROM messages")
+
+    def get_messages_count_by_period(self, period_days: int = 1) -> int:
+        """Получение количества сообщений за период"""
+        return self._fetchval(
+            "SELECT COUNT(*) FROM messages WHERE timestamp >= (now() AT TIME ZONE 'utc') - make_interval(days => $1)",
+            period_days
+        )
+
+    # Методы для работы с администраторами
+    def add_admin(self, username: str, telegram_user_id: int) -> int:
+        """Добавление нового администратора"""
+        return self._fetchval(
+            "INSERT INTO admins (username, telegram_user_id) VALUES ($1, $2) RETURNING id", username, telegram_user_id
+        )
+
+    def remove_admin(self, telegram_user_id: int):
+        """Удаление администратора"""
+        self._execute("DELETE FROM admins WHERE telegram_user_id = $1", telegram_user_id)
+
+    def is_admin(self, telegram_user_id: int) -> bool:
+        """Проверка, является ли пользователь администратором"""
+        return self._fetchval("SELECT EXISTS (SELECT 1 FROM admins WHERE telegram_user_id = $1)", telegram_user_id)
+
+    def get_all_admins(self) -> List[Admin]:
+        """Получение списка всех администраторов"""
+        rows = self._fetch("SELECT id, username, telegram_user_id, date_added FROM admins ORDER BY date_added, id")
+        return [Admin(*row) for row in rows]
+
+    def get_admin_by_username(self, username: str) -> Optional[Admin]:
+        """Получение админа по username"""
+        row = self._fetchrow(
+            "SELECT id, username, telegram_user_id, date_added FROM admins WHERE username = $1 ORDER BY id LIMIT 1",
+            username
+        )
+        return Admin(*row) if row else None
+
+    def remove_duplicate_admins(self) -> int:
+        """Удаление дублированных администраторов (остается первая запись каждого telegram_user_id)"""
+        try:
+            status = self._execute(
+                "DELETE FROM admins WHERE id NOT IN (SELECT MIN(id) FROM admins GROUP BY telegram_user_id)"
+            )
+            deleted_count = int(status.split()[-1])
+            logger.info(f"🧹 Удалено дублированных админов: {deleted_count}")
+            return deleted_count
+        except Exception as e:
+            logger.error(f"Ошибка при удалении дубликатов: {e}")
+            return 0
+
+    # Служебное состояние узла (SQLite база узла)
+    def get_state(self, key: str, default: str = None) -> Optional[str]:
+        return self.node.get_state(key, default)
+
+    def set_state(self, key: str, value: str):
+        self.node.set_state(key, value)
+
+    def mark_update_processed(self, update_id: int):
+        self.node.mark_update_processed(update_id)
+
+    def save_pending_updates(self, updates: List[Tuple[int, str]]):
+        self.node.save_pending_updates(updates)
+
+    def get_pending_updates(self) -> List[Tuple[int, str]]:
+        return self.node.get_pending_updates()
+
+    def get_processed_update_ids(self, min_update_id: int) -> set:
+        return self.node.get_processed_update_ids(min_update_id)
+
+    def prune_processed_updates(self, below_update_id: int) -> int:
+        return self.node.prune_processed_updates(below_update_id)
+
+    def save_telegram_entity(self, entity: TelegramEntity):
+        self.node.save_telegram_entity(entity)
+
+    def get_telegram_entity(self, entity_id: int) -> Optional[TelegramEntity]:
+        return self.node.get_telegram_entity(entity_id)
+
+    def save_conversation_state(self, namespace: str, user_id: int, value: str, expires_at: float):
+        self.node.save_conversation_state(namespace, user_id, value, expires_at)
+
+    def delete_conversation_state(self, namespace: str, user_id: int):
+        self.node.delete_conversation_state(namespace, user_id)
+
+    def get_conversation_states(self, namespace: str, now: float) -> List[Tuple[int, str, float]]:
+        return self.node.get_conversation_states(namespace, now)
+
+    def prune_conversation_states(self, now: float) -> int:
+        return self.node.prune_conversation_states(now)
+
+    def add_contact_import_job(self, contact_id: int, name: str, phone: str, requested_by: int = None) -> int:
+        return self.node.add_contact_import_job(contact_id, name, phone, requested_by)
+
+    def get_pending_contact_imports(self, limit: int) -> List[ContactImportJob]:
+        return self.node.get_pending_contact_imports(limit)
+
+    def get_pending_contact_imports_count(self) -> int:
+        return self.node.get_pending_contact_imports_count()
+
+    def count_contact_imports_since(self, seconds: int) -> int:
+        return self.node.count_contact_imports_since(seconds)
+
+    def finish_contact_import(self, job_id: int, status: str, telegram_user_id: int = None):
+        self.node.finish_contact_import(job_id, status, telegram_user_id)
+
+    def fail_contact_import_attempt(self, job_id: int, max_attempts: int) -> bool:
+        return self.node.fail_contact_import_attempt(job_id, max_attempts)
+
+    def create_bulk_import(self, source: str, file_format: str, requested_by: int = None) -> int:
+        return self.node.create_bulk_import(source, file_format, requested_by)
+
+    def get_bulk_import(self, import_id: int) -> Optional[BulkImport]:
+        return self.node.get_bulk_import(import_id)
+
+    def get_unfinished_bulk_imports(self) -> List[BulkImport]:
+        return self.node.get_unfinished_bulk_imports()
+
+    def finish_bulk_import(self, import_id: int, status: str, error: str = None):
+        self.node.finish_bulk_import(import_id, status, error)
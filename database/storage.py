@@ -0,0 +1,222 @@
+"""
+Интерфейс хранилища контактов, сообщений и администраторов
+"""
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import Config
+from .models import Admin, Contact, ContactMerge, Message
+
+
+class Storage(ABC):
+    """
+    Хранилище данных CRM: контакты, сообщения и администраторы
+
+    Реализации: Database (SQLite, один узел) и PostgresDatabase (общая база
+    для нескольких узлов бота/юзербота). Выбор - STORAGE_BACKEND в Config,
+    объект создает create_database(). Все методы синхронные, как и раньше
+    у Database; служебное состояние узла (курсоры, очереди, кэш сущностей)
+    в интерфейс не входит и хранится в SQLite базе узла.
+
+    Изменения данных отмечаются bump_version: по версиям инвалидируется
+    кэш отрисованных экранов, подписчики (индексы и буферы в памяти)
+    получают ID измененных строк.
+    """
+
+    def __init__(self):
+        # Версии данных по таблицам: увеличиваются при каждой записи через этот объект
+        # и служат ключом инвалидации кэша отрисованных экранов бота
+        self.data_versions = {"contacts": 0, "messages": 0}
+        # Подписчики на изменения таблиц (индексы в памяти): callback(ids)
+        self.change_listeners: Dict[str, List[Callable[[Optional[Iterable[int]]], None]]] = {}
+        # Подписчики на новые сообщения (буферы последних сообщений): callback(message)
+        self.message_listeners: List[Callable[[Message], None]] = []
+
+    def bump_version(self, table: str, ids: Iterable[int] = None):
+        """
+        Отметка изменения данных таблицы
+
+        Args:
+            ids: ID измененных строк (None - неизвестно какие, подписчикам нужно перечитать все)
+        """
+        self.data_versions[table] = self.data_versions.get(table, 0) + 1
+        for callback in self.change_listeners.get(table, ()):
+            callback(ids)
+
+    def subscribe(self, table: str, callback: Callable[[Optional[Iterable[int]]], None]):
+        """Подписка на изменения таблицы"""
+        self.change_listeners.setdefault(table, []).append(callback)
+
+    def subscribe_messages(self, callback: Callable[[Message], None]):
+        """Подписка на новые сообщения, сохраненные через add_message (получает готовый объект Message)"""
+        self.message_listeners.append(callback)
+
+    def _notify_message(self, message: Message):
+        self.bump_version("messages", [message.id])
+        for callback in self.message_listeners:
+            callback(message)
+
+    def data_version(self, *tables: str) -> tuple:
+        """Текущие версии данных указанных таблиц"""
+        return tuple(self.data_versions.get(table, 0) for table in tables)
+
+    @abstractmethod
+    def init_db(self):
+        """Создание таблиц и индексов"""
+
+    def close(self):
+        """Освобождение соединений при остановке (SQLite открывает соединение на каждый запрос)"""
+
+    # Контакты
+    @abstractmethod
+    def add_contact(self, name: str, phone: str, note: str = None, telegram_user_id: int = None,
+                    synthetic: bool = False) -> int:
+        """Добавление контакта; возвращает его ID"""
+
+    @abstractmethod
+    def get_contact(self, contact_id: int) -> Optional[Contact]:
+        """Контакт по ID"""
+
+    @abstractmethod
+    def get_contacts_by_ids(self, contact_ids: List[int]) -> List[Contact]:
+        """Контакты по списку ID (в порядке списка, отсутствующие пропускаются)"""
+
+    @abstractmethod
+    def get_contact_by_phone(self, phone: str) -> Optional[Contact]:
+        """Контакт по номеру телефона в любом написании"""
+
+    @abstractmethod
+    def get_contact_by_telegram_id(self, telegram_user_id: int) -> Optional[Contact]:
+        """Контакт по Telegram ID"""
+
+    @abstractmethod
+    def get_recent_contacts(self, limit: int = 10) -> List[Contact]:
+        """Последние добавленные контакты"""
+
+    @abstractmethod
+    def get_all_contacts(self, limit: int = 50, offset: int = 0) -> List[Contact]:
+        """Контакты по имени с пагинацией"""
+
+    @abstractmethod
+    def update_contact(self, contact_id: int, name: str = None, phone: str = None, note: str = None):
+        """Изменение полей контакта (None - поле не меняется)"""
+
+    @abstractmethod
+    def update_contact_telegram_id(self, contact_id: int, telegram_user_id: int):
+        """Привязка контакта к Telegram ID"""
+
+    @abstractmethod
+    def delete_contact(self, contact_id: int):
+        """Удаление контакта"""
+
+    @abstractmethod
+    def search_contacts(self, query: str, limit: int = 100) -> List[Contact]:
+        """Поиск контактов по имени, телефону или примечанию (по убыванию релевантности)"""
+
+    @abstractmethod
+    def get_contacts_count(self) -> int:
+        """Количество контактов"""
+
+    @abstractmethod
+    def iter_contacts(self, batch_size: int = 1000) -> Iterator[Contact]:
+        """Потоковый обход всех контактов в порядке добавления"""
+
+    @abstractmethod
+    def import_contacts_chunk(self, import_id: int, rows: List[Tuple[str, str, Optional[str]]],
+                              rows_read: int, invalid: int = 0, enqueue_telegram: bool = False) -> Tuple[int, int]:
+        """Вставка пачки контактов массового импорта без дубликатов; возвращает (вставлено, дубликатов)"""
+
+    @abstractmethod
+    def merge_contacts(self, merges: List[ContactMerge]) -> int:
+        """Слияние групп дубликатов; возвращает количество перенесенных сообщений"""
+
+    # Сообщения
+    @abstractmethod
+    def add_message(self, contact_id: int, message_id: int, direction: str,
+                    text: str, media_type: str = 'text', media_file_id: str = None) -> int:
+        """Сохранение сообщения; возвращает его ID"""
+
+    def get_contact_messages(self, contact_id: int, limit: int = 20) -> List[Message]:
+        """Последние сообщения контакта (новые первыми) для списков: превью без полного текста"""
+        return self.get_messages_page(contact_id, limit=limit)
+
+    @abstractmethod
+    def get_messages_page(self, contact_id: int, cursor_id: int = None, newer: bool = False,
+                          limit: int = 20) -> List[Message]:
+        """
+        Страница истории контакта от сообщения cursor_id по (timestamp, id)
+
+        newer=False - сообщения старше курсора (новые первыми), иначе новее (старые первыми)
+        """
+
+    @abstractmethod
+    def get_message(self, message_id: int) -> Optional[Message]:
+        """Сообщение целиком (с полным текстом) по ID"""
+
+    @abstractmethod
+    def get_message_by_id(self, contact_id: int, message_id: int) -> Optional[Message]:
+        """Сообщение по ID контакта и ID сообщения в Telegram"""
+
+    @abstractmethod
+    def get_message_counts(self, contact_ids: Iterable[int]) -> Dict[int, Dict[str, int]]:
+        """Количество сообщений контактов по направлениям: {contact_id: {direction: n}}"""
+
+    @abstractmethod
+    def iter_messages(self, since: Union[datetime, str] = None, contact_id: int = None,
+                      batch_size: int = 1000) -> Iterator[Message]:
+        """Потоковый обход сообщений в порядке сохранения"""
+
+    @abstractmethod
+    def get_messages_count(self) -> int:
+        """Количество сообщений"""
+
+    @abstractmethod
+    def get_messages_count_by_period(self, period_days: int = 1) -> int:
+        """Количество сообщений за последние period_days дней"""
+
+    # Администраторы
+    @abstractmethod
+    def add_admin(self, username: str, telegram_user_id: int) -> int:
+        """Добавление администратора; возвращает ID записи"""
+
+    @abstractmethod
+    def remove_admin(self, telegram_user_id: int):
+        """Удаление администратора"""
+
+    @abstractmethod
+    def is_admin(self, telegram_user_id: int) -> bool:
+        """Является ли пользователь администратором"""
+
+    @abstractmethod
+    def get_all_admins(self) -> List[Admin]:
+        """Все администраторы в порядке добавления"""
+
+    @abstractmethod
+    def get_admin_by_username(self, username: str) -> Optional[Admin]:
+        """Администратор по username"""
+
+    @abstractmethod
+    def remove_duplicate_admins(self) -> int:
+        """Удаление повторных записей администраторов; возвращает количество удаленных"""
+
+
+def create_database(db_path: str = None) -> Storage:
+    """
+    Хранилище по STORAGE_BACKEND из Config
+
+    Args:
+        db_path: SQLite база узла (по умолчанию DATABASE_PATH); при
+            STORAGE_BACKEND = "postgres" в ней остается только служебное
+            состояние узла
+    """
+    db_path = db_path or Config.DATABASE_PATH
+    if Config.STORAGE_BACKEND == "postgres":
+        # asyncpg нужен только для PostgreSQL
+        from .postgres import PostgresDatabase
+        return PostgresDatabase(Config.POSTGRES_DSN, db_path)
+    if Config.STORAGE_BACKEND != "sqlite":
+        raise ValueError(f"Неизвестный STORAGE_BACKEND: {Config.STORAGE_BACKEND}")
+    from .db import Database
+    return Database(db_path)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Поиск и слияние дубликатов контактов
+
+Примеры:
+    python dedup_contacts.py --dry-run
+    python dedup_contacts.py
+    python dedup_contacts.py --merge-by-name --min-score 0.9
+
+Подходит для запуска по расписанию (cron). Дубликаты с одинаковым
+Telegram ID или телефоном объединяются: сообщения переносятся на
+оставшийся контакт, удаленные записи сохраняются в журнале
+contact_merges. Контакты, похожие только по имени, объединяются лишь
+с --merge-by-name (или DEDUP_MERGE_BY_NAME), иначе выводятся в отчете.
+"""
+
+import argparse
+import os
+import sys
+
+from loguru import logger
+
+import Config
+from database import create_database
+from utils.dedup import ContactDeduplicator, describe_dedup_report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Поиск и слияние дубликатов контактов")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать найденные дубликаты")
+    parser.add_argument("--merge-by-name", action="store_true", help="Объединять и совпадения только по имени")
+    parser.add_argument("--min-score", type=float, help="Минимальное сходство имен (0..1)")
+    parser.add_argument("--limit", type=int, default=20, help="Сколько групп показать в отчете")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=Config.LOG_LEVEL)
+
+    if not os.path.exists(Config.DATABASE_PATH):
+        print(f"❌ База данных не найдена: {Config.DATABASE_PATH}", file=sys.stderr)
+        return 1
+    db = create_database()
+
+    deduplicator = ContactDeduplicator(
+        db,
+        merge_by_name=True if args.merge_by_name else None,
+        name_min_score=args.min_score
+    )
+    report = deduplicator.run(dry_run=args.dry_run)
+    print(describe_dedup_report(report, dry_run=args.dry_run, limit=args.limit))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
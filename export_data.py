@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Выгрузка контактов и переписки из базы
+
+Примеры:
+    python export_data.py contacts -o contacts.csv
+    python export_data.py messages --format jsonl --since 2024-01-01 > messages.jsonl
+    python export_data.py transcript --contact 42 -o chat.txt
+
+Данные читаются из базы пачками и сразу пишутся в файл, поэтому
+потребление памяти не зависит от объема выгрузки.
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from loguru import logger
+
+import Config
+from database import create_database
+from utils.exporters import EXPORTS, write_transcript
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Выгрузка контактов и переписки")
+    parser.add_argument("kind", choices=sorted(EXPORTS) + ["transcript"], help="Что выгружать")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv", help="Формат (кроме transcript)")
+    parser.add_argument("--since", help="Сообщения начиная с даты YYYY-MM-DD")
+    parser.add_argument("--contact", type=int, help="ID контакта (для messages и transcript)")
+    parser.add_argument("-o", "--output", help="Файл результата (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    options = {}
+    if args.kind == "messages":
+        if args.since:
+            try:
+                options["since"] = datetime.strptime(args.since, "%Y-%m-%d")
+            except ValueError:
+                parser.error("--since ожидается в формате YYYY-MM-DD")
+        if args.contact:
+            options["contact_id"] = args.contact
+    if args.kind == "transcript" and not args.contact:
+        parser.error("для transcript укажите --contact")
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    if not os.path.exists(Config.DATABASE_PATH):
+        print(f"❌ База данных не найдена: {Config.DATABASE_PATH}", file=sys.stderr)
+        return 1
+    db = create_database()
+
+    out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    try:
+        if args.kind == "transcript":
+            contact = db.get_contact(args.contact)
+            if contact is None:
+                print(f"❌ Контакт {args.contact} не найден", file=sys.stderr)
+                return 1
+            count = write_transcript(db, contact, out)
+        else:
+            count = EXPORTS[args.kind](db, out, args.format, **options)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"✅ Выгружено строк: {count}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,12 +2,14 @@ from telethon import events, Button
 from loguru import logger
 from typing import List
 from database.db import Database
+from utils.entity_cache import EntityCache
 import Config
 
 class AdminHandler:
-    def __init__(self, client, db: Database):
+    def __init__(self, client, db: Database, entity_cache: EntityCache = None):
         self.client = client
         self.db = db
+        self.entity_cache = entity_cache or EntityCache(client, db)
         self.setup_handlers()
 
     def setup_handlers(self):
@@ -51,10 +53,9 @@ class AdminHandler:
 
     async def handle_start(self, event):
         """Обработка команды /start"""
-        sender = await event.get_sender()
         
         # Проверяем права доступа через Config
-        if not Config.is_admin(sender.id) and not self.db.is_admin(sender.id):
+        if not Config.is_admin(event.sender_id) and not self.db.is_admin(event.sender_id):
             await event.reply("⛔ У вас нет прав администратора.")
             return
 
@@ -66,8 +67,7 @@ class AdminHandler:
 
     async def handle_add_admin(self, event):
         """Обработка команды /add_admin"""
-        sender = await event.get_sender()
-        if not self.db.is_admin(sender.id):
+        if not self.db.is_admin(event.sender_id):
             await event.reply("⛔ У вас нет прав для добавления администраторов.")
             return
 
@@ -80,7 +80,7 @@ class AdminHandler:
 
             username = args[1].replace("@", "")
             # Получаем информацию о пользователе
-            user = await self.client.get_entity(username)
+            user = await self.entity_cache.resolve_username(username)
             
             # Проверяем, не является ли уже админом
             if self.db.is_admin(user.id):
@@ -97,8 +97,7 @@ class AdminHandler:
 
     async def handle_remove_admin(self, event):
         """Обработка команды /remove_admin"""
-        sender = await event.get_sender()
-        if not self.db.is_admin(sender.id):
+        if not self.db.is_admin(event.sender_id):
             await event.reply("⛔ У вас нет прав для удаления администраторов.")
             return
 
@@ -109,7 +108,7 @@ class AdminHandler:
                 return
 
             username = args[1].replace("@", "")
-            user = await self.client.get_entity(username)
+            user = await self.entity_cache.resolve_username(username)
             
             if not self.db.is_admin(user.id):
                 await event.reply(f"⚠️ Пользователь @{username} не является администратором!")
@@ -124,8 +123,7 @@ class AdminHandler:
 
     async def handle_list_admins(self, event):
         """Обработка команды /list_admins"""
-        sender = await event.get_sender()
-        if not self.db.is_admin(sender.id):
+        if not self.db.is_admin(event.sender_id):
             await event.reply("⛔ У вас нет прав для просмотра списка администраторов.")
             return
 
@@ -147,8 +145,7 @@ class AdminHandler:
 
     async def handle_statistics(self, event):
         """Обработка показа статистики"""
-        sender = await event.get_sender()
-        if not self.db.is_admin(sender.id):
+        if not self.db.is_admin(event.sender_id):
             await event.answer("⛔ У вас нет прав администратора.", alert=True)
             return
 
@@ -180,8 +177,7 @@ class AdminHandler:
 
     async def handle_admin_menu(self, event):
         """Обработка нажатий на кнопки админ-меню"""
-        sender = await event.get_sender()
-        if not self.db.is_admin(sender.id):
+        if not self.db.is_admin(event.sender_id):
             await event.answer("⛔ У вас нет прав администратора.", alert=True)
             return
 
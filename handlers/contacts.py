@@ -3,16 +3,30 @@ from loguru import logger
 from typing import List, Optional
 from database.db import Database
 from database.models import Contact
-from utils.telegram_contacts import TelegramContactsManager
+from utils.conversation import ConversationRouter
+from utils.contact_import_queue import ContactImportQueue, describe_import_result
+from utils.name_index import NameIndex
 import Config
 
 class ContactHandler:
-    def __init__(self, client, db: Database):
+    def __init__(self, client, db: Database, conversations: ConversationRouter = None,
+                 import_queue: ContactImportQueue = None):
         self.client = client
         self.db = db
-        self.telegram_contacts = TelegramContactsManager(client)
+        self.conversations = conversations or ConversationRouter(client)
+        self.import_queue = import_queue or ContactImportQueue(db, notify=self.notify_import_result)
+        self.import_queue.start(client)
+        self.name_index = NameIndex(db)
         self.setup_handlers()
 
+    async def notify_import_result(self, job, username):
+        """Уведомление администратора о результате фонового импорта контакта"""
+        await self.client.send_message(
+            job.requested_by,
+            describe_import_result(job, username),
+            buttons=[[Button.inline("⬅️ Назад к контактам", b"contacts_menu")]]
+        )
+
     def setup_handlers(self):
         """Установка обработчиков для работы с контактами"""
         self.client.add_event_handler(
@@ -66,71 +80,61 @@ class ContactHandler:
             "Имя\nТелефон\nПримечание (опционально)"
         )
         
-        # Добавляем временный обработчик для получения данных контакта
-        @self.client.on(events.NewMessage(from_users=event.sender_id))
-        async def contact_data_handler(msg_event):
-            try:
-                # Парсим данные контакта
-                lines = msg_event.text.split('\n')
-                if len(lines) < 2:
-                    await msg_event.reply(
-                        "❌ Неверный формат!\n"
-                        "Пожалуйста, отправьте данные в формате:\n"
-                        "Имя\nТелефон\nПримечание (опционально)"
-                    )
-                    return
-
-                name = lines[0].strip()
-                phone = lines[1].strip()
-                note = lines[2].strip() if len(lines) > 2 else None
-
-                # Добавляем контакт в базу
-                contact_id = self.db.add_contact(name, phone, note)
-                
-                # Автоматически добавляем контакт в Telegram (если включено)
-                telegram_result = None
-                if Config.AUTO_IMPORT_TO_TELEGRAM:
-                    try:
-                        telegram_result = await self.telegram_contacts.add_contact_to_telegram(name, phone)
-                        
-                        if telegram_result["success"]:
-                            # Обновляем информацию в базе
-                            self.db.update_contact_telegram_id(contact_id, telegram_result["user_id"])
-                            logger.info(f"📱 Контакт автоматически добавлен в Telegram: {name}")
-                        
-                    except Exception as e:
-                        logger.warning(f"Не удалось автоматически добавить контакт в Telegram: {e}")
-
-                # Формируем ответное сообщение
-                response_text = (
-                    f"✅ Контакт успешно добавлен!\n\n"
-                    f"👤 Имя: {name}\n"
-                    f"📱 Телефон: {phone}\n"
-                    f"📝 Примечание: {note if note else '-'}\n"
-                )
-                
-                # Добавляем информацию о Telegram
-                if telegram_result:
-                    if telegram_result["success"]:
-                        username_info = f" (@{telegram_result['username']})" if telegram_result["username"] else ""
-                        response_text += f"\n📲 Telegram: Добавлен{username_info}"
-                    else:
-                        response_text += f"\n⚠️ Telegram: {telegram_result['message']}"
-
-                await msg_event.reply(response_text)
-
-                # Возвращаем меню контактов
-                await msg_event.respond(
-                    "📇 Меню управления контактами",
-                    buttons=await self.get_contacts_keyboard()
+        self.conversations.expect(event.sender_id, self.process_contact_data)
+
+    async def process_contact_data(self, msg_event) -> bool:
+        """Шаг диалога: данные нового контакта"""
+        try:
+            # Парсим данные контакта
+            lines = msg_event.text.split('\n')
+            if len(lines) < 2:
+                await msg_event.reply(
+                    "❌ Неверный формат!\n"
+                    "Пожалуйста, отправьте данные в формате:\n"
+                    "Имя\nТелефон\nПримечание (опционально)"
                 )
+                return False
 
-                # Удаляем временный обработчик
-                self.client.remove_event_handler(contact_data_handler)
+            name = lines[0].strip()
+            phone = lines[1].strip()
+            note = lines[2].strip() if len(lines) > 2 else None
 
-            except Exception as e:
-                logger.error(f"Ошибка при добавлении контакта: {e}")
-                await msg_event.reply("❌ Произошла ошибка при добавлении контакта.")
+            existing = self.db.get_contact_by_phone(phone)
+            if existing:
+                await msg_event.reply(f"⚠️ Контакт с этим номером уже есть: {existing.name} ({existing.phone})")
+                return True
+
+            # Добавляем контакт в базу
+            contact_id = self.db.add_contact(name, phone, note)
+
+            # Импорт в Telegram (если включен) выполняется фоновой очередью
+            if Config.AUTO_IMPORT_TO_TELEGRAM:
+                self.import_queue.enqueue(contact_id, name, phone, requested_by=msg_event.sender_id)
+
+            # Формируем ответное сообщение
+            response_text = (
+                f"✅ Контакт успешно добавлен!\n\n"
+                f"👤 Имя: {name}\n"
+                f"📱 Телефон: {phone}\n"
+                f"📝 Примечание: {note if note else '-'}\n"
+            )
+
+            if Config.AUTO_IMPORT_TO_TELEGRAM:
+                response_text += "\n⏳ Telegram: поиск поставлен в очередь, сообщу о результате"
+
+            await msg_event.reply(response_text)
+
+            # Возвращаем меню контактов
+            await msg_event.respond(
+                "📇 Меню управления контактами",
+                buttons=await self.get_contacts_keyboard()
+            )
+            return True
+
+        except Exception as e:
+            logger.error(f"Ошибка при добавлении контакта: {e}")
+            await msg_event.reply("❌ Произошла ошибка при добавлении контакта.")
+            return False
 
     async def handle_search_contact(self, event):
         """Обработка поиска контактов"""
@@ -143,42 +147,43 @@ class ContactHandler:
             "Введите имя или номер телефона для поиска:"
         )
 
-        @self.client.on(events.NewMessage(from_users=event.sender_id))
-        async def search_handler(msg_event):
-            try:
-                query = msg_event.text.strip()
-                contacts = self.db.search_contacts(query)
-
-                if not contacts:
-                    await msg_event.reply(
-                        "❌ Контакты не найдены.",
-                        buttons=await self.get_contacts_keyboard()
-                    )
-                    return
-
-                # Формируем список найденных контактов
-                result = "🔍 Результаты поиска:\n\n"
-                for contact in contacts:
-                    result += (
-                        f"👤 {contact.name}\n"
-                        f"📱 {contact.phone}\n"
-                        f"📝 {contact.note if contact.note else '-'}\n"
-                        f"➖➖➖➖➖➖\n"
-                    )
+        self.conversations.expect(event.sender_id, self.process_contact_search)
 
+    async def process_contact_search(self, msg_event) -> bool:
+        """Шаг диалога: поисковый запрос"""
+        try:
+            query = msg_event.text.strip()
+            contacts = self.name_index.search_contacts(query, Config.SEARCH_RESULTS_LIMIT)
+
+            if not contacts:
                 await msg_event.reply(
-                    result,
-                    buttons=[[Button.inline(f"✏️ Редактировать {contact.name}", 
-                             f"edit_contact_{contact.id}".encode())] for contact in contacts] +
-                            [[Button.inline("⬅️ Назад", b"contacts_menu")]]
+                    "❌ Контакты не найдены.",
+                    buttons=await self.get_contacts_keyboard()
                 )
+                return False
 
-                # Удаляем временный обработчик
-                self.client.remove_event_handler(search_handler)
+            # Формируем список найденных контактов
+            result = "🔍 Результаты поиска:\n\n"
+            for contact in contacts:
+                result += (
+                    f"👤 {contact.name}\n"
+                    f"📱 {contact.phone}\n"
+                    f"📝 {contact.note if contact.note else '-'}\n"
+                    f"➖➖➖➖➖➖\n"
+                )
 
-            except Exception as e:
-                logger.error(f"Ошибка при поиске контактов: {e}")
-                await msg_event.reply("❌ Произошла ошибка при поиске контактов.")
+            await msg_event.reply(
+                result,
+                buttons=[[Button.inline(f"✏️ Редактировать {contact.name}", 
+                         f"edit_contact_{contact.id}".encode())] for contact in contacts] +
+                        [[Button.inline("⬅️ Назад", b"contacts_menu")]]
+            )
+            return True
+
+        except Exception as e:
+            logger.error(f"Ошибка при поиске контактов: {e}")
+            await msg_event.reply("❌ Произошла ошибка при поиске контактов.")
+            return False
 
     async def handle_add_to_telegram(self, event):
         """Обработка ручного добавления контакта в Telegram"""
@@ -195,31 +200,16 @@ class ContactHandler:
                 await event.answer("❌ Контакт не найден.", alert=True)
                 return
 
-            await event.answer("📱 Добавляю контакт в Telegram...", alert=False)
-            
-            # Добавляем контакт в Telegram
-            result = await self.telegram_contacts.add_contact_to_telegram(contact.name, contact.phone)
-            
-            if result["success"]:
-                # Обновляем информацию в базе
-                self.db.update_contact_telegram_id(contact_id, result["user_id"])
-                
-                username_info = f" (@{result['username']})" if result["username"] else ""
-                await event.edit(
-                    f"✅ Контакт добавлен в Telegram!\n\n"
-                    f"👤 {contact.name}\n"
-                    f"📱 {contact.phone}\n"
-                    f"📲 Telegram ID: {result['user_id']}{username_info}",
-                    buttons=[[Button.inline("⬅️ Назад к контактам", b"contacts_menu")]]
-                )
-            else:
-                await event.edit(
-                    f"❌ Не удалось добавить контакт в Telegram\n\n"
-                    f"👤 {contact.name}\n"
-                    f"📱 {contact.phone}\n"
-                    f"⚠️ Причина: {result['message']}",
-                    buttons=[[Button.inline("⬅️ Назад к контактам", b"contacts_menu")]]
-                )
+            # Импорт выполняется фоновой очередью, результат придет отдельным сообщением
+            self.import_queue.enqueue(contact_id, contact.name, contact.phone, requested_by=event.sender_id)
+
+            await event.edit(
+                f"⏳ Поиск в Telegram поставлен в очередь\n\n"
+                f"👤 {contact.name}\n"
+                f"📱 {contact.phone}\n\n"
+                f"Пришлю уведомление, когда контакт будет обработан.",
+                buttons=[[Button.inline("⬅️ Назад к контактам", b"contacts_menu")]]
+            )
                 
         except Exception as e:
             logger.error(f"Ошибка при добавлении контакта в Telegram: {e}")
@@ -3,11 +3,20 @@ from loguru import logger
 from typing import List, Optional
 from database.db import Database
 from database.models import Contact, Message
+from utils.entity_cache import EntityCache
+from utils.event_filters import IngestionFilter
+from utils.keyed_executor import KeyedExecutor
+from utils.conversation import ConversationRouter
+from utils.phone import normalize_phone
 
 class MessageHandler:
-    def __init__(self, client, db: Database):
+    def __init__(self, client, db: Database, entity_cache: EntityCache = None,
+                 conversations: ConversationRouter = None):
         self.client = client
         self.db = db
+        self.entity_cache = entity_cache or EntityCache(client, db)
+        self.conversations = conversations or ConversationRouter(client)
+        self.executor = KeyedExecutor("incoming")
         self.setup_handlers()
 
     def setup_handlers(self):
@@ -22,8 +31,8 @@ class MessageHandler:
         )
         # Обработчик входящих сообщений
         self.client.add_event_handler(
-            self.handle_incoming_message,
-            events.NewMessage(incoming=True)
+            self.executor.wrap(self.handle_incoming_message),
+            events.NewMessage(incoming=True, func=IngestionFilter(self.entity_cache.is_own_account))
         )
 
     async def handle_send_message_menu(self, event):
@@ -77,40 +86,40 @@ class MessageHandler:
             "Формат: +7XXXXXXXXXX"
         )
 
-        @self.client.on(events.NewMessage(from_users=event.sender_id))
-        async def phone_handler(msg_event):
-            try:
-                phone = msg_event.text.strip()
-                
-                # Проверяем формат номера
-                if not phone.startswith('+') or not phone[1:].isdigit():
-                    await msg_event.reply(
-                        "❌ Неверный формат номера!\n"
-                        "Используйте формат: +7XXXXXXXXXX"
-                    )
-                    return
-
-                # Проверяем, есть ли контакт в базе
-                contact = self.db.get_contact_by_phone(phone)
-                if not contact:
-                    # Предлагаем создать новый контакт
-                    await msg_event.reply(
-                        "❓ Контакт не найден в базе. Создать новый?",
-                        buttons=[
-                            [Button.inline("✅ Да, создать", f"create_contact_{phone}".encode())],
-                            [Button.inline("❌ Нет, отмена", b"send_message")]
-                        ]
-                    )
-                else:
-                    # Переходим к отправке сообщения
-                    await self.prepare_message_sending(msg_event, contact)
+        self.conversations.expect(event.sender_id, self.process_phone_for_message)
 
-                # Удаляем временный обработчик
-                self.client.remove_event_handler(phone_handler)
+    async def process_phone_for_message(self, msg_event) -> bool:
+        """Шаг диалога: номер телефона получателя"""
+        try:
+            # Номер в любом написании приводится к E.164
+            phone = normalize_phone(msg_event.text.strip())
+            if phone is None:
+                await msg_event.reply(
+                    "❌ Неверный формат номера!\n"
+                    "Используйте формат: +7XXXXXXXXXX"
+                )
+                return False
 
-            except Exception as e:
-                logger.error(f"Ошибка при обработке номера телефона: {e}")
-                await msg_event.reply("❌ Произошла ошибка при обработке номера.")
+            # Проверяем, есть ли контакт в базе
+            contact = self.db.get_contact_by_phone(phone)
+            if not contact:
+                # Предлагаем создать новый контакт
+                await msg_event.reply(
+                    "❓ Контакт не найден в базе. Создать новый?",
+                    buttons=[
+                        [Button.inline("✅ Да, создать", f"create_contact_{phone}".encode())],
+                        [Button.inline("❌ Нет, отмена", b"send_message")]
+                    ]
+                )
+            else:
+                # Переходим к отправке сообщения
+                await self.prepare_message_sending(msg_event, contact)
+            return True
+
+        except Exception as e:
+            logger.error(f"Ошибка при обработке номера телефона: {e}")
+            await msg_event.reply("❌ Произошла ошибка при обработке номера.")
+            return False
 
     async def prepare_message_sending(self, event, contact: Contact):
         """Подготовка к отправке сообщения конкретному контакту"""
@@ -120,37 +129,38 @@ class MessageHandler:
             f"📱 {contact.phone}"
         )
 
-        @self.client.on(events.NewMessage(from_users=event.sender_id))
-        async def message_handler(msg_event):
-            try:
-                # Отправляем сообщение
-                message = await self.client.send_message(
-                    contact.telegram_user_id or contact.phone,
-                    msg_event.text
-                )
+        self.conversations.expect(event.sender_id, self.send_prepared_message, contact)
 
-                # Сохраняем сообщение в базу
-                self.db.add_message(
-                    contact_id=contact.id,
-                    message_id=message.id,
-                    direction='outgoing',
-                    text=msg_event.text
-                )
+    async def send_prepared_message(self, msg_event, contact: Contact) -> bool:
+        """Шаг диалога: текст сообщения для контакта"""
+        try:
+            # Отправляем сообщение
+            message = await self.client.send_message(
+                contact.telegram_user_id or contact.phone,
+                msg_event.text
+            )
 
-                await msg_event.reply(
-                    "✅ Сообщение успешно отправлено!",
-                    buttons=[[Button.inline("⬅️ Назад в меню", b"send_message")]]
-                )
+            # Сохраняем сообщение в базу
+            self.db.add_message(
+                contact_id=contact.id,
+                message_id=message.id,
+                direction='outgoing',
+                text=msg_event.text
+            )
 
-                # Удаляем временный обработчик
-                self.client.remove_event_handler(message_handler)
+            await msg_event.reply(
+                "✅ Сообщение успешно отправлено!",
+                buttons=[[Button.inline("⬅️ Назад в меню", b"send_message")]]
+            )
+            return True
 
-            except Exception as e:
-                logger.error(f"Ошибка при отправке сообщения: {e}")
-                await msg_event.reply(
-                    "❌ Ошибка при отправке сообщения.",
-                    buttons=[[Button.inline("⬅️ Назад", b"send_message")]]
-                )
+        except Exception as e:
+            logger.error(f"Ошибка при отправке сообщения: {e}")
+            await msg_event.reply(
+                "❌ Ошибка при отправке сообщения.",
+                buttons=[[Button.inline("⬅️ Назад", b"send_message")]]
+            )
+            return False
 
     async def handle_message_history(self, event):
         """Обработка просмотра истории сообщений"""
@@ -172,7 +182,9 @@ class MessageHandler:
         """Обработка входящих сообщений"""
         try:
             # Получаем отправителя
-            sender = await event.get_sender()
+            sender = await self.entity_cache.get_sender(event)
+            if sender is None:
+                return
             
             # Ищем контакт в базе
             contact = self.db.get_contact_by_telegram_id(sender.id)
@@ -182,7 +194,8 @@ class MessageHandler:
                 contact_id = self.db.add_contact(
                     name=f"{sender.first_name or ''} {sender.last_name or ''}".strip(),
                     phone=phone or str(sender.id),
-                    telegram_user_id=sender.id
+                    telegram_user_id=sender.id,
+                    synthetic=not phone
                 )
                 contact = self.db.get_contact(contact_id)
 
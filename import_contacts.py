@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Массовый импорт контактов из CSV или vCard
+
+Примеры:
+    python import_contacts.py contacts.csv
+    python import_contacts.py phonebook.vcf --no-telegram
+    python import_contacts.py --resume
+
+Контакты записываются в базу сразу; поиск в Telegram выполняет очередь
+импорта запущенного бота (main_bot.py / main.py) с учетом лимита
+MAX_NEW_CONTACTS_PER_HOUR. Прерванный импорт продолжается с места
+остановки командой --resume.
+"""
+
+import argparse
+import os
+import sys
+
+from loguru import logger
+
+import Config
+from database import create_database
+from utils.bulk_import import BulkContactImporter, READERS, describe_bulk_import
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Массовый импорт контактов из CSV или vCard")
+    parser.add_argument("file", nargs="?", help="Файл .csv или .vcf")
+    parser.add_argument("--format", choices=sorted(READERS), help="Формат файла (по умолчанию по расширению)")
+    parser.add_argument("--chunk-size", type=int, help="Строк в одной транзакции")
+    parser.add_argument("--no-telegram", action="store_true", help="Не ставить контакты в очередь поиска в Telegram")
+    parser.add_argument("--resume", action="store_true", help="Продолжить прерванные импорты")
+    args = parser.parse_args()
+
+    if not args.file and not args.resume:
+        parser.error("укажите файл или --resume")
+    if args.file and not os.path.isfile(args.file):
+        parser.error(f"файл не найден: {args.file}")
+
+    logger.remove()
+    logger.add(sys.stderr, level=Config.LOG_LEVEL)
+
+    os.makedirs(os.path.dirname(Config.DATABASE_PATH), exist_ok=True)
+    db = create_database()
+    importer = BulkContactImporter(
+        db,
+        chunk_size=args.chunk_size,
+        enqueue_telegram=False if args.no_telegram else None
+    )
+
+    import_ids = [job.id for job in db.get_unfinished_bulk_imports()] if args.resume else []
+    if args.file:
+        import_ids.append(importer.register(args.file, file_format=args.format))
+
+    if not import_ids:
+        print("Нет прерванных импортов.")
+        return 0
+
+    failed = False
+    for import_id in import_ids:
+        job = importer.run(import_id)
+        print(describe_bulk_import(job))
+        print()
+        failed = failed or job.status == "failed"
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,9 +3,12 @@ from telethon import TelegramClient, events
 from loguru import logger
 import Config
 from database.db import Database
+from database import create_database
 from handlers.admin import AdminHandler
 from handlers.contacts import ContactHandler
 from handlers.messages import MessageHandler
+from utils.entity_cache import EntityCache
+from utils.conversation import ConversationRouter
 
 # Создаем необходимые директории
 os.makedirs(Config.LOGS_DIR, exist_ok=True)
@@ -24,11 +27,13 @@ logger.add(
 if Config.LOG_TO_CONSOLE:
     logger.add(lambda msg: print(msg, end=""), level=Config.LOG_LEVEL)
 
-def setup_handlers(client: TelegramClient, db: Database):
+def setup_handlers(client: TelegramClient, db: Database, entity_cache: EntityCache):
     """Настройка всех обработчиков"""
-    AdminHandler(client, db)
-    ContactHandler(client, db)
-    MessageHandler(client, db)
+    # Один маршрутизатор ответов администраторов на все обработчики
+    conversations = ConversationRouter(client)
+    AdminHandler(client, db, entity_cache)
+    ContactHandler(client, db, conversations)
+    MessageHandler(client, db, entity_cache, conversations)
 
 async def interactive_auth(client):
     """Интерактивная авторизация с поддержкой 2FA"""
@@ -97,7 +102,7 @@ async def main():
         return
 
     # Инициализация базы данных
-    db = Database(Config.DATABASE_PATH)
+    db = create_database()
     
     # Получаем параметры подключения
     connection_params = Config.get_connection_params()
@@ -129,6 +134,8 @@ async def main():
         
         # Получаем информацию о владельце и обновляем конфигурацию
         me = await client.get_me()
+        entity_cache = EntityCache(client, db)
+        entity_cache.set_self(me)
         if not Config.OWNER_ID:
             Config.OWNER_ID = me.id
             logger.info(f"👑 Владелец установлен: {me.first_name} (ID: {me.id})")
@@ -147,7 +154,7 @@ async def main():
                 logger.warning(f"Не удалось добавить владельца в админы: {e}")
         
         # Настраиваем обработчики
-        setup_handlers(client, db)
+        setup_handlers(client, db, entity_cache)
         logger.info("⚙️ Обработчики успешно настроены!")
         
         # Выводим информацию о конфигурации
@@ -167,6 +174,7 @@ async def main():
             await client.disconnect()
         except:
             pass
+        db.close()
 
 if __name__ == '__main__':
     # Проверяем, настроен ли бот
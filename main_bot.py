@@ -6,19 +6,40 @@
 import os
 import asyncio
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, BotCommand
-from aiogram.filters import Command
+from aiogram.types import (Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, BotCommand, FSInputFile,
+                           BufferedInputFile, InlineQuery, InlineQueryResultArticle, InputTextMessageContent)
+from aiogram.filters import Command, CommandObject
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from loguru import logger
 import Config
-from database.db import Database
+from database import create_database
 from database.models import Contact, Message as DBMessage
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import re
+import html
 
 # Добавляем импорт для userbot
 from telethon import TelegramClient, types, events
 from utils.telegram_contacts import TelegramContactsManager
+from utils.webhook_server import start_update_delivery
+from utils.entity_cache import EntityCache
+from utils.event_filters import IngestionFilter
+from utils.keyed_executor import KeyedExecutor
+from utils.metrics import registry as metrics_registry
+from utils.state_store import StateStore
+from utils.callback_router import CallbackRouter
+from utils import callback_actions as cb
+from utils.render_cache import RenderCache, static_keyboard
+from utils.name_index import NameIndex
+from utils.prefix_index import PrefixIndex
+from utils.message_buffer import RecentMessages
+from utils.history_view import render_history_page, split_text
+from utils.contact_import_queue import ContactImportQueue, describe_import_result
+from utils.bulk_import import BulkContactImporter, VCARD_EXTENSIONS, describe_bulk_import
+from utils.exporters import EXPORTS, export_to_file, transcript_to_file
+from utils.dedup import ContactDeduplicator, describe_dedup_report
+from utils.cold_storage import MessageArchiver, MessageCompressor
+from utils.phone import normalize_phone
 
 # Создаем необходимые директории
 os.makedirs(Config.LOGS_DIR, exist_ok=True)
@@ -40,16 +61,65 @@ if Config.LOG_TO_CONSOLE:
 # Инициализация бота и диспетчера
 bot = Bot(token=Config.BOT_TOKEN)
 dp = Dispatcher()
-db = Database(Config.DATABASE_PATH)
+db = create_database()
+
+# Все inline-кнопки обрабатываются одним маршрутизатором (проверка прав администратора внутри)
+callbacks = CallbackRouter(guard=lambda callback_query: BotHandlers.is_admin(callback_query.from_user.id))
+callbacks.include(dp)
+
+# Отрисованные экраны (списки контактов, карточки) до изменения данных
+render_cache = RenderCache()
+
+# Нечеткий поиск по имени (кириллица/латиница, опечатки)
+name_index = NameIndex(db)
+
+# Префиксный поиск для inline-режима (по началу слов имени и номера)
+prefix_index = PrefixIndex(db)
+
+# Последние сообщения активных диалогов: история открывается без базы и Telegram
+recent_messages = RecentMessages(db, size=Config.MESSAGE_HISTORY_LIMIT + 1)
 
 # Userbot клиент для автоматического импорта контактов
 userbot_client = None
 telegram_contacts_manager = None
+entity_cache = None
+# Обработка входящих userbot: по порядку для каждого отправителя, параллельно между отправителями
+userbot_executor = KeyedExecutor("userbot")
+
+async def notify_contact_import(job, username):
+    """Уведомление администратора о результате фонового импорта контакта"""
+    builder = InlineKeyboardBuilder()
+    if job.telegram_user_id:
+        builder.button(text="💬 Написать", callback_data=cb.SEND_TO.pack(job.contact_id))
+        builder.button(text="📖 История", callback_data=cb.HISTORY.pack(job.contact_id))
+    else:
+        builder.button(text="🔍 Попробовать снова", callback_data=cb.SET_TELEGRAM_ID.pack(job.contact_id))
+    builder.button(text="📇 Карточка", callback_data=cb.CONTACT_CARD.pack(job.contact_id))
+    builder.adjust(2, 1)
+
+    await bot.send_message(job.requested_by, describe_import_result(job, username), reply_markup=builder.as_markup())
+
+# Импорт контактов в Telegram выполняется в фоне пачками с учетом часового лимита
+contact_import_queue = ContactImportQueue(db, notify=notify_contact_import)
+
+# Массовый импорт контактов из файлов CSV/vCard
+bulk_importer = BulkContactImporter(db)
+bulk_import_tasks = set()
+
+# Поиск и слияние дубликатов контактов (по команде /dedup и по расписанию)
+contact_deduplicator = ContactDeduplicator(db)
+dedup_lock = asyncio.Lock()
+dedup_task = None
+
+# Сжатие текста и архив старых сообщений по расписанию
+message_compressor = MessageCompressor(db)
+message_archiver = MessageArchiver(db)
+storage_task = None
 
 # Инициализация userbot для импорта контактов
 async def init_userbot_for_contacts():
     """Инициализация userbot клиента для автоматического импорта контактов"""
-    global userbot_client, telegram_contacts_manager
+    global userbot_client, telegram_contacts_manager, entity_cache
     
     try:
         if Config.AUTO_IMPORT_TO_TELEGRAM:
@@ -67,14 +137,19 @@ async def init_userbot_for_contacts():
             # Подключаемся
             await userbot_client.start(phone=Config.PHONE_NUMBER)
             
-            # Создаем менеджер контактов
+            # Создаем менеджер контактов и запускаем очередь импорта
             telegram_contacts_manager = TelegramContactsManager(userbot_client)
+            contact_import_queue.start(userbot_client)
+            
+            # Кэш сущностей (отправители, username, собственный ID)
+            entity_cache = EntityCache(userbot_client, db)
+            await entity_cache.get_self_id()
             
-            # Добавляем обработчик входящих сообщений
-            @userbot_client.on(events.NewMessage)
+            # Добавляем обработчик входящих сообщений (лишние события отсекаются до сетевых запросов)
+            @userbot_client.on(events.NewMessage(func=IngestionFilter(entity_cache.is_own_account)))
             async def handle_userbot_message(event):
                 """Обработчик входящих сообщений от userbot"""
-                await process_userbot_incoming_message(event)
+                await userbot_executor.submit(event.sender_id, process_userbot_incoming_message, event)
             
             logger.info("✅ Userbot для импорта контактов инициализирован")
         else:
@@ -84,36 +159,40 @@ async def init_userbot_for_contacts():
         logger.error(f"❌ Ошибка при инициализации userbot для контактов: {e}")
         userbot_client = None
         telegram_contacts_manager = None
+        entity_cache = None
 
 class BotHandlers:
     """Обработчики для обычного бота"""
     
     @staticmethod
+    @static_keyboard
     def get_main_keyboard():
         """Создание главной клавиатуры"""
         builder = InlineKeyboardBuilder()
         
-        builder.button(text=Config.BUTTON_TEXTS["contacts_menu"], callback_data="contacts_menu")
-        builder.button(text=Config.BUTTON_TEXTS["send_message"], callback_data="message_send")
-        builder.button(text=Config.BUTTON_TEXTS["message_history"], callback_data="history_view")
-        builder.button(text=Config.BUTTON_TEXTS["search"], callback_data="search_contacts")
-        builder.button(text=Config.BUTTON_TEXTS["manage_admins"], callback_data="admin_manage")
-        builder.button(text=Config.BUTTON_TEXTS["statistics"], callback_data="stats_view")
+        builder.button(text=Config.BUTTON_TEXTS["contacts_menu"], callback_data=cb.CONTACTS_MENU.pack())
+        builder.button(text=Config.BUTTON_TEXTS["send_message"], callback_data=cb.SEND_MENU.pack())
+        builder.button(text=Config.BUTTON_TEXTS["message_history"], callback_data=cb.HISTORY_MENU.pack())
+        builder.button(text=Config.BUTTON_TEXTS["search"], callback_data=cb.CONTACTS_SEARCH.pack())
+        builder.button(text=Config.BUTTON_TEXTS["manage_admins"], callback_data=cb.ADMIN_MENU.pack())
+        builder.button(text=Config.BUTTON_TEXTS["statistics"], callback_data=cb.STATS.pack())
         
         builder.adjust(2)  # 2 кнопки в ряд
         return builder.as_markup()
     
     @staticmethod
+    @static_keyboard
     def get_contacts_keyboard():
         """Клавиатура для меню контактов"""
         builder = InlineKeyboardBuilder()
         
-        builder.button(text=Config.BUTTON_TEXTS["add_contact"], callback_data="contacts_add")
-        builder.button(text=Config.BUTTON_TEXTS["list_contacts"], callback_data="contacts_list")
-        builder.button(text=Config.BUTTON_TEXTS["search_contacts"], callback_data="contacts_search")
-        builder.button(text=Config.BUTTON_TEXTS["back"], callback_data="main_menu")
+        builder.button(text=Config.BUTTON_TEXTS["add_contact"], callback_data=cb.CONTACTS_ADD.pack())
+        builder.button(text=Config.BUTTON_TEXTS["list_contacts"], callback_data=cb.CONTACTS_LIST.pack())
+        builder.button(text=Config.BUTTON_TEXTS["search_contacts"], callback_data=cb.CONTACTS_SEARCH.pack())
+        builder.button(text=Config.BUTTON_TEXTS["import_contacts"], callback_data=cb.CONTACTS_IMPORT.pack())
+        builder.button(text=Config.BUTTON_TEXTS["back"], callback_data=cb.MAIN_MENU.pack())
         
-        builder.adjust(2, 1, 1)  # 2 в первом ряду, по 1 в остальных
+        builder.adjust(2, 2, 1)  # по 2 в первых рядах, "Назад" отдельно
         return builder.as_markup()
     
     @staticmethod
@@ -128,7 +207,9 @@ async def process_userbot_incoming_message(event):
     try:
         # Проверяем что это входящее сообщение от другого пользователя
         if event.is_private and not event.out:
-            sender = await event.get_sender()
+            sender = await entity_cache.get_sender(event)
+            if sender is None:
+                return
             sender_id = sender.id
             sender_name = sender.first_name or ""
             if sender.last_name:
@@ -180,9 +261,9 @@ async def notify_admins_about_userbot_message(contact, message, sender):
     
     # Создаем клавиатуру для быстрого ответа
     builder = InlineKeyboardBuilder()
-    builder.button(text="💬 Ответить", callback_data=f"reply_{contact.id}")
-    builder.button(text="📖 История", callback_data=f"history_{contact.id}")
-    builder.button(text="📇 Карточка", callback_data=f"view_contact_{contact.id}")
+    builder.button(text="💬 Ответить", callback_data=cb.REPLY.pack(contact.id))
+    builder.button(text="📖 История", callback_data=cb.HISTORY.pack(contact.id))
+    builder.button(text="📇 Карточка", callback_data=cb.CONTACT_CARD.pack(contact.id))
     builder.adjust(1)
     
     # Отправляем уведомления всем админам
@@ -301,156 +382,334 @@ async def cmd_list_admins(message: Message):
     
     await message.reply(admin_text)
 
-# Обработчик inline кнопок
-@dp.callback_query(F.data.startswith(("contacts_", "main_", "message_", "search_", "admin_", "stats_")))
-async def process_callback(callback_query: CallbackQuery):
-    """Обработка нажатий на inline кнопки"""
+@dp.message(Command("export"))
+async def cmd_export(message: Message):
+    """Выгрузка контактов или сообщений файлом: /export contacts|messages [csv|jsonl] [дней]"""
     
-    user_id = callback_query.from_user.id
-    data = callback_query.data
+    if not BotHandlers.is_admin(message.from_user.id):
+        await message.reply("⛔ У вас нет прав для выгрузки данных.")
+        return
     
-    # Проверяем права
-    if not BotHandlers.is_admin(user_id):
-        await callback_query.answer("⛔ У вас нет прав администратора.", show_alert=True)
+    args = message.text.split()[1:]
+    kind = args[0] if args else "contacts"
+    file_format = args[1] if len(args) > 1 else "csv"
+    options = {}
+    if kind == "messages" and len(args) > 2 and args[2].isdigit():
+        # timestamp сообщений в базе - UTC (CURRENT_TIMESTAMP)
+        options["since"] = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=int(args[2]))
+    
+    if kind not in EXPORTS or file_format not in ("csv", "jsonl"):
+        await message.reply(
+            "❌ Формат команды:\n"
+            "/export contacts [csv|jsonl]\n"
+            "/export messages [csv|jsonl] [за сколько дней]"
+        )
         return
     
+    progress = await message.reply("⏳ Готовлю выгрузку...")
     try:
-        if data == "main_menu":
-            # Главное меню
-            await callback_query.message.edit_text(
-                "🏠 Главное меню CRM системы\n\nВыберите действие:",
-                reply_markup=BotHandlers.get_main_keyboard()
-            )
-        
-        elif data == "contacts_menu":
-            # Меню контактов
-            await callback_query.message.edit_text(
-                "📇 Управление контактами\n\nВыберите действие:",
-                reply_markup=BotHandlers.get_contacts_keyboard()
-            )
-        
-        elif data == "contacts_add":
-            # Добавление контакта
-            await callback_query.message.edit_text(
-                "➕ Добавление нового контакта\n\n"
-                "Отправьте данные контакта в формате:\n"
-                "Имя\nТелефон\nПримечание (опционально)\n\n"
-                "Пример:\n"
-                "Иван Иванов\n"
-                "+79001234567\n"
-                "ВИП клиент"
-            )
-        
-        elif data == "contacts_list":
-            # Список контактов
-            contacts = db.get_all_contacts(limit=Config.CONTACTS_PER_PAGE)
-            
-            if not contacts:
-                builder = InlineKeyboardBuilder()
-                builder.button(text="⬅️ Назад", callback_data="contacts_menu")
-                
-                await callback_query.message.edit_text(
-                    "📋 Список контактов пуст.",
-                    reply_markup=builder.as_markup()
-                )
-            else:
-                contact_text = "📋 Список контактов:\n\n"
-                for contact in contacts:
-                    contact_text += (
-                        f"👤 {contact.name}\n"
-                        f"📱 {contact.phone}\n"
-                        f"📝 {contact.note or '-'}\n"
-                        f"➖➖➖➖➖\n"
-                    )
-                
-                builder = InlineKeyboardBuilder()
-                builder.button(text="⬅️ Назад", callback_data="contacts_menu")
-                
-                await callback_query.message.edit_text(contact_text, reply_markup=builder.as_markup())
-        
-        elif data == "stats_view":
-            # Статистика
-            contacts_count = db.get_contacts_count()
-            messages_total = db.get_messages_count()
-            messages_today = db.get_messages_count_by_period(1)
-            messages_week = db.get_messages_count_by_period(7)
-            admins_count = len(db.get_all_admins())
-            
-            stats_text = (
-                "📊 Статистика CRM системы\n\n"
-                f"👥 Контактов в базе: {contacts_count}\n"
-                f"💬 Всего сообщений: {messages_total}\n"
-                f"📅 Сообщений сегодня: {messages_today}\n"
-                f"📈 Сообщений за неделю: {messages_week}\n"
-                f"🛡️ Администраторов: {admins_count}"
-            )
-            
-            builder = InlineKeyboardBuilder()
-            builder.button(text="⬅️ Назад", callback_data="main_menu")
-            
-            await callback_query.message.edit_text(stats_text, reply_markup=builder.as_markup())
-        
-        elif data == "message_send":
-            # Отправка сообщения
-            await show_send_message_menu(callback_query)
-        
-        elif data == "history_view":
-            # История переписки
-            await show_history_menu(callback_query)
-        
-        elif data == "search_contacts":
-            # Поиск контактов
-            await show_search_menu(callback_query)
-        
-        elif data == "admin_manage":
-            # Управление администраторами
-            await show_admin_menu(callback_query)
-        
-        elif data.startswith("remove_admin_"):
-            # Подтверждение удаления администратора
-            admin_id = int(data.split("_")[2])
-            
-            admin = next((a for a in db.get_all_admins() if a.telegram_user_id == admin_id), None)
-            if admin:
-                builder = InlineKeyboardBuilder()
-                builder.button(text="✅ Да, удалить", callback_data=f"confirm_remove_{admin_id}")
-                builder.button(text="❌ Отмена", callback_data="admin_list")
-                builder.adjust(1)
-                
-                await callback_query.message.edit_text(
-                    f"⚠️ Удалить администратора @{admin.username}?\n\n"
-                    f"🆔 ID: {admin.telegram_user_id}",
-                    reply_markup=builder.as_markup()
-                )
-            else:
-                await callback_query.answer("❌ Администратор не найден", show_alert=True)
-        
-        elif data.startswith("confirm_remove_"):
-            # Подтверждение удаления администратора
-            admin_id = int(data.split("_")[2])
-            
+        path, count = await asyncio.to_thread(export_to_file, db, kind, file_format, **options)
+    except Exception as e:
+        logger.error(f"Ошибка при экспорте {kind}: {e}")
+        await progress.edit_text("❌ Ошибка при выгрузке данных.")
+        return
+    
+    await send_export_file(message.chat.id, path, f"📤 {kind}: {count} строк")
+    await progress.delete()
+
+@dp.message(Command("dedup"))
+async def cmd_dedup(message: Message):
+    """Поиск дубликатов контактов с подтверждением слияния"""
+    
+    if not BotHandlers.is_admin(message.from_user.id):
+        await message.reply("⛔ У вас нет прав для объединения контактов.")
+        return
+    
+    progress = await message.reply("⏳ Ищу дубликаты...")
+    report = await run_dedup(dry_run=True)
+    
+    builder = InlineKeyboardBuilder()
+    if report.merges:
+        builder.button(text=f"🔗 Объединить ({len(report.merges)})", callback_data=cb.DEDUP_MERGE.pack())
+    builder.button(text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack())
+    builder.adjust(1)
+    
+    await progress.edit_text(describe_dedup_report(report, dry_run=True), reply_markup=builder.as_markup())
+
+@callbacks.on(cb.DEDUP_MERGE)
+async def on_dedup_merge(callback_query: CallbackQuery):
+    """Слияние найденных дубликатов"""
+    await callback_query.message.edit_text("⏳ Объединяю дубликаты...")
+    try:
+        report = await run_dedup(dry_run=False)
+    except Exception as e:
+        logger.error(f"Ошибка при объединении дубликатов: {e}")
+        await callback_query.message.edit_text("❌ Ошибка при объединении дубликатов.")
+        return
+    
+    builder = InlineKeyboardBuilder()
+    builder.button(text="📇 Контакты", callback_data=cb.CONTACTS_MENU.pack())
+    builder.button(text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack())
+    builder.adjust(1)
+    await callback_query.message.edit_text(describe_dedup_report(report), reply_markup=builder.as_markup())
+
+async def run_dedup(dry_run: bool):
+    """Поиск (и слияние) дубликатов в отдельном потоке, не более одного запуска одновременно"""
+    async with dedup_lock:
+        return await asyncio.to_thread(contact_deduplicator.run, dry_run)
+
+async def auto_dedup_loop():
+    """Периодическое слияние дубликатов (AUTO_MERGE_DUPLICATES, раз в AUTO_TASKS_INTERVAL_HOURS)"""
+    while True:
+        await asyncio.sleep(Config.AUTO_TASKS_INTERVAL_HOURS * 3600)
+        try:
+            await run_dedup(dry_run=False)
+        except Exception as e:
+            logger.error(f"Ошибка при автоматическом объединении дубликатов: {e}")
+
+async def auto_storage_loop():
+    """
+    Периодическое обслуживание старых сообщений (раз в AUTO_TASKS_INTERVAL_HOURS):
+    сжатие текста (AUTO_COMPRESS_MESSAGES) и перенос в архив (AUTO_ARCHIVE_MESSAGES)
+    """
+    while True:
+        if Config.AUTO_COMPRESS_MESSAGES:
             try:
-                db.remove_admin(admin_id)
-                # Удаляем из списка Config
-                if admin_id in Config.ADMIN_IDS:
-                    Config.ADMIN_IDS.remove(admin_id)
-                
-                await callback_query.answer("✅ Администратор удален")
-                await show_admin_list(callback_query)
-                
+                await asyncio.to_thread(message_compressor.run)
             except Exception as e:
-                logger.error(f"Ошибка при удалении админа: {e}")
-                await callback_query.answer("❌ Ошибка при удалении", show_alert=True)
-        
-        else:
-            await callback_query.answer("🚧 Функция в разработке", show_alert=True)
+                logger.error(f"Ошибка при сжатии старых сообщений: {e}")
+        if Config.AUTO_ARCHIVE_MESSAGES:
+            try:
+                await asyncio.to_thread(message_archiver.run)
+            except Exception as e:
+                logger.error(f"Ошибка при переносе сообщений в архив: {e}")
+        await asyncio.sleep(Config.AUTO_TASKS_INTERVAL_HOURS * 3600)
+
+@dp.message(Command("metrics"))
+async def cmd_metrics(message: Message):
+    """Показать внутренние метрики"""
     
-    except Exception as e:
-        logger.error(f"Ошибка при обработке callback: {e}")
-        await callback_query.answer("❌ Произошла ошибка.", show_alert=True)
+    if not BotHandlers.is_admin(message.from_user.id):
+        await message.reply("⛔ У вас нет прав для просмотра метрик.")
+        return
     
-    await callback_query.answer()
+    text = metrics_registry.render_text() or "📈 Метрик пока нет"
+    if len(text) <= Config.MAX_MESSAGE_LENGTH:
+        await message.reply(text)
+        return
+    # Полный список метрик не помещается в сообщение Telegram - отправляем файлом
+    await message.reply_document(
+        BufferedInputFile(text.encode(), filename="metrics.txt"),
+        caption=f"📈 Метрики: {len(metrics_registry.metrics)}"
+    )
+
+@dp.message(Command(re.compile(r"msg_(\d+)")))
+async def cmd_open_message(message: Message, command: CommandObject):
+    """Полный текст сообщения из истории (/msg_<id>): в истории показывается только начало"""
+    
+    if not BotHandlers.is_admin(message.from_user.id):
+        await message.reply("⛔ У вас нет прав для просмотра переписки.")
+        return
+    
+    stored = db.get_message(int(command.regexp_match.group(1)))
+    contact = db.get_contact(stored.contact_id) if stored else None
+    if not contact:
+        await message.reply("❌ Сообщение не найдено")
+        return
+    
+    direction = "📤 Вы" if stored.direction == "outgoing" else f"📨 {contact.name}"
+    text = f"{direction}, {stored.timestamp.strftime(Config.DATE_FORMAT)}\n\n{stored.text or '[Медиа файл]'}"
+    for part in split_text(text, Config.MAX_MESSAGE_LENGTH):
+        await message.answer(part)
 
+# =================================================================
+# 🔎 INLINE-ПОИСК КОНТАКТОВ (@бот запрос)
+# =================================================================
+
+@dp.inline_query()
+async def handle_inline_query(inline_query: InlineQuery):
+    """Живой поиск контактов по началу имени или номера"""
+
+    if not BotHandlers.is_admin(inline_query.from_user.id):
+        await inline_query.answer([], cache_time=Config.INLINE_CACHE_TIME, is_personal=True)
+        return
+
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    contact_ids, next_offset = prefix_index.search(inline_query.query, offset, Config.INLINE_RESULTS_LIMIT)
+
+    results = []
+    for contact in db.get_contacts_by_ids(contact_ids):
+        details = f"📱 {contact.phone}" + (f"\n📝 {contact.note}" if contact.note else "")
+        results.append(InlineQueryResultArticle(
+            id=str(contact.id),
+            title=contact.name,
+            description=details,
+            input_message_content=InputTextMessageContent(message_text=f"👤 {contact.name}\n{details}"),
+        ))
+
+    # Результаты содержат данные CRM, поэтому кэш Telegram - только для этого администратора
+    await inline_query.answer(
+        results,
+        cache_time=Config.INLINE_CACHE_TIME,
+        is_personal=True,
+        next_offset=str(next_offset) if next_offset is not None else "",
+    )
+
+# =================================================================
+# 📞 ОБРАБОТЧИКИ INLINE КНОПОК
+# =================================================================
+
+@callbacks.on(cb.MAIN_MENU)
+async def on_main_menu(callback_query: CallbackQuery):
+    """Главное меню"""
+    await callback_query.message.edit_text(
+        "🏠 Главное меню CRM системы\n\nВыберите действие:",
+        reply_markup=BotHandlers.get_main_keyboard()
+    )
+
+@callbacks.on(cb.CONTACTS_MENU)
+async def on_contacts_menu(callback_query: CallbackQuery):
+    """Меню контактов"""
+    await callback_query.message.edit_text(
+        "📇 Управление контактами\n\nВыберите действие:",
+        reply_markup=BotHandlers.get_contacts_keyboard()
+    )
+
+@callbacks.on(cb.CONTACTS_ADD)
+async def on_contacts_add(callback_query: CallbackQuery):
+    """Добавление контакта"""
+    await callback_query.message.edit_text(
+        "➕ Добавление нового контакта\n\n"
+        "Отправьте данные контакта в формате:\n"
+        "Имя\nТелефон\nПримечание (опционально)\n\n"
+        "Пример:\n"
+        "Иван Иванов\n"
+        "+79001234567\n"
+        "ВИП клиент"
+    )
+
+@callbacks.on(cb.CONTACTS_IMPORT)
+async def on_contacts_import(callback_query: CallbackQuery):
+    """Массовый импорт контактов из файла"""
+    user_import_states[callback_query.from_user.id] = True
+
+    await callback_query.message.edit_text(
+        "📥 Импорт контактов из файла\n\n"
+        "Отправьте файл CSV или vCard (.vcf).\n\n"
+        "CSV: колонки name, phone, note (или имя, телефон, примечание);\n"
+        "без заголовка - в таком же порядке.\n\n"
+        "Номера, которые уже есть в базе, будут пропущены.",
+        reply_markup=InlineKeyboardBuilder().button(
+            text=Config.BUTTON_TEXTS["cancel"], callback_data=cb.CONTACTS_MENU.pack()
+        ).as_markup()
+    )
+
+@callbacks.on(cb.CONTACTS_LIST)
+async def on_contacts_list(callback_query: CallbackQuery, page: int = 0):
+    """Список контактов"""
+    text, markup = render_cache.get(
+        "contacts_list", page, db.data_version("contacts"),
+        lambda: render_contacts_list(page)
+    )
+    await callback_query.message.edit_text(text, reply_markup=markup)
+
+def render_contacts_list(page: int = 0):
+    """Текст и клавиатура списка контактов"""
+    contacts = db.get_all_contacts(limit=Config.CONTACTS_PER_PAGE, offset=page * Config.CONTACTS_PER_PAGE)
+
+    builder = InlineKeyboardBuilder()
+    builder.button(text="⬅️ Назад", callback_data=cb.CONTACTS_MENU.pack())
+
+    if not contacts:
+        return "📋 Список контактов пуст.", builder.as_markup()
+
+    contact_text = "📋 Список контактов:\n\n"
+    for contact in contacts:
+        contact_text += (
+            f"👤 {contact.name}\n"
+            f"📱 {contact.phone}\n"
+            f"📝 {contact.note or '-'}\n"
+            f"➖➖➖➖➖\n"
+        )
+
+    return contact_text, builder.as_markup()
+
+@callbacks.on(cb.STATS)
+async def on_stats(callback_query: CallbackQuery):
+    """Статистика"""
+    contacts_count = db.get_contacts_count()
+    messages_total = db.get_messages_count()
+    messages_today = db.get_messages_count_by_period(1)
+    messages_week = db.get_messages_count_by_period(7)
+    admins_count = len(db.get_all_admins())
+
+    stats_text = (
+        "📊 Статистика CRM системы\n\n"
+        f"👥 Контактов в базе: {contacts_count}\n"
+        f"💬 Всего сообщений: {messages_total}\n"
+        f"📅 Сообщений сегодня: {messages_today}\n"
+        f"📈 Сообщений за неделю: {messages_week}\n"
+        f"🛡️ Администраторов: {admins_count}"
+    )
+
+    builder = InlineKeyboardBuilder()
+    builder.button(text="⬅️ Назад", callback_data=cb.MAIN_MENU.pack())
+
+    await callback_query.message.edit_text(stats_text, reply_markup=builder.as_markup())
+
+@callbacks.on(cb.SEND_MENU)
+async def on_send_menu(callback_query: CallbackQuery):
+    """Отправка сообщения"""
+    await show_send_message_menu(callback_query)
+
+@callbacks.on(cb.HISTORY_MENU)
+async def on_history_menu(callback_query: CallbackQuery):
+    """История переписки"""
+    await show_history_menu(callback_query)
+
+@callbacks.on(cb.CONTACTS_SEARCH)
+async def on_contacts_search(callback_query: CallbackQuery):
+    """Поиск контактов"""
+    await show_search_menu(callback_query)
+
+@callbacks.on(cb.ADMIN_MENU)
+async def on_admin_menu(callback_query: CallbackQuery):
+    """Управление администраторами"""
+    await show_admin_menu(callback_query)
+
+@callbacks.on(cb.ADMIN_REMOVE_ASK)
+async def on_admin_remove_ask(callback_query: CallbackQuery, admin_id: int):
+    """Подтверждение удаления администратора"""
+    admin = next((a for a in db.get_all_admins() if a.telegram_user_id == admin_id), None)
+    if admin:
+        builder = InlineKeyboardBuilder()
+        builder.button(text="✅ Да, удалить", callback_data=cb.ADMIN_REMOVE_CONFIRM.pack(admin_id))
+        builder.button(text="❌ Отмена", callback_data=cb.ADMIN_LIST.pack())
+        builder.adjust(1)
+
+        await callback_query.message.edit_text(
+            f"⚠️ Удалить администратора @{admin.username}?\n\n"
+            f"🆔 ID: {admin.telegram_user_id}",
+            reply_markup=builder.as_markup()
+        )
+    else:
+        await callback_query.answer("❌ Администратор не найден", show_alert=True)
+
+@callbacks.on(cb.ADMIN_REMOVE_CONFIRM)
+async def on_admin_remove_confirm(callback_query: CallbackQuery, admin_id: int):
+    """Удаление администратора"""
+    try:
+        db.remove_admin(admin_id)
+        # Удаляем из списка Config
+        if admin_id in Config.ADMIN_IDS:
+            Config.ADMIN_IDS.remove(admin_id)
+
+        await callback_query.answer("✅ Администратор удален")
+        await show_admin_list(callback_query)
+
+    except Exception as e:
+        logger.error(f"Ошибка при удалении админа: {e}")
+        await callback_query.answer("❌ Ошибка при удалении", show_alert=True)
 
 
 async def handle_client_message(message: Message):
@@ -467,7 +726,7 @@ async def handle_client_message(message: Message):
         if not contact:
             # Если контакта нет, создаем новый
             phone = f"+{user_id}"  # Временный номер на основе ID
-            contact_id = db.add_contact(full_name, phone, f"Telegram: @{username}")
+            contact_id = db.add_contact(full_name, phone, f"Telegram: @{username}", synthetic=True)
             db.update_contact_telegram_id(contact_id, user_id)
             contact = db.get_contact(contact_id)
             logger.info(f"Создан новый контакт для пользователя {full_name} (ID: {user_id})")
@@ -512,9 +771,9 @@ async def notify_admins_about_message(contact, client_message: Message):
     
     # Создаем клавиатуру для быстрого ответа
     builder = InlineKeyboardBuilder()
-    builder.button(text="📖 История чата", callback_data=f"history_{contact.id}")
-    builder.button(text="💬 Быстрый ответ", callback_data=f"reply_{contact.id}")
-    builder.button(text="📇 Карточка", callback_data=f"contact_{contact.id}")
+    builder.button(text="📖 История чата", callback_data=cb.HISTORY.pack(contact.id))
+    builder.button(text="💬 Быстрый ответ", callback_data=cb.REPLY.pack(contact.id))
+    builder.button(text="📇 Карточка", callback_data=cb.CONTACT_CARD.pack(contact.id))
     builder.adjust(1)
     
     # Отправляем уведомления всем админам
@@ -530,111 +789,157 @@ async def notify_admins_about_message(contact, client_message: Message):
         except Exception as e:
             logger.error(f"Ошибка при отправке уведомления админу {admin.username}: {e}")
 
-# Добавляем новые callback обработчики
-@dp.callback_query(F.data.startswith(("history_", "contact_", "send_reply_", "view_history_")))
-async def handle_client_callbacks(callback_query: CallbackQuery):
-    """Обработка callback для работы с клиентами"""
-    
-    user_id = callback_query.from_user.id
-    data = callback_query.data
-    
-    # Проверяем права
-    if not BotHandlers.is_admin(user_id):
-        await callback_query.answer("⛔ У вас нет прав администратора.", show_alert=True)
-        return
-    
-    try:
-        if data == "history_view":
-            # История переписки из главного меню
-            await show_history_menu(callback_query)
-            
-        elif data == "history_by_contact":
-            # Показать контакты для истории
-            await show_contacts_for_history(callback_query)
-            
-        elif data.startswith("view_history_"):
-            # Показать историю конкретного контакта
-            contact_id = int(data.split("_")[2])
-            await show_chat_history(callback_query, contact_id)
-            
-        elif data.startswith("history_contacts_page_"):
-            # Пагинация контактов для истории
-            page = int(data.split("_")[3])
-            await show_contacts_for_history(callback_query, page)
-            
-        elif data == "history_search_contact":
-            await callback_query.answer("🔍 Функция поиска для истории в разработке", show_alert=True)
-            
-        elif data == "history_stats":
-            await callback_query.answer("📊 Статистика переписки в разработке", show_alert=True)
-            
-        elif data.startswith("history_"):
-            # Показать историю чата (для контактов с числовым ID)
-            try:
-                contact_id = int(data.split("_")[1])
-                await show_chat_history(callback_query, contact_id)
-            except ValueError:
-                await callback_query.answer("❌ Неверный формат callback", show_alert=True)
-            
-        elif data.startswith("contact_"):
-            # Показать карточку контакта
-            contact_id = int(data.split("_")[1])
-            await show_contact_card(callback_query, contact_id)
-            
-        elif data.startswith("send_reply_"):
-            # Отправить ответ (пока заглушка)
-            await callback_query.answer("💬 Введите ваш ответ в следующем сообщении", show_alert=True)
-            
-    except Exception as e:
-        logger.error(f"Ошибка при обработке callback для клиента: {e}")
-        await callback_query.answer("❌ Произошла ошибка.", show_alert=True)
-    
-    await callback_query.answer()
+@callbacks.on(cb.HISTORY_CONTACTS)
+async def on_history_contacts(callback_query: CallbackQuery, page: int = 0):
+    """Контакты для просмотра истории"""
+    await show_contacts_for_history(callback_query, page)
 
-async def show_chat_history(callback_query: CallbackQuery, contact_id: int):
-    """Показать историю чата с клиентом через userbot"""
-    
+@callbacks.on(cb.HISTORY)
+async def on_history(callback_query: CallbackQuery, contact_id: int):
+    """История чата с контактом"""
+    await show_chat_history(callback_query, contact_id)
+
+@callbacks.on(cb.HISTORY_REFRESH)
+async def on_history_refresh(callback_query: CallbackQuery, contact_id: int):
+    """История чата, заново загруженная из Telegram и базы"""
+    await show_chat_history(callback_query, contact_id, refresh=True)
+
+@callbacks.on(cb.HISTORY_PAGE)
+async def on_history_page(callback_query: CallbackQuery, contact_id: int, cursor_id: int, newer: bool = False):
+    """Более ранняя или поздняя страница истории чата"""
+    await show_chat_history(callback_query, contact_id, cursor_id=cursor_id, newer=newer)
+
+@callbacks.on(cb.HISTORY_SEARCH)
+async def on_history_search(callback_query: CallbackQuery):
+    await callback_query.answer("🔍 Функция поиска для истории в разработке", show_alert=True)
+
+@callbacks.on(cb.HISTORY_STATS)
+async def on_history_stats(callback_query: CallbackQuery):
+    await callback_query.answer("📊 Статистика переписки в разработке", show_alert=True)
+
+@callbacks.on(cb.TRANSCRIPT)
+async def on_transcript(callback_query: CallbackQuery, contact_id: int):
+    """Выгрузка всей переписки с контактом файлом"""
     contact = db.get_contact(contact_id)
     if not contact:
         await callback_query.answer("❌ Контакт не найден", show_alert=True)
         return
 
-    # Получаем историю через userbot и базу данных
-    await callback_query.answer("🔄 Загружаю историю...", show_alert=False)
-    
+    await callback_query.answer("📄 Готовлю файл...")
+    path = await asyncio.to_thread(transcript_to_file, db, contact)
+    await send_export_file(callback_query.from_user.id, path, f"📄 Переписка с {contact.name}")
+
+async def send_export_file(chat_id: int, path: str, caption: str):
+    """
+    Отправка файла выгрузки с удалением временного файла
+
+    Файл больше EXPORT_MAX_UPLOAD_BYTES Bot API не примет - он остается
+    на сервере, а администратор получает путь к нему.
+    """
+    size = os.path.getsize(path)
+    if size > Config.EXPORT_MAX_UPLOAD_BYTES:
+        logger.warning(f"📦 Выгрузка {path} ({size} байт) больше лимита отправки, оставлена на сервере")
+        await bot.send_message(
+            chat_id,
+            f"{caption}\n\n"
+            f"📦 Файл слишком большой для Telegram ({size / 1024 / 1024:.1f} МБ), "
+            f"он сохранен на сервере:\n{os.path.abspath(path)}"
+        )
+        return
     try:
-        # Сначала синхронизируем историю с Telegram через userbot
-        if userbot_client and contact.telegram_user_id:
-            await sync_chat_history_from_telegram(contact_id, contact.telegram_user_id)
-        
-        # Получаем обновленную историю из базы
-        messages = db.get_contact_messages(contact_id, limit=Config.MESSAGE_HISTORY_LIMIT)
-        
+        await bot.send_document(chat_id, FSInputFile(path), caption=caption)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+@callbacks.on(cb.CONTACT_CARD)
+async def on_contact_card(callback_query: CallbackQuery, contact_id: int):
+    """Карточка контакта"""
+    await show_contact_card(callback_query, contact_id)
+
+async def show_chat_history(callback_query: CallbackQuery, contact_id: int, refresh: bool = False,
+                            cursor_id: int = None, newer: bool = False):
+    """
+    Показать страницу истории чата с клиентом
+
+    Последняя страница активного диалога берется из буфера последних
+    сообщений, иначе (и по кнопке "Обновить") история синхронизируется
+    с Telegram через userbot и читается из базы. Более ранние и поздние
+    страницы читаются от курсора (ID крайнего показанного сообщения).
+    Страница вмещает до MESSAGE_HISTORY_LIMIT сообщений, но не длиннее
+    MAX_MESSAGE_LENGTH символов - остальные переходят на соседнюю страницу.
+    """
+    limit = Config.MESSAGE_HISTORY_LIMIT
+    # Одно лишнее сообщение показывает, есть ли следующая страница
+    cached = None if refresh or cursor_id else recent_messages.history(contact_id, limit + 1)
+    if cached:
+        contact, messages = cached
+        await callback_query.answer()
+    else:
+        contact = db.get_contact(contact_id)
+        if not contact:
+            await callback_query.answer("❌ Контакт не найден", show_alert=True)
+            return
+        await callback_query.answer("🔄 Загружаю историю..." if cursor_id is None else None)
+
+    try:
+        if cursor_id is not None:
+            messages = db.get_messages_page(contact_id, cursor_id, newer, limit + 1)
+            if not messages:
+                # Сообщение-курсор удалено или перенесено к другому контакту
+                cursor_id, newer = None, False
+        if not cached and cursor_id is None:
+            # Сначала синхронизируем историю с Telegram через userbot
+            if userbot_client and contact.telegram_user_id:
+                await sync_chat_history_from_telegram(contact_id, contact.telegram_user_id)
+
+            # Получаем обновленную историю из базы (и сохраняем в буфер)
+            contact, messages = recent_messages.load(contact_id, limit + 1)
+            if not contact:
+                await callback_query.message.edit_text("❌ Контакт не найден")
+                return
+
+        builder = InlineKeyboardBuilder()
         if not messages:
-            history_text = f"📖 История чата с {contact.name}\n\n📭 Сообщений пока нет"
+            history_text = f"📖 История чата с {html.escape(contact.name)}\n\n📭 Сообщений пока нет"
         else:
-            history_text = f"📖 История чата с {contact.name}\n\n"
-            
-            # Показываем сообщения в хронологическом порядке (сначала старые)
-            for msg in reversed(messages):
-                direction_icon = "📤" if msg.direction == "outgoing" else "📨"
-                timestamp = msg.timestamp.strftime('%d.%m %H:%M')
-                
-                # Обрезаем длинные сообщения
-                text_preview = msg.text or "[Медиа файл]"
-                if len(text_preview) > 80:
-                    text_preview = text_preview[:80] + "..."
-                
-                history_text += f"{direction_icon} <b>{timestamp}</b>\n{text_preview}\n\n"
-        
+            history_text, shown = render_history_page(
+                f"📖 История чата с {html.escape(contact.name)}\n\n", messages[:limit],
+                Config.MAX_MESSAGE_LENGTH, newest_first=not newer
+            )
+            more = shown < len(messages)
+            page = messages[:shown]
+            if newer:
+                has_older, has_newer = True, more
+                oldest, newest = page[0], page[-1]
+            else:
+                has_older, has_newer = more, cursor_id is not None
+                oldest, newest = page[-1], page[0]
+
+            nav_buttons = []
+            if has_older:
+                nav_buttons.append(InlineKeyboardButton(
+                    text="⬅️ Раньше", callback_data=cb.HISTORY_PAGE.pack(contact_id, oldest.id, False)
+                ))
+            if has_newer:
+                nav_buttons.append(InlineKeyboardButton(
+                    text="Позже ➡️", callback_data=cb.HISTORY_PAGE.pack(contact_id, newest.id, True)
+                ))
+            if nav_buttons:
+                builder.row(*nav_buttons)
+
         # Создаем клавиатуру
-        builder = InlineKeyboardBuilder()
-        builder.button(text="💬 Ответить", callback_data=f"reply_{contact_id}")
-        builder.button(text="📇 Карточка", callback_data=f"view_contact_{contact_id}")
-        builder.button(text="🔄 Обновить", callback_data=f"history_{contact_id}")
-        builder.button(text="🏠 Главное меню", callback_data="main_menu")
-        builder.adjust(2, 2)
-        
+        actions = InlineKeyboardBuilder()
+        actions.button(text="💬 Ответить", callback_data=cb.REPLY.pack(contact_id))
+        actions.button(text="📇 Карточка", callback_data=cb.CONTACT_CARD.pack(contact_id))
+        actions.button(text="🔄 Обновить", callback_data=cb.HISTORY_REFRESH.pack(contact_id))
+        actions.button(text="📄 Выгрузить переписку", callback_data=cb.TRANSCRIPT.pack(contact_id))
+        actions.button(text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack())
+        actions.adjust(2, 2, 1)
+        builder.attach(actions)
+
         await callback_query.message.edit_text(
             history_text, 
             reply_markup=builder.as_markup(),
@@ -645,7 +950,7 @@ async def show_chat_history(callback_query: CallbackQuery, contact_id: int):
         logger.error(f"Ошибка при загрузке истории чата: {e}")
         await callback_query.message.edit_text(
             f"❌ Ошибка при загрузке истории чата с {contact.name}",
-            reply_markup=InlineKeyboardBuilder().button(text="🏠 Главное меню", callback_data="main_menu").as_markup()
+            reply_markup=InlineKeyboardBuilder().button(text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack()).as_markup()
         )
 
 async def sync_chat_history_from_telegram(contact_id: int, telegram_user_id: int):
@@ -697,9 +1002,9 @@ async def show_reply_interface(callback_query: CallbackQuery, contact_id: int):
     callback_query.message.reply_to_contact_id = contact_id
     
     builder = InlineKeyboardBuilder()
-    builder.button(text="📖 История", callback_data=f"history_{contact_id}")
-    builder.button(text="📇 Карточка", callback_data=f"contact_{contact_id}")
-    builder.button(text="❌ Отмена", callback_data="main_menu")
+    builder.button(text="📖 История", callback_data=cb.HISTORY.pack(contact_id))
+    builder.button(text="📇 Карточка", callback_data=cb.CONTACT_CARD.pack(contact_id))
+    builder.button(text="❌ Отмена", callback_data=cb.MAIN_MENU.pack())
     builder.adjust(2, 1)
     
     await callback_query.message.edit_text(
@@ -709,16 +1014,27 @@ async def show_reply_interface(callback_query: CallbackQuery, contact_id: int):
 
 async def show_contact_card(callback_query: CallbackQuery, contact_id: int):
     """Показать карточку контакта"""
-    
-    contact = db.get_contact(contact_id)
-    if not contact:
+    screen = render_cache.get(
+        "contact_card", contact_id, db.data_version("contacts", "messages"),
+        lambda: render_contact_card(contact_id)
+    )
+    if screen is None:
         await callback_query.answer("❌ Контакт не найден", show_alert=True)
         return
+
+    card_text, markup = screen
+    await callback_query.message.edit_text(card_text, reply_markup=markup, parse_mode="HTML")
+
+def render_contact_card(contact_id: int):
+    """Текст и клавиатура карточки контакта (None, если контакт не найден)"""
+    contact = db.get_contact(contact_id)
+    if not contact:
+        return None
     
     # Получаем статистику сообщений
-    messages = db.get_contact_messages(contact_id, limit=100)
-    incoming_count = len([m for m in messages if m.direction == "incoming"])
-    outgoing_count = len([m for m in messages if m.direction == "outgoing"])
+    counts = db.get_message_counts([contact_id]).get(contact_id, {})
+    incoming_count = counts.get("incoming", 0)
+    outgoing_count = counts.get("outgoing", 0)
     
     card_text = (
         f"📇 Карточка контакта\n\n"
@@ -730,29 +1046,77 @@ async def show_contact_card(callback_query: CallbackQuery, contact_id: int):
         f"📊 <b>Статистика:</b>\n"
         f"📨 Входящих: {incoming_count}\n"
         f"📤 Исходящих: {outgoing_count}\n"
-        f"💬 Всего: {len(messages)}"
+        f"💬 Всего: {incoming_count + outgoing_count}"
     )
     
     builder = InlineKeyboardBuilder()
-    builder.button(text="📖 История", callback_data=f"history_{contact_id}")
+    builder.button(text="📖 История", callback_data=cb.HISTORY.pack(contact_id))
     if contact.telegram_user_id:
-        builder.button(text="💬 Ответить", callback_data=f"reply_{contact_id}")
+        builder.button(text="💬 Ответить", callback_data=cb.REPLY.pack(contact_id))
     else:
-        builder.button(text="🔗 Установить Telegram ID", callback_data=f"set_telegram_id_{contact_id}")
-    builder.button(text="✏️ Редактировать", callback_data=f"edit_{contact_id}")
-    builder.button(text="🏠 Главное меню", callback_data="main_menu")
+        builder.button(text="🔗 Установить Telegram ID", callback_data=cb.SET_TELEGRAM_ID.pack(contact_id))
+    builder.button(text="✏️ Редактировать", callback_data=cb.CONTACT_EDIT.pack(contact_id))
+    builder.button(text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack())
     builder.adjust(2, 1, 1)
     
-    await callback_query.message.edit_text(
-        card_text, 
-        reply_markup=builder.as_markup(),
-        parse_mode="HTML"
+    return card_text, builder.as_markup()
+
+# Состояния для различных операций (с TTL, сохраняются в базе между перезапусками)
+user_reply_states = StateStore("reply", db)
+user_search_states = StateStore("search", db)
+user_message_states = StateStore("message", db)
+user_import_states = StateStore("import", db)
+
+@dp.message(F.document)
+async def handle_import_file(message: Message):
+    """Прием файла для массового импорта контактов"""
+    user_id = message.from_user.id
+    if not BotHandlers.is_admin(user_id) or user_import_states.pop(user_id, None) is None:
+        return
+
+    document = message.document
+    file_name = document.file_name or "contacts.csv"
+    file_format = "vcard" if file_name.lower().endswith(VCARD_EXTENSIONS) else "csv"
+
+    os.makedirs(Config.IMPORTS_DIR, exist_ok=True)
+    path = os.path.join(Config.IMPORTS_DIR, f"{document.file_unique_id}_{os.path.basename(file_name)}")
+
+    try:
+        await bot.download(document, destination=path)
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке файла импорта: {e}")
+        await message.reply("❌ Не удалось загрузить файл.")
+        return
+
+    import_id = bulk_importer.register(path, requested_by=user_id, file_format=file_format)
+    start_bulk_import(import_id)
+
+    await message.reply(
+        f"⏳ Импорт файла {file_name} начат.\n"
+        f"Пришлю отчет, когда все записи будут обработаны."
     )
 
-# Состояния для различных операций
-user_reply_states = {}
-user_search_states = {}
-user_message_states = {}
+def start_bulk_import(import_id: int):
+    """Запуск массового импорта в фоне"""
+    task = asyncio.create_task(run_bulk_import(import_id))
+    bulk_import_tasks.add(task)
+    task.add_done_callback(bulk_import_tasks.discard)
+
+async def run_bulk_import(import_id: int):
+    """Массовый импорт с отчетом администратору"""
+    job = await bulk_importer.run_async(import_id)
+    # Новые контакты уже в очереди поиска в Telegram
+    contact_import_queue.wakeup()
+
+    if job.requested_by:
+        builder = InlineKeyboardBuilder()
+        builder.button(text="📇 Контакты", callback_data=cb.CONTACTS_LIST.pack())
+        builder.button(text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack())
+        builder.adjust(1)
+        try:
+            await bot.send_message(job.requested_by, describe_bulk_import(job), reply_markup=builder.as_markup())
+        except Exception as e:
+            logger.warning(f"Не удалось отправить отчет об импорте {import_id}: {e}")
 
 # Обновленный обработчик сообщений с проверкой состояния ответа
 @dp.message(F.text)
@@ -770,20 +1134,20 @@ async def handle_text_messages_updated(message: Message):
     if user_id in user_reply_states:
         contact_id = user_reply_states[user_id]
         await send_reply_to_client(message, contact_id)
-        del user_reply_states[user_id]
+        user_reply_states.pop(user_id, None)
         return
     
     # Проверяем, ожидается ли поиск
     if user_id in user_search_states:
         await perform_search(message, message.text)
-        del user_search_states[user_id]
+        user_search_states.pop(user_id, None)
         return
     
     # Проверяем, ожидается ли отправка сообщения
     if user_id in user_message_states:
         contact_id = user_message_states[user_id]
         await send_message_to_client(message, contact_id)
-        del user_message_states[user_id]
+        user_message_states.pop(user_id, None)
         return
     
     # Проверяем, похоже ли на данные контакта
@@ -793,8 +1157,18 @@ async def handle_text_messages_updated(message: Message):
         phone = lines[1].strip()
         note = lines[2].strip() if len(lines) > 2 else None
         
-        # Проверяем формат телефона
-        if re.match(Config.PHONE_REGEX, phone):
+        # Проверяем формат телефона (пробелы, скобки и 8 вместо +7 допускаются)
+        if normalize_phone(phone):
+            existing = db.get_contact_by_phone(phone)
+            if existing:
+                await message.reply(
+                    f"⚠️ Контакт с этим номером уже есть: {existing.name} ({existing.phone})",
+                    reply_markup=InlineKeyboardBuilder().button(
+                        text="📇 Открыть карточку", callback_data=cb.CONTACT_CARD.pack(existing.id)
+                    ).as_markup()
+                )
+                return
+            
             try:
                 # Сначала добавляем контакт в базу
                 contact_id = db.add_contact(name, phone, note)
@@ -807,34 +1181,16 @@ async def handle_text_messages_updated(message: Message):
                     f"🆔 ID в базе: {contact_id}"
                 )
                 
-                # Автоматически добавляем контакт в Telegram и получаем telegram_user_id
+                # Импорт в Telegram выполняется в фоне, о результате придет уведомление
                 if telegram_contacts_manager:
-                    try:
-                        telegram_result = await telegram_contacts_manager.add_contact_to_telegram(name, phone)
-                        
-                        if telegram_result["success"]:
-                            # Обновляем telegram_user_id в базе
-                            db.update_contact_telegram_id(contact_id, telegram_result["user_id"])
-                            
-                            username_info = f" (@{telegram_result['username']})" if telegram_result["username"] else ""
-                            response_text += f"\n\n📲 <b>Telegram:</b> Найден и добавлен{username_info}"
-                            response_text += f"\n✅ <b>Telegram ID:</b> {telegram_result['user_id']}"
-                            
-                            logger.info(f"📱 Контакт автоматически добавлен в Telegram: {name} -> {telegram_result['user_id']}")
-                        else:
-                            response_text += f"\n\n⚠️ <b>Telegram:</b> {telegram_result['message']}"
-                            response_text += f"\n❌ <b>Telegram ID:</b> Не найден"
-                            
-                    except Exception as e:
-                        logger.warning(f"Не удалось автоматически добавить контакт в Telegram: {e}")
-                        response_text += f"\n\n⚠️ <b>Telegram:</b> Ошибка автоматического добавления"
-                        response_text += f"\n❌ <b>Telegram ID:</b> Не установлен"
+                    contact_import_queue.enqueue(contact_id, name, phone, requested_by=user_id)
+                    response_text += f"\n\n⏳ <b>Telegram:</b> поиск поставлен в очередь, сообщу о результате"
                 else:
                     response_text += f"\n\n❌ <b>Telegram ID:</b> Не установлен (userbot не подключен)"
                 
                 builder = InlineKeyboardBuilder()
-                builder.button(text="📇 К контактам", callback_data="contacts_menu")
-                builder.button(text="🏠 Главное меню", callback_data="main_menu")
+                builder.button(text="📇 К контактам", callback_data=cb.CONTACTS_MENU.pack())
+                builder.button(text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack())
                 builder.adjust(1)
                 
                 await message.reply(response_text, reply_markup=builder.as_markup(), parse_mode="HTML")
@@ -860,7 +1216,7 @@ async def send_reply_to_client(admin_message: Message, contact_id: int):
         # Отправляем сообщение клиенту через userbot
         if userbot_client:
             sent_message = await userbot_client.send_message(
-                entity=contact.telegram_user_id,
+                entity=entity_cache.get_input_peer(contact.telegram_user_id),
                 message=admin_message.text
             )
             message_id = sent_message.id
@@ -882,9 +1238,9 @@ async def send_reply_to_client(admin_message: Message, contact_id: int):
         
         # Подтверждение админу
         builder = InlineKeyboardBuilder()
-        builder.button(text="📖 История", callback_data=f"history_{contact_id}")
-        builder.button(text="📇 Карточка", callback_data=f"contact_{contact_id}")
-        builder.button(text="🏠 Главное меню", callback_data="main_menu")
+        builder.button(text="📖 История", callback_data=cb.HISTORY.pack(contact_id))
+        builder.button(text="📇 Карточка", callback_data=cb.CONTACT_CARD.pack(contact_id))
+        builder.button(text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack())
         builder.adjust(2, 1)
         
         await admin_message.reply(
@@ -910,7 +1266,7 @@ async def send_message_to_client(admin_message: Message, contact_id: int):
         # Отправляем сообщение клиенту через userbot
         if userbot_client:
             sent_message = await userbot_client.send_message(
-                entity=contact.telegram_user_id,
+                entity=entity_cache.get_input_peer(contact.telegram_user_id),
                 message=admin_message.text
             )
         else:
@@ -931,10 +1287,10 @@ async def send_message_to_client(admin_message: Message, contact_id: int):
         
         # Подтверждение админу
         builder = InlineKeyboardBuilder()
-        builder.button(text="📖 История", callback_data=f"history_{contact_id}")
-        builder.button(text="📇 Карточка", callback_data=f"contact_{contact_id}")
-        builder.button(text="📨 Отправить еще", callback_data=f"send_to_{contact_id}")
-        builder.button(text="🏠 Главное меню", callback_data="main_menu")
+        builder.button(text="📖 История", callback_data=cb.HISTORY.pack(contact_id))
+        builder.button(text="📇 Карточка", callback_data=cb.CONTACT_CARD.pack(contact_id))
+        builder.button(text="📨 Отправить еще", callback_data=cb.SEND_TO.pack(contact_id))
+        builder.button(text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack())
         builder.adjust(2, 1, 1)
         
         await admin_message.reply(
@@ -948,65 +1304,48 @@ async def send_message_to_client(admin_message: Message, contact_id: int):
         logger.error(f"Ошибка при отправке сообщения клиенту: {e}")
         await admin_message.reply("❌ Ошибка при отправке сообщения клиенту")
 
-# Обновляем обработчик reply callback
-@dp.callback_query(F.data.startswith("reply_"))
-async def handle_reply_callback(callback_query: CallbackQuery):
+@callbacks.on(cb.REPLY)
+async def on_reply(callback_query: CallbackQuery, contact_id: int):
     """Обработка нажатия кнопки 'Ответить'"""
-    
     user_id = callback_query.from_user.id
-    data = callback_query.data
-    
-    if not BotHandlers.is_admin(user_id):
-        await callback_query.answer("⛔ У вас нет прав администратора.", show_alert=True)
+    contact = db.get_contact(contact_id)
+
+    if not contact:
+        await callback_query.answer("❌ Контакт не найден", show_alert=True)
         return
-    
-    try:
-        contact_id = int(data.split("_")[1])
-        contact = db.get_contact(contact_id)
-        
-        if not contact:
-            await callback_query.answer("❌ Контакт не найден", show_alert=True)
-            return
-        
-        # Устанавливаем состояние ожидания ответа
-        user_reply_states[user_id] = contact_id
-        
-        reply_text = (
-            f"💬 Ответ клиенту: <b>{contact.name}</b>\n\n"
-            f"📱 {contact.phone}\n"
-            f"📝 {contact.note or 'Без примечаний'}\n\n"
-            f"✍️ Напишите ваш ответ в следующем сообщении.\n"
-            f"Он будет автоматически отправлен клиенту."
-        )
-        
-        builder = InlineKeyboardBuilder()
-        builder.button(text="📖 История", callback_data=f"history_{contact_id}")
-        builder.button(text="📇 Карточка", callback_data=f"contact_{contact_id}")
-        builder.button(text="❌ Отмена", callback_data=f"cancel_reply_{contact_id}")
-        builder.adjust(2, 1)
-        
-        await callback_query.message.edit_text(
-            reply_text, 
-            reply_markup=builder.as_markup(),
-            parse_mode="HTML"
-        )
-        
-        await callback_query.answer("✍️ Ожидаю ваш ответ...")
-        
-    except Exception as e:
-        logger.error(f"Ошибка при обработке reply callback: {e}")
-        await callback_query.answer("❌ Произошла ошибка.", show_alert=True)
 
-# Обработчик отмены ответа
-@dp.callback_query(F.data.startswith("cancel_reply_"))
-async def handle_cancel_reply(callback_query: CallbackQuery):
+    # Устанавливаем состояние ожидания ответа
+    user_reply_states[user_id] = contact_id
+
+    reply_text = (
+        f"💬 Ответ клиенту: <b>{contact.name}</b>\n\n"
+        f"📱 {contact.phone}\n"
+        f"📝 {contact.note or 'Без примечаний'}\n\n"
+        f"✍️ Напишите ваш ответ в следующем сообщении.\n"
+        f"Он будет автоматически отправлен клиенту."
+    )
+
+    builder = InlineKeyboardBuilder()
+    builder.button(text="📖 История", callback_data=cb.HISTORY.pack(contact_id))
+    builder.button(text="📇 Карточка", callback_data=cb.CONTACT_CARD.pack(contact_id))
+    builder.button(text="❌ Отмена", callback_data=cb.CANCEL_REPLY.pack(contact_id))
+    builder.adjust(2, 1)
+
+    await callback_query.message.edit_text(
+        reply_text, 
+        reply_markup=builder.as_markup(),
+        parse_mode="HTML"
+    )
+
+    await callback_query.answer("✍️ Ожидаю ваш ответ...")
+
+@callbacks.on(cb.CANCEL_REPLY, public=True)
+async def on_cancel_reply(callback_query: CallbackQuery, contact_id: int):
     """Отмена ответа клиенту"""
-    
     user_id = callback_query.from_user.id
-    
+
     # Удаляем состояние ожидания ответа
-    if user_id in user_reply_states:
-        del user_reply_states[user_id]
+    user_reply_states.pop(user_id, None)
     
     await callback_query.answer("❌ Ответ отменен")
     
@@ -1016,167 +1355,86 @@ async def handle_cancel_reply(callback_query: CallbackQuery):
         reply_markup=BotHandlers.get_main_keyboard()
     )
 
-# Дополнительные обработчики callback
-@dp.callback_query(F.data.startswith(("send_", "admin_", "history_", "view_", "set_telegram_id_")))
-async def handle_additional_callbacks(callback_query: CallbackQuery):
-    """Обработка дополнительных callback"""
-    
+@callbacks.on(cb.SEND_BY_CONTACT)
+async def on_send_by_contact(callback_query: CallbackQuery, page: int = 0):
+    """Выбор контакта для отправки сообщения"""
+    await show_contact_list_for_sending(callback_query, page)
+
+@callbacks.on(cb.SEND_TO)
+async def on_send_to(callback_query: CallbackQuery, contact_id: int):
+    """Отправка сообщения выбранному контакту"""
     user_id = callback_query.from_user.id
-    data = callback_query.data
-    
-    if not BotHandlers.is_admin(user_id):
-        await callback_query.answer("⛔ У вас нет прав администратора.", show_alert=True)
+    contact = db.get_contact(contact_id)
+
+    if not contact:
+        await callback_query.answer("❌ Контакт не найден", show_alert=True)
         return
-    
-    try:
-        # === ОТПРАВКА СООБЩЕНИЙ ===
-        if data == "send_by_contact":
-            await show_contact_list_for_sending(callback_query)
-        
-        elif data.startswith("send_contacts_page_"):
-            page = int(data.split("_")[-1])
-            await show_contact_list_for_sending(callback_query, page)
-        
-        elif data.startswith("send_to_"):
-            contact_id = int(data.split("_")[2])
-            contact = db.get_contact(contact_id)
-            
-            if not contact:
-                await callback_query.answer("❌ Контакт не найден", show_alert=True)
-                return
-            
-            # Устанавливаем состояние отправки сообщения
-            user_message_states[user_id] = contact_id
-            
-            await callback_query.message.edit_text(
-                f"📨 Отправка сообщения контакту:\n\n"
-                f"👤 {contact.name}\n"
-                f"📱 {contact.phone}\n\n"
-                f"✍️ Напишите ваше сообщение:"
-            )
-            await callback_query.answer("✍️ Ожидаю ваше сообщение...")
-        
-        # === ИСТОРИЯ ПЕРЕПИСКИ ===
-        elif data == "history_by_contact":
-            await show_contacts_for_history(callback_query)
-        
-        elif data.startswith("history_contacts_page_"):
-            page = int(data.split("_")[-1])
-            await show_contacts_for_history(callback_query, page)
-        
-        elif data.startswith("view_history_"):
-            contact_id = int(data.split("_")[2])
-            await show_chat_history(callback_query, contact_id)
-        
-        elif data.startswith("view_contact_"):
-            contact_id = int(data.split("_")[2])
-            await show_contact_card(callback_query, contact_id)
-        
-        elif data.startswith("set_telegram_id_"):
-            # Установка Telegram ID для контакта
-            contact_id = int(data.split("_")[3])
-            contact = db.get_contact(contact_id)
-            
-            if not contact:
-                await callback_query.answer("❌ Контакт не найден", show_alert=True)
-                return
-            
-            await callback_query.answer("🔍 Ищу контакт в Telegram...", show_alert=False)
-            
-            # Ищем контакт в Telegram через userbot
-            if telegram_contacts_manager:
-                try:
-                    telegram_result = await telegram_contacts_manager.add_contact_to_telegram(contact.name, contact.phone)
-                    
-                    if telegram_result["success"]:
-                        # Обновляем telegram_user_id в базе
-                        db.update_contact_telegram_id(contact_id, telegram_result["user_id"])
-                        
-                        username_info = f" (@{telegram_result['username']})" if telegram_result["username"] else ""
-                        
-                        success_text = (
-                            f"✅ Telegram ID установлен!\n\n"
-                            f"👤 <b>Имя:</b> {contact.name}\n"
-                            f"📱 <b>Телефон:</b> {contact.phone}\n"
-                            f"📝 <b>Примечание:</b> {contact.note or 'Не указано'}\n"
-                            f"🆔 <b>ID:</b> {contact.id}\n\n"
-                            f"✅ <b>Telegram ID:</b> {telegram_result['user_id']}{username_info}"
-                        )
-                        
-                        builder = InlineKeyboardBuilder()
-                        builder.button(text="💬 Написать", callback_data=f"send_to_{contact_id}")
-                        builder.button(text="📖 История", callback_data=f"history_{contact_id}")
-                        builder.button(text="🏠 Главное меню", callback_data="main_menu")
-                        builder.adjust(2, 1)
-                        
-                        await callback_query.message.edit_text(
-                            success_text, 
-                            reply_markup=builder.as_markup(),
-                            parse_mode="HTML"
-                        )
-                        
-                        logger.info(f"📱 Telegram ID установлен для контакта: {contact.name} -> {telegram_result['user_id']}")
-                    else:
-                        error_text = (
-                            f"❌ Не удалось найти контакт в Telegram\n\n"
-                            f"👤 <b>Имя:</b> {contact.name}\n"
-                            f"📱 <b>Телефон:</b> {contact.phone}\n"
-                            f"📝 <b>Примечание:</b> {contact.note or 'Не указано'}\n\n"
-                            f"⚠️ <b>Причина:</b> {telegram_result['message']}"
-                        )
-                        
-                        builder = InlineKeyboardBuilder()
-                        builder.button(text="🔍 Попробовать снова", callback_data=f"set_telegram_id_{contact_id}")
-                        builder.button(text="🏠 Главное меню", callback_data="main_menu")
-                        builder.adjust(1)
-                        
-                        await callback_query.message.edit_text(
-                            error_text, 
-                            reply_markup=builder.as_markup(),
-                            parse_mode="HTML"
-                        )
-                        
-                except Exception as e:
-                    logger.error(f"Ошибка при поиске контакта в Telegram: {e}")
-                    await callback_query.message.edit_text(
-                        f"❌ Ошибка при поиске контакта в Telegram:\n{str(e)}",
-                        reply_markup=InlineKeyboardBuilder().button(
-                            text="🏠 Главное меню", callback_data="main_menu"
-                        ).as_markup()
-                    )
-            else:
-                await callback_query.message.edit_text(
-                    "❌ Userbot не подключен.\nАвтоматический поиск недоступен.",
-                    reply_markup=InlineKeyboardBuilder().button(
-                        text="🏠 Главное меню", callback_data="main_menu"
-                    ).as_markup()
-                )
-        
-        # === УПРАВЛЕНИЕ АДМИНАМИ ===
-        elif data == "admin_list":
-            await show_admin_list(callback_query)
-        
-        elif data == "admin_add":
-            await callback_query.message.edit_text(
-                "➕ Добавление администратора\n\n"
-                "Используйте команду: /add_admin USER_ID\n"
-                "Где USER_ID - Telegram ID пользователя"
-            )
-        
-        elif data == "admin_remove":
-            # Показываем список админов для удаления
-            await show_admin_list(callback_query)
-        
 
-        
-        else:
-            await callback_query.answer("🚧 Функция в разработке", show_alert=True)
-    
-    except Exception as e:
-        logger.error(f"Ошибка при обработке callback: {e}")
-        await callback_query.answer("❌ Произошла ошибка.", show_alert=True)
-    
-    await callback_query.answer()
+    # Устанавливаем состояние отправки сообщения
+    user_message_states[user_id] = contact_id
+
+    await callback_query.message.edit_text(
+        f"📨 Отправка сообщения контакту:\n\n"
+        f"👤 {contact.name}\n"
+        f"📱 {contact.phone}\n\n"
+        f"✍️ Напишите ваше сообщение:"
+    )
+    await callback_query.answer("✍️ Ожидаю ваше сообщение...")
+
+@callbacks.on(cb.SET_TELEGRAM_ID)
+async def on_set_telegram_id(callback_query: CallbackQuery, contact_id: int):
+    """Установка Telegram ID для контакта"""
+    contact = db.get_contact(contact_id)
+
+    if not contact:
+        await callback_query.answer("❌ Контакт не найден", show_alert=True)
+        return
+
+    if not telegram_contacts_manager:
+        await callback_query.message.edit_text(
+            "❌ Userbot не подключен.\nАвтоматический поиск недоступен.",
+            reply_markup=InlineKeyboardBuilder().button(
+                text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack()
+            ).as_markup()
+        )
+        return
+
+    # Поиск выполняется фоновой очередью, результат придет отдельным сообщением
+    contact_import_queue.enqueue(contact_id, contact.name, contact.phone, requested_by=callback_query.from_user.id)
+
+    queued_text = (
+        f"⏳ Поиск в Telegram поставлен в очередь\n\n"
+        f"👤 <b>Имя:</b> {contact.name}\n"
+        f"📱 <b>Телефон:</b> {contact.phone}\n"
+        f"📝 <b>Примечание:</b> {contact.note or 'Не указано'}\n\n"
+        f"Пришлю уведомление, когда контакт будет обработан."
+    )
+
+    builder = InlineKeyboardBuilder()
+    builder.button(text="📇 Карточка", callback_data=cb.CONTACT_CARD.pack(contact_id))
+    builder.button(text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack())
+    builder.adjust(1)
+
+    await callback_query.message.edit_text(
+        queued_text,
+        reply_markup=builder.as_markup(),
+        parse_mode="HTML"
+    )
+    await callback_query.answer("⏳ Поставлено в очередь")
+
+@callbacks.on(cb.ADMIN_LIST, cb.ADMIN_REMOVE)
+async def on_admin_list(callback_query: CallbackQuery):
+    """Список администраторов (в том числе для удаления)"""
+    await show_admin_list(callback_query)
+
+@callbacks.on(cb.ADMIN_ADD)
+async def on_admin_add(callback_query: CallbackQuery):
+    """Подсказка по добавлению администратора"""
+    await callback_query.message.edit_text(
+        "➕ Добавление администратора\n\n"
+        "Используйте команду: /add_admin USER_ID\n"
+        "Где USER_ID - Telegram ID пользователя"
+    )
 
 # =================================================================
 # 📨 ФУНКЦИИ ОТПРАВКИ СООБЩЕНИЙ
@@ -1191,29 +1449,25 @@ async def show_send_message_menu(callback_query: CallbackQuery):
     )
     
     builder = InlineKeyboardBuilder()
-    builder.button(text="📇 По контакту", callback_data="send_by_contact")
-    builder.button(text="📱 По номеру телефона", callback_data="send_by_phone")
-    builder.button(text="🔍 Найти контакт", callback_data="send_search_contact")
-    builder.button(text="⬅️ Назад", callback_data="main_menu")
+    builder.button(text="📇 По контакту", callback_data=cb.SEND_BY_CONTACT.pack())
+    builder.button(text="📱 По номеру телефона", callback_data=cb.SEND_BY_PHONE.pack())
+    builder.button(text="🔍 Найти контакт", callback_data=cb.SEND_SEARCH.pack())
+    builder.button(text="⬅️ Назад", callback_data=cb.MAIN_MENU.pack())
     builder.adjust(1)
     
     await callback_query.message.edit_text(menu_text, reply_markup=builder.as_markup())
 
-async def show_contact_list_for_sending(callback_query: CallbackQuery, page: int = 0):
-    """Показать список контактов для отправки сообщения"""
+def render_contact_list_for_sending(page: int = 0):
+    """Текст и клавиатура списка контактов для отправки сообщения"""
     
     offset = page * Config.CONTACTS_PER_PAGE
     contacts = db.get_all_contacts(limit=Config.CONTACTS_PER_PAGE, offset=offset)
     
     if not contacts:
         builder = InlineKeyboardBuilder()
-        builder.button(text="⬅️ Назад", callback_data="message_send")
+        builder.button(text="⬅️ Назад", callback_data=cb.SEND_MENU.pack())
         
-        await callback_query.message.edit_text(
-            "📋 Контактов не найдено.",
-            reply_markup=builder.as_markup()
-        )
-        return
+        return "📋 Контактов не найдено.", builder.as_markup()
     
     contact_text = f"📇 Выберите контакт (стр. {page + 1}):\n\n"
     
@@ -1222,26 +1476,34 @@ async def show_contact_list_for_sending(callback_query: CallbackQuery, page: int
         contact_text += f"👤 {contact.name} - {contact.phone}\n"
         builder.button(
             text=f"{contact.name}",
-            callback_data=f"send_to_{contact.id}"
+            callback_data=cb.SEND_TO.pack(contact.id)
         )
     
     # Навигация
     nav_buttons = []
     if page > 0:
-        nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"send_contacts_page_{page-1}"))
+        nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=cb.SEND_BY_CONTACT.pack(page-1)))
     
     # Проверяем есть ли еще контакты
     next_contacts = db.get_all_contacts(limit=1, offset=(page + 1) * Config.CONTACTS_PER_PAGE)
     if next_contacts:
-        nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"send_contacts_page_{page+1}"))
+        nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=cb.SEND_BY_CONTACT.pack(page+1)))
     
     if nav_buttons:
         builder.row(*nav_buttons)
     
-    builder.button(text="⬅️ Назад", callback_data="message_send")
+    builder.button(text="⬅️ Назад", callback_data=cb.SEND_MENU.pack())
     builder.adjust(1)
     
-    await callback_query.message.edit_text(contact_text, reply_markup=builder.as_markup())
+    return contact_text, builder.as_markup()
+
+async def show_contact_list_for_sending(callback_query: CallbackQuery, page: int = 0):
+    """Показать список контактов для отправки сообщения"""
+    text, markup = render_cache.get(
+        "send_contacts", page, db.data_version("contacts"),
+        lambda: render_contact_list_for_sending(page)
+    )
+    await callback_query.message.edit_text(text, reply_markup=markup)
 
 # =================================================================
 # 🗂️ ФУНКЦИИ ИСТОРИИ ПЕРЕПИСКИ  
@@ -1256,60 +1518,64 @@ async def show_history_menu(callback_query: CallbackQuery):
     )
     
     builder = InlineKeyboardBuilder()
-    builder.button(text="📇 По контакту", callback_data="history_by_contact")
-    builder.button(text="🔍 Найти контакт", callback_data="history_search_contact")
-    builder.button(text="📊 Статистика переписки", callback_data="history_stats")
-    builder.button(text="⬅️ Назад", callback_data="main_menu")
+    builder.button(text="📇 По контакту", callback_data=cb.HISTORY_CONTACTS.pack())
+    builder.button(text="🔍 Найти контакт", callback_data=cb.HISTORY_SEARCH.pack())
+    builder.button(text="📊 Статистика переписки", callback_data=cb.HISTORY_STATS.pack())
+    builder.button(text="⬅️ Назад", callback_data=cb.MAIN_MENU.pack())
     builder.adjust(1)
     
     await callback_query.message.edit_text(menu_text, reply_markup=builder.as_markup())
 
-async def show_contacts_for_history(callback_query: CallbackQuery, page: int = 0):
-    """Показать список контактов для просмотра истории"""
+def render_contacts_for_history(page: int = 0):
+    """Текст и клавиатура списка контактов для просмотра истории"""
     
     offset = page * Config.CONTACTS_PER_PAGE
     contacts = db.get_all_contacts(limit=Config.CONTACTS_PER_PAGE, offset=offset)
     
     if not contacts:
         builder = InlineKeyboardBuilder()
-        builder.button(text="⬅️ Назад", callback_data="history_view")
+        builder.button(text="⬅️ Назад", callback_data=cb.HISTORY_MENU.pack())
         
-        await callback_query.message.edit_text(
-            "📋 Контактов не найдено.",
-            reply_markup=builder.as_markup()
-        )
-        return
+        return "📋 Контактов не найдено.", builder.as_markup()
     
     contact_text = f"📇 Выберите контакт (стр. {page + 1}):\n\n"
     
     builder = InlineKeyboardBuilder()
+    # Количество сообщений всех контактов страницы одним запросом
+    counts = db.get_message_counts(contact.id for contact in contacts)
     for contact in contacts:
-        # Получаем количество сообщений
-        messages = db.get_contact_messages(contact.id, limit=1)
-        msg_count = len(db.get_contact_messages(contact.id, limit=1000))
+        msg_count = sum(counts.get(contact.id, {}).values())
         
         contact_text += f"👤 {contact.name} - {contact.phone} ({msg_count} сообщ.)\n"
         builder.button(
             text=f"{contact.name} ({msg_count})",
-            callback_data=f"view_history_{contact.id}"
+            callback_data=cb.HISTORY.pack(contact.id)
         )
     
     # Навигация
     nav_buttons = []
     if page > 0:
-        nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"history_contacts_page_{page-1}"))
+        nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=cb.HISTORY_CONTACTS.pack(page-1)))
     
     next_contacts = db.get_all_contacts(limit=1, offset=(page + 1) * Config.CONTACTS_PER_PAGE)
     if next_contacts:
-        nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"history_contacts_page_{page+1}"))
+        nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=cb.HISTORY_CONTACTS.pack(page+1)))
     
     if nav_buttons:
         builder.row(*nav_buttons)
     
-    builder.button(text="⬅️ Назад", callback_data="history_view")
+    builder.button(text="⬅️ Назад", callback_data=cb.HISTORY_MENU.pack())
     builder.adjust(1)
     
-    await callback_query.message.edit_text(contact_text, reply_markup=builder.as_markup())
+    return contact_text, builder.as_markup()
+
+async def show_contacts_for_history(callback_query: CallbackQuery, page: int = 0):
+    """Показать список контактов для просмотра истории"""
+    text, markup = render_cache.get(
+        "history_contacts", page, db.data_version("contacts", "messages"),
+        lambda: render_contacts_for_history(page)
+    )
+    await callback_query.message.edit_text(text, reply_markup=markup)
 
 # =================================================================
 # 🔍 ФУНКЦИИ ПОИСКА
@@ -1323,14 +1589,17 @@ async def show_search_menu(callback_query: CallbackQuery):
         "Введите запрос для поиска:\n"
         "• По имени\n"
         "• По номеру телефона\n"
-        "• По примечанию"
+        "• По примечанию\n\n"
+        "⚡ Живой поиск: наберите @имя_бота и начало имени или номера"
     )
     
     # Устанавливаем состояние поиска
     user_search_states[callback_query.from_user.id] = True
     
     builder = InlineKeyboardBuilder()
-    builder.button(text="❌ Отмена", callback_data="main_menu")
+    builder.button(text="⚡ Живой поиск", switch_inline_query_current_chat="")
+    builder.button(text="❌ Отмена", callback_data=cb.MAIN_MENU.pack())
+    builder.adjust(1)
     
     await callback_query.message.edit_text(menu_text, reply_markup=builder.as_markup())
 
@@ -1338,12 +1607,12 @@ async def perform_search(message: Message, query: str):
     """Выполнить поиск контактов"""
     
     try:
-        contacts = db.search_contacts(query)
+        contacts = name_index.search_contacts(query, Config.SEARCH_RESULTS_LIMIT)
         
         if not contacts:
             builder = InlineKeyboardBuilder()
-            builder.button(text="🔍 Новый поиск", callback_data="search_contacts")
-            builder.button(text="🏠 Главное меню", callback_data="main_menu")
+            builder.button(text="🔍 Новый поиск", callback_data=cb.CONTACTS_SEARCH.pack())
+            builder.button(text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack())
             builder.adjust(1)
             
             await message.reply(
@@ -1376,15 +1645,15 @@ async def perform_search(message: Message, query: str):
             # Создаем кнопки для каждого контакта
             builder.button(
                 text=f"📇 {contact.name}",
-                callback_data=f"view_contact_{contact.id}"
+                callback_data=cb.CONTACT_CARD.pack(contact.id)
             )
         
         if len(contacts) > 10:
             result_text += f"... и еще {len(contacts) - 10} контактов"
         
         # Кнопки навигации
-        builder.button(text="🔍 Новый поиск", callback_data="search_contacts")
-        builder.button(text="🏠 Главное меню", callback_data="main_menu")
+        builder.button(text="🔍 Новый поиск", callback_data=cb.CONTACTS_SEARCH.pack())
+        builder.button(text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack())
         builder.adjust(2, 2, 1)  # По 2 кнопки для контактов, потом навигация
         
         await message.reply(result_text, reply_markup=builder.as_markup(), parse_mode="HTML")
@@ -1397,9 +1666,9 @@ async def show_contact_card_from_search(message: Message, contact):
     """Показать карточку контакта из результатов поиска"""
     
     # Получаем статистику сообщений
-    messages = db.get_contact_messages(contact.id, limit=100)
-    incoming_count = len([m for m in messages if m.direction == "incoming"])
-    outgoing_count = len([m for m in messages if m.direction == "outgoing"])
+    counts = db.get_message_counts([contact.id]).get(contact.id, {})
+    incoming_count = counts.get("incoming", 0)
+    outgoing_count = counts.get("outgoing", 0)
     
     card_text = (
         f"📇 Найденный контакт:\n\n"
@@ -1411,21 +1680,21 @@ async def show_contact_card_from_search(message: Message, contact):
         f"📊 <b>Статистика:</b>\n"
         f"📨 Входящих: {incoming_count}\n"
         f"📤 Исходящих: {outgoing_count}\n"
-        f"💬 Всего: {len(messages)}"
+        f"💬 Всего: {incoming_count + outgoing_count}"
     )
     
     builder = InlineKeyboardBuilder()
-    builder.button(text="📖 История", callback_data=f"history_{contact.id}")
+    builder.button(text="📖 История", callback_data=cb.HISTORY.pack(contact.id))
     
     if contact.telegram_user_id:
-        builder.button(text="💬 Написать", callback_data=f"send_to_{contact.id}")
+        builder.button(text="💬 Написать", callback_data=cb.SEND_TO.pack(contact.id))
         card_text += f"\n\n✅ <b>Telegram ID:</b> {contact.telegram_user_id}"
     else:
-        builder.button(text="🔗 Установить Telegram ID", callback_data=f"set_telegram_id_{contact.id}")
+        builder.button(text="🔗 Установить Telegram ID", callback_data=cb.SET_TELEGRAM_ID.pack(contact.id))
         card_text += f"\n\n❌ <b>Telegram ID не установлен</b>"
     
-    builder.button(text="🔍 Новый поиск", callback_data="search_contacts")
-    builder.button(text="🏠 Главное меню", callback_data="main_menu")
+    builder.button(text="🔍 Новый поиск", callback_data=cb.CONTACTS_SEARCH.pack())
+    builder.button(text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack())
     builder.adjust(2, 1, 1)
     
     await message.reply(card_text, reply_markup=builder.as_markup(), parse_mode="HTML")
@@ -1452,10 +1721,10 @@ async def show_admin_menu(callback_query: CallbackQuery):
     )
     
     builder = InlineKeyboardBuilder()
-    builder.button(text="📋 Список админов", callback_data="admin_list")
-    builder.button(text="➕ Добавить админа", callback_data="admin_add")
-    builder.button(text="➖ Удалить админа", callback_data="admin_remove")
-    builder.button(text="⬅️ Назад", callback_data="main_menu")
+    builder.button(text="📋 Список админов", callback_data=cb.ADMIN_LIST.pack())
+    builder.button(text="➕ Добавить админа", callback_data=cb.ADMIN_ADD.pack())
+    builder.button(text="➖ Удалить админа", callback_data=cb.ADMIN_REMOVE.pack())
+    builder.button(text="⬅️ Назад", callback_data=cb.MAIN_MENU.pack())
     builder.adjust(1)
     
     await callback_query.message.edit_text(menu_text, reply_markup=builder.as_markup())
@@ -1467,7 +1736,7 @@ async def show_admin_list(callback_query: CallbackQuery):
     
     if not admins:
         builder = InlineKeyboardBuilder()
-        builder.button(text="⬅️ Назад", callback_data="admin_manage")
+        builder.button(text="⬅️ Назад", callback_data=cb.ADMIN_MENU.pack())
         
         await callback_query.message.edit_text(
             "📋 Список администраторов пуст.",
@@ -1490,10 +1759,10 @@ async def show_admin_list(callback_query: CallbackQuery):
         if admin.telegram_user_id != Config.OWNER_ID:  # Нельзя удалить владельца
             builder.button(
                 text=f"➖ {admin.username}",
-                callback_data=f"remove_admin_{admin.telegram_user_id}"
+                callback_data=cb.ADMIN_REMOVE_ASK.pack(admin.telegram_user_id)
             )
     
-    builder.button(text="⬅️ Назад", callback_data="admin_manage")
+    builder.button(text="⬅️ Назад", callback_data=cb.ADMIN_MENU.pack())
     builder.adjust(1)
     
     await callback_query.message.edit_text(admin_text, reply_markup=builder.as_markup())
@@ -1504,12 +1773,16 @@ async def setup_bot_commands():
         BotCommand(command="start", description="🏠 Главное меню"),
         BotCommand(command="add_admin", description="🛡️ Добавить администратора"),
         BotCommand(command="list_admins", description="📋 Список администраторов"),
+        BotCommand(command="export", description="📤 Выгрузка контактов и сообщений"),
+        BotCommand(command="dedup", description="🧬 Поиск и слияние дубликатов контактов"),
+        BotCommand(command="metrics", description="📈 Метрики системы"),
     ]
     
     await bot.set_my_commands(commands)
 
 async def main():
     """Основная функция запуска бота"""
+    global dedup_task, storage_task
     # Проверяем конфигурацию
     validation_errors = Config.validate_config()
     if validation_errors:
@@ -1536,6 +1809,24 @@ async def main():
     # Инициализируем userbot для автоматического импорта контактов
     await init_userbot_for_contacts()
     
+    # Дубликаты контактов объединяются по расписанию
+    if Config.ENABLE_AUTO_TASKS and Config.AUTO_MERGE_DUPLICATES:
+        dedup_task = asyncio.create_task(auto_dedup_loop())
+    
+    # Старые сообщения сжимаются и переносятся в архив в фоне
+    # (только SQLite: в PostgreSQL хранением управляет сама база)
+    if (Config.ENABLE_AUTO_TASKS and Config.STORAGE_BACKEND == "sqlite"
+            and (Config.AUTO_COMPRESS_MESSAGES or Config.AUTO_ARCHIVE_MESSAGES)):
+        storage_task = asyncio.create_task(auto_storage_loop())
+    
+    # Индексы поиска строятся в фоне, не задерживая запуск
+    name_index.start_rebuild()
+    prefix_index.start_rebuild()
+    
+    # Продолжаем массовые импорты, прерванные перезапуском
+    for bulk_import in db.get_unfinished_bulk_imports():
+        start_bulk_import(bulk_import.id)
+    
     # Настройка команд
     await setup_bot_commands()
     
@@ -1549,13 +1840,19 @@ async def main():
     
     # Запуск бота
     try:
-        await dp.start_polling(bot, skip_updates=True)
+        await start_update_delivery(dp, bot, db)
     except KeyboardInterrupt:
         print("\n👋 Бот остановлен пользователем.")
     except Exception as e:
         print(f"\n❌ Критическая ошибка: {e}")
         logger.exception("Критическая ошибка при запуске")
     finally:
+        await contact_import_queue.stop()
+        await userbot_executor.stop()
+        if dedup_task:
+            dedup_task.cancel()
+        if storage_task:
+            storage_task.cancel()
         if userbot_client:
             try:
                 await userbot_client.disconnect()
@@ -1563,6 +1860,7 @@ async def main():
             except:
                 pass
         await bot.session.close()
+        db.close()
 
 if __name__ == '__main__':
     try:
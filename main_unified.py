@@ -5,7 +5,8 @@ from pathlib import Path
 
 from aiogram import Bot, Dispatcher, F, BaseMiddleware
 from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery, BotCommand, InlineKeyboardButton
+from aiogram.types import (Message, CallbackQuery, BotCommand, InlineKeyboardButton, BufferedInputFile,
+                           InlineQuery, InlineQueryResultArticle, InputTextMessageContent)
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from telethon import TelegramClient, events
 from telethon.tl.functions.contacts import ImportContactsRequest
@@ -14,8 +15,20 @@ from telethon.errors import SessionPasswordNeededError, PhoneCodeInvalidError
 from loguru import logger
 
 import Config
-from database.db import Database
+from database import create_database
 from utils.date_helpers import format_date_display
+from utils.webhook_server import start_update_delivery
+from utils.entity_cache import EntityCache
+from utils.event_filters import IngestionFilter
+from utils.keyed_executor import KeyedExecutor
+from utils.metrics import registry as metrics_registry
+from utils.state_store import StateStore
+from utils.callback_router import CallbackRouter
+from utils import callback_actions as cb
+from utils.render_cache import RenderCache, static_keyboard
+from utils.name_index import NameIndex
+from utils.prefix_index import PrefixIndex
+from utils.contact_import_queue import ContactImportQueue, describe_import_result
 
 # Настройка логирования
 logger.remove()
@@ -28,17 +41,46 @@ logger.add(
 )
 
 # Инициализация
-db = Database()
+db = create_database()
 bot = Bot(token=Config.BOT_TOKEN)
 dp = Dispatcher()
 
+# Все inline-кнопки обрабатываются одним маршрутизатором (проверка прав администратора внутри)
+callbacks = CallbackRouter(guard=lambda callback_query: BotHandlers.is_admin(callback_query.from_user.id))
+callbacks.include(dp)
+
+# Отрисованные экраны (списки контактов, карточки) до изменения данных
+render_cache = RenderCache()
+
+# Нечеткий поиск по имени (кириллица/латиница, опечатки)
+name_index = NameIndex(db)
+
+# Префиксный поиск для inline-режима (по началу слов имени и номера)
+prefix_index = PrefixIndex(db)
+
 # Глобальные переменные
 userbot_client = None
 telegram_contacts_manager = None
-user_states = {}
-user_search_states = {}
-user_message_states = {}
-user_reply_states = {}
+entity_cache = None
+# Обработка входящих userbot: по порядку для каждого отправителя, параллельно между отправителями
+userbot_executor = KeyedExecutor("userbot")
+# Состояния диалогов с администраторами (с TTL, сохраняются в базе между перезапусками)
+user_states = StateStore("add_contact", db)
+user_search_states = StateStore("search", db)
+user_message_states = StateStore("message", db)
+user_reply_states = StateStore("reply", db)
+
+async def notify_contact_import(job, username):
+    """Уведомление администратора о результате фонового импорта контакта"""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="📇 Контакты", callback_data=cb.CONTACTS_MENU.pack())
+    builder.button(text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack())
+    builder.adjust(1)
+
+    await bot.send_message(job.requested_by, describe_import_result(job, username), reply_markup=builder.as_markup())
+
+# Импорт контактов в Telegram выполняется в фоне пачками с учетом часового лимита
+contact_import_queue = ContactImportQueue(db, notify=notify_contact_import)
 
 class TelegramContactsManager:
     """Менеджер для работы с контактами Telegram через userbot"""
@@ -87,7 +129,7 @@ class TelegramContactsManager:
 
 async def init_userbot():
     """Инициализация userbot клиента"""
-    global userbot_client, telegram_contacts_manager
+    global userbot_client, telegram_contacts_manager, entity_cache
     
     logger.info("🔄 Инициализация userbot...")
     
@@ -107,11 +149,16 @@ async def init_userbot():
         
         # Инициализация менеджера контактов
         telegram_contacts_manager = TelegramContactsManager(userbot_client)
+        contact_import_queue.start(userbot_client)
+        
+        # Кэш сущностей: свой ID запрашиваем один раз при старте
+        entity_cache = EntityCache(userbot_client, db)
+        await entity_cache.get_self_id()
         
-        # Обработчик входящих сообщений
-        @userbot_client.on(events.NewMessage)
+        # Обработчик входящих сообщений (лишние события отсекаются до сетевых запросов)
+        @userbot_client.on(events.NewMessage(func=IngestionFilter(entity_cache.is_own_account)))
         async def handle_userbot_message(event):
-            await process_userbot_incoming_message(event)
+            await userbot_executor.submit(event.sender_id, process_userbot_incoming_message, event)
         
         logger.info("✅ Userbot инициализирован")
         
@@ -122,14 +169,12 @@ async def init_userbot():
 async def process_userbot_incoming_message(event):
     """Обработка входящих сообщений через userbot"""
     try:
-        sender = await event.get_sender()
-        
-        # Пропускаем сообщения от ботов и самого себя
-        if sender.bot or sender.id == (await userbot_client.get_me()).id:
+        sender = await entity_cache.get_sender(event)
+        if sender is None:
             return
         
-        # Пропускаем сообщения от нашего бота
-        if sender.id == int(Config.BOT_TOKEN.split(':')[0]):
+        # Пропускаем сообщения от ботов, самого себя и нашего бота
+        if sender.bot or entity_cache.is_own_account(sender.id):
             return
             
         sender_name = f"{sender.first_name or ''} {sender.last_name or ''}".strip()
@@ -146,7 +191,7 @@ async def process_userbot_incoming_message(event):
             phone = f"+{sender.id}"  # Временный номер
             note = f"Telegram: @{sender.username}" if sender.username else "Автоматически создан"
             
-            contact_id = db.add_contact(sender_name, phone, note)
+            contact_id = db.add_contact(sender_name, phone, note, synthetic=True)
             db.update_contact_telegram_id(contact_id, sender.id)
             contact = db.get_contact(contact_id)
             
@@ -186,9 +231,9 @@ async def notify_admins_about_incoming_message(contact, message, sender):
     )
     
     builder = InlineKeyboardBuilder()
-    builder.button(text="💬 Ответить", callback_data=f"reply_{contact.id}")
-    builder.button(text="📖 История", callback_data=f"history_{contact.id}")
-    builder.button(text="📇 Карточка", callback_data=f"view_contact_{contact.id}")
+    builder.button(text="💬 Ответить", callback_data=cb.REPLY.pack(contact.id))
+    builder.button(text="📖 История", callback_data=cb.HISTORY.pack(contact.id))
+    builder.button(text="📇 Карточка", callback_data=cb.CONTACT_CARD.pack(contact.id))
     builder.adjust(1)
     
     for admin in admins:
@@ -205,26 +250,28 @@ class BotHandlers:
     """Класс с обработчиками бота"""
     
     @staticmethod
+    @static_keyboard
     def get_main_keyboard():
         """Главная клавиатура"""
         builder = InlineKeyboardBuilder()
-        builder.button(text="📇 Контакты", callback_data="contacts_menu")
-        builder.button(text="📨 Отправить сообщение", callback_data="message_send")
-        builder.button(text="🗂️ История переписки", callback_data="history_view")
-        builder.button(text="🔍 Поиск контактов", callback_data="search_contacts")
-        builder.button(text="👥 Администраторы", callback_data="admin_manage")
-        builder.button(text="📊 Статистика", callback_data="stats_view")
+        builder.button(text="📇 Контакты", callback_data=cb.CONTACTS_MENU.pack())
+        builder.button(text="📨 Отправить сообщение", callback_data=cb.SEND_MENU.pack())
+        builder.button(text="🗂️ История переписки", callback_data=cb.HISTORY_MENU.pack())
+        builder.button(text="🔍 Поиск контактов", callback_data=cb.CONTACTS_SEARCH.pack())
+        builder.button(text="👥 Администраторы", callback_data=cb.ADMIN_MENU.pack())
+        builder.button(text="📊 Статистика", callback_data=cb.STATS.pack())
         builder.adjust(2, 2, 2)
         return builder.as_markup()
     
     @staticmethod
+    @static_keyboard
     def get_contacts_keyboard():
         """Клавиатура для работы с контактами"""
         builder = InlineKeyboardBuilder()
-        builder.button(text="➕ Добавить контакт", callback_data="contacts_add")
-        builder.button(text="📋 Список контактов", callback_data="contacts_list")
-        builder.button(text="🔍 Поиск контакта", callback_data="search_contacts")
-        builder.button(text="⬅️ Назад", callback_data="main_menu")
+        builder.button(text="➕ Добавить контакт", callback_data=cb.CONTACTS_ADD.pack())
+        builder.button(text="📋 Список контактов", callback_data=cb.CONTACTS_LIST.pack())
+        builder.button(text="🔍 Поиск контакта", callback_data=cb.CONTACTS_SEARCH.pack())
+        builder.button(text="⬅️ Назад", callback_data=cb.MAIN_MENU.pack())
         builder.adjust(1)
         return builder.as_markup()
     
@@ -244,10 +291,9 @@ async def cmd_start(message: Message):
     username = message.from_user.username or "unknown"
     full_name = message.from_user.full_name or "Неизвестный пользователь"
     
-    # Устанавливаем владельца при первом запуске
+    # Устанавливаем владельца при первом запуске (в базу он попадает как администратор ниже)
     if not Config.OWNER_ID:
         Config.OWNER_ID = user_id
-        db.set_owner(user_id, username)
         logger.info(f"👑 Владелец установлен: {full_name} (ID: {user_id})")
     
     # Проверяем права администратора
@@ -310,92 +356,136 @@ async def cmd_add_admin(message: Message):
         logger.error(f"Ошибка при добавлении админа: {e}")
         await message.reply("❌ Ошибка при добавлении администратора.")
 
+@dp.message(Command("metrics"))
+async def cmd_metrics(message: Message):
+    """Показать внутренние метрики"""
+    
+    if not BotHandlers.is_admin(message.from_user.id):
+        await message.reply("⛔ У вас нет прав для просмотра метрик.")
+        return
+    
+    text = metrics_registry.render_text() or "📈 Метрик пока нет"
+    if len(text) <= Config.MAX_MESSAGE_LENGTH:
+        await message.reply(text)
+        return
+    # Полный список метрик не помещается в сообщение Telegram - отправляем файлом
+    await message.reply_document(
+        BufferedInputFile(text.encode(), filename="metrics.txt"),
+        caption=f"📈 Метрики: {len(metrics_registry.metrics)}"
+    )
+
 # =================================================================
-# 📞 ОБРАБОТЧИКИ CALLBACK'ОВ
+# 🔎 INLINE-ПОИСК КОНТАКТОВ (@бот запрос)
 # =================================================================
 
-@dp.callback_query(F.data.startswith(("main_", "contacts_", "message_", "history_", "search_", "admin_", "stats_")))
-async def process_main_callbacks(callback_query: CallbackQuery):
-    """Обработка основных callback'ов"""
-    
-    user_id = callback_query.from_user.id
-    data = callback_query.data
-    
-    if not BotHandlers.is_admin(user_id):
-        await callback_query.answer("⛔ У вас нет прав администратора.", show_alert=True)
+@dp.inline_query()
+async def handle_inline_query(inline_query: InlineQuery):
+    """Живой поиск контактов по началу имени или номера"""
+
+    if not BotHandlers.is_admin(inline_query.from_user.id):
+        await inline_query.answer([], cache_time=Config.INLINE_CACHE_TIME, is_personal=True)
         return
-    
-    try:
-        if data == "main_menu":
-            await callback_query.message.edit_text(
-                "🏠 Главное меню CRM системы\n\nВыберите действие:",
-                reply_markup=BotHandlers.get_main_keyboard()
-            )
-        
-        elif data == "contacts_menu":
-            await callback_query.message.edit_text(
-                "📇 Управление контактами\n\nВыберите действие:",
-                reply_markup=BotHandlers.get_contacts_keyboard()
-            )
-        
-        elif data == "contacts_add":
-            user_states[user_id] = "adding_contact"
-            await callback_query.message.edit_text(
-                "➕ Добавление нового контакта\n\n"
-                "Отправьте данные контакта в формате:\n"
-                "Имя\nТелефон\nПримечание (опционально)\n\n"
-                "Пример:\n"
-                "Иван Иванов\n"
-                "+79001234567\n"
-                "ВИП клиент"
-            )
-        
-        elif data == "contacts_list":
-            await show_contacts_list(callback_query)
-        
-        elif data == "message_send":
-            await show_send_message_menu(callback_query)
-        
-        elif data == "history_view":
-            await show_history_menu(callback_query)
-        
-        elif data == "search_contacts":
-            await show_search_menu(callback_query)
-        
-        elif data == "admin_manage":
-            await show_admin_menu(callback_query)
-        
-        elif data == "stats_view":
-            await show_stats(callback_query)
-        
-        else:
-            await callback_query.answer("🚧 Функция в разработке", show_alert=True)
-    
-    except Exception as e:
-        logger.error(f"Ошибка при обработке callback: {e}")
-        await callback_query.answer("❌ Произошла ошибка.", show_alert=True)
-    
-    await callback_query.answer()
+
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    contact_ids, next_offset = prefix_index.search(inline_query.query, offset, Config.INLINE_RESULTS_LIMIT)
+
+    results = []
+    for contact in db.get_contacts_by_ids(contact_ids):
+        details = f"📱 {contact.phone}" + (f"\n📝 {contact.note}" if contact.note else "")
+        results.append(InlineQueryResultArticle(
+            id=str(contact.id),
+            title=contact.name,
+            description=details,
+            input_message_content=InputTextMessageContent(message_text=f"👤 {contact.name}\n{details}"),
+        ))
+
+    # Результаты содержат данные CRM, поэтому кэш Telegram - только для этого администратора
+    await inline_query.answer(
+        results,
+        cache_time=Config.INLINE_CACHE_TIME,
+        is_personal=True,
+        next_offset=str(next_offset) if next_offset is not None else "",
+    )
+
+# =================================================================
+# 📞 ОБРАБОТЧИКИ CALLBACK'ОВ
+# =================================================================
+
+@callbacks.on(cb.MAIN_MENU)
+async def on_main_menu(callback_query: CallbackQuery):
+    """Главное меню"""
+    await callback_query.message.edit_text(
+        "🏠 Главное меню CRM системы\n\nВыберите действие:",
+        reply_markup=BotHandlers.get_main_keyboard()
+    )
+
+@callbacks.on(cb.CONTACTS_MENU)
+async def on_contacts_menu(callback_query: CallbackQuery):
+    """Меню контактов"""
+    await callback_query.message.edit_text(
+        "📇 Управление контактами\n\nВыберите действие:",
+        reply_markup=BotHandlers.get_contacts_keyboard()
+    )
+
+@callbacks.on(cb.CONTACTS_ADD)
+async def on_contacts_add(callback_query: CallbackQuery):
+    """Добавление контакта"""
+    user_states[callback_query.from_user.id] = "adding_contact"
+    await callback_query.message.edit_text(
+        "➕ Добавление нового контакта\n\n"
+        "Отправьте данные контакта в формате:\n"
+        "Имя\nТелефон\nПримечание (опционально)\n\n"
+        "Пример:\n"
+        "Иван Иванов\n"
+        "+79001234567\n"
+        "ВИП клиент"
+    )
+
+@callbacks.on(cb.CONTACTS_LIST)
+async def on_contacts_list(callback_query: CallbackQuery, page: int = 0):
+    """Список контактов"""
+    await show_contacts_list(callback_query, page)
+
+@callbacks.on(cb.SEND_MENU)
+async def on_send_menu(callback_query: CallbackQuery):
+    """Отправка сообщения"""
+    await show_send_message_menu(callback_query)
+
+@callbacks.on(cb.HISTORY_MENU)
+async def on_history_menu(callback_query: CallbackQuery):
+    """История переписки"""
+    await show_history_menu(callback_query)
+
+@callbacks.on(cb.CONTACTS_SEARCH)
+async def on_contacts_search(callback_query: CallbackQuery):
+    """Поиск контактов"""
+    await show_search_menu(callback_query)
+
+@callbacks.on(cb.ADMIN_MENU)
+async def on_admin_menu(callback_query: CallbackQuery):
+    """Управление администраторами"""
+    await show_admin_menu(callback_query)
+
+@callbacks.on(cb.STATS)
+async def on_stats(callback_query: CallbackQuery):
+    """Статистика"""
+    await show_stats(callback_query)
 
 # =================================================================
 # 📇 ФУНКЦИИ РАБОТЫ С КОНТАКТАМИ
 # =================================================================
 
-async def show_contacts_list(callback_query: CallbackQuery, page: int = 0):
-    """Показать список контактов"""
+def render_contacts_list(page: int = 0):
+    """Текст и клавиатура списка контактов"""
     
     offset = page * Config.CONTACTS_PER_PAGE
     contacts = db.get_all_contacts(limit=Config.CONTACTS_PER_PAGE, offset=offset)
     
     if not contacts:
         builder = InlineKeyboardBuilder()
-        builder.button(text="⬅️ Назад", callback_data="contacts_menu")
+        builder.button(text="⬅️ Назад", callback_data=cb.CONTACTS_MENU.pack())
         
-        await callback_query.message.edit_text(
-            "📋 Список контактов пуст.",
-            reply_markup=builder.as_markup()
-        )
-        return
+        return "📋 Список контактов пуст.", builder.as_markup()
     
     contact_text = f"📋 Список контактов (стр. {page + 1}):\n\n"
     
@@ -413,25 +503,33 @@ async def show_contacts_list(callback_query: CallbackQuery, page: int = 0):
         
         builder.button(
             text=f"📇 {contact.name}",
-            callback_data=f"view_contact_{contact.id}"
+            callback_data=cb.CONTACT_CARD.pack(contact.id)
         )
     
     # Навигация
     nav_buttons = []
     if page > 0:
-        nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"contacts_page_{page-1}"))
+        nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=cb.CONTACTS_LIST.pack(page-1)))
     
     next_contacts = db.get_all_contacts(limit=1, offset=(page + 1) * Config.CONTACTS_PER_PAGE)
     if next_contacts:
-        nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"contacts_page_{page+1}"))
+        nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=cb.CONTACTS_LIST.pack(page+1)))
     
     if nav_buttons:
         builder.row(*nav_buttons)
     
-    builder.button(text="⬅️ Назад", callback_data="contacts_menu")
+    builder.button(text="⬅️ Назад", callback_data=cb.CONTACTS_MENU.pack())
     builder.adjust(1)
     
-    await callback_query.message.edit_text(contact_text, reply_markup=builder.as_markup())
+    return contact_text, builder.as_markup()
+
+async def show_contacts_list(callback_query: CallbackQuery, page: int = 0):
+    """Показать список контактов"""
+    text, markup = render_cache.get(
+        "contacts_list", page, db.data_version("contacts"),
+        lambda: render_contacts_list(page)
+    )
+    await callback_query.message.edit_text(text, reply_markup=markup)
 
 # =================================================================
 # 📨 ФУНКЦИИ ОТПРАВКИ СООБЩЕНИЙ
@@ -446,9 +544,9 @@ async def show_send_message_menu(callback_query: CallbackQuery):
     )
     
     builder = InlineKeyboardBuilder()
-    builder.button(text="📇 По контакту", callback_data="send_by_contact")
-    builder.button(text="📱 По номеру телефона", callback_data="send_by_phone")
-    builder.button(text="⬅️ Назад", callback_data="main_menu")
+    builder.button(text="📇 По контакту", callback_data=cb.SEND_BY_CONTACT.pack())
+    builder.button(text="📱 По номеру телефона", callback_data=cb.SEND_BY_PHONE.pack())
+    builder.button(text="⬅️ Назад", callback_data=cb.MAIN_MENU.pack())
     builder.adjust(1)
     
     await callback_query.message.edit_text(menu_text, reply_markup=builder.as_markup())
@@ -466,8 +564,8 @@ async def show_history_menu(callback_query: CallbackQuery):
     )
     
     builder = InlineKeyboardBuilder()
-    builder.button(text="📇 По контакту", callback_data="history_by_contact")
-    builder.button(text="⬅️ Назад", callback_data="main_menu")
+    builder.button(text="📇 По контакту", callback_data=cb.HISTORY_CONTACTS.pack())
+    builder.button(text="⬅️ Назад", callback_data=cb.MAIN_MENU.pack())
     builder.adjust(1)
     
     await callback_query.message.edit_text(menu_text, reply_markup=builder.as_markup())
@@ -484,13 +582,16 @@ async def show_search_menu(callback_query: CallbackQuery):
         "Введите запрос для поиска:\n"
         "• По имени\n"
         "• По номеру телефона\n"
-        "• По примечанию"
+        "• По примечанию\n\n"
+        "⚡ Живой поиск: наберите @имя_бота и начало имени или номера"
     )
     
     user_search_states[callback_query.from_user.id] = True
     
     builder = InlineKeyboardBuilder()
-    builder.button(text="❌ Отмена", callback_data="main_menu")
+    builder.button(text="⚡ Живой поиск", switch_inline_query_current_chat="")
+    builder.button(text="❌ Отмена", callback_data=cb.MAIN_MENU.pack())
+    builder.adjust(1)
     
     await callback_query.message.edit_text(menu_text, reply_markup=builder.as_markup())
 
@@ -515,9 +616,9 @@ async def show_admin_menu(callback_query: CallbackQuery):
     )
     
     builder = InlineKeyboardBuilder()
-    builder.button(text="📋 Список админов", callback_data="admin_list")
-    builder.button(text="➕ Добавить админа", callback_data="admin_add")
-    builder.button(text="⬅️ Назад", callback_data="main_menu")
+    builder.button(text="📋 Список админов", callback_data=cb.ADMIN_LIST.pack())
+    builder.button(text="➕ Добавить админа", callback_data=cb.ADMIN_ADD.pack())
+    builder.button(text="⬅️ Назад", callback_data=cb.MAIN_MENU.pack())
     builder.adjust(1)
     
     await callback_query.message.edit_text(menu_text, reply_markup=builder.as_markup())
@@ -545,7 +646,7 @@ async def show_stats(callback_query: CallbackQuery):
     )
     
     builder = InlineKeyboardBuilder()
-    builder.button(text="⬅️ Назад", callback_data="main_menu")
+    builder.button(text="⬅️ Назад", callback_data=cb.MAIN_MENU.pack())
     
     await callback_query.message.edit_text(stats_text, reply_markup=builder.as_markup())
 
@@ -563,12 +664,12 @@ async def handle_text_messages(message: Message):
         return
     
     # Обработка добавления контакта
-    if user_id in user_states and user_states[user_id] == "adding_contact":
+    if user_states.get(user_id) == "adding_contact":
         await process_adding_contact(message)
         return
     
     # Обработка поиска
-    if user_id in user_search_states and user_search_states[user_id]:
+    if user_search_states.get(user_id):
         await process_search(message)
         return
     
@@ -603,18 +704,18 @@ async def process_adding_contact(message: Message):
         phone = lines[1].strip()
         note = lines[2].strip() if len(lines) > 2 else None
         
+        existing = db.get_contact_by_phone(phone)
+        if existing:
+            await message.reply(f"⚠️ Контакт с этим номером уже есть: {existing.name} ({existing.phone})")
+            user_states.pop(user_id, None)
+            return
+        
         # Добавляем контакт в базу
         contact_id = db.add_contact(name, phone, note)
         
-        # Пытаемся добавить в Telegram
-        telegram_result = None
+        # Поиск в Telegram - в фоновой очереди, о результате придет уведомление
         if telegram_contacts_manager:
-            try:
-                telegram_result = await telegram_contacts_manager.add_contact_to_telegram(name, phone)
-                if telegram_result["success"]:
-                    db.update_contact_telegram_id(contact_id, telegram_result["user_id"])
-            except Exception as e:
-                logger.error(f"Ошибка при добавлении в Telegram: {e}")
+            contact_import_queue.enqueue(contact_id, name, phone, requested_by=user_id)
         
         # Формируем ответ
         success_text = f"✅ Контакт успешно добавлен!\n\n👤 {name}\n📱 {phone}\n"
@@ -622,21 +723,20 @@ async def process_adding_contact(message: Message):
         if note:
             success_text += f"📝 {note}\n"
         
-        if telegram_result and telegram_result["success"]:
-            username_info = f" (@{telegram_result['username']})" if telegram_result["username"] else ""
-            success_text += f"✅ Telegram ID: {telegram_result['user_id']}{username_info}"
+        if telegram_contacts_manager:
+            success_text += "⏳ Поиск в Telegram поставлен в очередь"
         else:
             success_text += "❌ Telegram ID не установлен"
         
         builder = InlineKeyboardBuilder()
-        builder.button(text="🏠 Главное меню", callback_data="main_menu")
-        builder.button(text="📇 Контакты", callback_data="contacts_menu")
+        builder.button(text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack())
+        builder.button(text="📇 Контакты", callback_data=cb.CONTACTS_MENU.pack())
         builder.adjust(1)
         
         await message.reply(success_text, reply_markup=builder.as_markup())
         
         # Сбрасываем состояние
-        del user_states[user_id]
+        user_states.pop(user_id, None)
         
     except Exception as e:
         logger.error(f"Ошибка при добавлении контакта: {e}")
@@ -649,12 +749,12 @@ async def process_search(message: Message):
     query = message.text.strip()
     
     try:
-        contacts = db.search_contacts(query)
+        contacts = name_index.search_contacts(query, Config.SEARCH_RESULTS_LIMIT)
         
         if not contacts:
             builder = InlineKeyboardBuilder()
-            builder.button(text="🔍 Новый поиск", callback_data="search_contacts")
-            builder.button(text="🏠 Главное меню", callback_data="main_menu")
+            builder.button(text="🔍 Новый поиск", callback_data=cb.CONTACTS_SEARCH.pack())
+            builder.button(text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack())
             builder.adjust(1)
             
             await message.reply(
@@ -678,20 +778,20 @@ async def process_search(message: Message):
                 
                 builder.button(
                     text=f"📇 {contact.name}",
-                    callback_data=f"view_contact_{contact.id}"
+                    callback_data=cb.CONTACT_CARD.pack(contact.id)
                 )
             
             if len(contacts) > 10:
                 result_text += f"... и еще {len(contacts) - 10} контактов"
             
-            builder.button(text="🔍 Новый поиск", callback_data="search_contacts")
-            builder.button(text="🏠 Главное меню", callback_data="main_menu")
+            builder.button(text="🔍 Новый поиск", callback_data=cb.CONTACTS_SEARCH.pack())
+            builder.button(text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack())
             builder.adjust(2, 2, 1)
             
             await message.reply(result_text, reply_markup=builder.as_markup())
         
         # Сбрасываем состояние
-        user_search_states[user_id] = False
+        user_search_states.pop(user_id, None)
         
     except Exception as e:
         logger.error(f"Ошибка при поиске: {e}")
@@ -717,7 +817,7 @@ async def send_message_to_contact(message: Message, contact_id: int):
             return
         
         # Отправляем сообщение через userbot
-        await userbot_client.send_message(contact.telegram_user_id, message.text)
+        await userbot_client.send_message(entity_cache.get_input_peer(contact.telegram_user_id), message.text)
         
         # Сохраняем в базу
         db.add_message(
@@ -730,12 +830,12 @@ async def send_message_to_contact(message: Message, contact_id: int):
         await message.reply(
             f"✅ Сообщение отправлено контакту {contact.name}",
             reply_markup=InlineKeyboardBuilder().button(
-                text="🏠 Главное меню", callback_data="main_menu"
+                text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack()
             ).as_markup()
         )
         
         # Сбрасываем состояние
-        del user_message_states[user_id]
+        user_message_states.pop(user_id, None)
         
     except Exception as e:
         logger.error(f"Ошибка при отправке сообщения: {e}")
@@ -761,7 +861,7 @@ async def send_reply_to_contact(message: Message, contact_id: int):
             return
         
         # Отправляем ответ через userbot
-        await userbot_client.send_message(contact.telegram_user_id, message.text)
+        await userbot_client.send_message(entity_cache.get_input_peer(contact.telegram_user_id), message.text)
         
         # Сохраняем в базу
         db.add_message(
@@ -774,12 +874,12 @@ async def send_reply_to_contact(message: Message, contact_id: int):
         await message.reply(
             f"✅ Ответ отправлен контакту {contact.name}",
             reply_markup=InlineKeyboardBuilder().button(
-                text="🏠 Главное меню", callback_data="main_menu"
+                text="🏠 Главное меню", callback_data=cb.MAIN_MENU.pack()
             ).as_markup()
         )
         
         # Сбрасываем состояние
-        del user_reply_states[user_id]
+        user_reply_states.pop(user_id, None)
         
     except Exception as e:
         logger.error(f"Ошибка при отправке ответа: {e}")
@@ -794,6 +894,7 @@ async def setup_bot_commands():
     commands = [
         BotCommand(command="start", description="🏠 Главное меню"),
         BotCommand(command="add_admin", description="🛡️ Добавить администратора"),
+        BotCommand(command="metrics", description="📈 Метрики системы"),
     ]
     
     await bot.set_my_commands(commands)
@@ -822,6 +923,10 @@ async def main():
     # Инициализируем userbot
     await init_userbot()
     
+    # Индексы поиска строятся в фоне, не задерживая запуск
+    name_index.start_rebuild()
+    prefix_index.start_rebuild()
+    
     # Настройка команд
     await setup_bot_commands()
     
@@ -835,13 +940,15 @@ async def main():
     
     # Запуск бота
     try:
-        await dp.start_polling(bot, skip_updates=True)
+        await start_update_delivery(dp, bot, db)
     except KeyboardInterrupt:
         print("\n👋 Система остановлена пользователем.")
     except Exception as e:
         print(f"\n❌ Критическая ошибка: {e}")
         logger.exception("Критическая ошибка при запуске")
     finally:
+        await contact_import_queue.stop()
+        await userbot_executor.stop()
         if userbot_client:
             try:
                 await userbot_client.disconnect()
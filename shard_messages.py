@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Перераспределение сообщений по шардам
+
+Примеры:
+    python shard_messages.py              # по MESSAGE_SHARDS из Config
+    python shard_messages.py --shards 4
+    python shard_messages.py --shards 1   # вернуть сообщения в основную базу
+
+Сообщения раскладываются по файлам <база>_messages_<i>of<K>.db по
+контакту (все сообщения контакта - в одном файле), архивные - в архивы
+шардов. ID сообщений сохраняются. Запускать при остановленном боте;
+после сбоя достаточно запустить еще раз.
+"""
+
+import argparse
+import os
+import sys
+
+from loguru import logger
+
+import Config
+from database.db import Database
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Перераспределение сообщений по шардам")
+    parser.add_argument("--shards", type=int, help="Число шардов (по умолчанию MESSAGE_SHARDS)")
+    parser.add_argument("--batch", type=int, default=Config.EXPORT_BATCH_SIZE, help="Сообщений за одно чтение")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=Config.LOG_LEVEL)
+
+    if not os.path.exists(Config.DATABASE_PATH):
+        print(f"❌ База данных не найдена: {Config.DATABASE_PATH}", file=sys.stderr)
+        return 1
+    shards = args.shards or Config.MESSAGE_SHARDS
+    if shards < 1:
+        print("❌ Число шардов должно быть не меньше 1", file=sys.stderr)
+        return 1
+
+    db = Database(Config.DATABASE_PATH, message_shards=shards)
+    if db.message_shards == shards:
+        print(f"✅ Сообщения уже разложены по {shards} шардам")
+        return 0
+
+    print(f"🔀 Шардов: {db.message_shards} -> {shards}")
+    moved = db.reshard_messages(shards, batch_size=args.batch)
+    print(f"✅ Перенесено сообщений: {moved}")
+    for path in db.message_paths:
+        print(f"📦 {path}: {os.path.getsize(path) / 1048576:.1f} МБ")
+    if Config.MESSAGE_SHARDS != shards:
+        print(f"💡 Укажите MESSAGE_SHARDS = {shards} в Config.py")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
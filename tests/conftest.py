@@ -0,0 +1,36 @@
+"""
+Общие настройки тестов
+"""
+
+import os
+import re
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def _load_config():
+    """
+    Config.py в репозитории - шаблон: числовые настройки до заполнения
+    записаны как OOO WHOMEVER и не компилируются. Для тестов такие
+    значения заменяются нулем, остальные настройки - как в файле.
+    """
+    try:
+        import Config  # noqa: F401
+        return
+    except SyntaxError:
+        pass
+
+    path = os.path.join(ROOT, "Config.py")
+    with open(path, encoding="utf-8") as f:
+        source = re.sub(r"^(\w+ = )OOO WHOMEVER", r"\g<1>0", f.read(), flags=re.MULTILINE)
+    module = types.ModuleType("Config")
+    module.__file__ = path
+    exec(compile(source, path, "exec"), module.__dict__)
+    sys.modules["Config"] = module
+
+
+_load_config()
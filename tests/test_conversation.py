@@ -0,0 +1,107 @@
+"""
+Маршрутизатор диалогов: один обработчик Telethon на любое число диалогов
+"""
+
+import asyncio
+
+import pytest
+from telethon import TelegramClient
+from telethon.sessions import StringSession
+
+from utils import conversation
+from utils.conversation import ConversationRouter
+
+
+class FakeEvent:
+    """Входящее сообщение: только то, что использует маршрутизатор и обработчики шагов"""
+
+    def __init__(self, sender_id: int, text: str):
+        self.sender_id = sender_id
+        self.text = text
+        self.replies = []
+
+    async def reply(self, text: str, **kwargs):
+        self.replies.append(text)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(conversation.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def client():
+    # Без подключения: нужен только реестр обработчиков событий
+    return TelegramClient(StringSession(), api_id=1, api_hash="0" * 32)
+
+
+def test_handler_count_stays_constant(client, clock):
+    router = ConversationRouter(client, timeout=60)
+    users = range(1, 11)
+    answers = []
+
+    async def ask_name(event, step):
+        if not event.text:
+            return False
+        answers.append((event.sender_id, step, event.text))
+        router.expect(event.sender_id, ask_note, step)
+        return True
+
+    async def ask_note(event, step):
+        answers.append((event.sender_id, step, event.text))
+        return True
+
+    async def run():
+        for cycle in range(200):
+            for user_id in users:
+                router.expect(user_id, ask_name, cycle)
+            if cycle % 3 == 0:
+                # Ответ с ошибкой ввода оставляет шаг, затем двухшаговый диалог до конца
+                for user_id in users:
+                    await router.dispatch(FakeEvent(user_id, ""))
+                    await router.dispatch(FakeEvent(user_id, f"name {cycle}"))
+                    await router.dispatch(FakeEvent(user_id, f"note {cycle}"))
+            elif cycle % 3 == 1:
+                # Пользователи молчат дольше таймаута - ответ приходит после истечения
+                clock.now += 61
+                for user_id in users:
+                    event = FakeEvent(user_id, "late")
+                    await router.dispatch(event)
+                    assert event.replies
+            else:
+                # Истекшие состояния удаляются при следующем expect()
+                clock.now += 61
+                router.expect(0, ask_note, cycle)
+                assert not any(router.is_waiting(user_id) for user_id in users)
+                router.cancel(0)
+
+            assert router.handler_count() == 1
+            assert len(client.list_event_handlers()) == 1
+
+    asyncio.run(run())
+
+    assert router.states == {}
+    assert len(answers) == 2 * len(users) * len(range(0, 200, 3))
+
+
+def test_routers_share_nothing_between_clients(clock):
+    first = TelegramClient(StringSession(), api_id=1, api_hash="0" * 32)
+    second = TelegramClient(StringSession(), api_id=1, api_hash="0" * 32)
+    routers = [ConversationRouter(first), ConversationRouter(second)]
+
+    for router in routers:
+        for user_id in range(100):
+            router.expect(user_id, lambda event: True)
+
+    assert [router.handler_count() for router in routers] == [1, 1]
+    assert len(first.list_event_handlers()) == len(second.list_event_handlers()) == 1
@@ -0,0 +1,42 @@
+"""
+Префиксный индекс контактов (inline-поиск)
+"""
+
+import pytest
+
+from database import Database
+from utils.prefix_index import PrefixIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    db = Database(str(tmp_path / "crm.db"))
+    for name, phone in [("Борис", "+79161234567"), ("Анна", "+79161234568"),
+                        ("Vera", "+998901234567"), ("Дмитрий", "+79161234569")]:
+        db.add_contact(name, phone)
+    prefix_index = PrefixIndex(db)
+    prefix_index.rebuild()
+    return db, prefix_index
+
+
+def test_empty_query_lists_names_before_phones(index):
+    db, prefix_index = index
+
+    ids, next_offset = prefix_index.search("", 0, 3)
+
+    # Латиница (в том числе транслитерация: anna, boris, dmitrij) идет раньше кириллицы
+    assert [c.name for c in db.get_contacts_by_ids(ids)] == ["Анна", "Борис", "Дмитрий"]
+    assert next_offset == 3
+    assert [c.name for c in db.get_contacts_by_ids(prefix_index.search("", 3, 3)[0])] == ["Vera"]
+
+
+def test_truncated_search_keeps_paginating(index):
+    db, prefix_index = index
+    job = db.create_bulk_import("file.csv", "csv")
+    db.import_contacts_chunk(job, [(f"Контакт {i}", f"+7916000{i:04d}", None) for i in range(600)], 600)
+
+    # Бюджет кончается на первой проверке - раньше, чем набирается смещение
+    page, next_offset = prefix_index.search("", 500, 20, budget_ms=-1)
+
+    assert page == []
+    assert next_offset == 500
@@ -0,0 +1,72 @@
+"""
+Микробенчмарк отрисовки экранов бота: стоимость клика без кэша и с RenderCache
+
+Запускается только по запросу, на базе из 1000 контактов и 20000 сообщений:
+
+    CRM_BENCHMARK=1 python -m pytest -q -s tests/test_render_benchmark.py
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+import Config
+
+BENCHMARK_ENV = "CRM_BENCHMARK"
+CONTACTS = 1000
+MESSAGES = 20000
+ROUNDS = 50
+
+pytestmark = pytest.mark.skipif(not os.environ.get(BENCHMARK_ENV), reason=f"{BENCHMARK_ENV} не задан")
+
+
+@pytest.fixture(scope="module")
+def bot(tmp_path_factory):
+    """main_bot на временной базе (логи и база - во временной директории)"""
+    directory = tmp_path_factory.mktemp("render")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(directory)
+        patch.setattr(Config, "DATABASE_PATH", str(directory / "crm.db"))
+        patch.setattr(Config, "STORAGE_BACKEND", "sqlite")
+        if ":" not in Config.BOT_TOKEN:
+            patch.setattr(Config, "BOT_TOKEN", "123456:benchmark")
+        import main_bot
+
+        db = main_bot.db
+        job = db.create_bulk_import("benchmark", "csv")
+        db.import_contacts_chunk(
+            job, [(f"Контакт {i}", f"+7916{i:07d}", None) for i in range(CONTACTS)], CONTACTS
+        )
+        contact_ids = [contact.id for contact in db.iter_contacts()]
+        for i in range(MESSAGES):
+            db.add_message(contact_ids[i % CONTACTS], i, "incoming" if i % 2 else "outgoing", f"Сообщение {i} " * 5)
+        yield main_bot
+    sys.modules.pop("main_bot", None)
+
+
+def _per_call_ms(func) -> float:
+    func()
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        func()
+    return (time.perf_counter() - started) * 1000 / ROUNDS
+
+
+def test_render_cost_per_click(bot):
+    db = bot.db
+    contact_id = next(db.iter_contacts()).id
+    screens = [
+        ("contacts_list", 0, ("contacts",), lambda: bot.render_contacts_list(0)),
+        ("contact_card", contact_id, ("contacts", "messages"), lambda: bot.render_contact_card(contact_id)),
+        ("send_contacts", 0, ("contacts",), lambda: bot.render_contact_list_for_sending(0)),
+        ("history_contacts", 0, ("contacts", "messages"), lambda: bot.render_contacts_for_history(0)),
+    ]
+
+    print(f"\n{'экран':<20}{'без кэша, мс':>15}{'с кэшем, мс':>15}")
+    for screen, cursor, tables, render in screens:
+        uncached = _per_call_ms(render)
+        cached = _per_call_ms(lambda: bot.render_cache.get(screen, cursor, db.data_version(*tables), render))
+        print(f"{screen:<20}{uncached:>15.3f}{cached:>15.3f}")
+        assert cached < uncached
@@ -0,0 +1,285 @@
+"""
+Общие проверки Storage для SQLite и PostgreSQL
+
+PostgreSQL проверяется, если в CRM_TEST_POSTGRES_DSN указана тестовая база,
+например postgresql://postgres@/postgres?host=/tmp/pgdata. Все таблицы
+этой базы удаляются перед каждым тестом.
+"""
+
+import asyncio
+import os
+import threading
+
+import pytest
+
+from database import Database, Storage
+from database.models import ContactMerge
+
+POSTGRES_DSN_ENV = "CRM_TEST_POSTGRES_DSN"
+
+
+def _postgres_dsn() -> str:
+    dsn = os.environ.get(POSTGRES_DSN_ENV)
+    if not dsn:
+        pytest.skip(f"{POSTGRES_DSN_ENV} не задан")
+    pytest.importorskip("asyncpg")
+    return dsn
+
+
+def _reset_postgres(dsn: str):
+    """Пустая схема public: тесты не зависят друг от друга"""
+    import asyncpg
+
+    async def reset():
+        conn = await asyncpg.connect(dsn)
+        try:
+            await conn.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public")
+        finally:
+            await conn.close()
+
+    asyncio.run(reset())
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def db(request, tmp_path):
+    if request.param == "sqlite":
+        storage = Database(str(tmp_path / "crm.db"))
+    else:
+        dsn = _postgres_dsn()
+        _reset_postgres(dsn)
+        from database.postgres import PostgresDatabase
+        storage = PostgresDatabase(dsn, str(tmp_path / "node.db"))
+    yield storage
+    storage.close()
+
+
+def test_postgres_implements_storage_only():
+    postgres = pytest.importorskip("database.postgres")
+    assert issubclass(postgres.PostgresDatabase, Storage)
+    assert not issubclass(postgres.PostgresDatabase, Database)
+
+
+def test_contacts_crud(db):
+    a = db.add_contact("Анна", "+79161234567", "note a")
+    b = db.add_contact("Борис", "89161234568")
+
+    assert db.get_contact(a).name == "Анна"
+    assert db.get_contact(a).note == "note a"
+    assert db.get_contact(10 ** 9) is None
+    assert [c.id for c in db.get_contacts_by_ids([b, 999, a])] == [b, a]
+    assert db.get_contact_by_phone("8 (916) 123 45 67").id == a
+
+    db.update_contact_telegram_id(b, 555)
+    assert db.get_contact_by_telegram_id(555).id == b
+
+    db.delete_contact(b)
+    assert db.get_contact(b) is None
+    assert db.get_contacts_count() == 1
+
+
+def test_contacts_listing(db):
+    names = ["Вера", "Анна", "Борис"]
+    ids = [db.add_contact(name, f"+7916000000{i}") for i, name in enumerate(names)]
+
+    assert db.get_contacts_count() == 3
+    assert [c.id for c in db.iter_contacts(batch_size=2)] == ids
+    assert [c.name for c in db.get_all_contacts(limit=2)] == sorted(names)[:2]
+
+
+def test_search_ranking(db):
+    a = db.add_contact("Анна", "+79161234567")
+    b = db.add_contact("Борис", "89161234568")
+    c = db.add_contact("Мария", "+79990000000", "коллега Анна")
+
+    assert [x.id for x in db.search_contacts("4568")] == [b]
+    found = [x.id for x in db.search_contacts("Анна")]
+    assert found[0] == a and c in found
+    assert {x.id for x in db.search_contacts("234 Анна")} == {a}
+    assert db.search_contacts("Григорий") == []
+
+
+def test_messages_paging(db):
+    a = db.add_contact("Анна", "+79161234567")
+    c = db.add_contact("Вера", "+79161234569")
+    ids = [
+        db.add_message(a if i % 2 else c, i, "incoming" if i % 3 else "outgoing", f"text {i} " * 50)
+        for i in range(30)
+    ]
+
+    page = db.get_messages_page(a, limit=5)
+    assert len(page) == 5
+    assert page[0].text is None and page[0].preview
+
+    older = db.get_messages_page(a, cursor_id=page[-1].id, limit=100)
+    assert [m.id for m in page + older] == sorted(ids[1::2], reverse=True)
+
+    assert db.get_message(ids[3]).text == "text 3 " * 50
+    assert db.get_message_by_id(a, 3).id == ids[3]
+    assert [m.id for m in db.iter_messages(contact_id=c, batch_size=4)] == ids[0::2]
+
+
+def test_message_counts(db):
+    a = db.add_contact("Анна", "+79161234567")
+    b = db.add_contact("Борис", "+79161234568")
+    for i in range(6):
+        db.add_message(a, i, "incoming" if i % 3 else "outgoing", f"text {i}")
+
+    counts = db.get_message_counts([a, b])
+    assert counts[a] == {"incoming": 4, "outgoing": 2}
+    assert b not in counts
+    assert db.get_messages_count() == 6
+    assert db.get_messages_count_by_period(1) == 6
+
+
+def test_merge_contacts(db):
+    a = db.add_contact("Анна", "+79161234567", "note a")
+    c = db.add_contact("анна дубль", "+79161234560")
+    for i in range(4):
+        db.add_message(c, i, "incoming", f"text {i}")
+    job_id = db.add_contact_import_job(c, "анна дубль", "+79161234560")
+
+    moved = db.merge_contacts([ContactMerge(
+        target_id=a, source_ids=[c], reason="phone", name="Анна", phone="+79161234567", note="note a"
+    )])
+
+    assert moved == 4
+    assert db.get_contact(c) is None
+    assert db.get_message_counts([a])[a] == {"incoming": 4}
+    assert [job.contact_id for job in db.get_pending_contact_imports(10) if job.id == job_id] == [a]
+
+
+def test_import_deduplicates_phones(db):
+    existing = db.add_contact("Анна", "+79161234567")
+    job = db.create_bulk_import("file.csv", "csv")
+
+    inserted, duplicates = db.import_contacts_chunk(
+        job,
+        [("X", "+79160000001", None), ("Y", "+79160000001", None), ("Z", "+79161234567", None)],
+        3,
+        enqueue_telegram=True,
+    )
+
+    assert (inserted, duplicates) == (1, 2)
+    assert db.get_contact_by_phone("79160000001").name == "X"
+    assert db.get_contact_by_phone("+79161234567").id == existing
+    assert db.get_pending_contact_imports_count() == 1
+
+    bulk = db.get_bulk_import(job)
+    assert (bulk.rows_read, bulk.inserted, bulk.duplicates) == (3, 1, 2)
+
+
+def test_import_reports_inserted_ids(db):
+    changed = []
+    db.add_contact("Анна", "+79161234567")
+    last = db.add_contact("Борис", "+79161234568")
+    db.delete_contact(last)
+    db.subscribe("contacts", changed.append)
+
+    db.import_contacts_chunk(
+        db.create_bulk_import("file.csv", "csv"),
+        [("X", "+79160000001", None), ("Y", "+79160000002", None)],
+        2,
+    )
+
+    imported = [db.get_contact_by_phone(phone).id for phone in ("+79160000001", "+79160000002")]
+    assert [list(ids) for ids in changed] == [imported]
+
+
+def test_import_races_with_add_contact(db):
+    phones = [f"+7916{i:07d}" for i in range(200)]
+    done = threading.Event()
+
+    def add_contacts():
+        for phone in phones[::2]:
+            db.add_contact("Бот", phone)
+        done.set()
+
+    job = db.create_bulk_import("file.csv", "csv")
+    worker = threading.Thread(target=add_contacts)
+    worker.start()
+    for start in range(0, len(phones), 20):
+        chunk = [("Файл", phone, None) for phone in phones[start:start + 20]]
+        db.import_contacts_chunk(job, chunk, start + len(chunk), enqueue_telegram=True)
+    worker.join()
+
+    contacts = list(db.iter_contacts())
+    first_by_phone = {}
+    for contact in contacts:
+        first_by_phone.setdefault(contact.normalized_phone, contact)
+    assert sorted(first_by_phone) == phones
+    # add_contact сам дубликаты не проверяет; импорт не должен вставлять уже сохраненный номер
+    imported = {c.id for c in contacts if c.name == "Файл"}
+    assert imported <= {c.id for c in first_by_phone.values()}
+    queued = [j.contact_id for j in db.get_pending_contact_imports(len(phones))]
+    assert sorted(queued) == sorted(imported)
+    assert done.is_set()
+
+
+def test_admins(db):
+    db.add_admin("root", 1)
+    db.add_admin("root", 1)
+
+    assert db.is_admin(1) and not db.is_admin(2)
+    assert db.remove_duplicate_admins() == 1
+    assert db.get_admin_by_username("root").telegram_user_id == 1
+    assert len(db.get_all_admins()) == 1
+
+    db.remove_admin(1)
+    assert not db.is_admin(1)
+
+
+def test_listeners_and_versions(db):
+    changed = []
+    received = []
+    db.subscribe("contacts", changed.append)
+    db.subscribe_messages(received.append)
+    before = db.data_version("contacts", "messages")
+
+    a = db.add_contact("Анна", "+79161234567")
+    message_id = db.add_message(a, 1, "incoming", "привет")
+
+    assert changed
+    assert [m.id for m in received] == [message_id]
+    assert db.data_version("contacts", "messages") > before
+
+
+def test_node_state(db):
+    db.set_state("offset", "42")
+    assert db.get_state("offset") == "42"
+    assert db.get_state("missing", "x") == "x"
+
+    db.save_pending_updates([(7, "{}")])
+    assert db.get_pending_updates() == [(7, "{}")]
+    db.mark_update_processed(7)
+    assert db.get_pending_updates() == []
+    assert db.get_processed_update_ids(0) == {7}
+
+
+def test_postgres_notifies_other_nodes(tmp_path):
+    dsn = _postgres_dsn()
+    from database.postgres import PostgresDatabase
+
+    _reset_postgres(dsn)
+    first = PostgresDatabase(dsn, str(tmp_path / "first.db"))
+    second = PostgresDatabase(dsn, str(tmp_path / "second.db"))
+    try:
+        received = []
+        arrived = threading.Event()
+
+        def on_message(message):
+            received.append(message)
+            arrived.set()
+
+        second.subscribe_messages(on_message)
+        before = second.data_version("contacts")
+
+        contact_id = first.add_contact("Анна", "+79161234567")
+        message_id = first.add_message(contact_id, 1, "incoming", "привет")
+
+        assert arrived.wait(5)
+        assert [m.id for m in received] == [message_id]
+        assert second.data_version("contacts") > before
+        assert second.get_contact(contact_id).name == "Анна"
+    finally:
+        first.close()
+        second.close()
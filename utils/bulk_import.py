@@ -0,0 +1,250 @@
+"""
+Массовый импорт контактов из CSV и vCard с возобновлением после перезапуска
+"""
+
+import asyncio
+import csv
+import os
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+import Config
+from database.db import Database
+from database.models import BulkImport
+from utils.metrics import registry
+from utils.phone import normalize_phone
+
+bulk_import_rows = registry.counter("bulk_import_rows_total", "строк массового импорта по результату")
+
+# Запись файла: (имя, телефон как в файле, примечание)
+RawContact = Tuple[str, str, Optional[str]]
+
+NAME_COLUMNS = {"name", "full name", "fn", "имя", "фио", "контакт"}
+PHONE_COLUMNS = ("phone", "tel", "mobile", "телефон", "номер")
+NOTE_COLUMNS = {"note", "notes", "comment", "примечание", "комментарий"}
+
+VCARD_EXTENSIONS = (".vcf", ".vcard")
+
+
+def detect_format(path: str) -> str:
+    """Формат файла по расширению: 'vcard' или 'csv'"""
+    return "vcard" if path.lower().endswith(VCARD_EXTENSIONS) else "csv"
+
+
+def _csv_columns(header: List[str]) -> Optional[Tuple[int, int, Optional[int]]]:
+    """Номера колонок (имя, телефон, примечание) по заголовку или None, если заголовка нет"""
+    names = [column.strip().lower() for column in header]
+    name = next((i for i, column in enumerate(names) if column in NAME_COLUMNS), None)
+    phone = next((i for i, column in enumerate(names) if column.startswith(PHONE_COLUMNS)), None)
+    note = next((i for i, column in enumerate(names) if column in NOTE_COLUMNS), None)
+    if name is None or phone is None:
+        return None
+    return name, phone, note
+
+
+def iter_csv(path: str) -> Iterator[RawContact]:
+    """
+    Потоковое чтение CSV
+
+    Колонки определяются по заголовку (name/phone/note, имя/телефон/
+    примечание); без заголовка ожидается порядок: имя, телефон, примечание.
+    Разделитель (",", ";", табуляция) определяется по началу файла.
+    """
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as file:
+        sample = file.read(4096)
+        file.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+
+        reader = csv.reader(file, dialect)
+        first = next(reader, None)
+        if first is None:
+            return
+
+        columns = _csv_columns(first)
+        if columns is None:
+            columns = (0, 1, 2)
+            rows = _chain_first(first, reader)
+        else:
+            rows = reader
+
+        name_column, phone_column, note_column = columns
+        for row in rows:
+            if not any(cell.strip() for cell in row):
+                continue
+            yield (
+                _cell(row, name_column) or "",
+                _cell(row, phone_column) or "",
+                _cell(row, note_column)
+            )
+
+
+def _chain_first(first: List[str], rows: Iterator[List[str]]) -> Iterator[List[str]]:
+    yield first
+    yield from rows
+
+
+def _cell(row: List[str], index: Optional[int]) -> Optional[str]:
+    if index is None or index >= len(row):
+        return None
+    return row[index].strip() or None
+
+
+def iter_vcard(path: str) -> Iterator[RawContact]:
+    """
+    Потоковое чтение vCard (2.1/3.0/4.0)
+
+    Из каждой карточки берутся FN (или N), первый TEL и NOTE.
+    """
+    card = None
+    for key, value in _iter_vcard_properties(path):
+        if key == "BEGIN" and value.upper() == "VCARD":
+            card = {}
+        elif key == "END" and value.upper() == "VCARD":
+            if card is not None:
+                name = card.get("FN") or " ".join(
+                    part for part in reversed(card.get("N", "").split(";")[:2]) if part
+                )
+                yield name, card.get("TEL", ""), card.get("NOTE")
+            card = None
+        elif card is not None and key in ("FN", "N", "TEL", "NOTE"):
+            card.setdefault(key, _unescape_vcard(value).strip())
+
+
+def _iter_vcard_properties(path: str) -> Iterator[Tuple[str, str]]:
+    """Свойства vCard (ИМЯ, значение) с учетом переноса длинных строк"""
+    with open(path, encoding="utf-8-sig", errors="replace") as file:
+        current = None
+        for line in file:
+            line = line.rstrip("\r\n")
+            if line[:1] in (" ", "\t") and current is not None:
+                current += line[1:]
+                continue
+            if current is not None:
+                yield _split_vcard_line(current)
+            current = line
+        if current is not None:
+            yield _split_vcard_line(current)
+
+
+def _split_vcard_line(line: str) -> Tuple[str, str]:
+    name, _, value = line.partition(":")
+    # "item1.TEL;TYPE=CELL" -> "TEL"
+    key = name.split(";")[0].split(".")[-1].strip().upper()
+    return key, value
+
+
+def _unescape_vcard(value: str) -> str:
+    return value.replace("\\n", " ").replace("\\N", " ").replace("\\,", ",").replace("\\;", ";").replace("\\\\", "\\")
+
+
+READERS = {"csv": iter_csv, "vcard": iter_vcard}
+
+
+class BulkContactImporter:
+    """
+    Импорт больших файлов контактов пачками
+
+    Записи читаются потоково, номера нормализуются, каждая пачка из
+    BULK_IMPORT_CHUNK_SIZE записей вставляется одним executemany в
+    отдельной транзакции вместе с курсором (сколько записей файла уже
+    обработано). После перезапуска импорт продолжается с сохраненного
+    курсора. Дубликаты (номер уже есть в базе или встречался в файле)
+    пропускаются. Новые контакты ставятся в очередь импорта в Telegram
+    (contact_import_jobs), которую разбирает ContactImportQueue с учетом
+    часового лимита.
+    """
+
+    def __init__(self, db: Database, chunk_size: int = None, enqueue_telegram: bool = None):
+        self.db = db
+        self.chunk_size = max(1, min(chunk_size or Config.BULK_IMPORT_CHUNK_SIZE, 999))
+        self.enqueue_telegram = Config.AUTO_IMPORT_TO_TELEGRAM if enqueue_telegram is None else enqueue_telegram
+
+    def register(self, path: str, requested_by: int = None, file_format: str = None) -> int:
+        """
+        Регистрация файла для импорта
+
+        Returns:
+            ID массового импорта
+        """
+        file_format = file_format or detect_format(path)
+        if file_format not in READERS:
+            raise ValueError(f"Неизвестный формат импорта: {file_format}")
+        return self.db.create_bulk_import(os.path.abspath(path), file_format, requested_by)
+
+    def run(self, import_id: int) -> BulkImport:
+        """Импорт файла с сохраненного курсора до конца (блокирующий)"""
+        job = self.db.get_bulk_import(import_id)
+        if job is None:
+            raise ValueError(f"Массовый импорт {import_id} не найден")
+        if job.status != "running":
+            return job
+
+        if job.rows_read:
+            logger.info(f"📥 Продолжаю импорт {import_id} с записи {job.rows_read}")
+
+        try:
+            records = islice(READERS[job.file_format](job.source), job.rows_read, None)
+            rows_read = job.rows_read
+            while True:
+                chunk = list(islice(records, self.chunk_size))
+                if not chunk:
+                    break
+                rows_read += len(chunk)
+                self._import_chunk(import_id, chunk, rows_read)
+        except Exception as e:
+            logger.error(f"❌ Ошибка массового импорта {import_id}: {e}")
+            self.db.finish_bulk_import(import_id, "failed", str(e))
+            return self.db.get_bulk_import(import_id)
+
+        self.db.finish_bulk_import(import_id, "done")
+        job = self.db.get_bulk_import(import_id)
+        logger.info(
+            f"📥 Импорт {import_id} завершен: добавлено {job.inserted}, "
+            f"дубликатов {job.duplicates}, некорректных {job.invalid}"
+        )
+        return job
+
+    async def run_async(self, import_id: int) -> BulkImport:
+        """run() в отдельном потоке, чтобы не блокировать обработку обновлений"""
+        return await asyncio.to_thread(self.run, import_id)
+
+    def _import_chunk(self, import_id: int, chunk: List[RawContact], rows_read: int):
+        rows = []
+        invalid = 0
+        for name, phone, note in chunk:
+            normalized = normalize_phone(phone)
+            if normalized is None:
+                invalid += 1
+                continue
+            name = (name or "").strip()[:Config.MAX_CONTACT_NAME_LENGTH] or normalized
+            note = note[:Config.MAX_CONTACT_NOTE_LENGTH] if note else None
+            rows.append((name, normalized, note))
+
+        inserted, duplicates = self.db.import_contacts_chunk(
+            import_id, rows, rows_read, invalid, self.enqueue_telegram
+        )
+        bulk_import_rows.inc("inserted", inserted)
+        bulk_import_rows.inc("duplicate", duplicates)
+        bulk_import_rows.inc("invalid", invalid)
+        logger.debug(f"📥 Импорт {import_id}: обработано {rows_read} записей")
+
+
+def describe_bulk_import(job: BulkImport) -> str:
+    """Текст отчета о массовом импорте"""
+    status = {"done": "✅ Импорт завершен", "failed": "❌ Импорт прерван ошибкой"}.get(job.status, "⏳ Импорт выполняется")
+    text = (
+        f"{status}\n\n"
+        f"📄 {os.path.basename(job.source)}\n"
+        f"📊 Обработано записей: {job.rows_read}\n"
+        f"➕ Добавлено: {job.inserted}\n"
+        f"🔁 Дубликатов: {job.duplicates}\n"
+        f"⚠️ Некорректных номеров: {job.invalid}"
+    )
+    if job.error:
+        text += f"\n\nОшибка: {job.error}"
+    return text
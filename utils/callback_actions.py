@@ -0,0 +1,53 @@
+"""
+Действия inline-кнопок бота (общие для main_bot.py и main_unified.py)
+
+Новые кнопки создаются через ACTION.pack(...); старые строковые форматы
+оставлены через legacy(), чтобы работали кнопки в уже отправленных
+сообщениях.
+"""
+
+from utils.callback_router import CallbackAction
+
+# Главное меню и статистика
+MAIN_MENU = CallbackAction("main_menu", "mm").legacy("main_menu")
+STATS = CallbackAction("stats", "st").legacy("stats_view")
+
+# Контакты
+CONTACTS_MENU = CallbackAction("contacts_menu", "cm").legacy("contacts_menu")
+CONTACTS_ADD = CallbackAction("contacts_add", "ca").legacy("contacts_add")
+CONTACTS_LIST = CallbackAction("contacts_list", "cl", page=int).legacy("contacts_list", "contacts_page_")
+CONTACTS_SEARCH = CallbackAction("contacts_search", "cs").legacy("search_contacts", "contacts_search")
+CONTACT_CARD = CallbackAction("contact_card", "cc", contact_id=int).legacy("view_contact_", "contact_")
+CONTACT_EDIT = CallbackAction("contact_edit", "ce", contact_id=int).legacy("edit_")
+SET_TELEGRAM_ID = CallbackAction("set_telegram_id", "ti", contact_id=int).legacy("set_telegram_id_")
+CONTACTS_IMPORT = CallbackAction("contacts_import", "ci")
+DEDUP_MERGE = CallbackAction("dedup_merge", "dm")
+
+# Отправка сообщений
+SEND_MENU = CallbackAction("send_menu", "sm").legacy("message_send")
+SEND_BY_CONTACT = CallbackAction("send_by_contact", "sc", page=int).legacy("send_by_contact", "send_contacts_page_")
+SEND_BY_PHONE = CallbackAction("send_by_phone", "sp").legacy("send_by_phone")
+SEND_SEARCH = CallbackAction("send_search", "ss").legacy("send_search_contact")
+SEND_TO = CallbackAction("send_to", "so", contact_id=int).legacy("send_to_")
+
+# Ответы клиентам
+REPLY = CallbackAction("reply", "r", contact_id=int).legacy("reply_")
+CANCEL_REPLY = CallbackAction("cancel_reply", "rx", contact_id=int).legacy("cancel_reply_")
+
+# История переписки
+HISTORY_MENU = CallbackAction("history_menu", "hm").legacy("history_view")
+HISTORY_CONTACTS = CallbackAction("history_contacts", "hc", page=int).legacy("history_by_contact", "history_contacts_page_")
+HISTORY_SEARCH = CallbackAction("history_search", "hs").legacy("history_search_contact")
+HISTORY_STATS = CallbackAction("history_stats", "ht").legacy("history_stats")
+HISTORY = CallbackAction("history", "h", contact_id=int).legacy("view_history_", "history_")
+HISTORY_REFRESH = CallbackAction("history_refresh", "hr", contact_id=int)
+HISTORY_PAGE = CallbackAction("history_page", "hp", contact_id=int, cursor_id=int, newer=bool)
+TRANSCRIPT = CallbackAction("transcript", "tx", contact_id=int)
+
+# Администраторы
+ADMIN_MENU = CallbackAction("admin_menu", "am").legacy("admin_manage")
+ADMIN_LIST = CallbackAction("admin_list", "al").legacy("admin_list")
+ADMIN_ADD = CallbackAction("admin_add", "aa").legacy("admin_add")
+ADMIN_REMOVE = CallbackAction("admin_remove", "ar").legacy("admin_remove")
+ADMIN_REMOVE_ASK = CallbackAction("admin_remove_ask", "ad", admin_id=int).legacy("remove_admin_")
+ADMIN_REMOVE_CONFIRM = CallbackAction("admin_remove_confirm", "ac", admin_id=int).legacy("confirm_remove_")
@@ -0,0 +1,232 @@
+"""
+Маршрутизация нажатий inline-кнопок бота по компактному callback_data
+"""
+
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiogram import Dispatcher
+from aiogram.types import CallbackQuery
+from loguru import logger
+
+from utils.metrics import registry
+
+# Telegram ограничивает callback_data 64 байтами
+MAX_CALLBACK_DATA_LENGTH = 64
+SEPARATOR = ":"
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+# Все объявленные действия: префикс -> действие
+ACTIONS: Dict[str, "CallbackAction"] = {}
+
+# Старые форматы callback_data (кнопки в уже отправленных сообщениях)
+_LEGACY_EXACT: Dict[str, "CallbackAction"] = {}
+_LEGACY_PREFIXES: List[Tuple[str, "CallbackAction"]] = []
+
+callback_requests = registry.counter("bot_callback_requests_total", "нажатий inline-кнопок по маршрутам")
+callback_failures = registry.counter("bot_callback_failures_total", "ошибок обработки нажатий по маршрутам")
+callback_latency = registry.labeled_histogram("bot_callback_seconds", "время обработки нажатий по маршрутам")
+
+
+def encode_int(value: int) -> str:
+    """Число в base-36 (короче десятичной записи для Telegram ID)"""
+    if value < 0:
+        return "-" + encode_int(-value)
+    if value < 36:
+        return _DIGITS[value]
+    digits = []
+    while value:
+        value, remainder = divmod(value, 36)
+        digits.append(_DIGITS[remainder])
+    return "".join(reversed(digits))
+
+
+def decode_int(text: str) -> int:
+    """Обратное преобразование encode_int"""
+    return int(text, 36)
+
+
+class CallbackAction:
+    """
+    Типизированная фабрика callback_data для одного действия
+
+    Данные кодируются как "<префикс>:<поле>:<поле>", числа - в base-36:
+    CallbackAction("history", "h", contact_id=int).pack(12345) -> "h:9ix".
+    Незаданные хвостовые поля не передаются, обработчик получает для них
+    значения по умолчанию из своей сигнатуры.
+    """
+
+    def __init__(self, name: str, prefix: str, **fields: type):
+        if SEPARATOR in prefix:
+            raise ValueError(f"Префикс callback не может содержать '{SEPARATOR}': {prefix}")
+        if prefix in ACTIONS:
+            raise ValueError(f"Префикс callback '{prefix}' уже занят действием {ACTIONS[prefix].name}")
+
+        self.name = name
+        self.prefix = prefix
+        self.fields: List[Tuple[str, type]] = list(fields.items())
+        ACTIONS[prefix] = self
+
+    def pack(self, *values) -> str:
+        """Формирование callback_data"""
+        if len(values) > len(self.fields):
+            raise ValueError(f"Слишком много значений для callback {self.name}")
+
+        parts = [self.prefix]
+        for (field, field_type), value in zip(self.fields, values):
+            if field_type is int:
+                parts.append(encode_int(int(value)))
+            elif field_type is bool:
+                parts.append("1" if value else "0")
+            else:
+                text = str(value)
+                if SEPARATOR in text:
+                    raise ValueError(f"Значение поля {field} не может содержать '{SEPARATOR}'")
+                parts.append(text)
+
+        data = SEPARATOR.join(parts)
+        if len(data.encode()) > MAX_CALLBACK_DATA_LENGTH:
+            raise ValueError(f"callback_data длиннее {MAX_CALLBACK_DATA_LENGTH} байт: {data}")
+        return data
+
+    def unpack(self, parts: List[str]) -> Dict[str, object]:
+        """Разбор значений полей из частей callback_data (без префикса)"""
+        if len(parts) > len(self.fields):
+            raise ValueError(f"Лишние поля в callback {self.name}")
+
+        values = {}
+        for (field, field_type), raw in zip(self.fields, parts):
+            if field_type is int:
+                values[field] = decode_int(raw)
+            elif field_type is bool:
+                values[field] = raw == "1"
+            else:
+                values[field] = raw
+        return values
+
+    def legacy(self, *names: str) -> "CallbackAction":
+        """
+        Старые варианты callback_data этого действия
+
+        Строка без "_" на конце сравнивается целиком, с "_" на конце - как
+        префикс, за которым идут десятичные значения полей через "_".
+        """
+        for name in names:
+            if name.endswith("_"):
+                _LEGACY_PREFIXES.append((name, self))
+                _LEGACY_PREFIXES.sort(key=lambda item: len(item[0]), reverse=True)
+            else:
+                _LEGACY_EXACT[name] = self
+        return self
+
+
+def resolve(data: Optional[str]) -> Optional[Tuple[CallbackAction, Dict[str, object]]]:
+    """
+    Определение действия и значений полей по callback_data
+
+    Returns:
+        (действие, поля) либо None, если данные не относятся ни к одному действию
+    """
+    if not data:
+        return None
+
+    prefix, _, rest = data.partition(SEPARATOR)
+    action = ACTIONS.get(prefix)
+    if action is not None:
+        try:
+            return action, action.unpack(rest.split(SEPARATOR) if rest else [])
+        except ValueError:
+            return None
+
+    action = _LEGACY_EXACT.get(data)
+    if action is not None:
+        return action, {}
+
+    for legacy_prefix, action in _LEGACY_PREFIXES:
+        if data.startswith(legacy_prefix):
+            raw_values = data[len(legacy_prefix):].split("_")
+            try:
+                values = [int(value) for value in raw_values]
+            except ValueError:
+                continue
+            if len(values) <= len(action.fields):
+                return action, {field: value for (field, _), value in zip(action.fields, values)}
+    return None
+
+
+class CallbackRouter:
+    """
+    Один обработчик callback_query на все inline-кнопки
+
+    Действие определяется одним поиском в словаре по префиксу; для
+    действия без зарегистрированного обработчика отвечает
+    "Функция в разработке". guard - проверка прав перед любым действием.
+    """
+
+    def __init__(self, guard: Callable[[CallbackQuery], bool] = None,
+                 denied_text: str = "⛔ У вас нет прав администратора."):
+        self.handlers: Dict[str, Callable] = {}
+        self.public: set = set()
+        self.guard = guard
+        self.denied_text = denied_text
+
+    def on(self, *actions: CallbackAction, public: bool = False) -> Callable:
+        """
+        Декоратор обработчика действий: handler(callback_query, **поля)
+
+        Args:
+            actions: Действия, которые обрабатывает функция
+            public: Не проверять права через guard
+        """
+        def decorator(handler: Callable) -> Callable:
+            for action in actions:
+                if action.prefix in self.handlers:
+                    raise ValueError(f"Обработчик callback {action.name} уже зарегистрирован")
+                self.handlers[action.prefix] = handler
+                if public:
+                    self.public.add(action.prefix)
+            return handler
+        return decorator
+
+    def include(self, dp: Dispatcher):
+        """Регистрация маршрутизатора в диспетчере aiogram"""
+        dp.callback_query.register(self.dispatch, lambda callback_query: resolve(callback_query.data) is not None)
+
+    async def dispatch(self, callback_query: CallbackQuery):
+        """Обработка нажатия inline-кнопки"""
+        resolved = resolve(callback_query.data)
+        if resolved is None:
+            return
+        action, values = resolved
+
+        if self.guard and action.prefix not in self.public and not self.guard(callback_query):
+            await callback_query.answer(self.denied_text, show_alert=True)
+            return
+
+        handler = self.handlers.get(action.prefix)
+        if handler is None:
+            await callback_query.answer("🚧 Функция в разработке", show_alert=True)
+            return
+
+        callback_requests.inc(action.name)
+        started = time.monotonic()
+        try:
+            await handler(callback_query, **values)
+        except Exception as e:
+            callback_failures.inc(action.name)
+            logger.error(f"Ошибка при обработке callback {action.name}: {e}")
+            await self._answer(callback_query, "❌ Произошла ошибка.", show_alert=True)
+        finally:
+            callback_latency.observe(action.name, time.monotonic() - started)
+
+        # Убираем индикатор загрузки, если обработчик не ответил сам
+        await self._answer(callback_query)
+
+    @staticmethod
+    async def _answer(callback_query: CallbackQuery, text: str = None, show_alert: bool = False):
+        try:
+            await callback_query.answer(text, show_alert=show_alert)
+        except Exception:
+            # На callback уже ответили
+            pass
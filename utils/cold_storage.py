@@ -0,0 +1,159 @@
+"""
+Холодное хранение: сжатие текста и архив старых сообщений
+"""
+
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from loguru import logger
+
+import Config
+from database.db import Database
+from utils.compression import compress_text, train_dictionary
+from utils.metrics import registry
+
+compressed_messages = registry.counter("cold_storage_messages_total", "сообщений, проверенных задачей сжатия (сжато/как есть)")
+compressed_bytes = registry.counter("cold_storage_bytes_total", "байт текста до и после сжатия")
+compression_duration = registry.histogram("cold_storage_run_seconds", "время сжатия старых сообщений")
+archived_messages = registry.counter("archive_messages_total", "сообщений, перенесенных в архив")
+archive_duration = registry.histogram("archive_run_seconds", "время переноса старых сообщений в архив")
+
+# Тексты короче почти не сжимаются и остаются как есть
+MIN_COMPRESS_BYTES = 64
+
+# Сколько старых сообщений брать для обучения словаря
+TRAINING_SAMPLE_SIZE = 5000
+
+
+def _days_ago(days: int) -> datetime:
+    """Момент days дней назад в UTC (как timestamp в базе)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+
+
+@dataclass
+class ColdStorageReport:
+    checked: int = 0
+    compressed: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+    seconds: float = 0.0
+
+
+class MessageCompressor:
+    """
+    Сжатие текста сообщений старше COLD_STORAGE_AFTER_DAYS
+
+    Старые переписки читаются редко, а занимают большую часть базы.
+    Текст сжимается zlib с общим словарем частых фраз (обучается на
+    старых сообщениях при первом запуске и хранится в базе): без словаря
+    короткие сообщения почти не сжимаются. Сжатый текст хранится в
+    text_compressed, Database распаковывает его при чтении, так что
+    остальной код получает обычные строки. Превью для списков остаются
+    несжатыми.
+
+    Сообщения обрабатываются пачками по COLD_STORAGE_BATCH_SIZE (одна
+    транзакция на пачку), кандидаты берутся по частичному индексу еще
+    не проверенных сообщений. Освободившееся место база использует для
+    новых данных; уменьшить файл можно VACUUM (compress_messages.py --vacuum).
+    """
+
+    def __init__(self, db: Database, after_days: int = None, batch_size: int = None):
+        self.db = db
+        self.after_days = Config.COLD_STORAGE_AFTER_DAYS if after_days is None else after_days
+        self.batch_size = max(1, batch_size or Config.COLD_STORAGE_BATCH_SIZE)
+
+    def cutoff(self) -> datetime:
+        """Сообщения старше этой даты (UTC, как timestamp в базе) сжимаются"""
+        return _days_ago(self.after_days)
+
+    def _dictionary(self, cutoff: datetime, shard: int):
+        latest = self.db.get_latest_compression_dictionary()
+        if latest:
+            return latest
+        sample = [text for _, text in self.db.get_messages_to_compress(cutoff, TRAINING_SAMPLE_SIZE, shard) if text]
+        dictionary = train_dictionary(sample)
+        dictionary_id = self.db.add_compression_dictionary(dictionary, len(sample))
+        logger.info(f"🗜 Словарь сжатия #{dictionary_id}: {len(dictionary)} байт по {len(sample)} сообщениям")
+        return dictionary_id, dictionary
+
+    def run(self) -> ColdStorageReport:
+        """Сжатие всех еще не проверенных сообщений старше порога (во всех шардах)"""
+        started = time.monotonic()
+        report = ColdStorageReport()
+        cutoff = self.cutoff()
+
+        dictionary_id = dictionary = None
+        for shard in range(self.db.message_shards):
+            rows = self.db.get_messages_to_compress(cutoff, self.batch_size, shard)
+            if rows and dictionary is None:
+                dictionary_id, dictionary = self._dictionary(cutoff, shard)
+            while rows:
+                results = []
+                for message_id, text in rows:
+                    raw = text.encode() if text else b""
+                    data = compress_text(text, dictionary) if len(raw) >= MIN_COMPRESS_BYTES else None
+                    if data is not None and len(data) < len(raw):
+                        results.append((message_id, data, dictionary_id))
+                        report.compressed += 1
+                        report.bytes_before += len(raw)
+                        report.bytes_after += len(data)
+                    else:
+                        results.append((message_id, None, None))
+                self.db.store_compressed_messages(results, shard)
+                report.checked += len(rows)
+                rows = self.db.get_messages_to_compress(cutoff, self.batch_size, shard)
+
+        compressed_messages.inc("compressed", report.compressed)
+        compressed_messages.inc("kept", report.checked - report.compressed)
+        compressed_bytes.inc("before", report.bytes_before)
+        compressed_bytes.inc("after", report.bytes_after)
+        report.seconds = time.monotonic() - started
+        compression_duration.observe(report.seconds)
+        if report.checked:
+            logger.info(
+                f"🗜 Сжато сообщений: {report.compressed} из {report.checked}, "
+                f"{report.bytes_before / 1024:.0f} КБ -> {report.bytes_after / 1024:.0f} КБ "
+                f"за {report.seconds:.1f}с"
+            )
+        return report
+
+
+class MessageArchiver:
+    """
+    Перенос сообщений старше ARCHIVE_MESSAGES_AFTER_DAYS в архив
+
+    Архив - отдельный файл SQLite, который подключается (ATTACH) только
+    к запросам, дошедшим до старых сообщений: история при листании назад,
+    выгрузки, поиск сообщения по ID, счетчики и слияние контактов. Основная
+    база с недавней перепиской остается небольшой и помещается в кэш.
+
+    Сообщения переносятся пачками по ARCHIVE_BATCH_SIZE, каждая пачка -
+    одна транзакция для обеих баз, самые старые первыми. Освободившееся
+    в основной базе место используется для новых сообщений. При раскладке
+    по шардам у каждого шарда свой архив.
+    """
+
+    def __init__(self, db: Database, after_days: int = None, batch_size: int = None):
+        self.db = db
+        self.after_days = Config.ARCHIVE_MESSAGES_AFTER_DAYS if after_days is None else after_days
+        self.batch_size = max(1, batch_size or Config.ARCHIVE_BATCH_SIZE)
+
+    def run(self) -> int:
+        """Перенос всех сообщений старше порога (во всех шардах); возвращает их количество"""
+        started = time.monotonic()
+        cutoff = _days_ago(self.after_days)
+        total = 0
+        for shard in range(self.db.message_shards):
+            while True:
+                moved = self.db.archive_messages(cutoff, self.batch_size, shard)
+                total += moved
+                if moved < self.batch_size:
+                    break
+
+        archived_messages.inc(amount=total)
+        seconds = time.monotonic() - started
+        archive_duration.observe(seconds)
+        if total:
+            logger.info(f"🗄 В архив перенесено сообщений: {total} за {seconds:.1f}с")
+        return total
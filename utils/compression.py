@@ -0,0 +1,62 @@
+"""
+Сжатие текста сообщений zlib с общим словарем
+"""
+
+import zlib
+from collections import Counter
+from typing import Iterable
+
+# Размер окна zlib: словарь длиннее не используется
+DICTIONARY_SIZE = 32 * 1024
+
+COMPRESSION_LEVEL = 9
+
+# Без заголовка и контрольной суммы zlib (raw deflate): минус 6 байт на сообщение
+_WBITS = -15
+
+
+def train_dictionary(texts: Iterable[str], size: int = DICTIONARY_SIZE) -> bytes:
+    """
+    Общий словарь для сжатия сообщений
+
+    Короткое сообщение само по себе почти не сжимается - в нем мало
+    повторов. Словарь из частых фраз переписки (1-3 слова) дает zlib
+    повторы для каждого сообщения. Фразы упорядочены по пользе
+    (частота × длина), самые полезные - в конце словаря: ссылки на
+    ближние данные кодируются короче.
+    """
+    phrases = Counter()
+    for text in texts:
+        words = text[:2000].split()
+        for n in (1, 2, 3):
+            for i in range(len(words) - n + 1):
+                phrases[" ".join(words[i:i + n])] += 1
+
+    scored = sorted(
+        ((count * len(phrase.encode()), phrase) for phrase, count in phrases.items()
+         if count > 1 and len(phrase) > 3),
+        reverse=True
+    )
+    chosen, total = [], 0
+    for _, phrase in scored:
+        encoded = phrase.encode() + b" "
+        if total + len(encoded) > size:
+            continue
+        chosen.append(encoded)
+        total += len(encoded)
+        if total >= size - 4:
+            break
+    chosen.reverse()
+    return b"".join(chosen)
+
+
+def compress_text(text: str, dictionary: bytes) -> bytes:
+    """Сжатие текста с общим словарем"""
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, _WBITS, zdict=dictionary)
+    return compressor.compress(text.encode()) + compressor.flush()
+
+
+def decompress_text(data: bytes, dictionary: bytes) -> str:
+    """Распаковка текста, сжатого compress_text с тем же словарем"""
+    decompressor = zlib.decompressobj(_WBITS, zdict=dictionary)
+    return (decompressor.decompress(data) + decompressor.flush()).decode()
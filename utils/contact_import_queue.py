@@ -0,0 +1,203 @@
+"""
+Фоновая очередь импорта контактов в Telegram (ImportContactsRequest пачками)
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional
+
+from telethon import types
+from telethon.errors import FloodWaitError
+from telethon.tl.functions.contacts import ImportContactsRequest
+from loguru import logger
+
+import Config
+from database.db import Database
+from database.models import ContactImportJob
+from utils.metrics import registry
+from utils.phone import normalize_phone
+
+import_results = registry.counter("contact_import_total", "результатов импорта контактов по статусу")
+import_queue_size = registry.gauge("contact_import_pending", "контактов в очереди импорта")
+
+# notify(job, username): job.telegram_user_id - найденный пользователь или None, если номер не найден
+NotifyCallback = Callable[[ContactImportJob, Optional[str]], Awaitable[None]]
+
+
+def build_input_contact(job: ContactImportJob) -> types.InputPhoneContact:
+    """InputPhoneContact для задачи (client_id = ID задачи, по нему сопоставляется ответ)"""
+    parts = (job.name or "").split()
+    return types.InputPhoneContact(
+        client_id=job.id,
+        phone=job.phone,
+        first_name=parts[0] if parts else "Контакт",
+        last_name=" ".join(parts[1:])
+    )
+
+
+class ContactImportQueue:
+    """
+    Очередь импорта контактов в Telegram
+
+    Задачи хранятся в таблице contact_import_jobs, поэтому переживают
+    перезапуск. Рабочая задача отправляет ожидающие номера одним запросом
+    ImportContactsRequest (до CONTACT_IMPORT_BATCH_SIZE) и не превышает
+    MAX_NEW_CONTACTS_PER_HOUR за скользящий час: остаток ждет в очереди
+    до освобождения лимита. Найденный telegram_user_id записывается в
+    контакт, администратор, поставивший задачу, получает уведомление.
+    """
+
+    HOUR = 3600
+
+    def __init__(self, db: Database, notify: NotifyCallback = None):
+        self.db = db
+        self.notify = notify
+        self.client = None
+        self.hourly_limit = Config.MAX_NEW_CONTACTS_PER_HOUR
+        self.batch_size = max(1, Config.CONTACT_IMPORT_BATCH_SIZE)
+        self.interval = Config.CONTACT_IMPORT_INTERVAL_SECONDS
+        self.max_attempts = Config.CONTACT_IMPORT_MAX_ATTEMPTS
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def enqueue(self, contact_id: int, name: str, phone: str, requested_by: int = None) -> int:
+        """
+        Постановка контакта в очередь импорта
+
+        Returns:
+            ID задачи
+        """
+        # Telegram сопоставляет номера в международном формате
+        phone = normalize_phone(phone) or phone
+        job_id = self.db.add_contact_import_job(contact_id, name, phone, requested_by)
+        self.wakeup()
+        logger.info(f"📥 Контакт {name} ({phone}) поставлен в очередь импорта в Telegram")
+        return job_id
+
+    def wakeup(self):
+        """Проверить очередь сейчас, не дожидаясь интервала (после записи задач в базу напрямую)"""
+        self._wakeup.set()
+
+    def start(self, client):
+        """Запуск обработки очереди через userbot клиент"""
+        self.client = client
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("📥 Очередь импорта контактов запущена")
+
+    async def stop(self):
+        """Остановка обработки (незавершенные задачи остаются в базе)"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def available_quota(self) -> int:
+        """Сколько номеров еще можно импортировать в текущем часовом окне"""
+        return max(0, self.hourly_limit - self.db.count_contact_imports_since(self.HOUR))
+
+    async def _run(self):
+        while True:
+            try:
+                processed = await self.process_batch()
+            except Exception as e:
+                logger.error(f"Ошибка в очереди импорта контактов: {e}")
+                processed = 0
+
+            if processed:
+                # Пауза между пачками вместо паузы перед каждым контактом
+                await asyncio.sleep(Config.MESSAGE_SEND_DELAY)
+                continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def process_batch(self) -> int:
+        """
+        Импорт одной пачки ожидающих контактов
+
+        Returns:
+            Количество обработанных задач (0 - нечего делать или исчерпан лимит)
+        """
+        pending = self.db.get_pending_contact_imports_count()
+        import_queue_size.set("", pending)
+        if not pending:
+            return 0
+
+        quota = self.available_quota()
+        if not quota:
+            logger.debug(f"⏳ Лимит импорта на час исчерпан, в очереди: {pending}")
+            return 0
+
+        jobs = self.db.get_pending_contact_imports(min(quota, self.batch_size))
+        if not jobs:
+            return 0
+
+        try:
+            result = await self.client(ImportContactsRequest([build_input_contact(job) for job in jobs]))
+        except FloodWaitError as e:
+            logger.warning(f"⏳ FloodWait при импорте контактов: {e.seconds}с")
+            await asyncio.sleep(e.seconds)
+            return 0
+        except Exception as e:
+            logger.error(f"❌ Ошибка при импорте контактов: {e}")
+            for job in jobs:
+                if self.db.fail_contact_import_attempt(job.id, self.max_attempts):
+                    import_results.inc("failed")
+            return 0
+
+        users: Dict[int, types.User] = {user.id: user for user in result.users}
+        imported: Dict[int, int] = {item.client_id: item.user_id for item in result.imported}
+        retry = set(result.retry_contacts or [])
+
+        for job in jobs:
+            if job.id in retry:
+                # Telegram просит повторить позже - задача остается в очереди
+                continue
+
+            user_id = imported.get(job.id)
+            if user_id:
+                self.db.update_contact_telegram_id(job.contact_id, user_id)
+                self.db.finish_contact_import(job.id, "done", user_id)
+                import_results.inc("done")
+                logger.info(f"📱 Контакт найден в Telegram: {job.name} -> {user_id}")
+            else:
+                self.db.finish_contact_import(job.id, "not_found")
+                import_results.inc("not_found")
+                logger.warning(f"📱 Контакт не найден в Telegram: {job.phone}")
+
+            job.telegram_user_id = user_id
+            user = users.get(user_id)
+            await self._notify(job, user.username if user else None)
+
+        return len(jobs) - len(retry)
+
+    async def _notify(self, job: ContactImportJob, username: Optional[str]):
+        if not self.notify or not job.requested_by:
+            return
+        try:
+            await self.notify(job, username)
+        except Exception as e:
+            logger.warning(f"Не удалось уведомить администратора {job.requested_by}: {e}")
+
+
+def describe_import_result(job: ContactImportJob, username: Optional[str] = None) -> str:
+    """Текст уведомления администратору о результате импорта"""
+    if not job.telegram_user_id:
+        return (
+            f"⚠️ Контакт не найден в Telegram\n\n"
+            f"👤 {job.name}\n"
+            f"📱 {job.phone}\n"
+            f"Номер не зарегистрирован в Telegram или скрыт настройками приватности"
+        )
+
+    username_info = f" (@{username})" if username else ""
+    return (
+        f"✅ Контакт найден в Telegram\n\n"
+        f"👤 {job.name}\n"
+        f"📱 {job.phone}\n"
+        f"📲 Telegram ID: {job.telegram_user_id}{username_info}"
+    )
@@ -0,0 +1,100 @@
+"""
+Маршрутизатор диалогов с администраторами для Telethon (userbot режим)
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Tuple
+
+from telethon import events
+from loguru import logger
+
+import Config
+from utils.metrics import registry
+
+active_conversations = registry.gauge("userbot_conversations_active", "ожидаемых ответов администраторов")
+expired_conversations = registry.counter("userbot_conversations_expired_total", "диалогов завершено по таймауту")
+
+
+@dataclass
+class ConversationState:
+    """Ожидаемый от пользователя ответ"""
+    handler: Callable
+    args: Tuple[Any, ...] = field(default_factory=tuple)
+    expires_at: float = 0.0
+
+
+class ConversationRouter:
+    """
+    Один обработчик NewMessage на все диалоги
+
+    Вместо регистрации временного обработчика на каждый вопрос состояние
+    хранится в словаре по sender_id: входящее сообщение проверяется одним
+    поиском в словаре, количество обработчиков Telethon не зависит от числа
+    открытых диалогов.
+
+    Обработчик шага получает событие и аргументы, переданные в expect().
+    Если он вернул True - шаг завершен и состояние удаляется (если только
+    обработчик сам не назначил следующий шаг через expect()). Любое другое
+    значение оставляет пользователя в ожидании (например, при ошибке ввода).
+    """
+
+    def __init__(self, client, timeout: int = None):
+        self.client = client
+        self.timeout = timeout or Config.CONVERSATION_TIMEOUT_SECONDS
+        self.states: Dict[int, ConversationState] = {}
+        self.client.add_event_handler(
+            self.dispatch,
+            events.NewMessage(func=lambda event: event.sender_id in self.states)
+        )
+
+    def expect(self, user_id: int, handler: Callable, *args):
+        """Ожидать следующее сообщение пользователя и передать его в handler"""
+        self.purge_expired()
+        self.states[user_id] = ConversationState(handler, args, time.monotonic() + self.timeout)
+        active_conversations.set("", len(self.states))
+
+    def cancel(self, user_id: int):
+        """Отменить ожидание ответа от пользователя"""
+        self.states.pop(user_id, None)
+        active_conversations.set("", len(self.states))
+
+    def is_waiting(self, user_id: int) -> bool:
+        """Ожидается ли ответ от пользователя"""
+        state = self.states.get(user_id)
+        return state is not None and state.expires_at > time.monotonic()
+
+    def purge_expired(self):
+        """Удаление просроченных состояний"""
+        now = time.monotonic()
+        expired = [user_id for user_id, state in self.states.items() if state.expires_at <= now]
+        for user_id in expired:
+            del self.states[user_id]
+        if expired:
+            expired_conversations.inc(amount=len(expired))
+            active_conversations.set("", len(self.states))
+
+    async def dispatch(self, event):
+        """Передача сообщения в обработчик текущего шага диалога"""
+        state = self.states.get(event.sender_id)
+        if state is None:
+            return
+
+        if state.expires_at <= time.monotonic():
+            self.cancel(event.sender_id)
+            expired_conversations.inc()
+            await event.reply("⌛ Время ожидания ответа истекло. Откройте меню заново.")
+            return
+
+        try:
+            done = await state.handler(event, *state.args)
+        except Exception as e:
+            logger.error(f"Ошибка в обработчике диалога: {e}")
+            return
+
+        if done is True and self.states.get(event.sender_id) is state:
+            self.cancel(event.sender_id)
+
+    def handler_count(self) -> int:
+        """Количество обработчиков Telethon, зарегистрированных маршрутизатором"""
+        return sum(1 for callback, _ in self.client.list_event_handlers() if callback == self.dispatch)
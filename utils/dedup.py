@@ -0,0 +1,280 @@
+"""
+Поиск и слияние дубликатов контактов
+"""
+
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+import Config
+from database.db import Database
+from database.models import Contact, ContactMerge
+from utils.metrics import registry
+from utils.name_index import transliterate, trigrams
+
+merged_contacts = registry.counter("dedup_merged_contacts_total", "объединено дубликатов по причине слияния")
+dedup_conflicts = registry.counter("dedup_conflicts_total", "групп дубликатов, пропущенных из-за противоречий")
+dedup_duration = registry.histogram("dedup_run_seconds", "время поиска и слияния дубликатов")
+
+REASON_TITLES = {
+    "telegram_id": "одинаковый Telegram ID",
+    "phone": "одинаковый телефон",
+    "name": "похожее имя",
+}
+
+
+def name_key(name: str) -> Optional[str]:
+    """Ключ блока по имени: первые три буквы слов транслитерации в алфавитном порядке"""
+    words = sorted(word[:3] for word in transliterate(name or "").split())
+    return " ".join(words) or None
+
+
+def blocking_keys(contact: Contact) -> List[Tuple[str, str]]:
+    """Ключи блоков контакта: только контакты с общим ключом сравниваются между собой"""
+    keys = []
+    if contact.telegram_user_id:
+        keys.append(("telegram_id", str(contact.telegram_user_id)))
+    if contact.normalized_phone and not contact.phone_synthetic:
+        keys.append(("phone", contact.normalized_phone))
+    key = name_key(contact.name)
+    if key:
+        keys.append(("name", key))
+    return keys
+
+
+def _real_phone(contact: Contact) -> Optional[str]:
+    return None if contact.phone_synthetic else contact.normalized_phone
+
+
+def name_similarity(a: Set[str], b: Set[str]) -> float:
+    """Коэффициент Дайса по триграммам имен"""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent: Dict[int, int] = {}
+
+    def find(self, item: int) -> int:
+        root = item
+        while self.parent.get(root, root) != root:
+            root = self.parent[root]
+        while item != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a: int, b: int):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+    def groups(self, items) -> List[List[int]]:
+        result = defaultdict(list)
+        for item in items:
+            result[self.find(item)].append(item)
+        return [sorted(group) for group in result.values() if len(group) > 1]
+
+
+def plan_merge(contacts: List[Contact], reason: str) -> ContactMerge:
+    """
+    Слияние группы дубликатов
+
+    Остается контакт с настоящим телефоном, затем с Telegram ID, затем
+    самый старый. Он получает Telegram ID из группы, если своего нет;
+    примечания объединяются, другие телефоны группы дописываются в примечание.
+    """
+    ordered = sorted(contacts, key=lambda c: (_real_phone(c) is None, c.telegram_user_id is None, c.id))
+    target, sources = ordered[0], ordered[1:]
+
+    notes = []
+    for contact in ordered:
+        if contact.note and contact.note not in notes:
+            notes.append(contact.note)
+    phones = {_real_phone(target)}
+    for contact in sources:
+        phone = _real_phone(contact)
+        if phone and phone not in phones:
+            phones.add(phone)
+            notes.append(f"📱 {contact.phone}")
+
+    return ContactMerge(
+        target_id=target.id,
+        source_ids=[contact.id for contact in sources],
+        reason=reason,
+        name=target.name,
+        phone=target.phone,
+        note="\n".join(notes) or None,
+        telegram_user_id=target.telegram_user_id or next(
+            (contact.telegram_user_id for contact in sources if contact.telegram_user_id), None
+        ),
+        source_names=[contact.name for contact in sources],
+    )
+
+
+@dataclass
+class DedupReport:
+    scanned: int = 0
+    merges: List[ContactMerge] = field(default_factory=list)
+    suggestions: List[ContactMerge] = field(default_factory=list)  # найдены только по имени, не объединяются
+    conflicts: int = 0
+    merged: int = 0
+    messages_moved: int = 0
+    seconds: float = 0.0
+
+
+class ContactDeduplicator:
+    """
+    Поиск дубликатов контактов по ключам блоков
+
+    Вместо сравнения всех пар (O(n²)) контакты раскладываются по блокам:
+    Telegram ID, нормализованный телефон и ключ имени (начала слов
+    транслитерации, "Алишер Каримов" и "Karimov Alisher" в одном блоке).
+    Контакты с общим Telegram ID или телефоном - один человек; внутри
+    блока имени пары сравниваются по триграммам и считаются дубликатами
+    при сходстве не ниже DEDUP_NAME_MIN_SCORE и отсутствии разных
+    телефонов и Telegram ID. Такие пары объединяются, только если включен
+    DEDUP_MERGE_BY_NAME, иначе попадают в отчет как предложения.
+
+    Первый проход по базе собирает только ID по блокам, полностью
+    загружаются лишь контакты из блоков с несколькими участниками.
+    """
+
+    def __init__(self, db: Database, merge_by_name: bool = None, name_min_score: float = None,
+                 max_block_size: int = None, batch_size: int = None):
+        self.db = db
+        self.merge_by_name = Config.DEDUP_MERGE_BY_NAME if merge_by_name is None else merge_by_name
+        self.name_min_score = name_min_score or Config.DEDUP_NAME_MIN_SCORE
+        self.max_block_size = max_block_size or Config.DEDUP_MAX_BLOCK_SIZE
+        self.batch_size = max(1, batch_size or Config.DEDUP_MERGE_BATCH_SIZE)
+
+    def find_duplicates(self) -> DedupReport:
+        """Поиск групп дубликатов без изменения базы"""
+        report = DedupReport()
+        blocks: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+        for contact in self.db.iter_contacts(Config.EXPORT_BATCH_SIZE):
+            report.scanned += 1
+            for key in blocking_keys(contact):
+                blocks[key].append(contact.id)
+
+        blocks = {key: ids for key, ids in blocks.items() if len(ids) > 1}
+        candidate_ids = sorted({contact_id for ids in blocks.values() for contact_id in ids})
+        contacts = {contact.id: contact for contact in self.db.get_contacts_by_ids(candidate_ids)}
+
+        certain = _UnionFind()
+        name_pairs = []
+        for (kind, _), ids in blocks.items():
+            members = [contacts[contact_id] for contact_id in ids if contact_id in contacts]
+            if kind == "telegram_id":
+                for contact in members[1:]:
+                    certain.union(members[0].id, contact.id)
+            elif kind == "phone":
+                # Один телефон у разных пользователей Telegram - не дубликат
+                if len({c.telegram_user_id for c in members if c.telegram_user_id}) > 1:
+                    report.conflicts += 1
+                    dedup_conflicts.inc(kind)
+                    continue
+                for contact in members[1:]:
+                    certain.union(members[0].id, contact.id)
+            elif len(members) <= self.max_block_size:
+                name_pairs.extend(self._similar_names(members))
+
+        # Пары по имени между уже найденными группами
+        full = _UnionFind()
+        full.parent = dict(certain.parent)
+        suggestions = []
+        for a, b in name_pairs:
+            if certain.find(a) != certain.find(b):
+                full.union(a, b)
+                suggestions.append((a, b))
+
+        groups = (full if self.merge_by_name else certain).groups(candidate_ids)
+        for ids in groups:
+            members = [contacts[contact_id] for contact_id in ids]
+            # Группа, связанная хотя бы одной парой только по имени, слабее остальных
+            by_name = len({certain.find(contact_id) for contact_id in ids}) > 1
+            reason = "name" if by_name else self._group_reason(members)
+            telegram_ids = {c.telegram_user_id for c in members if c.telegram_user_id}
+            phones = {_real_phone(c) for c in members} - {None}
+            if len(telegram_ids) > 1 or (by_name and len(phones) > 1):
+                report.conflicts += 1
+                dedup_conflicts.inc(reason)
+                logger.warning(f"⚠️ Дубликаты {ids} не объединены: разные Telegram ID или телефоны")
+                continue
+            report.merges.append(plan_merge(members, reason))
+
+        if not self.merge_by_name:
+            for a, b in suggestions:
+                report.suggestions.append(plan_merge([contacts[a], contacts[b]], "name"))
+        return report
+
+    def _similar_names(self, members: List[Contact]) -> List[Tuple[int, int]]:
+        grams = [trigrams(contact.name) for contact in members]
+        pairs = []
+        for i, a in enumerate(members):
+            for j in range(i + 1, len(members)):
+                b = members[j]
+                if a.telegram_user_id and b.telegram_user_id and a.telegram_user_id != b.telegram_user_id:
+                    continue
+                if _real_phone(a) and _real_phone(b) and _real_phone(a) != _real_phone(b):
+                    continue
+                if name_similarity(grams[i], grams[j]) >= self.name_min_score:
+                    pairs.append((a.id, b.id))
+        return pairs
+
+    @staticmethod
+    def _group_reason(members: List[Contact]) -> str:
+        telegram_ids = [c.telegram_user_id for c in members if c.telegram_user_id]
+        if len(telegram_ids) > len(set(telegram_ids)):
+            return "telegram_id"
+        return "phone"
+
+    def run(self, dry_run: bool = False) -> DedupReport:
+        """Поиск и слияние дубликатов пачками по DEDUP_MERGE_BATCH_SIZE групп на транзакцию"""
+        started = time.monotonic()
+        report = self.find_duplicates()
+
+        if not dry_run:
+            for start in range(0, len(report.merges), self.batch_size):
+                batch = report.merges[start:start + self.batch_size]
+                report.messages_moved += self.db.merge_contacts(batch)
+                for merge in batch:
+                    merged_contacts.inc(merge.reason, len(merge.source_ids))
+                    report.merged += len(merge.source_ids)
+
+        report.seconds = time.monotonic() - started
+        dedup_duration.observe(report.seconds)
+        if report.merges or report.suggestions:
+            logger.info(
+                f"🧬 Дубликаты контактов: групп {len(report.merges)}, объединено {report.merged}, "
+                f"сообщений перенесено {report.messages_moved}, по имени на проверку {len(report.suggestions)} "
+                f"({report.scanned} контактов за {report.seconds:.1f}с)"
+            )
+        return report
+
+
+def describe_dedup_report(report: DedupReport, dry_run: bool = False, limit: int = 10) -> str:
+    """Текст отчета о поиске дубликатов для администратора"""
+    lines = [f"🧬 Проверено контактов: {report.scanned}"]
+    if dry_run:
+        lines.append(f"🔗 Найдено групп дубликатов: {len(report.merges)}")
+    else:
+        lines.append(f"🔗 Объединено дубликатов: {report.merged} (групп: {len(report.merges)})")
+        lines.append(f"💬 Перенесено сообщений: {report.messages_moved}")
+    if report.conflicts:
+        lines.append(f"⚠️ Пропущено групп с разными Telegram ID/телефонами: {report.conflicts}")
+
+    for merge in report.merges[:limit]:
+        lines.append(f"• {merge.name} ← {', '.join(merge.source_names)} ({REASON_TITLES[merge.reason]})")
+    if len(report.merges) > limit:
+        lines.append(f"... и еще {len(report.merges) - limit}")
+
+    if report.suggestions:
+        lines.append(f"\n🤔 Возможные дубликаты по имени (не объединены): {len(report.suggestions)}")
+        for merge in report.suggestions[:limit]:
+            lines.append(f"• #{merge.target_id} {merge.name} ↔ #{merge.source_ids[0]} {merge.source_names[0]}")
+    return "\n".join(lines)
@@ -0,0 +1,169 @@
+"""
+Кэш сущностей Telegram для userbot: собственный ID, ID бота, отправители и username
+"""
+
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from telethon import types
+from loguru import logger
+
+import Config
+from database.db import Database
+from database.models import TelegramEntity
+
+
+def entity_from_telethon(entity) -> TelegramEntity:
+    """
+    Конвертирует пользователя Telethon в TelegramEntity
+
+    Args:
+        entity: Объект User (или Channel/Chat) из Telethon
+
+    Returns:
+        TelegramEntity
+    """
+    return TelegramEntity(
+        id=entity.id,
+        access_hash=getattr(entity, "access_hash", None),
+        first_name=getattr(entity, "first_name", None) or getattr(entity, "title", None),
+        last_name=getattr(entity, "last_name", None),
+        username=getattr(entity, "username", None),
+        phone=getattr(entity, "phone", None),
+        bot=bool(getattr(entity, "bot", False))
+    )
+
+
+def parse_bot_id(bot_token: str) -> Optional[int]:
+    """Извлекает ID бота из токена вида '123456:ABC...'"""
+    try:
+        return int(bot_token.split(':')[0])
+    except (AttributeError, ValueError):
+        return None
+
+
+class EntityCache:
+    """LRU-кэш отправителей с сохранением в БД и TTL-кэш username"""
+
+    def __init__(self, client, db: Database,
+                 max_size: int = None, username_ttl: int = None):
+        self.client = client
+        self.db = db
+        self.max_size = max_size or Config.ENTITY_CACHE_SIZE
+        self.username_ttl = username_ttl if username_ttl is not None else Config.USERNAME_CACHE_TTL_SECONDS
+        self.bot_id = parse_bot_id(Config.BOT_TOKEN)
+        self.self_id = None
+        self._entities: "OrderedDict[int, TelegramEntity]" = OrderedDict()
+        self._usernames: Dict[str, Tuple[float, TelegramEntity]] = {}
+
+    async def get_self_id(self) -> int:
+        """ID аккаунта userbot (запрашивается один раз)"""
+        if self.self_id is None:
+            me = await self.client.get_me()
+            self.self_id = me.id
+            self.remember(entity_from_telethon(me), persist=False)
+        return self.self_id
+
+    def set_self(self, me):
+        """Сохранение уже полученного get_me() без повторного запроса"""
+        self.self_id = me.id
+        self.remember(entity_from_telethon(me), persist=False)
+
+    def is_own_account(self, user_id: int) -> bool:
+        """Проверка, что ID принадлежит userbot или нашему боту"""
+        return user_id is not None and user_id in (self.self_id, self.bot_id)
+
+    def get(self, entity_id: int) -> Optional[TelegramEntity]:
+        """Получение сущности из памяти или из БД без сетевых запросов"""
+        entity = self._entities.get(entity_id)
+        if entity is not None:
+            self._entities.move_to_end(entity_id)
+            return entity
+
+        entity = self.db.get_telegram_entity(entity_id)
+        if entity is not None:
+            self.remember(entity, persist=False)
+        return entity
+
+    def remember(self, entity: TelegramEntity, persist: bool = True):
+        """Добавление сущности в кэш (и в БД, если она изменилась)"""
+        cached = self._entities.get(entity.id)
+        self._entities[entity.id] = entity
+        self._entities.move_to_end(entity.id)
+
+        while len(self._entities) > self.max_size:
+            self._entities.popitem(last=False)
+
+        if persist and self._is_changed(cached, entity):
+            try:
+                self.db.save_telegram_entity(entity)
+            except Exception as e:
+                logger.warning(f"Не удалось сохранить сущность {entity.id} в кэш БД: {e}")
+
+    async def get_sender(self, event) -> Optional[TelegramEntity]:
+        """
+        Отправитель события с минимумом запросов к Telegram
+
+        Если Telethon уже получил пользователя вместе с обновлением - берем его
+        (и обновляем кэш), иначе ищем в кэше, и только в крайнем случае
+        выполняем get_sender().
+        """
+        sender = getattr(event, "sender", None)
+        if sender is not None:
+            entity = entity_from_telethon(sender)
+            # Подгружаем сохраненную копию, чтобы не перезаписывать БД без изменений
+            self.get(entity.id)
+            self.remember(entity)
+            return entity
+
+        sender_id = getattr(event, "sender_id", None)
+        if sender_id is not None:
+            entity = self.get(sender_id)
+            if entity is not None:
+                return entity
+
+        sender = await event.get_sender()
+        if sender is None:
+            return None
+
+        entity = entity_from_telethon(sender)
+        self.remember(entity)
+        return entity
+
+    def get_input_peer(self, user_id: int):
+        """InputPeerUser из кэша (без resolve), либо сам ID если access_hash неизвестен"""
+        entity = self.get(user_id)
+        if entity is not None and entity.access_hash is not None:
+            return types.InputPeerUser(entity.id, entity.access_hash)
+        return user_id
+
+    async def resolve_username(self, username: str) -> TelegramEntity:
+        """
+        Поиск пользователя по username с кэшированием на USERNAME_CACHE_TTL_SECONDS
+
+        Raises:
+            Исключения Telethon, если username не найден
+        """
+        key = username.lstrip("@").lower()
+        cached = self._usernames.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        user = await self.client.get_entity(username)
+        entity = entity_from_telethon(user)
+        self.remember(entity)
+        self._usernames[key] = (time.monotonic() + self.username_ttl, entity)
+        return entity
+
+    @staticmethod
+    def _is_changed(cached: Optional[TelegramEntity], entity: TelegramEntity) -> bool:
+        if cached is None:
+            return True
+        return (
+            cached.access_hash != entity.access_hash
+            or cached.first_name != entity.first_name
+            or cached.last_name != entity.last_name
+            or cached.username != entity.username
+            or cached.phone != entity.phone
+        )
@@ -0,0 +1,89 @@
+"""
+Предварительная фильтрация событий Telethon до любых сетевых запросов
+"""
+
+from typing import Callable, List, Optional, Tuple
+
+from loguru import logger
+
+import Config
+from utils.metrics import registry
+
+# Счетчик отброшенных событий по правилам фильтра
+dropped_events = registry.counter("userbot_ingest_dropped_total", "отброшено событий по правилам фильтра")
+accepted_events = registry.counter("userbot_ingest_accepted_total", "событий прошло фильтр")
+
+
+def get_chat_type(event) -> Optional[str]:
+    """
+    Тип чата события без обращения к Telegram
+
+    Returns:
+        'private', 'group', 'channel' или None если определить нельзя
+    """
+    if event.is_private:
+        return "private"
+    if event.is_channel:
+        message = getattr(event, "message", None)
+        if getattr(message, "post", False) or event.is_group is False:
+            return "channel"
+        return "group"
+    if event.is_group:
+        return "group"
+    return None
+
+
+class IngestionFilter:
+    """
+    Цепочка правил для events.NewMessage(func=...)
+
+    Каждое правило - (имя, предикат); событие отбрасывается первым правилом,
+    которое вернуло False. Все проверки используют только поля самого
+    события, без get_sender()/get_me().
+    """
+
+    def __init__(self, is_own_account: Callable[[int], bool] = None):
+        self.is_own_account = is_own_account
+        self.rules: List[Tuple[str, Callable]] = self.build_rules()
+
+    def build_rules(self) -> List[Tuple[str, Callable]]:
+        """Формирование списка правил из Config"""
+        rules = []
+
+        if Config.INGEST_INCOMING_ONLY:
+            rules.append(("outgoing", lambda event: not event.out))
+
+        chat_types = set(Config.INGEST_CHAT_TYPES or [])
+        if chat_types:
+            rules.append(("chat_type", lambda event: get_chat_type(event) in chat_types))
+
+        if Config.INGEST_SKIP_SERVICE_MESSAGES:
+            rules.append(("service", lambda event: getattr(event.message, "action", None) is None))
+
+        if self.is_own_account:
+            rules.append(("own_account", lambda event: not self.is_own_account(event.sender_id)))
+
+        denylist = set(Config.INGEST_SENDER_DENYLIST or [])
+        if denylist:
+            rules.append(("sender_denylist", lambda event: event.sender_id not in denylist))
+
+        allowlist = set(Config.INGEST_SENDER_ALLOWLIST or [])
+        if allowlist:
+            rules.append(("sender_allowlist", lambda event: event.sender_id in allowlist))
+
+        return rules
+
+    def __call__(self, event) -> bool:
+        for name, check in self.rules:
+            try:
+                passed = check(event)
+            except Exception as e:
+                logger.debug(f"Правило фильтра {name} не смогло обработать событие: {e}")
+                passed = False
+
+            if not passed:
+                dropped_events.inc(name)
+                return False
+
+        accepted_events.inc()
+        return True
@@ -0,0 +1,130 @@
+"""
+Потоковый экспорт контактов и переписки (CSV, JSONL, стенограмма)
+"""
+
+import csv
+import json
+import os
+import time
+from dataclasses import fields
+from datetime import datetime
+from typing import Callable, Dict, Iterable, TextIO, Tuple
+
+from loguru import logger
+
+import Config
+from database.db import Database
+from database.models import Contact, Message
+from utils.metrics import registry
+
+exported_rows = registry.counter("export_rows_total", "выгружено строк по типу данных")
+
+CONTACT_FIELDS = [field.name for field in fields(Contact)]
+# Превью - производное от текста поле для списков, в выгрузку не входит
+MESSAGE_FIELDS = [field.name for field in fields(Message) if field.name != "preview"]
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def write_csv(rows: Iterable, columns: list, out: TextIO) -> int:
+    """Запись dataclass-строк в CSV по одной (без накопления в памяти)"""
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow([_serialize(getattr(row, column)) for column in columns])
+        count += 1
+    return count
+
+
+def write_jsonl(rows: Iterable, out: TextIO, columns: list = None) -> int:
+    """Запись dataclass-строк в JSON Lines по одной (columns - только эти поля)"""
+    count = 0
+    for row in rows:
+        data = {column: getattr(row, column) for column in columns} if columns else vars(row)
+        out.write(json.dumps(data, ensure_ascii=False, default=_serialize))
+        out.write("\n")
+        count += 1
+    return count
+
+
+def export_contacts(db: Database, out: TextIO, file_format: str = "csv") -> int:
+    """Экспорт всех контактов"""
+    rows = db.iter_contacts(Config.EXPORT_BATCH_SIZE)
+    count = write_csv(rows, CONTACT_FIELDS, out) if file_format == "csv" else write_jsonl(rows, out)
+    exported_rows.inc("contacts", count)
+    return count
+
+
+def export_messages(db: Database, out: TextIO, file_format: str = "csv",
+                    since: datetime = None, contact_id: int = None) -> int:
+    """Экспорт сообщений (всех, начиная с даты или одного контакта)"""
+    rows = db.iter_messages(since=since, contact_id=contact_id, batch_size=Config.EXPORT_BATCH_SIZE)
+    count = write_csv(rows, MESSAGE_FIELDS, out) if file_format == "csv" else write_jsonl(rows, out, MESSAGE_FIELDS)
+    exported_rows.inc("messages", count)
+    return count
+
+
+def write_transcript(db: Database, contact: Contact, out: TextIO) -> int:
+    """Стенограмма переписки с контактом в читаемом виде"""
+    out.write(f"Переписка с {contact.name} ({contact.phone})\n")
+    out.write(f"Выгружено: {datetime.now().strftime(Config.DATE_FORMAT)}\n\n")
+
+    count = 0
+    for message in db.iter_messages(contact_id=contact.id, batch_size=Config.EXPORT_BATCH_SIZE):
+        author = "Вы" if message.direction == "outgoing" else contact.name
+        timestamp = message.timestamp.strftime(Config.DATE_FORMAT) if message.timestamp else "-"
+        text = message.text or f"[{message.media_type or 'медиа'}]"
+        out.write(f"[{timestamp}] {author}: {text}\n")
+        count += 1
+
+    if not count:
+        out.write("Сообщений нет\n")
+    exported_rows.inc("transcript", count)
+    return count
+
+
+# Вид экспорта -> функция экспорта
+EXPORTS: Dict[str, Callable[..., int]] = {
+    "contacts": export_contacts,
+    "messages": export_messages,
+}
+
+
+def export_to_file(db: Database, kind: str, file_format: str = "csv",
+                   directory: str = None, **options) -> Tuple[str, int]:
+    """
+    Экспорт в файл в директории EXPORTS_DIR
+
+    Returns:
+        (путь к файлу, количество строк)
+    """
+    if kind not in EXPORTS:
+        raise ValueError(f"Неизвестный вид экспорта: {kind}")
+    if file_format not in ("csv", "jsonl"):
+        raise ValueError(f"Неизвестный формат экспорта: {file_format}")
+
+    export = EXPORTS[kind]
+    directory = directory or Config.EXPORTS_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{file_format}")
+
+    started = time.monotonic()
+    with open(path, "w", newline="", encoding="utf-8") as out:
+        count = export(db, out, file_format, **options)
+    logger.info(f"📤 Экспорт {kind}: {count} строк за {time.monotonic() - started:.1f}с -> {path}")
+    return path, count
+
+
+def transcript_to_file(db: Database, contact: Contact, directory: str = None) -> str:
+    """Стенограмма переписки с контактом в файл EXPORTS_DIR"""
+    directory = directory or Config.EXPORTS_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"transcript_{contact.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
+    with open(path, "w", encoding="utf-8") as out:
+        write_transcript(db, contact, out)
+    return path
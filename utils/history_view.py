@@ -0,0 +1,93 @@
+"""
+Отрисовка страниц истории переписки в пределах одного сообщения Telegram
+"""
+
+import html
+from typing import List, Tuple
+
+from database.models import Message
+
+_ELLIPSIS = "…"
+
+
+def _cut_escaped(text: str, length: int) -> str:
+    """Обрезка HTML-экранированного текста, не разрывающая сущности вроде &amp;"""
+    text = text[:length]
+    amp = text.rfind("&")
+    if amp > text.rfind(";"):
+        text = text[:amp]
+    return text
+
+
+def format_history_message(message: Message, max_length: int = None) -> str:
+    """
+    Блок одного сообщения в истории (HTML)
+
+    Для сообщения из списка (только превью) длинный текст заканчивается
+    командой /msg_<id>, открывающей его целиком.
+
+    Args:
+        max_length: Максимальная длина блока; длинный текст обрезается с многоточием
+    """
+    direction_icon = "📤" if message.direction == "outgoing" else "📨"
+    head = f"{direction_icon} <b>{message.timestamp.strftime('%d.%m %H:%M')}</b>\n"
+    text = message.text if message.text is not None else message.preview
+    if not text:
+        text = "[Медиа файл]"
+    elif message.text is None and text.endswith(_ELLIPSIS):
+        # В списке только начало текста - полный текст по команде
+        text = f"{html.escape(text)} /msg_{message.id}"
+    else:
+        text = html.escape(text)
+    block = f"{head}{text}\n\n"
+    if max_length is None or len(block) <= max_length:
+        return block
+    available = max(0, max_length - len(head) - len(_ELLIPSIS) - 2)
+    return f"{head}{_cut_escaped(text, available)}{_ELLIPSIS}\n\n"
+
+
+def render_history_page(title: str, messages: List[Message], max_length: int,
+                        newest_first: bool = True) -> Tuple[str, int]:
+    """
+    Текст страницы истории не длиннее max_length
+
+    Сообщения берутся подряд в порядке удаления от курсора, пока помещаются;
+    оставшиеся переходят на следующую страницу. Первое сообщение страницы
+    показывается всегда - если не помещается даже оно, его текст обрезается.
+
+    Args:
+        title: Заголовок страницы (HTML)
+        messages: Сообщения в порядке удаления от курсора
+        newest_first: Порядок messages (на странице сообщения всегда идут от старых к новым)
+
+    Returns:
+        (текст страницы, сколько сообщений из messages на ней показано)
+    """
+    budget = max_length - len(title)
+    blocks = []
+    for message in messages:
+        block = format_history_message(message)
+        if len(block) > budget:
+            if blocks:
+                break
+            block = format_history_message(message, budget)
+        blocks.append(block)
+        budget -= len(block)
+
+    if newest_first:
+        blocks.reverse()
+    return (title + "".join(blocks)).rstrip(), len(blocks)
+
+
+def split_text(text: str, max_length: int) -> List[str]:
+    """Разбиение текста на части не длиннее max_length, по возможности по строкам"""
+    parts = []
+    while len(text) > max_length:
+        cut = text.rfind("\n", 0, max_length + 1)
+        if cut <= 0:
+            cut = max_length
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text or not parts:
+        parts.append(text)
+    return parts
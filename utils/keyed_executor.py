@@ -0,0 +1,102 @@
+"""
+Исполнитель обработчиков Telethon с упорядочиванием по ключу (отправителю)
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, List, Optional
+
+from loguru import logger
+
+import Config
+from utils.metrics import registry
+
+
+class KeyedExecutor:
+    """
+    Фиксированное число рабочих «полос» (lanes) с очередями
+
+    Задачи с одинаковым ключом всегда попадают в одну полосу и выполняются
+    по порядку; задачи разных ключей выполняются параллельно в разных полосах.
+    """
+
+    def __init__(self, name: str = "userbot", lanes: int = None, queue_size: int = None):
+        self.name = name
+        self.lanes = max(1, lanes or Config.USERBOT_WORKER_LANES)
+        self.queue_size = queue_size if queue_size is not None else Config.USERBOT_LANE_QUEUE_SIZE
+        self.queues: List[asyncio.Queue] = []
+        self.workers: List[asyncio.Task] = []
+        self.busy = [False] * self.lanes
+
+        self.occupancy = registry.gauge(f"{name}_lane_occupancy", "задач в полосе (в очереди + выполняется)")
+        self.lag = registry.gauge(f"{name}_lane_lag_seconds", "задержка последней задачи в полосе")
+        self.lag_histogram = registry.histogram(f"{name}_lane_lag", "задержка от постановки в очередь до запуска, с")
+        self.failures = registry.counter(f"{name}_lane_failures_total", "задач завершилось ошибкой")
+
+    def start(self):
+        """Запуск рабочих полос (вызывается автоматически при первой задаче)"""
+        if self.workers:
+            return
+        self.queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.lanes)]
+        self.workers = [asyncio.create_task(self._worker(lane)) for lane in range(self.lanes)]
+        logger.info(f"⚙️ Запущено полос обработки {self.name}: {self.lanes}")
+
+    def lane_for(self, key: Any) -> int:
+        """Номер полосы для ключа"""
+        return hash(key) % self.lanes if key is not None else 0
+
+    async def submit(self, key: Any, handler: Callable, *args):
+        """Поставить handler(*args) в очередь полосы, соответствующей ключу"""
+        self.start()
+        lane = self.lane_for(key)
+        await self.queues[lane].put((time.monotonic(), handler, args))
+        self._update_occupancy(lane)
+
+    def wrap(self, handler: Callable, key: Optional[Callable] = None) -> Callable:
+        """
+        Обертка обработчика события для client.add_event_handler / client.on
+
+        Args:
+            handler: Асинхронный обработчик события
+            key: Функция получения ключа из события (по умолчанию sender_id)
+        """
+        key = key or (lambda event: event.sender_id)
+
+        async def dispatch(event):
+            await self.submit(key(event), handler, event)
+
+        return dispatch
+
+    async def stop(self, timeout: float = 10):
+        """Дождаться выполнения очередей (не дольше timeout) и остановить полосы"""
+        if not self.workers:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self.queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Не все задачи {self.name} завершены до остановки")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def _worker(self, lane: int):
+        queue = self.queues[lane]
+        while True:
+            enqueued_at, handler, args = await queue.get()
+            lag = time.monotonic() - enqueued_at
+            self.lag.set(str(lane), lag)
+            self.lag_histogram.observe(lag)
+            self.busy[lane] = True
+            try:
+                await handler(*args)
+            except Exception as e:
+                self.failures.inc(str(lane))
+                logger.error(f"Ошибка в полосе {self.name}#{lane}: {e}")
+            finally:
+                self.busy[lane] = False
+                queue.task_done()
+                self._update_occupancy(lane)
+
+    def _update_occupancy(self, lane: int):
+        self.occupancy.set(str(lane), self.queues[lane].qsize() + int(self.busy[lane]))
@@ -0,0 +1,187 @@
+"""
+Кольцевые буферы последних сообщений активных контактов
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import replace
+from typing import Iterable, List, Optional, Tuple
+
+import Config
+from database.db import Database
+from database.models import Contact, Message
+from utils.metrics import registry
+
+buffer_requests = registry.counter("message_buffer_requests_total", "обращений к буферу истории (hit/miss)")
+buffer_hit_ratio = registry.gauge("message_buffer_hit_ratio", "доля открытий истории без обращения к базе")
+buffer_evictions = registry.counter("message_buffer_evictions_total", "контактов, вытесненных из буфера истории")
+buffer_bytes = registry.gauge("message_buffer_bytes", "оценка памяти буферов истории")
+buffer_contacts = registry.gauge("message_buffer_contacts", "контактов в буфере истории")
+
+# Объект Message со словарем атрибутов без учета превью (оценка)
+_MESSAGE_OVERHEAD = 400
+
+
+def message_size(message: Message) -> int:
+    """Оценка памяти сообщения в буфере"""
+    return _MESSAGE_OVERHEAD + sys.getsizeof(message.preview or "")
+
+
+class _Entry:
+    __slots__ = ("contact", "messages", "bytes", "complete", "loaded_at")
+
+    def __init__(self, size: int):
+        self.contact: Optional[Contact] = None
+        self.messages: "deque[Message]" = deque(maxlen=size)
+        self.bytes = 0
+        # True - в буфере действительно последние сообщения (загружены из базы
+        # и дополнялись новыми), иначе только сообщения, пришедшие после создания буфера
+        self.complete = False
+        # Когда буфер загружен из базы (time.monotonic)
+        self.loaded_at = 0.0
+
+
+class RecentMessages:
+    """
+    Последние сообщения недавно активных контактов в памяти
+
+    Для каждого контакта хранится кольцевой буфер из последних
+    MESSAGE_HISTORY_LIMIT сообщений (превью, без полного текста) и сам
+    контакт. Буфер пополняется
+    новыми сообщениями при сохранении (входящие и отправленные - через
+    подписку на Database.add_message) и загружается из базы при первом
+    открытии истории; после этого открытие истории активного диалога
+    обходится без базы и Telegram.
+
+    Контакты вытесняются по LRU, когда оценка памяти всех буферов
+    превышает MESSAGE_BUFFER_MAX_BYTES. Массовые изменения сообщений
+    (слияние контактов) сбрасывают все буферы, изменение контакта - его
+    буфер. Изменения из других процессов, работающих с той же базой,
+    сюда не приходят: буфер старше MESSAGE_BUFFER_REFRESH_SECONDS
+    перечитывается из базы при следующем открытии истории.
+    """
+
+    def __init__(self, db: Database, size: int = None, max_bytes: int = None, refresh_seconds: int = None):
+        self.db = db
+        self.size = max(1, size or Config.MESSAGE_HISTORY_LIMIT)
+        self.max_bytes = max_bytes or Config.MESSAGE_BUFFER_MAX_BYTES
+        self.refresh_seconds = Config.MESSAGE_BUFFER_REFRESH_SECONDS if refresh_seconds is None else refresh_seconds
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._requests = 0
+        self._lock = threading.Lock()
+        db.subscribe_messages(self._on_message_saved)
+        db.subscribe("messages", self._on_messages_changed)
+        db.subscribe("contacts", self._on_contacts_changed)
+
+    def history(self, contact_id: int, limit: int = None) -> Optional[Tuple[Contact, List[Message]]]:
+        """
+        Контакт и его последние сообщения (новые первыми) без обращения к базе
+
+        Returns:
+            None, если истории контакта нет в буфере целиком или она устарела - нужен load()
+        """
+        limit = limit or self.size
+        with self._lock:
+            entry = self._entries.get(contact_id)
+            hit = (entry is not None and entry.complete and limit <= self.size
+                   and time.monotonic() - entry.loaded_at <= self.refresh_seconds)
+            self._count(hit)
+            if not hit:
+                return None
+            self._entries.move_to_end(contact_id)
+            contact, messages = entry.contact, list(entry.messages)
+        messages.reverse()
+        return contact, messages[:limit]
+
+    def load(self, contact_id: int, limit: int = None) -> Tuple[Optional[Contact], List[Message]]:
+        """Загрузка контакта и последних сообщений из базы с сохранением в буфер"""
+        limit = limit or self.size
+        contact = self.db.get_contact(contact_id)
+        messages = self.db.get_contact_messages(contact_id, limit=max(limit, self.size))
+        if contact is None or limit > self.size:
+            return contact, messages[:limit]
+
+        with self._lock:
+            entry = self._entry(contact_id)
+            # Сообщения, сохраненные после чтения из базы, остаются в буфере
+            newest = max((message.id for message in messages), default=0)
+            newer = [message for message in entry.messages if message.id > newest]
+            self._resize(entry, -entry.bytes)
+            entry.messages.clear()
+            entry.messages.extend(reversed(messages))
+            entry.messages.extend(newer)
+            entry.contact = contact
+            entry.complete = True
+            entry.loaded_at = time.monotonic()
+            self._resize(entry, sum(map(message_size, entry.messages)))
+            self._evict()
+        return contact, messages[:limit]
+
+    def clear(self):
+        """Сброс всех буферов"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._update_gauges()
+
+    def _on_message_saved(self, message: Message):
+        # Как и в списках из базы, в буфере только превью: полный текст не держится в памяти
+        message = replace(message, text=None, media_file_id=None)
+        with self._lock:
+            entry = self._entry(message.contact_id)
+            if len(entry.messages) == entry.messages.maxlen:
+                self._resize(entry, -message_size(entry.messages[0]))
+            entry.messages.append(message)
+            self._resize(entry, message_size(message))
+            self._evict()
+
+    def _on_messages_changed(self, ids: Optional[Iterable[int]]):
+        # Отдельные новые сообщения приходят в _on_message_saved; без ID -
+        # сообщения перенесены между контактами, буферы устарели
+        if ids is None:
+            self.clear()
+
+    def _on_contacts_changed(self, ids: Optional[Iterable[int]]):
+        # Измененный или удаленный контакт загружается заново при следующем открытии
+        if ids is None:
+            self.clear()
+            return
+        with self._lock:
+            for contact_id in ids:
+                entry = self._entries.pop(contact_id, None)
+                if entry is not None:
+                    self._bytes -= entry.bytes
+            self._update_gauges()
+
+    def _entry(self, contact_id: int) -> _Entry:
+        entry = self._entries.get(contact_id)
+        if entry is None:
+            entry = self._entries[contact_id] = _Entry(self.size)
+        self._entries.move_to_end(contact_id)
+        return entry
+
+    def _resize(self, entry: _Entry, delta: int):
+        entry.bytes += delta
+        self._bytes += delta
+
+    def _evict(self):
+        # Последний использованный контакт остается даже сверх лимита
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.bytes
+            buffer_evictions.inc()
+        self._update_gauges()
+
+    def _count(self, hit: bool):
+        self._requests += 1
+        self._hits += hit
+        buffer_requests.inc("hit" if hit else "miss")
+        buffer_hit_ratio.set("", round(self._hits / self._requests, 4))
+
+    def _update_gauges(self):
+        buffer_bytes.set("", self._bytes)
+        buffer_contacts.set("", len(self._entries))
@@ -0,0 +1,160 @@
+"""
+Простые метрики в памяти процесса: счетчики, значения и гистограммы
+"""
+
+import bisect
+from collections import Counter as _Counter
+from typing import Dict, Iterable, List, Optional
+
+
+class Counter:
+    """Набор счетчиков с метками (например, правило фильтра -> количество)"""
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self.values = _Counter()
+
+    def inc(self, label: str = "", amount: int = 1):
+        self.values[label] += amount
+
+    def get(self, label: str = "") -> int:
+        return self.values.get(label, 0)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_label(label)} {value}" for label, value in sorted(self.values.items())]
+
+
+class Gauge:
+    """Набор текущих значений с метками"""
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self.values: Dict[str, float] = {}
+
+    def set(self, label: str, value: float):
+        self.values[label] = value
+
+    def get(self, label: str = "") -> float:
+        return self.values.get(label, 0)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_label(label)} {_fmt(value)}" for label, value in sorted(self.values.items())]
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин (в секундах)"""
+
+    DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name: str, description: str = "", buckets: Iterable[float] = None):
+        self.name = name
+        self.description = description
+        self.buckets = sorted(buckets or self.DEFAULT_BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля по верхней границе корзины"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def render(self, label: str = "") -> List[str]:
+        key = f'key="{label}",' if label else ""
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{{{key}le="{_fmt(bound)}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{{key}le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum{_label(label)} {_fmt(self.total)}")
+        lines.append(f"{self.name}_count{_label(label)} {self.count}")
+        return lines
+
+
+class LabeledHistogram:
+    """Гистограммы с метками под одним именем (например, кнопка -> время обработки)"""
+
+    def __init__(self, name: str, description: str = "", buckets: Iterable[float] = None):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.children: Dict[str, Histogram] = {}
+
+    def labels(self, label: str) -> Histogram:
+        child = self.children.get(label)
+        if child is None:
+            child = self.children[label] = Histogram(self.name, buckets=self.buckets)
+        return child
+
+    def observe(self, label: str, value: float):
+        self.labels(label).observe(value)
+
+    def render(self) -> List[str]:
+        lines = []
+        for label, child in sorted(self.children.items()):
+            lines.extend(child.render(label))
+        return lines
+
+
+class MetricsRegistry:
+    """Реестр всех метрик процесса"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def _get_or_create(self, cls, name: str, description: str, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = cls(name, description, **kwargs)
+            self.metrics[name] = metric
+        return metric
+
+    def counter(self, name: str, description: str = "") -> Counter:
+        return self._get_or_create(Counter, name, description)
+
+    def gauge(self, name: str, description: str = "") -> Gauge:
+        return self._get_or_create(Gauge, name, description)
+
+    def histogram(self, name: str, description: str = "", buckets: Iterable[float] = None) -> Histogram:
+        return self._get_or_create(Histogram, name, description, buckets=buckets)
+
+    def labeled_histogram(self, name: str, description: str = "",
+                          buckets: Iterable[float] = None) -> LabeledHistogram:
+        return self._get_or_create(LabeledHistogram, name, description, buckets=buckets)
+
+    def render_text(self) -> str:
+        """Текстовое представление всех метрик (формат, близкий к Prometheus)"""
+        lines = []
+        for name in sorted(self.metrics):
+            metric = self.metrics[name]
+            if metric.description:
+                lines.append(f"# {name}: {metric.description}")
+            lines.extend(metric.render())
+        return "\n".join(lines)
+
+
+def _label(label: str) -> str:
+    return f'{{key="{label}"}}' if label else ""
+
+
+def _fmt(value: float) -> str:
+    return f"{value:g}"
+
+
+# Общий реестр метрик
+registry = MetricsRegistry()
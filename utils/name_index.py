@@ -0,0 +1,265 @@
+"""
+Нечеткий поиск контактов по имени: триграммы транслитерированных имен
+"""
+
+import heapq
+import math
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+
+import Config
+from database.db import Database
+from database.models import Contact
+from utils.metrics import registry
+
+index_size = registry.gauge("contact_index_contacts", "контактов в индексах поиска в памяти")
+index_rebuilds = registry.counter("contact_index_rebuilds_total", "полных перестроений индексов поиска")
+name_search_latency = registry.histogram("name_search_seconds", "время нечеткого поиска по имени")
+
+# Во сколько раз проверка кандидата пересечением дороже учета одной записи списка
+_CANDIDATE_CHECK_COST = 8
+
+_CYRILLIC = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh",
+    "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "h", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "sch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu",
+    "я": "ya", "і": "i", "ї": "yi", "є": "ye", "ґ": "g", "ў": "u", "қ": "k", "ғ": "g",
+    "ҳ": "h", "ң": "n", "ү": "u", "ұ": "u", "ө": "o", "ә": "a", "һ": "h",
+}
+
+# Латинские написания одного звука, сводимые к одному варианту
+_LATIN = (("kh", "h"), ("ph", "f"), ("j", "y"), ("w", "v"), ("x", "ks"), ("q", "k"))
+
+
+def transliterate(text: str) -> str:
+    """Имя в нижнем регистре латиницей без диакритики: "Алишер" и "Alisher" -> "alisher\""""
+    text = "".join(_CYRILLIC.get(ch, ch) for ch in text.casefold())
+    text = "".join(ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch))
+    for source, target in _LATIN:
+        text = text.replace(source, target)
+    return "".join(ch if ch.isalnum() else " " for ch in text)
+
+
+def trigrams(text: str) -> Set[str]:
+    """Триграммы слов имени (с границами слов, как в pg_trgm)"""
+    grams = set()
+    for word in transliterate(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class ContactIndex:
+    """
+    Основа индексов контактов в памяти, синхронизируемых с записями в базу
+
+    Индекс обновляется по уведомлениям Database об измененных контактах
+    (применяются при следующем поиске). Полное перестроение - при первом
+    обращении, после массовых изменений без списка ID и раз в
+    NAME_INDEX_REFRESH_SECONDS (изменения из других процессов). Повторные
+    перестроения идут в фоновом потоке в отдельную копию индекса, которая
+    затем подменяет текущую, поэтому поиск не ждет их. Подмена может
+    случиться посреди поиска: поиск берет ссылки на структуры индекса
+    один раз под _lock и дальше работает только с ними.
+    Наследники реализуют __len__, _clear, _add и _remove; _clear должен
+    заново создавать все структуры данных индекса.
+    """
+
+    name = "contacts"
+
+    def __init__(self, db: Database, refresh_seconds: int = None):
+        self.db = db
+        self.refresh_seconds = refresh_seconds or Config.NAME_INDEX_REFRESH_SECONDS
+        self._built_at: Optional[float] = None
+        self._dirty: Set[int] = set()
+        self._stale = False
+        # ID, измененные во время фонового перестроения (None - перестроения нет)
+        self._changed_during_rebuild: Optional[Set[int]] = None
+        self._lock = threading.Lock()
+        db.subscribe("contacts", self._on_contacts_changed)
+
+    def _on_contacts_changed(self, ids: Optional[Iterable[int]]):
+        # Вызывается из потока, записавшего данные; применяется при следующем поиске
+        if ids is None:
+            self._stale = True
+            return
+        ids = set(ids)
+        self._dirty.update(ids)
+        changed = self._changed_during_rebuild
+        if changed is not None:
+            changed.update(ids)
+
+    def rebuild(self):
+        """Полное построение индекса по всем контактам"""
+        started = time.monotonic()
+        with self._lock:
+            self._changed_during_rebuild = set()
+            self._stale = False
+
+        # Новая копия без __init__ (и подписки) содержит только данные индекса
+        fresh = object.__new__(type(self))
+        fresh._clear()
+        for contact in self.db.iter_contacts():
+            fresh._add(contact)
+
+        with self._lock:
+            self.__dict__.update(fresh.__dict__)
+            self._built_at = time.monotonic()
+            # Контакты, измененные во время обхода, могли попасть в копию
+            # до изменения - применяются заново
+            self._dirty = self._changed_during_rebuild or set()
+            self._changed_during_rebuild = None
+
+        index_rebuilds.inc(self.name)
+        index_size.set(self.name, len(self))
+        logger.debug(f"🔤 Индекс {self.name} построен: {len(self)} контактов за {time.monotonic() - started:.2f}с")
+
+    def start_rebuild(self):
+        """Перестроение индекса в фоновом потоке (если оно еще не идет)"""
+        if self._changed_during_rebuild is not None:
+            return
+        threading.Thread(target=self._rebuild_safely, name=f"{self.name}-index", daemon=True).start()
+
+    def _rebuild_safely(self):
+        try:
+            self.rebuild()
+        except Exception as e:
+            self._changed_during_rebuild = None
+            logger.error(f"❌ Ошибка перестроения индекса {self.name}: {e}")
+
+    def _refresh(self):
+        if self._built_at is None:
+            # Первое построение: синхронно, если его не запустили заранее
+            if self._changed_during_rebuild is None:
+                self.rebuild()
+            return
+        if self._stale or time.monotonic() - self._built_at > self.refresh_seconds:
+            self.start_rebuild()
+        if not self._dirty:
+            return
+
+        with self._lock:
+            ids, self._dirty = list(self._dirty), set()
+            for contact_id in ids:
+                self._remove(contact_id)
+            for contact in self.db.get_contacts_by_ids(ids):
+                self._add(contact)
+        index_size.set(self.name, len(self))
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+    def _add(self, contact: Contact):
+        raise NotImplementedError
+
+    def _remove(self, contact_id: int):
+        raise NotImplementedError
+
+
+class NameIndex(ContactIndex):
+    """
+    Индекс триграмм имен контактов в памяти
+
+    Для каждой триграммы хранится список ID контактов; кандидаты
+    считаются одним проходом Counter по спискам триграмм запроса, затем
+    ранжируются по доле совпавших триграмм запроса (опечатки и другое
+    написание снижают оценку, а не исключают контакт).
+    """
+
+    name = "names"
+
+    def __init__(self, db: Database, min_score: float = None, refresh_seconds: int = None):
+        super().__init__(db, refresh_seconds)
+        self.min_score = Config.FUZZY_SEARCH_MIN_SCORE if min_score is None else min_score
+        self.postings: Dict[str, List[int]] = {}
+        self.grams: Dict[int, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.grams)
+
+    def _clear(self):
+        self.postings, self.grams = {}, {}
+
+    def _add(self, contact: Contact):
+        contact_grams = trigrams(contact.name)
+        self.grams[contact.id] = contact_grams
+        for gram in contact_grams:
+            self.postings.setdefault(gram, []).append(contact.id)
+
+    def _remove(self, contact_id: int):
+        for gram in self.grams.pop(contact_id, ()):
+            posting = self.postings.get(gram)
+            if posting is not None:
+                posting.remove(contact_id)
+                if not posting:
+                    del self.postings[gram]
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[int, float]]:
+        """
+        Нечеткий поиск по имени
+
+        Returns:
+            [(ID контакта, оценка 0..1)] по убыванию оценки
+        """
+        self._refresh()
+        started = time.monotonic()
+
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+
+        # Фоновое перестроение может подменить словари - поиск идет по одной их версии
+        with self._lock:
+            index_postings, grams = self.postings, self.grams
+
+        total = len(query_grams)
+        required = max(1, math.ceil(total * self.min_score))
+        postings = sorted((index_postings.get(gram, ()) for gram in query_grams), key=len)
+        # Контакт с required общими триграммами обязательно содержит одну из
+        # (total - required + 1) самых редких триграмм запроса: если их списки
+        # короткие, кандидаты берутся только из них и проверяются пересечением
+        rare = postings[:total - required + 1]
+        if sum(map(len, rare)) * _CANDIDATE_CHECK_COST < sum(map(len, postings)):
+            candidates = set().union(*rare)
+            matches = ((contact_id, len(query_grams & grams[contact_id])) for contact_id in candidates)
+        else:
+            counts = Counter()
+            for posting in postings:
+                counts.update(posting)
+            # Кандидатов с запасом: итоговая оценка учитывает и длину имени
+            matches = heapq.nlargest(limit * 3, counts.items(), key=lambda item: item[1])
+
+        results = []
+        for contact_id, common in matches:
+            if common < required:
+                continue
+            # Доля совпадений в имени контакта отличает "Иван" от "Иванов Иван Иванович"
+            dice = 2 * common / (total + len(grams[contact_id]))
+            results.append((contact_id, round(0.7 * common / total + 0.3 * dice, 4)))
+
+        top = heapq.nlargest(limit, results, key=lambda item: item[1])
+        name_search_latency.observe(time.monotonic() - started)
+        return top
+
+    def search_contacts(self, query: str, limit: int = 10) -> List[Contact]:
+        """
+        Поиск контактов: сначала точные совпадения search_contacts, затем нечеткие по имени
+
+        Для запросов-номеров нечеткий поиск не выполняется.
+        """
+        contacts = self.db.search_contacts(query, limit)
+        if len(contacts) >= limit or not any(ch.isalpha() for ch in query):
+            return contacts
+
+        found = {contact.id for contact in contacts}
+        fuzzy_ids = [contact_id for contact_id, _ in self.search(query, limit) if contact_id not in found]
+        return contacts + self.db.get_contacts_by_ids(fuzzy_ids[:limit - len(contacts)])
@@ -0,0 +1,83 @@
+"""
+Нормализация телефонных номеров
+"""
+
+import re
+from typing import List, Optional
+
+import Config
+
+_NON_DIGITS = re.compile(r"\D")
+
+# Короче не бывает номеров с кодом страны
+MIN_PHONE_DIGITS = 8
+
+
+def national_length(country_code: str) -> int:
+    """Количество цифр номера без кода страны по шаблону из PHONE_FORMATS"""
+    for template in Config.PHONE_FORMATS.values():
+        prefix, _, rest = template.lstrip("+").partition("X")
+        if prefix == country_code:
+            return len(rest) + 1
+    return 10
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """
+    Приведение номера к виду E.164 (+<код страны><номер>)
+
+    "8 (900) 123-45-67" и "9001234567" дополняются кодом страны по
+    умолчанию (DEFAULT_PHONE_COUNTRY_CODE, длина номера - по PHONE_FORMATS),
+    "00" в начале считается международным префиксом. Результат проверяется
+    по PHONE_REGEX.
+
+    Returns:
+        Номер в формате +79001234567 или None, если это не похоже на номер
+    """
+    if not phone:
+        return None
+
+    digits = _NON_DIGITS.sub("", phone)
+    if digits.startswith("00"):
+        digits = digits[2:]
+    elif not phone.lstrip().startswith("+"):
+        country = Config.DEFAULT_PHONE_COUNTRY_CODE
+        length = national_length(country)
+        if len(digits) == length + 1 and digits.startswith("8") and country == "7":
+            digits = country + digits[1:]
+        elif len(digits) == length:
+            digits = country + digits
+
+    normalized = "+" + digits
+    if len(digits) < MIN_PHONE_DIGITS or not re.match(Config.PHONE_REGEX, normalized):
+        return None
+    return normalized
+
+
+def is_synthetic_phone(phone: Optional[str], telegram_user_id: Optional[int]) -> bool:
+    """Временный номер "+<telegram id>" у контактов, созданных по входящему сообщению"""
+    if not phone or not telegram_user_id:
+        return False
+    return _NON_DIGITS.sub("", phone) == str(telegram_user_id)
+
+
+def reverse_digits(normalized: Optional[str]) -> Optional[str]:
+    """Цифры нормализованного номера в обратном порядке (ключ поиска по окончанию номера)"""
+    if not normalized:
+        return None
+    return _NON_DIGITS.sub("", normalized)[::-1]
+
+
+def search_prefixes(digits: str) -> List[str]:
+    """
+    Возможные начала нормализованного номера для введенных цифр
+
+    "8900" и "900" ищутся также как "+7900" (код страны по умолчанию).
+    """
+    country = Config.DEFAULT_PHONE_COUNTRY_CODE
+    prefixes = ["+" + digits]
+    if digits.startswith("8") and country == "7":
+        prefixes.append("+" + country + digits[1:])
+    elif not digits.startswith(country):
+        prefixes.append("+" + country + digits)
+    return prefixes
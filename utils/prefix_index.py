@@ -0,0 +1,263 @@
+"""
+Префиксный поиск контактов по началу слов имени и номера (inline-режим)
+"""
+
+import bisect
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from loguru import logger
+
+import Config
+from database.db import Database
+from database.models import Contact
+from utils.metrics import registry
+from utils.name_index import ContactIndex, transliterate
+from utils.phone import search_prefixes
+
+prefix_search_latency = registry.histogram("prefix_search_seconds", "время префиксного поиска контактов")
+prefix_search_truncated = registry.counter("prefix_search_truncated_total",
+                                           "префиксных поисков, прерванных по бюджету времени")
+
+# Как часто проверять бюджет времени (в просмотренных ID)
+_BUDGET_CHECK_EVERY = 256
+
+_PHONE_CHARS = set("0123456789+-() ")
+
+
+class _Node:
+    """Узел сжатого дерева: label - часть ключа на ребре от родителя"""
+
+    __slots__ = ("label", "children", "ids")
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        # Словарь детей и список ID создаются только при необходимости:
+        # большинство узлов - листья с одним контактом
+        self.children: Optional[Dict[str, "_Node"]] = None
+        self.ids: Optional[List[int]] = None
+
+
+def _common_length(a: str, b: str) -> int:
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
+
+
+def contact_keys(contact: Contact) -> Tuple[str, ...]:
+    """Ключи контакта в дереве: слова имени как есть и в транслитерации, цифры номера"""
+    keys = set(contact.name.casefold().split())
+    keys.update(transliterate(contact.name).split())
+    if contact.normalized_phone and not contact.phone_synthetic:
+        keys.add(contact.normalized_phone.lstrip("+"))
+    # Одинаковые слова имен у разных контактов хранятся одной строкой
+    return tuple(sys.intern(key) for key in keys)
+
+
+def query_variants(token: str) -> Set[str]:
+    """Варианты написания слова запроса, по которым ищется начало ключа"""
+    return {token.casefold(), *transliterate(token).split()} - {""}
+
+
+class PrefixIndex(ContactIndex):
+    """
+    Префиксное дерево (trie) ключей контактов в памяти
+
+    Узел дерева хранит ID контактов, ключ которых в нем заканчивается.
+    Поиск спускается по префиксу и обходит поддерево в алфавитном порядке,
+    пока не наберет страницу результатов, поэтому стоимость запроса
+    определяется смещением и размером страницы, а не числом контактов.
+    Для многословного запроса кандидаты берутся по самому длинному слову
+    и проверяются по ключам контакта.
+
+    Обход ограничен бюджетом времени (INLINE_SEARCH_BUDGET_MS): inline-запрос
+    приходит на каждое нажатие клавиши, и лучше вернуть неполную страницу,
+    чем задержать ответ.
+    """
+
+    name = "prefixes"
+
+    def __init__(self, db: Database, refresh_seconds: int = None):
+        super().__init__(db, refresh_seconds)
+        self.root = _Node()
+        self.keys: Dict[int, Tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _clear(self):
+        self.root = _Node()
+        self.keys = {}
+
+    def _add(self, contact: Contact):
+        keys = contact_keys(contact)
+        self.keys[contact.id] = keys
+        for key in keys:
+            self._insert(key, contact.id)
+
+    def _insert(self, key: str, contact_id: int):
+        node, i = self.root, 0
+        while i < len(key):
+            if node.children is None:
+                node.children = {}
+            child = node.children.get(key[i])
+            if child is None:
+                child = node.children[key[i]] = _Node(key[i:])
+                node = child
+                break
+            common = _common_length(child.label, key[i:])
+            if common < len(child.label):
+                # Ключ расходится с ребром посередине - ребро делится
+                middle = node.children[key[i]] = _Node(child.label[:common])
+                child.label = child.label[common:]
+                middle.children = {child.label[0]: child}
+                child = middle
+            node, i = child, i + common
+        # ID в узле хранятся отсортированными - обход выдает их без сортировки
+        ids = node.ids
+        if ids is None:
+            node.ids = [contact_id]
+        elif contact_id > ids[-1]:
+            # При перестроении контакты идут по возрастанию ID
+            ids.append(contact_id)
+        else:
+            position = bisect.bisect_left(ids, contact_id)
+            if position == len(ids) or ids[position] != contact_id:
+                ids.insert(position, contact_id)
+
+    def _remove(self, contact_id: int):
+        for key in self.keys.pop(contact_id, ()):
+            path, i = [self.root], 0
+            while i < len(key):
+                child = (path[-1].children or {}).get(key[i])
+                if child is None or not key.startswith(child.label, i):
+                    break
+                path.append(child)
+                i += len(child.label)
+            else:
+                self._discard(path, contact_id)
+
+    @staticmethod
+    def _discard(path: List[_Node], contact_id: int):
+        node = path[-1]
+        position = bisect.bisect_left(node.ids or [], contact_id)
+        if not node.ids or position == len(node.ids) or node.ids[position] != contact_id:
+            return
+        del node.ids[position]
+        if node.ids:
+            return
+        node.ids = None
+        # Пустые ветви удаляются, а оставшийся без своих ID узел с одним
+        # ребром сливается с ним, чтобы дерево оставалось сжатым
+        depth = len(path) - 1
+        while depth > 0 and path[depth].ids is None and not path[depth].children:
+            parent = path[depth - 1]
+            del parent.children[path[depth].label[0]]
+            if not parent.children:
+                parent.children = None
+            depth -= 1
+        node = path[depth]
+        if depth > 0 and node.ids is None and node.children and len(node.children) == 1:
+            (child,) = node.children.values()
+            node.label += child.label
+            node.children, node.ids = child.children, child.ids
+
+    @staticmethod
+    def _walk(root: _Node, prefix: str) -> Iterator[int]:
+        """ID контактов с ключами, начинающимися с prefix (в порядке ключей)"""
+        node, i = root, 0
+        while i < len(prefix):
+            child = (node.children or {}).get(prefix[i])
+            if child is None:
+                return
+            if not (prefix.startswith(child.label, i) or child.label.startswith(prefix[i:])):
+                return
+            node, i = child, i + len(child.label)
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.ids:
+                yield from node.ids
+            if node.children:
+                stack.extend(node.children[ch] for ch in sorted(node.children, reverse=True))
+
+    @staticmethod
+    def _matches(keys: Tuple[str, ...], variants: List[Set[str]]) -> bool:
+        return all(any(key.startswith(variant) for key in keys for variant in token) for token in variants)
+
+    def search(self, query: str, offset: int = 0, limit: int = 20,
+               budget_ms: int = None) -> Tuple[List[int], Optional[int]]:
+        """
+        Страница контактов, ключи которых начинаются со слов запроса
+
+        Пустой запрос возвращает все контакты в порядке слов имени: сначала
+        ключи на буквы (латиница, в том числе транслитерация, раньше
+        кириллицы), затем ключи на цифры - номера и имена из цифр.
+
+        Returns:
+            (ID контактов, смещение следующей страницы или None). Если бюджет
+            времени кончился, смещение указывает на продолжение, даже когда
+            страница пуста.
+        """
+        self._refresh()
+        # Фоновое перестроение может подменить дерево - поиск идет по одной его версии
+        with self._lock:
+            root, index_keys = self.root, self.keys
+        started = time.monotonic()
+        budget = (Config.INLINE_SEARCH_BUDGET_MS if budget_ms is None else budget_ms) / 1000
+        deadline = started + budget
+
+        query = query.strip()
+        if query and set(query) <= _PHONE_CHARS and any(ch.isdigit() for ch in query):
+            digits = "".join(ch for ch in query if ch.isdigit())
+            prefixes = [prefix.lstrip("+") for prefix in search_prefixes(digits)]
+            others: List[Set[str]] = []
+        else:
+            tokens = sorted((query_variants(token) for token in query.split()),
+                            key=lambda variants: -max(map(len, variants)))
+            if tokens:
+                prefixes = sorted(tokens[0])
+            else:
+                # Номера (ключи из цифр) не должны открывать список раньше имен
+                prefixes = sorted(root.children or (), key=lambda ch: (ch.isdigit(), ch))
+            others = tokens[1:]
+
+        page: List[int] = []
+        seen: Set[int] = set()
+        skipped = 0
+        checked = 0
+        truncated = False
+        for prefix in prefixes:
+            for contact_id in self._walk(root, prefix):
+                checked += 1
+                if checked % _BUDGET_CHECK_EVERY == 0 and time.monotonic() > deadline:
+                    truncated = True
+                    break
+                if contact_id in seen or (others and not self._matches(index_keys.get(contact_id, ()), others)):
+                    continue
+                seen.add(contact_id)
+                if skipped < offset:
+                    skipped += 1
+                    continue
+                page.append(contact_id)
+                # Один лишний результат показывает, что есть следующая страница
+                if len(page) > limit:
+                    break
+            if truncated or len(page) > limit:
+                break
+
+        elapsed = time.monotonic() - started
+        prefix_search_latency.observe(elapsed)
+        if truncated:
+            prefix_search_truncated.inc()
+            logger.debug(f"⏱ Префиксный поиск '{query}' прерван через {elapsed * 1000:.1f}мс")
+            # Продолжение с того же места: страница могла быть неполной или
+            # пустой (бюджет кончился до смещения), но совпадения могут остаться
+            return page[:limit], offset + len(page[:limit])
+
+        if len(page) > limit:
+            return page[:limit], offset + limit
+        return page, None
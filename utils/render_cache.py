@@ -0,0 +1,77 @@
+"""
+Кэш отрисованных экранов бота (текст + клавиатура)
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Tuple
+
+import Config
+from utils.metrics import registry
+
+render_requests = registry.counter("bot_render_cache_total", "обращений к кэшу экранов (hit/miss)")
+
+
+def static_keyboard(build: Callable) -> Callable:
+    """
+    Декоратор для клавиатур без динамических данных
+
+    Клавиатура строится при первом вызове, дальше возвращается тот же объект.
+    """
+    markup = None
+
+    def wrapper():
+        nonlocal markup
+        if markup is None:
+            markup = build()
+        return markup
+
+    wrapper.__doc__ = build.__doc__
+    return wrapper
+
+
+class RenderCache:
+    """
+    LRU кэш экранов по ключу (экран, курсор) с проверкой версии данных
+
+    Экран перерисовывается, если изменилась версия данных (Database.data_version),
+    истек RENDER_CACHE_TTL_SECONDS или экран вытеснен из кэша.
+    """
+
+    def __init__(self, max_size: int = None, ttl: int = None):
+        self.max_size = max(1, max_size or Config.RENDER_CACHE_SIZE)
+        self.ttl = ttl if ttl is not None else Config.RENDER_CACHE_TTL_SECONDS
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[Hashable, float, Any]]" = OrderedDict()
+
+    def get(self, screen: str, cursor: Hashable, version: Hashable, render: Callable) -> Any:
+        """
+        Получение экрана из кэша или отрисовка через render()
+
+        Args:
+            screen: Имя экрана
+            cursor: Параметры экрана (страница, ID контакта)
+            version: Версия данных, от которых зависит экран
+            render: Функция отрисовки без аргументов (None - экран не кэшируется)
+        """
+        key = (screen, cursor)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            cached_version, rendered_at, value = entry
+            if cached_version == version and (not self.ttl or now - rendered_at < self.ttl):
+                self._entries.move_to_end(key)
+                render_requests.inc("hit")
+                return value
+
+        render_requests.inc("miss")
+        value = render()
+        if value is not None:
+            self._entries[key] = (version, now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        """Сброс всех экранов"""
+        self._entries.clear()
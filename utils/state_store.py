@@ -0,0 +1,149 @@
+"""
+Хранилище состояний диалогов с администраторами (TTL, LRU, SQLite)
+"""
+
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Iterator, Tuple
+
+from loguru import logger
+
+import Config
+from database.db import Database
+from utils.metrics import registry
+
+state_entries = registry.gauge("conversation_state_entries", "состояний диалогов в памяти")
+state_evictions = registry.counter("conversation_state_evictions_total", "состояний удалено по TTL или лимиту размера")
+
+_MISSING = object()
+
+
+class StateStore:
+    """
+    Словарь user_id -> состояние с ограниченным временем жизни и размером
+
+    Поддерживает привычные операции словаря (in, [], del, get, pop), поэтому
+    заменяет глобальные dict без изменения логики обработчиков. Каждая запись
+    живет не дольше ttl секунд с момента последней установки; при превышении
+    max_size вытесняются давно не использованные записи. Если передана база
+    данных, состояния сохраняются в таблицу conversation_states и
+    восстанавливаются при создании хранилища после перезапуска.
+
+    Значения должны сериализоваться в JSON (строки, числа, bool, списки, dict).
+    """
+
+    def __init__(self, namespace: str, db: Database = None, ttl: int = None, max_size: int = None):
+        self.namespace = namespace
+        self.db = db if Config.PERSIST_CONVERSATION_STATE else None
+        self.ttl = ttl or Config.CONVERSATION_TIMEOUT_SECONDS
+        self.max_size = max(1, max_size or Config.CONVERSATION_STATE_MAX_SIZE)
+        self._entries: "OrderedDict[int, Tuple[Any, float]]" = OrderedDict()
+
+        if self.db is not None:
+            self.load()
+
+    def load(self):
+        """Восстановление неистекших состояний из базы"""
+        now = time.time()
+        try:
+            self.db.prune_conversation_states(now)
+            rows = self.db.get_conversation_states(self.namespace, now)
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке состояний диалогов {self.namespace}: {e}")
+            return
+
+        for user_id, value, expires_at in rows:
+            self._entries[user_id] = (json.loads(value), expires_at)
+        self._trim()
+        self._update_gauge()
+
+        if rows:
+            logger.info(f"💾 Восстановлено состояний диалогов {self.namespace}: {len(self._entries)}")
+
+    def set(self, user_id: int, value: Any):
+        """Установка состояния пользователя (продлевает TTL)"""
+        expires_at = time.time() + self.ttl
+        self._entries[user_id] = (value, expires_at)
+        self._entries.move_to_end(user_id)
+        self.purge_expired()
+        self._trim()
+        self._update_gauge()
+
+        if self.db is not None:
+            try:
+                self.db.save_conversation_state(self.namespace, user_id, json.dumps(value), expires_at)
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении состояния диалога: {e}")
+
+    def get(self, user_id: int, default: Any = None) -> Any:
+        """Получение состояния пользователя (default если нет или истекло)"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return default
+
+        value, expires_at = entry
+        if expires_at <= time.time():
+            self._remove(user_id)
+            state_evictions.inc("ttl")
+            return default
+
+        self._entries.move_to_end(user_id)
+        return value
+
+    def pop(self, user_id: int, default: Any = None) -> Any:
+        """Удаление состояния пользователя с возвратом значения"""
+        value = self.get(user_id, _MISSING)
+        if value is _MISSING:
+            return default
+        self._remove(user_id)
+        return value
+
+    def purge_expired(self) -> int:
+        """Удаление всех истекших состояний"""
+        now = time.time()
+        expired = [user_id for user_id, (_, expires_at) in self._entries.items() if expires_at <= now]
+        for user_id in expired:
+            self._remove(user_id)
+        if expired:
+            state_evictions.inc("ttl", len(expired))
+        return len(expired)
+
+    def __contains__(self, user_id: int) -> bool:
+        return self.get(user_id, _MISSING) is not _MISSING
+
+    def __getitem__(self, user_id: int) -> Any:
+        value = self.get(user_id, _MISSING)
+        if value is _MISSING:
+            raise KeyError(user_id)
+        return value
+
+    def __setitem__(self, user_id: int, value: Any):
+        self.set(user_id, value)
+
+    def __delitem__(self, user_id: int):
+        if self.pop(user_id, _MISSING) is _MISSING:
+            raise KeyError(user_id)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self._entries))
+
+    def _remove(self, user_id: int):
+        self._entries.pop(user_id, None)
+        self._update_gauge()
+        if self.db is not None:
+            try:
+                self.db.delete_conversation_state(self.namespace, user_id)
+            except Exception as e:
+                logger.error(f"Ошибка при удалении состояния диалога: {e}")
+
+    def _trim(self):
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+            state_evictions.inc("size")
+
+    def _update_gauge(self):
+        state_entries.set(self.namespace, len(self._entries))
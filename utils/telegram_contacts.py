@@ -167,20 +167,26 @@ class TelegramContactsManager:
             contacts_list: Список контактов [(name, phone), ...]
             
         Returns:
-            dict: Статистика импорта
+            dict: Статистика импорта; контакты сверх MAX_NEW_CONTACTS_PER_HOUR
+            не отправляются и возвращаются в "remaining" (для больших списков
+            используйте BulkContactImporter и очередь импорта)
         """
         
         if not contacts_list:
-            return {"imported": 0, "failed": 0, "total": 0}
+            return {"imported": 0, "failed": 0, "total": 0, "remaining": []}
+        
+        remaining = list(contacts_list[Config.MAX_NEW_CONTACTS_PER_HOUR:])
+        contacts_list = contacts_list[:Config.MAX_NEW_CONTACTS_PER_HOUR]
+        if remaining:
+            logger.warning(
+                f"⚠️ Достигнут лимит импорта контактов: {Config.MAX_NEW_CONTACTS_PER_HOUR}, "
+                f"не отправлено: {len(remaining)}"
+            )
         
         try:
             # Создаем список контактов для импорта
             input_contacts = []
             for i, (name, phone) in enumerate(contacts_list):
-                if len(input_contacts) >= Config.MAX_NEW_CONTACTS_PER_HOUR:
-                    logger.warning(f"⚠️ Достигнут лимит импорта контактов: {Config.MAX_NEW_CONTACTS_PER_HOUR}")
-                    break
-                
                 input_contact = types.InputPhoneContact(
                     client_id=i,
                     phone=phone,
@@ -202,6 +208,7 @@ class TelegramContactsManager:
                 "imported": imported_count,
                 "failed": failed_count, 
                 "total": total_count,
+                "remaining": remaining,
                 "details": result
             }
             
@@ -211,6 +218,7 @@ class TelegramContactsManager:
                 "imported": 0,
                 "failed": len(contacts_list),
                 "total": len(contacts_list),
+                "remaining": remaining,
                 "error": str(e)
             }
     
@@ -0,0 +1,305 @@
+"""
+Long polling Bot API с сохранением offset и необработанных обновлений в базе данных
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import GetUpdates
+from aiogram.types import Update
+from loguru import logger
+
+import Config
+from database.db import Database
+from utils.metrics import registry
+
+# Задержка от времени создания обновления в Telegram до окончания обработки
+update_latency = registry.histogram("bot_update_latency_seconds", "от даты обновления в Telegram до окончания обработки")
+# Время работы обработчиков одного обновления
+update_handle_time = registry.histogram("bot_update_handle_seconds", "время обработки одного обновления")
+updates_received = registry.counter("bot_updates_total", "получено обновлений по типам")
+
+
+def get_update_chat_id(update: Update) -> Optional[int]:
+    """
+    Определяет чат, к которому относится обновление
+
+    Args:
+        update: Обновление Bot API
+
+    Returns:
+        ID чата (или пользователя) либо None
+    """
+    try:
+        event = update.event
+    except Exception:
+        return None
+
+    chat = getattr(event, "chat", None)
+    if chat is not None:
+        return chat.id
+
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+
+    return None
+
+
+def get_update_date(update: Update) -> Optional[datetime]:
+    """
+    Возвращает время создания обновления на стороне Telegram
+
+    Args:
+        update: Обновление Bot API
+
+    Returns:
+        datetime в UTC либо None, если у события нет даты (например, callback)
+    """
+    try:
+        event = update.event
+    except Exception:
+        return None
+
+    date = getattr(event, "date", None)
+    if not isinstance(date, datetime):
+        return None
+
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date
+
+
+class DurableUpdatePoller:
+    """
+    Получение обновлений с продолжением с последнего полученного update_id
+
+    Обработчики запускаются задачами, и цикл getUpdates не ждет их
+    завершения: долгий обработчик (выгрузка, синхронизация истории)
+    задерживает только свой чат. Одновременно работает не более
+    UPDATES_CONCURRENCY обработчиков и не более
+    UPDATES_PER_CHAT_CONCURRENCY из одного чата (при 1 - строго по
+    порядку получения).
+
+    Полученная пачка сохраняется в очередь pending_updates до следующего
+    getUpdates, который подтверждает ее Telegram; обработанное
+    обновление удаляется из очереди вместе с записью в журнал
+    processed_updates. После рестарта необработанные обновления
+    дообрабатываются из очереди, а сохраненный offset продолжает
+    получение с первого неполученного.
+    """
+
+    OFFSET_KEY = "bot_update_offset"
+
+    def __init__(self, dp: Dispatcher, bot: Bot, db: Database):
+        self.dp = dp
+        self.bot = bot
+        self.db = db
+        self.polling_timeout = Config.BOT_POLLING_TIMEOUT
+        self.limit = min(100, max(1, Config.BOT_POLLING_LIMIT))
+        self.concurrency = max(1, Config.UPDATES_CONCURRENCY)
+        self.per_chat_concurrency = max(1, Config.UPDATES_PER_CHAT_CONCURRENCY)
+        self.max_update_age = Config.MAX_UPDATE_AGE_SECONDS
+        # Сколько обновлений может ждать обработки, прежде чем getUpdates приостановится
+        self.max_pending = 2 * max(self.limit, self.concurrency)
+        self.offset = None
+        self._running = False
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        # Очереди чатов: chat_id -> [семафор чата, сколько обновлений чата запущено]
+        self._lanes: Dict[Optional[int], list] = {}
+        self._in_flight: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def load_offset(self) -> Optional[int]:
+        """Загрузка сохраненного offset из базы"""
+        value = self.db.get_state(self.OFFSET_KEY)
+        return int(value) if value else None
+
+    def save_offset(self, offset: int):
+        """Сохранение offset и очистка журнала подтвержденных обновлений"""
+        self.db.set_state(self.OFFSET_KEY, str(offset))
+        self.db.prune_processed_updates(offset)
+
+    def load_pending_updates(self) -> List[Update]:
+        """Обновления, полученные до рестарта, но не обработанные"""
+        updates = []
+        for update_id, payload in self.db.get_pending_updates():
+            try:
+                updates.append(Update.model_validate_json(payload, context={"bot": self.bot}))
+            except ValueError as e:
+                logger.warning(f"Не удалось восстановить обновление {update_id}: {e}")
+                self.db.mark_update_processed(update_id)
+        return updates
+
+    async def start(self):
+        """Запуск цикла получения обновлений"""
+        if Config.PERSIST_UPDATE_OFFSET:
+            # Снимаем webhook (если был режим webhook), сохраняя очередь обновлений
+            await self.bot.delete_webhook(drop_pending_updates=False)
+            self.offset = self.load_offset()
+            logger.info(f"📡 Продолжаем получение обновлений с offset={self.offset}")
+            pending = self.load_pending_updates()
+            if pending:
+                logger.info(f"📡 Дообрабатываем обновления, полученные до рестарта: {len(pending)}")
+                self.schedule_updates(pending)
+        else:
+            await self.bot.delete_webhook(drop_pending_updates=True)
+            logger.info("📡 Накопившиеся обновления сброшены")
+
+        allowed_updates = self.get_allowed_updates()
+        logger.info(f"📡 Типы обновлений: {', '.join(allowed_updates)}")
+
+        await self.dp.emit_startup(bot=self.bot)
+        self._running = True
+        failures = 0
+        try:
+            while self._running:
+                # Обработка не успевает за получением - ждем, пока освободится место
+                while len(self._tasks) >= self.max_pending:
+                    await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+
+                try:
+                    updates = await self.bot(
+                        GetUpdates(
+                            offset=self.offset,
+                            limit=self.limit,
+                            timeout=self.polling_timeout,
+                            allowed_updates=allowed_updates
+                        ),
+                        request_timeout=int(self.bot.session.timeout + self.polling_timeout)
+                    )
+                except Exception as e:
+                    failures += 1
+                    delay = min(60, 2 ** min(failures, 6))
+                    logger.error(f"Ошибка при получении обновлений: {e}. Повтор через {delay}с")
+                    await asyncio.sleep(delay)
+                    continue
+
+                failures = 0
+                if not updates:
+                    continue
+
+                if Config.PERSIST_UPDATE_OFFSET:
+                    # До следующего getUpdates (он подтвердит пачку Telegram) пачка должна быть в базе
+                    self.db.save_pending_updates(
+                        [(update.update_id, update.model_dump_json(exclude_unset=True)) for update in updates]
+                    )
+                self.schedule_updates(updates)
+
+                self.offset = updates[-1].update_id + 1
+                if Config.PERSIST_UPDATE_OFFSET:
+                    self.save_offset(self.offset)
+        finally:
+            self._running = False
+            # Прерванные обновления остаются в pending_updates и будут обработаны после рестарта
+            for task in list(self._tasks):
+                task.cancel()
+            await self.dp.emit_shutdown(bot=self.bot)
+
+    def get_allowed_updates(self) -> List[str]:
+        """Типы обновлений из Config либо по зарегистрированным обработчикам"""
+        if Config.BOT_ALLOWED_UPDATES:
+            return list(Config.BOT_ALLOWED_UPDATES)
+        return self.dp.resolve_used_update_types()
+
+    def stop(self):
+        """Остановка цикла получения (запущенные обработчики прерываются при выходе)"""
+        self._running = False
+
+    def schedule_updates(self, updates: List[Update]) -> List[asyncio.Task]:
+        """
+        Запуск обработки пачки обновлений задачами (без ожидания)
+
+        Уже обработанные (по журналу processed_updates) и уже запущенные
+        обновления пропускаются, устаревшие - отмечаются обработанными
+        без вызова обработчиков.
+
+        Returns:
+            Задачи запущенных обновлений
+        """
+        processed = set()
+        if Config.PERSIST_UPDATE_OFFSET:
+            processed = self.db.get_processed_update_ids(updates[0].update_id)
+
+        tasks = []
+        skipped_old = 0
+        for update in updates:
+            if update.update_id in processed or update.update_id in self._in_flight:
+                continue
+            if self.is_expired(update):
+                skipped_old += 1
+                if Config.PERSIST_UPDATE_OFFSET:
+                    self.db.mark_update_processed(update.update_id)
+                continue
+            self._in_flight.add(update.update_id)
+            task = asyncio.create_task(self._run_in_lane(update, get_update_chat_id(update)))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            tasks.append(task)
+
+        if skipped_old:
+            logger.warning(f"⏳ Пропущено устаревших обновлений: {skipped_old}")
+        return tasks
+
+    async def process_updates(self, updates: List[Update]):
+        """Обработка пачки обновлений с ожиданием завершения (webhook отвечает Telegram после обработки)"""
+        tasks = self.schedule_updates(updates)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def _run_in_lane(self, update: Update, chat_id: Optional[int]):
+        """
+        Обработка обновления в очереди своего чата
+
+        Задачи запускаются в порядке получения, а семафоры asyncio отдают
+        место в порядке ожидания, поэтому при UPDATES_PER_CHAT_CONCURRENCY = 1
+        обновления чата обрабатываются строго по очереди.
+        """
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            lane = self._lanes[chat_id] = [asyncio.Semaphore(self.per_chat_concurrency), 0]
+        lane[1] += 1
+        try:
+            async with lane[0]:
+                async with self._semaphore:
+                    await self.process_update(update)
+        finally:
+            self._in_flight.discard(update.update_id)
+            lane[1] -= 1
+            if not lane[1]:
+                del self._lanes[chat_id]
+
+    async def process_update(self, update: Update):
+        """Передача одного обновления в диспетчер с отметкой в журнале"""
+        try:
+            updates_received.inc(update.event_type)
+        except Exception:
+            updates_received.inc("unknown")
+        started = time.monotonic()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            logger.exception(f"Ошибка при обработке обновления {update.update_id}: {e}")
+        finally:
+            update_handle_time.observe(time.monotonic() - started)
+            date = get_update_date(update)
+            if date is not None:
+                update_latency.observe((datetime.now(timezone.utc) - date).total_seconds())
+
+        if Config.PERSIST_UPDATE_OFFSET:
+            self.db.mark_update_processed(update.update_id)
+
+    def is_expired(self, update: Update) -> bool:
+        """Проверка, что обновление старше MAX_UPDATE_AGE_SECONDS"""
+        if not self.max_update_age:
+            return False
+
+        date = get_update_date(update)
+        if date is None:
+            return False
+
+        age = (datetime.now(timezone.utc) - date).total_seconds()
+        return age > self.max_update_age
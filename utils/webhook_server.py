@@ -0,0 +1,182 @@
+"""
+Получение обновлений Bot API через webhook (локальный aiohttp сервер)
+"""
+
+import asyncio
+import hmac
+import json
+import sys
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+from loguru import logger
+from pydantic import ValidationError
+
+import Config
+from database.db import Database
+from utils.metrics import registry
+from utils.update_poller import DurableUpdatePoller
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+webhook_requests = registry.counter("bot_webhook_requests_total", "запросов к webhook по статусу ответа")
+
+
+class WebhookServer:
+    """
+    aiohttp сервер, принимающий обновления от Telegram
+
+    Обновления проходят через тот же конвейер, что и при polling
+    (журнал обработанных update_id, отсечение устаревших, лимиты
+    параллельности), поэтому повторная доставка Telegram не дублирует
+    сообщения.
+    """
+
+    # Сколько последних update_id хранить в журнале обработанных
+    JOURNAL_WINDOW = 1000
+
+    def __init__(self, dp: Dispatcher, bot: Bot, db: Database):
+        self.dp = dp
+        self.bot = bot
+        self.db = db
+        self.processor = DurableUpdatePoller(dp, bot, db)
+        self.secret_token = Config.WEBHOOK_SECRET_TOKEN
+        self._handled = 0
+
+    def create_app(self) -> web.Application:
+        """Создание aiohttp приложения с маршрутом webhook (метрики - отдельным сервером)"""
+        app = web.Application()
+        app.router.add_post(Config.WEBHOOK_PATH, self.handle_update)
+        return app
+
+    async def start(self):
+        """Запуск сервера и регистрация webhook в Telegram"""
+        if not self.secret_token:
+            raise RuntimeError("WEBHOOK_SECRET_TOKEN не задан - webhook без проверки запросов не запускается")
+
+        runner = web.AppRunner(self.create_app())
+        await runner.setup()
+        site = web.TCPSite(runner, Config.WEBHOOK_LISTEN_HOST, Config.WEBHOOK_LISTEN_PORT)
+
+        await self.dp.emit_startup(bot=self.bot)
+        try:
+            await site.start()
+            logger.info(
+                f"🌐 Webhook сервер запущен: http://{Config.WEBHOOK_LISTEN_HOST}:"
+                f"{Config.WEBHOOK_LISTEN_PORT}{Config.WEBHOOK_PATH}"
+            )
+
+            if Config.WEBHOOK_URL:
+                await self.bot.set_webhook(
+                    url=Config.WEBHOOK_URL.rstrip("/") + Config.WEBHOOK_PATH,
+                    secret_token=self.secret_token or None,
+                    allowed_updates=self.processor.get_allowed_updates(),
+                    max_connections=Config.UPDATES_CONCURRENCY,
+                    drop_pending_updates=not Config.PERSIST_UPDATE_OFFSET
+                )
+                logger.info(f"🌐 Webhook зарегистрирован: {Config.WEBHOOK_URL}")
+            else:
+                logger.warning("⚠️ WEBHOOK_URL не задан - webhook не зарегистрирован (локальный режим)")
+
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+            await self.dp.emit_shutdown(bot=self.bot)
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """Прием одного обновления от Telegram"""
+        received = request.headers.get(SECRET_HEADER, "")
+        if not self.secret_token or not hmac.compare_digest(received.encode(), self.secret_token.encode()):
+            webhook_requests.inc("401")
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except (ValueError, ValidationError) as e:
+            logger.warning(f"Некорректное обновление в webhook: {e}")
+            webhook_requests.inc("400")
+            return web.Response(status=400)
+
+        await self.processor.process_updates([update])
+
+        self._handled += 1
+        if Config.PERSIST_UPDATE_OFFSET and self._handled % 100 == 0:
+            self.db.prune_processed_updates(update.update_id - self.JOURNAL_WINDOW)
+
+        webhook_requests.inc("200")
+        return web.json_response({})
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """Отдача метрик в текстовом виде"""
+    return web.Response(text=registry.render_text())
+
+
+async def start_metrics_server(host: str = None, port: int = None) -> web.AppRunner:
+    """
+    Сервер GET /metrics на отдельном адресе (по умолчанию METRICS_LISTEN_HOST:METRICS_LISTEN_PORT)
+
+    Метрики не публикуются на адресе webhook: он доступен из интернета,
+    а сервер метрик слушает только локальный интерфейс.
+    """
+    host = host or Config.METRICS_LISTEN_HOST
+    port = Config.METRICS_LISTEN_PORT if port is None else port
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"📈 Метрики: http://{host}:{port}/metrics")
+    return runner
+
+
+async def start_update_delivery(dp: Dispatcher, bot: Bot, db: Database):
+    """Запуск получения обновлений в режиме Config.BOT_DELIVERY_MODE"""
+    metrics_runner = await start_metrics_server() if Config.METRICS_LISTEN_PORT else None
+    try:
+        if Config.BOT_DELIVERY_MODE == "webhook":
+            await WebhookServer(dp, bot, db).start()
+        else:
+            await DurableUpdatePoller(dp, bot, db).start()
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+
+
+async def replay_updates(path: str, url: str = None, secret_token: str = None):
+    """
+    Отправка сохраненных Update (JSON или JSON Lines) на локальный webhook
+
+    Args:
+        path: Файл с одним обновлением или по одному обновлению на строку
+        url: Адрес webhook (по умолчанию локальный сервер из Config)
+        secret_token: Секретный токен (по умолчанию из Config)
+    """
+    from aiohttp import ClientSession
+
+    url = url or f"http://{Config.WEBHOOK_LISTEN_HOST}:{Config.WEBHOOK_LISTEN_PORT}{Config.WEBHOOK_PATH}"
+    secret_token = secret_token if secret_token is not None else Config.WEBHOOK_SECRET_TOKEN
+    headers = {SECRET_HEADER: secret_token} if secret_token else {}
+
+    with open(path, encoding="utf-8") as f:
+        content = f.read().strip()
+
+    if content.startswith("["):
+        updates = json.loads(content)
+    elif "\n" in content:
+        updates = [json.loads(line) for line in content.splitlines() if line.strip()]
+    else:
+        updates = [json.loads(content)]
+
+    async with ClientSession() as session:
+        for update in updates:
+            async with session.post(url, json=update, headers=headers) as response:
+                print(f"update_id={update.get('update_id')}: HTTP {response.status}")
+
+
+if __name__ == "__main__":
+    # python -m utils.webhook_server updates.jsonl [URL]
+    if len(sys.argv) < 2:
+        print("Использование: python -m utils.webhook_server FILE [URL]")
+        sys.exit(1)
+    asyncio.run(replay_updates(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None))